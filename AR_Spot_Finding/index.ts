@@ -1,6 +1,28 @@
 import { initialize } from "@zcomponent/three";
 import { default as Scene } from "./Scene.zcomp";
+import { SpotMap } from "./spotMap";
 
 initialize(Scene, {}, {
     launchButton: document.getElementById('launchButton')
 });
+
+// ?lot=<id> picks the lot; ?api=<origin> points at the Admin_UI server
+const params = new URLSearchParams(window.location.search);
+const lotId = Number(params.get("lot"));
+if (lotId) {
+    const map = new SpotMap(params.get("api") || window.location.origin, lotId);
+    const label = document.getElementById("spotTarget");
+    let target: number | null = null;
+    map.onChange = () => {
+        const spot = map.nearestFree();
+        if (label) {
+            label.textContent = spot ? `Go to spot ${spot.number}` : `${map.layout?.name || "This lot"} is full`;
+        }
+        if ((spot ? spot.id : null) !== target) {
+            target = spot ? spot.id : null;
+            // The scene listens for this to point its arrow at the spot
+            window.dispatchEvent(new CustomEvent("spot-target", { detail: spot }));
+        }
+    };
+    map.start().catch((error) => console.error(error));
+}
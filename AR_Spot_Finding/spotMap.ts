@@ -0,0 +1,161 @@
+// Live spot map of one lot, from the Admin_UI spot map API
+//
+// The layout (spot numbers and positions in metres from the lot entrance)
+// is fetched once and kept in localStorage under its ETag, so later visits
+// only revalidate it. Statuses then arrive as small deltas: over the
+// server-sent event stream where EventSource exists, otherwise by polling
+// /status?since=<tag>, which answers 304 when nothing changed.
+
+export interface SpotLayout {
+    lot_id: number;
+    name: string;
+    address: string;
+    spot_size: [number, number];
+    spot_ids: number[];
+    numbers: string[];
+    x: number[];
+    y: number[];
+    heading: number[];
+}
+
+export interface Spot {
+    index: number;
+    id: number;
+    number: string;
+    x: number;
+    y: number;
+    heading: number;
+    status: string;
+}
+
+interface StatusPayload {
+    layout: string;
+    tag: string;
+    base?: string;
+    status?: string;
+    changes?: [number, string][];
+}
+
+const POLL_MS = 3000;
+const STORAGE_PREFIX = "ecolot-spot-map-";
+
+export class SpotMap {
+    layout: SpotLayout | null = null;
+    layoutTag: string | null = null;
+    status = "";
+    tag: string | null = null;
+    onChange: ((map: SpotMap) => void) | null = null;
+
+    private source: EventSource | null = null;
+    private timer: number | null = null;
+
+    constructor(private api: string, private lotId: number) {}
+
+    private url(part: string): string {
+        return `${this.api}/api/spot_map/${this.lotId}/${part}`;
+    }
+
+    async loadLayout(): Promise<SpotLayout> {
+        const key = STORAGE_PREFIX + this.lotId;
+        const cached = localStorage.getItem(key);
+        let stored: { tag: string; layout: SpotLayout } | null = cached ? JSON.parse(cached) : null;
+        const headers: Record<string, string> = stored ? { "If-None-Match": `"${stored.tag}"` } : {};
+        const response = await fetch(this.url("layout"), { headers });
+        if (response.status !== 304 || !stored) {
+            if (!response.ok) {
+                throw new Error(`Spot map layout request failed (${response.status})`);
+            }
+            const tag = (response.headers.get("ETag") || "").replace(/"/g, "");
+            stored = { tag, layout: await response.json() };
+            localStorage.setItem(key, JSON.stringify(stored));
+        }
+        this.layout = stored.layout;
+        this.layoutTag = stored.tag;
+        return this.layout;
+    }
+
+    private async apply(payload: StatusPayload): Promise<void> {
+        if (payload.layout !== this.layoutTag) {
+            // Spots were added or removed; positions must be refetched
+            await this.loadLayout();
+        }
+        if (payload.changes && payload.base === this.tag) {
+            const codes = this.status.split("");
+            for (const [index, code] of payload.changes) {
+                codes[index] = code;
+            }
+            this.status = codes.join("");
+        } else if (payload.status !== undefined) {
+            this.status = payload.status;
+        } else {
+            // A delta from a tag we don't hold; start over from the full string
+            this.tag = null;
+            return this.poll();
+        }
+        this.tag = payload.tag;
+        if (this.onChange) {
+            this.onChange(this);
+        }
+    }
+
+    private async poll(): Promise<void> {
+        const since = this.tag ? `?since=${encodeURIComponent(this.tag)}` : "";
+        const response = await fetch(this.url("status") + since);
+        if (response.ok) {
+            await this.apply(await response.json());
+        }
+    }
+
+    async start(): Promise<void> {
+        await this.loadLayout();
+        await this.poll();
+        if (window.EventSource) {
+            this.source = new EventSource(this.url(`stream?since=${encodeURIComponent(this.tag || "")}`));
+            this.source.onmessage = (message) => { this.apply(JSON.parse(message.data)); };
+        } else {
+            const next = () => {
+                this.poll().catch(() => undefined).then(() => {
+                    this.timer = window.setTimeout(next, POLL_MS);
+                });
+            };
+            this.timer = window.setTimeout(next, POLL_MS);
+        }
+    }
+
+    stop(): void {
+        if (this.source) {
+            this.source.close();
+            this.source = null;
+        }
+        if (this.timer !== null) {
+            window.clearTimeout(this.timer);
+            this.timer = null;
+        }
+    }
+
+    spots(): Spot[] {
+        const layout = this.layout;
+        if (!layout) {
+            return [];
+        }
+        return layout.spot_ids.map((id, index) => ({
+            index, id,
+            number: layout.numbers[index],
+            x: layout.x[index],
+            y: layout.y[index],
+            heading: layout.heading[index],
+            status: this.status[index] || "U",
+        }));
+    }
+
+    /** The free spot closest to the entrance, or null when the lot is full */
+    nearestFree(): Spot | null {
+        let best: Spot | null = null;
+        for (const spot of this.spots()) {
+            if (spot.status === "A" && (!best || spot.y < best.y || (spot.y === best.y && spot.x < best.x))) {
+                best = spot;
+            }
+        }
+        return best;
+    }
+}
@@ -1,11 +1,35 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, Response, session, stream_with_context, abort
+from flask.cli import ScriptInfo
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from app.models import db, User, ParkingLot, ParkingSpot, Reservation
-from datetime import datetime, timedelta
+from app.models import db, User, ParkingLot, ParkingSpot, Reservation, AdvanceBooking, SpotListing, SpotRequest, WaitlistEntry, Job, AutoClosedSession
+from datetime import datetime, timedelta, timezone
 from app.chart_generator import ChartGenerator
-from sqlalchemy import func, and_, or_
-import math
+from app import forecasting
+from app.pricing import PricingEngine, charged_hours_for
+from app import provisioning
+from app import archival
+from app.scheduler import run_every, run_forever, run_all
+from app import metrics
+from app.identity_cache import UserCache, new_stamp
+from app.fragment_cache import FragmentCache, lot_versions, bump_lot_versions
+from app import device_registry
+from app import sensor_frames
+from app.spot_table import SpotTable, segment_name
+from app import advance_booking
+from app import marketplace
+from app import waitlist as waitlists
+from app.live_updates import LiveChannel
+from app.spot_map import SpotMaps
+from app import jobs
+from app.lot_catalog import LotCatalog
+from app.user_analytics import AnalyticsMemo
+from app.session_reconciler import SessionReconciler
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import select, func, false, and_, or_
+import click
+import json
+import numpy as np
 import os
 import sys
 sys.path.append(os.path.join(os.path.dirname(__file__), "app"))
@@ -16,12 +40,53 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///parking_app.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['FORECAST_REFRESH_INTERVAL'] = timedelta(hours=1)
+app.config['HEATMAP_WEEKS'] = 4                 # default history behind the spot heatmaps
+app.config['DYNAMIC_PRICING'] = True
+app.config['ARCHIVE_AFTER'] = timedelta(days=365)      # completed sessions older than this are archived
+app.config['ARCHIVE_INTERVAL'] = timedelta(hours=24)   # how often the archiver runs
+app.config['SLOW_QUERY_MS'] = 200               # queries slower than this are logged
+app.config['REQUEST_PROFILING'] = False         # allow `X-Profile: 1` to dump a cProfile file
+app.config['USER_CACHE_TTL'] = 300              # seconds a cached login identity is trusted
+app.config['CHART_FORMAT'] = 'svg'              # png | png-lite | webp | svg | client (drawn in the browser)
+app.config['SENSOR_TIMEOUT'] = timedelta(minutes=15)  # silent sensors are flagged after this long
+app.config['SENSOR_CHECK_INTERVAL'] = 5         # seconds between silent-sensor checks
+app.config['SENSOR_API_KEY'] = None             # if set, sensors must send it in X-Sensor-Key
+app.config['SENSOR_MAX_FRAMES'] = 4096          # frames accepted per /api/sensor/frames request
+app.config['SENSOR_FRAME_MAX_DELAY'] = timedelta(minutes=5)  # longest a gateway may hold frames before sending them
+app.config['SPOT_TABLE'] = True                 # share live spot status between workers in shared memory
+app.config['SPOT_TABLE_SPOTS'] = 1 << 20        # highest spot id the shared table can hold
+app.config['SPOT_TABLE_LOTS'] = 1 << 16         # highest lot id the shared table can hold
+app.config['ADVANCE_BOOKING_HORIZON'] = timedelta(days=30)  # how far ahead spots can be booked
+app.config['ADVANCE_BOOKING_MAX'] = timedelta(hours=24)     # longest window one booking can hold
+app.config['DISPLAY_UTC_OFFSET'] = timedelta(hours=5, minutes=30)  # booking times are entered in IST
+app.config['MARKET_HORIZON'] = timedelta(days=30)  # how far ahead marketplace windows can end
+app.config['MARKET_SYNC_INTERVAL'] = 2          # seconds between marketplace syncs in the background
+app.config['WAITLIST_HOLD'] = timedelta(minutes=5)  # how long a freed spot is held for the next waiter
+app.config['WAITLIST_CHECK_INTERVAL'] = 5       # seconds between checks for lapsed holds
+app.config['SPOT_MAP_CORS_ORIGIN'] = '*'        # origins allowed to read the spot map API (None to disable)
+app.config['JOB_INLINE_SPOTS'] = 500            # lots with more spots than this are built / deleted by a background job
+app.config['JOB_WORKER_THREAD'] = True          # the development server runs queued jobs itself
+app.config['JOB_POLL_INTERVAL'] = 1             # seconds between queue checks in the development server
+app.config['SESSION_VACANT_GRACE'] = timedelta(minutes=20)  # booked spots a sensor sees empty this long are released
+app.config['SESSION_MAX_DURATION'] = timedelta(hours=24)    # sessions longer than this are released and billed
+app.config['SESSION_RECONCILE_INTERVAL'] = 60   # seconds between stale-session sweeps
 
 # Initialize extensions
 db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
+metrics.init_app(app)
+
+# Logged-in users, so load_user does not hit the database on every request
+user_cache = UserCache(ttl_seconds=app.config['USER_CACHE_TTL'])
+
+# How charts are rendered and delivered
+ChartGenerator.configure(app.config['CHART_FORMAT'])
+
+# Precomputed per-lot hourly price tables
+pricing = PricingEngine(enabled=app.config['DYNAMIC_PRICING'])
 
 app.jinja_env.globals.update(timedelta=timedelta)
 
@@ -30,21 +95,164 @@ class MomentHelper:
     def utcnow():
         return datetime.utcnow()
 
+# Sensor devices and their report deadlines
+devices = device_registry.DeviceRegistry(
+    timeout=app.config['SENSOR_TIMEOUT'],
+    tick_seconds=app.config['SENSOR_CHECK_INTERVAL'],
+    on_spots_changed=lambda *lot_ids: spots_freed(*lot_ids),
+    max_delay=app.config['SENSOR_FRAME_MAX_DELAY']
+)
+
+# Upcoming advance bookings per spot, for conflict checks and spot search
+bookings = advance_booking.BookingIndex()
+
+# Open marketplace listings and requests, matched as they arrive
+market = marketplace.Market()
+
+# Notifications pushed to users' browsers
+live = LiveChannel()
+
+# Users queued for full lots; freed spots are held for them in turn
+waitlist = waitlists.Waitlist(
+    hold=app.config['WAITLIST_HOLD'],
+    choose_spot=bookings.walk_in_spot,
+    notify=lambda kind, entry: notify_waitlist(kind, entry)
+)
+
+# Heavy admin work, run by `python app.py run-jobs` workers
+job_queue = jobs.JobQueue()
+
+# Rendered lot cards, keyed by lot id and lot version
+fragment_cache = FragmentCache()
+
 # Add helpers to Jinja globals
 app.jinja_env.globals.update(
     timedelta=timedelta,
-    moment=MomentHelper()
+    moment=MomentHelper(),
+    fragment_cache=fragment_cache,
+    client_charts=ChartGenerator.client_side
 )
 
+# Keep compiled templates on disk so new workers skip recompiling them
+jinja_cache_dir = os.path.join(app.instance_path, 'jinja_cache')
+os.makedirs(jinja_cache_dir, exist_ok=True)
+app.jinja_env.bytecode_cache = FileSystemBytecodeCache(jinja_cache_dir)
+
+# Live spot status and per-lot counts, shared by every worker process
+spot_table = None
+if app.config['SPOT_TABLE']:
+    spot_table = SpotTable(
+        segment_name(app.instance_path + app.config['SQLALCHEMY_DATABASE_URI']),
+        os.path.join(app.instance_path, 'spot_table.lock'),
+        max_spots=app.config['SPOT_TABLE_SPOTS'],
+        max_lots=app.config['SPOT_TABLE_LOTS']
+    )
+
+# Spot layouts and status deltas for the AR spot finder
+spot_maps = SpotMaps(spot_table)
+
+# Lot listings and searches for the dashboards; the shared table tells every worker when lots change
+catalog = LotCatalog(
+    generation=spot_table.catalog_generation if spot_table is not None else None,
+    bump=spot_table.bump_catalog_generation if spot_table is not None else None
+)
+
+# Per-user spending and duration series, kept until the user's next release
+user_analytics_memo = AnalyticsMemo()
+
+# Releases sessions whose car has left (per the sensors) or that ran too long
+reconciler = SessionReconciler(
+    price_table=pricing.session_table,
+    grace=app.config['SESSION_VACANT_GRACE'],
+    max_duration=app.config['SESSION_MAX_DURATION'],
+    on_closed=lambda rows: sessions_auto_closed(rows)
+)
+
+def lot_occupancy(lot):
+    """Occupancy counts for a lot, from the shared spot table when it has them"""
+    if spot_table is not None:
+        if not spot_table.built:
+            spot_table.rebuild()
+        stats = spot_table.lot_stats(lot.id)
+        if stats is not None:
+            return stats
+    return lot.get_occupancy_stats()
+
+app.jinja_env.globals.update(lot_occupancy=lot_occupancy)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, int(user_id))
+    return user_cache.load(int(user_id), session.get('user_stamp'))
+
+def lots_changed(*lot_ids):
+    """Invalidate everything derived from these lots' spots, prices or history"""
+    # Price tables are left to their TTL: rebuilding on every booking and release costs more than it buys
+    bump_lot_versions(lot_ids)
+    if spot_table is not None:
+        spot_table.refresh(lot_ids)
+
+def lot_spots_changed(*lot_ids):
+    """Like lots_changed, for lots that gained or lost spots"""
+    bookings.reload_lots(lot_ids)
+    spots_freed(*lot_ids)
+
+def spots_freed(*lot_ids):
+    """Like lots_changed, for lots where spots may have become available; waiters get them first"""
+    bookings.sync()
+    waitlist.offer(lot_ids)
+    lots_changed(*lot_ids)
+
+def check_waitlists():
+    """Pass on lapsed holds and serve waiters from spots freed by other workers"""
+    bookings.sync()
+    changed = waitlist.tick()
+    if changed:
+        lots_changed(*changed)
+
+def sessions_auto_closed(rows):
+    """Hand freed spots on and tell each user their session was released for them"""
+    spots_freed(*sorted({row['lot_id'] for row in rows}))
+    offset = app.config['DISPLAY_UTC_OFFSET']
+    for row in rows:
+        until = f"{row['closed_at'] + offset:%H:%M} IST"
+        why = (f'the spot has been empty since {until}' if row['reason'] == 'vacant'
+               else f'it ran over the time limit; billed until {until}')
+        live.publish(row['user_id'], 'session_auto_closed', reservation_id=row['reservation_id'],
+                     message=f"Your parking session was released because {why}. "
+                             f"Charged ₹{row['parking_cost']} for {row['hours_charged']} hour(s).",
+                     url=path_for('user_summary'))
+
+def path_for(endpoint, **values):
+    """url_for that also works outside a request (background threads)"""
+    return app.url_map.bind('').build(endpoint, values)
+
+def notify_waitlist(kind, entry):
+    """Tell a waitlisted user a spot is held for them, or that the hold lapsed"""
+    lot_name = entry.lot.prime_location_name
+    if kind == 'waitlist_offer':
+        until = entry.hold_until + app.config['DISPLAY_UTC_OFFSET']
+        live.publish(entry.user_id, kind, lot_id=entry.lot_id,
+                     message=f'Spot {entry.spot.spot_number} at {lot_name} is held for you until {until:%H:%M} IST.',
+                     url=path_for('book_confirmation', lot_id=entry.lot_id))
+    else:
+        live.publish(entry.user_id, kind, lot_id=entry.lot_id,
+                     message=f'Your hold on a spot at {lot_name} ran out. Join the waitlist again if you still need one.')
+
+def user_changed(user_id):
+    """Drop cached copies of a user after their row changes"""
+    user_cache.invalidate(user_id)
+    if current_user.is_authenticated and current_user.id == user_id:
+        # A new stamp in the cookie makes every other worker reload this user too
+        session['user_stamp'] = new_stamp()
 
 # Helper Functions 
 def init_database():
     """Initialize database with default admin"""
     with app.app_context():
         db.create_all()
+        archival.rebuild_history_view()
+        if spot_table is not None:
+            spot_table.rebuild()
         
         admin = User.query.filter_by(username='admin').first()
         if not admin:
@@ -62,28 +270,76 @@ def init_database():
             db.session.commit()
             print("Database initialized with default admin!")
 
-def create_parking_spots(lot_id, max_spots):
-    """Create parking spots for a lot"""
-    for i in range(1, max_spots + 1):
-        spot = ParkingSpot(
-            lot_id=lot_id,
-            spot_number=f"A{i:03d}",  # A001, A002, etc.
-            status='A'
-        )
-        db.session.add(spot)
+def add_lot_spots(lot, first, last):
+    """Create spots first..last for a lot, inline or (for many spots) as a background job.
 
-def search_parking_lots(query):
-    """Search parking lots by name, location, or pincode"""
-    if not query:
-        return ParkingLot.query.all()
+    Returns the queued Job, or None when the spots were added to the current
+    transaction and the caller should commit and call lot_spots_changed.
+    """
+    if last - first + 1 <= app.config['JOB_INLINE_SPOTS']:
+        provisioning.bulk_create_spots(lot.id, first, last, commit=False)
+        return None
+    return job_queue.enqueue('create_spots', created_by=current_user.id, lot_id=lot.id, first=first, last=last,
+                             message=f'Adding {last - first + 1} spots to {lot.prime_location_name}')
+
+def lot_deletion_blocker(lot_id):
+    """Why a lot can't be deleted right now, or None"""
+    if ParkingSpot.query.filter(ParkingSpot.lot_id == lot_id, ParkingSpot.status.in_(('O', 'H'))).first():
+        return 'Cannot delete lot: some spots are occupied!'
+    if ParkingSpot.query.filter(ParkingSpot.lot_id == lot_id, advance_booking.has_upcoming_bookings()).first():
+        return 'Cannot delete lot: some spots are booked ahead!'
+    return None
+
+def delete_lot(lot):
+    """Archive a lot's parking history, then delete it with its spots"""
+    lot_id = lot.id
+    # Keep the lot's parking history in the archive before its spots go away
+    archival.archive_spot_history([spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(lot_id=lot_id)])
     
-    return ParkingLot.query.filter(
-        or_(
-            ParkingLot.prime_location_name.contains(query),
-            ParkingLot.address.contains(query),
-            ParkingLot.pin_code.contains(query)
-        )
-    ).all()
+    db.session.delete(lot)
+    db.session.commit()
+    catalog.invalidate()
+    if spot_table is not None:
+        spot_table.refresh([lot_id])
+    bookings.reload_lots([lot_id])
+
+def search_parking_lots(query):
+    """Search parking lots by name, location, or pincode (served from the lot catalog)"""
+    return catalog.search(query)
+
+def archive_old_reservations():
+    """Move completed reservations past the retention window into the archive"""
+    cutoff = datetime.utcnow() - app.config['ARCHIVE_AFTER']
+    return archival.archive_reservations(cutoff)
+
+def prune_history():
+    """Delete old live update events and finished jobs"""
+    return live.prune(), job_queue.prune()
+
+def refresh_forecasts_if_stale():
+    """Fold new reservations into the forecasts when the cache is out of date"""
+    if forecasting.forecasts_are_stale(app.config['FORECAST_REFRESH_INTERVAL']):
+        forecasting.refresh_forecasts()
+        pricing.invalidate_all()
+
+def parse_utc_time(value, naive_offset=timedelta(0)):
+    """An ISO timestamp as naive UTC.
+
+    Values with an offset (or a Z) are converted; values without one are
+    taken to be naive_offset ahead of UTC.
+    """
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    when = datetime.fromisoformat(value)
+    if when.tzinfo is None:
+        return when - naive_offset
+    return when.astimezone(timezone.utc).replace(tzinfo=None)
+
+def parse_forecast_time(value):
+    """Read the ?at= parameter (ISO format, UTC unless it has an offset), defaulting to one hour from now"""
+    if not value:
+        return datetime.utcnow() + timedelta(hours=1)
+    return parse_utc_time(value)
 
 def search_users(query):
     """Search users by various fields"""
@@ -104,6 +360,92 @@ def search_users(query):
         )
     ).all()
 
+# ═══════════════════════════════════════════════════════════════
+# CHART DATA  (shared by the pages and /api/charts)
+# ═══════════════════════════════════════════════════════════════
+
+def admin_chart_data(days_back=30):
+    """Day x lot matrices of occupied spots and revenue for the last `days_back` days.
+
+    Row 0 is the oldest day. Returns a dict with dates, lots (names),
+    occupied, capacity (per lot) and revenue.
+    """
+    today = datetime.utcnow().date()
+    first_day = today - timedelta(days=days_back - 1)
+    window_start = datetime.combine(first_day, datetime.min.time())
+    window_end = datetime.combine(today + timedelta(days=1), datetime.min.time())
+    
+    lots = ParkingLot.query.order_by(ParkingLot.id).all()
+    column = {lot.id: j for j, lot in enumerate(lots)}
+    dates = [(first_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(days_back)]
+    
+    # Occupancy: a reservation counts on every day from its start to its end
+    # (today while still active). Each one adds +1 on its first day and -1
+    # after its last; a cumulative sum down the days gives the daily counts.
+    # Both sweeps read the history view, so sessions on deleted spots count.
+    h = archival.reservation_history.c
+    rows = db.session.execute(
+        select(h.lot_id, h.parking_timestamp, h.leaving_timestamp).where(
+            h.lot_id.in_(list(column)),
+            h.parking_timestamp < window_end,
+            or_(h.leaving_timestamp.is_(None), h.leaving_timestamp >= window_start)
+        )
+    ).all()
+    
+    steps = np.zeros((days_back + 1, len(lots)))
+    if rows:
+        now = datetime.utcnow()
+        columns = np.array([column[row.lot_id] for row in rows])
+        starts = np.array([row.parking_timestamp for row in rows], dtype='datetime64[D]')
+        ends = np.array([row.leaving_timestamp or now for row in rows], dtype='datetime64[D]')
+        origin = np.datetime64(first_day)
+        first = np.clip((starts - origin).astype(np.int64), 0, days_back)
+        after_last = np.clip((ends - origin).astype(np.int64) + 1, 0, days_back)
+        np.add.at(steps, (first, columns), 1)
+        np.add.at(steps, (after_last, columns), -1)
+    occupied = np.cumsum(steps, axis=0)[:days_back]
+    
+    # Revenue: completed sessions summed per lot and leaving day
+    revenue = np.zeros((days_back, len(lots)))
+    leaving_day = func.date(h.leaving_timestamp)
+    totals = db.session.execute(
+        select(h.lot_id, leaving_day, func.sum(h.parking_cost)).where(
+            h.lot_id.in_(list(column)),
+            h.is_active == false(),
+            h.parking_cost.isnot(None),
+            h.leaving_timestamp >= window_start,
+            h.leaving_timestamp < window_end
+        ).group_by(h.lot_id, leaving_day)
+    ).all()
+    
+    for lot_id, day, total in totals:
+        i = (datetime.strptime(day, '%Y-%m-%d').date() - first_day).days
+        revenue[i, column[lot_id]] = total
+    
+    return {
+        'dates': dates,
+        'lots': [lot.prime_location_name for lot in lots],
+        'occupied': occupied,
+        'capacity': np.array([lot.maximum_number_of_spots for lot in lots], dtype=np.float64),
+        'revenue': revenue
+    }
+
+def lot_heatmaps():
+    """Every lot and its (n_lots, 168) hour-of-week occupancy share"""
+    refresh_forecasts_if_stale()
+    lots = ParkingLot.query.order_by(ParkingLot.id).all()
+    return lots, forecasting.lot_heatmap(lots)
+
+def spot_heatmaps(lot, weeks):
+    """A lot's spots and their (n_spots, 24) hour-of-day occupancy share over the last `weeks` weeks"""
+    spots = ParkingSpot.query.filter_by(lot_id=lot.id).order_by(ParkingSpot.id).all()
+    return spots, forecasting.spot_heatmap([spot.id for spot in spots], weeks)
+
+def heatmap_weeks():
+    """The ?weeks= parameter, kept between 1 and 52"""
+    weeks = request.args.get('weeks', app.config['HEATMAP_WEEKS'], type=int)
+    return max(1, min(52, weeks or app.config['HEATMAP_WEEKS']))
+
 # ═══════════════════════════════════════════════════════════════
 # AUTHENTICATION ROUTES
 # ═══════════════════════════════════════════════════════════════
@@ -122,6 +464,7 @@ def login():
         
         if user and check_password_hash(user.password, password):
             login_user(user)
+            session['user_stamp'] = new_stamp()
             if user.is_admin:
                 return redirect(url_for('admin_dashboard'))
             else:
@@ -191,15 +534,35 @@ def user_dashboard():
         is_active=True
     ).first()
     
-    # User's parking history
-    parking_history = Reservation.query.filter_by(
-        user_id=current_user.id
-    ).order_by(Reservation.parking_timestamp.desc()).limit(10).all()
+    # Advance bookings that have not started or been used yet
+    upcoming_bookings = AdvanceBooking.query.filter(
+        AdvanceBooking.user_id == current_user.id,
+        AdvanceBooking.status == advance_booking.BOOKED,
+        AdvanceBooking.end_time > datetime.utcnow()
+    ).order_by(AdvanceBooking.start_time).all()
+    
+    # Place in a lot's waitlist, if queued
+    waitlist_entry = waitlist.active_entry(current_user.id)
+    waitlist_position = None
+    if waitlist_entry is not None and waitlist_entry.status == waitlists.WAITING:
+        waitlist_position = waitlist.position(waitlist_entry)
+    
+    # User's parking history, archived sessions included
+    parking_history = archival.recent_history(current_user.id, limit=10)
+    
+    # Expected availability in an hour, from the cached forecasts
+    forecast_time = datetime.utcnow() + timedelta(hours=1)
+    forecasts = forecasting.expected_availability(lots, forecast_time, lot_occupancy)
     
     return render_template('user_dashboard.html',
                          lots=lots,
+                         lot_versions=lot_versions(lot.id for lot in lots),
                          active_reservation=active_reservation,
+                         upcoming_bookings=upcoming_bookings,
+                         waitlist_entry=waitlist_entry,
+                         waitlist_position=waitlist_position,
                          parking_history=parking_history,
+                         forecasts=forecasts,
                          search_query=search_query)
 
 @app.route('/user_summary')
@@ -208,36 +571,16 @@ def user_summary():
     if current_user.is_admin:
         return redirect(url_for('admin_dashboard'))
     
-    # Get user's completed reservations
-    completed_reservations = [r for r in current_user.reservations if not r.is_active]
-    
-    # Calculate location bookings using Python
-    location_counts = {}
-    for reservation in completed_reservations:
-        location = reservation.spot.lot.prime_location_name
-        location_counts[location] = location_counts.get(location, 0) + 1
-    
-    # Convert to list of tuples for chart
-    location_bookings = [(location, count) for location, count in location_counts.items()]
-    
-    # Get duration data
-    duration_data = []
-    for reservation in completed_reservations:
-        if reservation.leaving_timestamp:
-            duration = reservation.leaving_timestamp - reservation.parking_timestamp
-            hours = duration.total_seconds() / 3600
-            duration_data.append({
-                'date': reservation.parking_timestamp.strftime('%Y-%m-%d'),
-                'hours': round(hours, 2),
-                'location': reservation.spot.lot.prime_location_name
-            })
-    
-    # Sort by date
-    duration_data.sort(key=lambda x: x['date'])
-    
-    # Generate charts using matplotlib
-    location_chart_url = ChartGenerator.generate_user_location_chart(location_bookings)
-    duration_chart_url = ChartGenerator.generate_user_duration_chart(duration_data)
+    analytics = user_analytics_memo.get(current_user.id)
+    location_bookings, duration_data = analytics.location_bookings, analytics.duration_data
+    
+    # Render the charts, or point the page at their JSON series
+    if ChartGenerator.client_side():
+        location_chart_url = url_for('chart_series', chart='user_location') if location_bookings else None
+        duration_chart_url = url_for('chart_series', chart='user_duration') if duration_data else None
+    else:
+        location_chart_url = ChartGenerator.generate_user_location_chart(location_bookings)
+        duration_chart_url = ChartGenerator.generate_user_duration_chart(duration_data)
     
     return render_template('user_summary.html',
                          location_chart_url=location_chart_url,
@@ -260,15 +603,28 @@ def book_confirmation(lot_id):
         flash('You already have an active parking reservation!', 'error')
         return redirect(url_for('user_dashboard'))
     
-    # Find available spot
-    available_spot = ParkingSpot.query.filter_by(lot_id=lot_id, status='A').first()
+    check_waitlists()
+    entry = waitlist.active_entry(current_user.id)
+    if entry is not None and entry.lot_id == lot_id and entry.status == waitlists.OFFERED:
+        # The spot held for this user when they reached the front of the queue
+        available_spot = entry.spot
+    elif waitlist.has_waiters(lot_id):
+        # Spots go to the people already waiting first
+        return redirect(url_for('waitlist_view', lot_id=lot_id))
+    else:
+        # Find an available spot, keeping clear of upcoming advance bookings
+        available_ids = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(lot_id=lot_id, status='A')]
+        spot_id = bookings.walk_in_spot(available_ids, datetime.utcnow())
+        available_spot = db.session.get(ParkingSpot, spot_id) if spot_id is not None else None
     if not available_spot:
-        flash('No available spots in this parking lot!', 'error')
-        return redirect(url_for('user_dashboard'))
+        return redirect(url_for('waitlist_view', lot_id=lot_id))
+    
+    current_rate = pricing.price_table(lot).rate_at(datetime.utcnow())
     
     return render_template('book_confirmation.html', 
                          lot=lot, 
                          spot=available_spot,
+                         current_rate=current_rate,
                          user=current_user)
 
 @app.route('/confirm_booking', methods=['POST'])
@@ -280,7 +636,13 @@ def confirm_booking():
     
     spot = ParkingSpot.query.get_or_404(spot_id)
     
-    if spot.status != 'A':
+    now = datetime.utcnow()
+    if spot.status == waitlists.SPOT_HELD:
+        # Only the waiter it is held for can take it, before the hold runs out
+        available = waitlist.claim_offer(current_user.id, spot.id, now)
+    else:
+        available = spot.status == 'A' and bookings.is_free(spot.id, now, now + timedelta(seconds=1))
+    if not available:
         flash('Spot no longer available!', 'error')
         return redirect(url_for('user_dashboard'))
     
@@ -290,7 +652,8 @@ def confirm_booking():
         user_id=current_user.id,
         vehicle_license_plate=vehicle_license_plate,
         vehicle_color=vehicle_color,
-        parking_timestamp=datetime.utcnow(),
+        parking_timestamp=now,
+        price_rates=pricing.price_table(spot.lot).snapshot(),
         is_active=True
     )
     
@@ -299,6 +662,7 @@ def confirm_booking():
     
     db.session.add(reservation)
     db.session.commit()
+    lots_changed(spot.lot_id)
     
     flash(f'Parking spot {spot.spot_number} booked successfully!', 'success')
     return redirect(url_for('user_dashboard'))
@@ -312,12 +676,13 @@ def release_confirmation(reservation_id):
         flash('Unauthorized access!', 'error')
         return redirect(url_for('user_dashboard'))
     
-    # Calculate cost
+    # Calculate cost from the price table in force when the car parked
     current_time = datetime.utcnow()  # Get current UTC time
     duration = current_time - reservation.parking_timestamp
     hours = duration.total_seconds() / 3600
-    charged_hours = max(1, math.ceil(hours))
-    cost = charged_hours * reservation.spot.lot.price
+    charged_hours = charged_hours_for(reservation.parking_timestamp, current_time)
+    price_table = pricing.session_table(reservation.spot.lot, reservation.price_rates)
+    cost = price_table.cost(reservation.parking_timestamp, charged_hours)
     
     return render_template('release_confirmation.html',
                          reservation=reservation,
@@ -337,15 +702,12 @@ def confirm_release():
         flash('Unauthorized access!', 'error')
         return redirect(url_for('user_dashboard'))
     
-    # Debug: Print before update
-    print(f"Before release - User spending: {current_user.get_total_spending()}")
-    print(f"Before release - Reservation cost: {reservation.parking_cost}")
-    
     # Set leaving timestamp first
     reservation.leaving_timestamp = datetime.utcnow()
     
     # Calculate and update cost using the model method
-    cost, hours = reservation.calculate_cost(reservation.spot.lot.price)
+    lot = reservation.spot.lot
+    cost, hours = reservation.calculate_cost(lot.price, pricing.session_table(lot, reservation.price_rates))
     reservation.parking_cost = cost
     reservation.hours_charged = hours
     reservation.is_active = False
@@ -355,15 +717,316 @@ def confirm_release():
     
     # Commit changes to database
     db.session.commit()
+    spots_freed(lot.id)
     
-    # Debug: Print after update
-    print(f"After release - User spending: {current_user.get_total_spending()}")
-    print(f"After release - Reservation cost: {reservation.parking_cost}")
-    print(f"After release - Cost calculated: {cost}")
+    app.logger.debug("Released reservation %s: %s hour(s), cost %s", reservation.id, hours, cost)
     
     flash(f'Parking released! Total cost: ₹{cost} for {hours} hour(s)', 'success')
     return redirect(url_for('user_dashboard'))
 
+def parse_booking_time(value):
+    """A datetime-local form value (display time zone, unless it has an offset) as naive UTC"""
+    return parse_utc_time(value, app.config['DISPLAY_UTC_OFFSET'])
+
+@app.route('/book_advance/<int:lot_id>', methods=['GET', 'POST'])
+@login_required
+def book_advance(lot_id):
+    if current_user.is_admin:
+        return redirect(url_for('admin_dashboard'))
+    
+    lot = ParkingLot.query.get_or_404(lot_id)
+    
+    if request.method == 'POST':
+        try:
+            start = parse_booking_time(request.form['start_time'])
+            end = parse_booking_time(request.form['end_time'])
+        except ValueError:
+            flash('Please enter a valid start and end time.', 'error')
+            return render_template('book_advance.html', lot=lot)
+        
+        now = datetime.utcnow()
+        if start < now or end <= start:
+            flash('The window must start in the future and end after it starts.', 'error')
+            return render_template('book_advance.html', lot=lot)
+        if start > now + app.config['ADVANCE_BOOKING_HORIZON'] or end - start > app.config['ADVANCE_BOOKING_MAX']:
+            flash(f"Bookings can start up to {app.config['ADVANCE_BOOKING_HORIZON'].days} days ahead "
+                  f"and last at most {app.config['ADVANCE_BOOKING_MAX'].total_seconds() / 3600:g} hours.", 'error')
+            return render_template('book_advance.html', lot=lot)
+        
+        try:
+            booking = advance_booking.create_booking(
+                bookings, current_user.id, lot.id, start, end,
+                request.form['vehicle_license_plate'], request.form['vehicle_color'])
+        except advance_booking.BookingError as e:
+            flash(str(e), 'error')
+            return render_template('book_advance.html', lot=lot)
+        
+        estimate = pricing.price_table(lot).cost(start, charged_hours_for(start, end))
+        flash(f'Spot {booking.spot.spot_number} at {lot.prime_location_name} is booked for you '
+              f'(about ₹{estimate:.2f}).', 'success')
+        return redirect(url_for('user_dashboard'))
+    
+    return render_template('book_advance.html', lot=lot)
+
+@app.route('/cancel_advance', methods=['POST'])
+@login_required
+def cancel_advance():
+    booking = AdvanceBooking.query.get_or_404(request.form['booking_id'])
+    if booking.user_id != current_user.id:
+        flash('Unauthorized access!', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    if booking.status == advance_booking.BOOKED:
+        advance_booking.set_status(bookings, booking, advance_booking.CANCELLED)
+        flash('Booking cancelled.', 'success')
+    return redirect(url_for('user_dashboard'))
+
+@app.route('/check_in_advance', methods=['POST'])
+@login_required
+def check_in_advance():
+    """Turn an advance booking into a parking session when the user arrives"""
+    booking = AdvanceBooking.query.get_or_404(request.form['booking_id'])
+    if booking.user_id != current_user.id:
+        flash('Unauthorized access!', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    now = datetime.utcnow()
+    if booking.status != advance_booking.BOOKED or now >= booking.end_time:
+        flash('This booking can no longer be used.', 'error')
+        return redirect(url_for('user_dashboard'))
+    if now < booking.start_time - advance_booking.CHECK_IN_EARLY:
+        flash('Check-in opens 15 minutes before your booking starts.', 'error')
+        return redirect(url_for('user_dashboard'))
+    if Reservation.query.filter_by(user_id=current_user.id, is_active=True).first():
+        flash('You already have an active parking reservation!', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    # If someone is still parked in the booked spot, hand over another free one
+    spot = booking.spot
+    if spot.status != 'A':
+        spot = advance_booking.move_to_free_spot(bookings, booking, now)
+        if spot is None:
+            flash('Your spot is still occupied and no other spot is free. Please try again shortly.', 'error')
+            return redirect(url_for('user_dashboard'))
+    
+    reservation = Reservation(
+        spot_id=spot.id,
+        user_id=current_user.id,
+        vehicle_license_plate=booking.vehicle_license_plate,
+        vehicle_color=booking.vehicle_color,
+        parking_timestamp=now,
+        price_rates=pricing.price_table(spot.lot).snapshot(),
+        is_active=True
+    )
+    spot.status = 'O'
+    db.session.add(reservation)
+    db.session.flush()
+    advance_booking.set_status(bookings, booking, advance_booking.CHECKED_IN, reservation_id=reservation.id)
+    lots_changed(spot.lot_id)
+    
+    flash(f'Checked in: parking spot {spot.spot_number}.', 'success')
+    return redirect(url_for('user_dashboard'))
+
+# ═══════════════════════════════════════════════════════════════
+# WAITLIST ROUTES
+# ═══════════════════════════════════════════════════════════════
+
+@app.route('/waitlist/<int:lot_id>')
+@login_required
+def waitlist_view(lot_id):
+    if current_user.is_admin:
+        return redirect(url_for('admin_dashboard'))
+    
+    lot = ParkingLot.query.get_or_404(lot_id)
+    check_waitlists()
+    
+    entry = waitlist.active_entry(current_user.id)
+    if entry is not None and entry.lot_id == lot.id and entry.status == waitlists.OFFERED:
+        return redirect(url_for('book_confirmation', lot_id=lot.id))
+    
+    waiting = WaitlistEntry.query.filter_by(lot_id=lot.id, status=waitlists.WAITING).count()
+    return render_template('waitlist.html',
+                         lot=lot,
+                         entry=entry,
+                         position=waitlist.position(entry) if entry is not None and entry.lot_id == lot.id else None,
+                         waiting=waiting,
+                         hold_minutes=int(app.config['WAITLIST_HOLD'].total_seconds() // 60))
+
+@app.route('/join_waitlist/<int:lot_id>', methods=['POST'])
+@login_required
+def join_waitlist(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+    
+    if Reservation.query.filter_by(user_id=current_user.id, is_active=True).first():
+        flash('You already have an active parking reservation!', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    try:
+        waitlist.join(lot.id, current_user.id)
+    except waitlists.WaitlistError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    # A spot may have come free while the page was open
+    changed = waitlist.offer([lot.id])
+    if changed:
+        lots_changed(*changed)
+    return redirect(url_for('waitlist_view', lot_id=lot.id))
+
+@app.route('/leave_waitlist', methods=['POST'])
+@login_required
+def leave_waitlist():
+    entry = WaitlistEntry.query.get_or_404(request.form['entry_id'])
+    if entry.user_id != current_user.id:
+        flash('Unauthorized access!', 'error')
+        return redirect(url_for('user_dashboard'))
+    
+    lot_id = entry.lot_id
+    if waitlist.leave(entry):
+        lots_changed(lot_id)
+        flash('You left the waitlist.', 'success')
+    return redirect(url_for('user_dashboard'))
+
+# ═══════════════════════════════════════════════════════════════
+# MARKETPLACE ROUTES
+# ═══════════════════════════════════════════════════════════════
+
+def parse_market_order(form, price_field):
+    """Location, window and price of a marketplace form. Raises ValueError with a message."""
+    try:
+        lat, lon = float(form['latitude']), float(form['longitude'])
+        price = float(form[price_field])
+    except (KeyError, ValueError):
+        raise ValueError('Please enter a valid location and price.')
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180) or price <= 0:
+        raise ValueError('Please enter a valid location and price.')
+    try:
+        start = parse_booking_time(form['start_time'])
+        end = parse_booking_time(form['end_time'])
+    except (KeyError, ValueError):
+        raise ValueError('Please enter a valid start and end time.')
+    now = datetime.utcnow()
+    if start < now - timedelta(minutes=1) or end <= start:
+        raise ValueError('The window must start in the future and end after it starts.')
+    if end > now + app.config['MARKET_HORIZON']:
+        raise ValueError(f"Windows must end within {app.config['MARKET_HORIZON'].days} days.")
+    return lat, lon, start, end, round(price, 2)
+
+@app.route('/marketplace')
+@login_required
+def marketplace_dashboard():
+    if current_user.is_admin:
+        return redirect(url_for('admin_dashboard'))
+    
+    market.sync()
+    listings = SpotListing.query.filter_by(owner_id=current_user.id).order_by(
+        SpotListing.start_time.desc()).limit(20).all()
+    spot_requests = SpotRequest.query.filter_by(driver_id=current_user.id).order_by(
+        SpotRequest.start_time.desc()).limit(20).all()
+    
+    return render_template('marketplace.html',
+                         listings=listings,
+                         spot_requests=spot_requests,
+                         max_distance_km=marketplace.MAX_DISTANCE_KM)
+
+@app.route('/marketplace/list', methods=['POST'])
+@login_required
+def create_listing():
+    """Offer a private spot; it is matched straight away if a driver is waiting"""
+    try:
+        lat, lon, start, end, price = parse_market_order(request.form, 'price_per_hour')
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('marketplace_dashboard'))
+    
+    now = datetime.utcnow()
+    listing = SpotListing(
+        owner_id=current_user.id,
+        title=request.form['title'],
+        address=request.form['address'],
+        pin_code=request.form['pin_code'],
+        latitude=lat,
+        longitude=lon,
+        start_time=start,
+        end_time=end,
+        price_per_hour=price,
+        created_at=now,
+        updated_at=now
+    )
+    db.session.add(listing)
+    db.session.commit()
+    
+    if market.place(listing):
+        flash(f'Your spot was matched with a driver at ₹{price}/hour.', 'success')
+    else:
+        flash('Your spot is listed. You will see the driver here once it is matched.', 'success')
+    return redirect(url_for('marketplace_dashboard'))
+
+@app.route('/marketplace/request', methods=['POST'])
+@login_required
+def create_spot_request():
+    """Ask for a spot near a point; matched with the cheapest, then nearest, listing"""
+    try:
+        lat, lon, start, end, max_price = parse_market_order(request.form, 'max_price_per_hour')
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('marketplace_dashboard'))
+    try:
+        max_km = float(request.form['max_distance_km'])
+    except ValueError:
+        max_km = 0
+    if not 0 < max_km <= marketplace.MAX_DISTANCE_KM:
+        flash(f'Distance must be between 0 and {marketplace.MAX_DISTANCE_KM:g} km.', 'error')
+        return redirect(url_for('marketplace_dashboard'))
+    
+    now = datetime.utcnow()
+    spot_request = SpotRequest(
+        driver_id=current_user.id,
+        latitude=lat,
+        longitude=lon,
+        start_time=start,
+        end_time=end,
+        max_price_per_hour=max_price,
+        max_distance_km=max_km,
+        vehicle_license_plate=request.form['vehicle_license_plate'],
+        created_at=now,
+        updated_at=now
+    )
+    db.session.add(spot_request)
+    db.session.commit()
+    
+    match = market.place(spot_request)
+    if match:
+        flash(f'Found a spot {match.distance_km:.1f} km away at ₹{match.price_per_hour}/hour.', 'success')
+    else:
+        flash('Request posted. We will match you as soon as a suitable spot is listed.', 'success')
+    return redirect(url_for('marketplace_dashboard'))
+
+@app.route('/marketplace/withdraw', methods=['POST'])
+@login_required
+def withdraw_market_order():
+    if request.form['kind'] == 'listing':
+        row = SpotListing.query.get_or_404(request.form['order_id'])
+        owner_id = row.owner_id
+    else:
+        row = SpotRequest.query.get_or_404(request.form['order_id'])
+        owner_id = row.driver_id
+    if owner_id != current_user.id:
+        flash('Unauthorized access!', 'error')
+        return redirect(url_for('marketplace_dashboard'))
+    
+    if market.withdraw(row):
+        flash('Taken off the marketplace.', 'success')
+    else:
+        flash('This has already been matched or withdrawn.', 'error')
+    return redirect(url_for('marketplace_dashboard'))
+
+@app.route('/api/marketplace/depth')
+@login_required
+def marketplace_depth():
+    """Open listings and requests in this worker's order book"""
+    return jsonify(market.depth())
+
 # ═══════════════════════════════════════════════════════════════
 # ADMIN ROUTES
 # ═══════════════════════════════════════════════════════════════
@@ -380,6 +1043,8 @@ def admin_dashboard():
     
     return render_template('admin_dashboard.html', 
                          lots=lots, 
+                         lot_versions=lot_versions(lot.id for lot in lots),
+                         fleet=device_registry.fleet_health(),
                          search_query=search_query)
 
 @app.route('/admin_users')
@@ -402,70 +1067,16 @@ def admin_summary():
     if not current_user.is_admin:
         return redirect(url_for('user_dashboard'))
     
-    # Daily occupancy data (last 30 days)
-    days_back = 30
-    occupancy_data = []
-    
-    for i in range(days_back):
-        date = datetime.utcnow().date() - timedelta(days=i)
-        
-        lots_data = []
-        for lot in ParkingLot.query.all():
-            occupied_count = 0
-            
-            for reservation in Reservation.query.filter(
-                Reservation.spot_id.in_([s.id for s in lot.spots])
-            ).all():
-                start_date = reservation.parking_timestamp.date()
-                end_date = reservation.leaving_timestamp.date() if reservation.leaving_timestamp else datetime.utcnow().date()
-                
-                if start_date <= date <= end_date:
-                    occupied_count += 1
-            
-            lots_data.append({
-                'name': lot.prime_location_name,
-                'occupied': occupied_count,
-                'total': lot.maximum_number_of_spots
-            })
-        
-        occupancy_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'lots': lots_data
-        })
-    
-    # Daily revenue data (last 30 days)
-    revenue_data = []
-    for i in range(days_back):
-        date = datetime.utcnow().date() - timedelta(days=i)
-        
-        lots_revenue = []
-        for lot in ParkingLot.query.all():
-            daily_revenue = db.session.query(func.sum(Reservation.parking_cost)).filter(
-                Reservation.spot_id.in_([s.id for s in lot.spots]),
-                func.date(Reservation.leaving_timestamp) == date,
-                Reservation.parking_cost.isnot(None),
-                Reservation.is_active == False
-            ).scalar() or 0
-            
-            lots_revenue.append({
-                'name': lot.prime_location_name,
-                'revenue': round(daily_revenue, 2)
-            })
-        
-        revenue_data.append({
-            'date': date.strftime('%Y-%m-%d'),
-            'lots': lots_revenue
-        })
-    
-    # Generate charts using matplotlib
-    lot_names = list(set([lot.prime_location_name for lot in ParkingLot.query.all()]))
-    
-    occupancy_chart_url = ChartGenerator.generate_occupancy_chart(
-        list(reversed(occupancy_data)), lot_names
-    )
-    revenue_chart_url = ChartGenerator.generate_revenue_chart(
-        list(reversed(revenue_data)), lot_names
-    )
+    # Render the charts, or point the page at their JSON series
+    if ChartGenerator.client_side():
+        occupancy_chart_url = url_for('chart_series', chart='occupancy')
+        revenue_chart_url = url_for('chart_series', chart='revenue')
+    else:
+        data = admin_chart_data()
+        occupancy_chart_url = ChartGenerator.generate_occupancy_matrix_chart(
+            data['dates'], data['lots'], data['occupied'], data['capacity'])
+        revenue_chart_url = ChartGenerator.generate_revenue_matrix_chart(
+            data['dates'], data['lots'], data['revenue'])
     
     # Comprehensive reservations summary table
     all_reservations = db.session.query(Reservation).join(
@@ -481,6 +1092,66 @@ def admin_summary():
                          revenue_chart_url=revenue_chart_url,
                          all_reservations=all_reservations)
 
+@app.route('/admin_heatmaps')
+@login_required
+def admin_heatmaps():
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    lots, lot_heat = lot_heatmaps()
+    weeks = heatmap_weeks()
+    lot_id = request.args.get('lot_id', type=int)
+    index = next((i for i, lot in enumerate(lots) if lot.id == lot_id), 0)
+    
+    lot = lots[index] if lots else None
+    week_heat = spots = spot_heat = None
+    if lot is not None:
+        week_heat = lot_heat[index].reshape(7, 24)
+        spots, spot_heat = spot_heatmaps(lot, weeks)
+    
+    return render_template('admin_heatmaps.html',
+                         lots=lots,
+                         lot=lot,
+                         weeks=weeks,
+                         week_heat=week_heat,
+                         spots=spots,
+                         spot_heat=spot_heat,
+                         weekdays=['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'])
+
+@app.route('/admin_sessions')
+@login_required
+def admin_sessions():
+    """Sessions the reconciler released, and the stale ones it is waiting on"""
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    since = datetime.utcnow() - timedelta(days=7)
+    totals = dict(db.session.query(AutoClosedSession.reason, func.count()).filter(
+        AutoClosedSession.detected_at >= since).group_by(AutoClosedSession.reason).all())
+    recent = AutoClosedSession.query.order_by(AutoClosedSession.id.desc()).limit(100).all()
+    lot_names = dict(db.session.query(ParkingLot.id, ParkingLot.prime_location_name).filter(
+        ParkingLot.id.in_({row.lot_id for row in recent})))
+    spot_numbers = dict(db.session.query(ParkingSpot.id, ParkingSpot.spot_number).filter(
+        ParkingSpot.id.in_({row.spot_id for row in recent})))
+    return render_template('admin_sessions.html',
+                           totals=totals,
+                           recent=recent,
+                           lot_names=lot_names,
+                           spot_numbers=spot_numbers,
+                           grace=app.config['SESSION_VACANT_GRACE'],
+                           max_duration=app.config['SESSION_MAX_DURATION'])
+
+@app.route('/admin_sessions/reconcile', methods=['POST'])
+@login_required
+def reconcile_sessions():
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    closed = reconciler.run()
+    flash(f"Released {closed['vacant']} session(s) on empty spots and {closed['overdue']} overdue session(s).",
+          'success')
+    return redirect(url_for('admin_sessions'))
+
 
 
 @app.route('/create_lot', methods=['GET', 'POST'])
@@ -500,15 +1171,46 @@ def create_lot():
         db.session.add(lot)
         db.session.flush()
         
-        # Create parking spots
-        create_parking_spots(lot.id, lot.maximum_number_of_spots)
-        
+        # Create parking spots; a queued job commits the lot along with it
+        job = add_lot_spots(lot, 1, lot.maximum_number_of_spots)
         db.session.commit()
-        flash('Parking lot created successfully!', 'success')
+        catalog.invalidate()
+        if job:
+            flash(f'Parking lot created! Its {lot.maximum_number_of_spots} spots are being added in the background '
+                  '(see Jobs).', 'success')
+        else:
+            lot_spots_changed(lot.id)
+            flash('Parking lot created successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
     
     return render_template('create_lot.html')
 
+@app.route('/import_lots', methods=['GET', 'POST'])
+@login_required
+def import_lots():
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    if request.method == 'POST':
+        upload = request.files.get('lot_file')
+        if not upload or not upload.filename:
+            flash('Please choose a CSV or JSON file to import.', 'error')
+            return render_template('import_lots.html')
+        
+        try:
+            records = provisioning.read_lot_file(upload.filename, upload.read())
+        except provisioning.LotImportError as e:
+            flash(str(e), 'error')
+            return render_template('import_lots.html')
+        
+        # Imports aren't idempotent, so a failed one is left for an admin to look at
+        job_queue.enqueue('import_lots', created_by=current_user.id, max_attempts=1, records=records,
+                          message=f'Importing {len(records)} row(s) from {upload.filename}')
+        flash(f'Import of {len(records)} row(s) started; follow it on the Jobs page.', 'success')
+        return redirect(url_for('admin_jobs'))
+    
+    return render_template('import_lots.html')
+
 @app.route('/edit_lot/<int:lot_id>', methods=['GET', 'POST'])
 @login_required
 def edit_lot(lot_id):
@@ -524,34 +1226,35 @@ def edit_lot(lot_id):
         lot.price = float(request.form['price'])
         
         new_max_spots = int(request.form['max_spots'])
-        current_spots = len(lot.spots)
+        current_spots = ParkingSpot.query.filter_by(lot_id=lot.id).count()
+        job = None
         
         if new_max_spots > current_spots:
             # Add new spots
-            for i in range(current_spots + 1, new_max_spots + 1):
-                spot = ParkingSpot(
-                    lot_id=lot.id,
-                    spot_number=f"A{i:03d}",
-                    status='A'
-                )
-                db.session.add(spot)
+            job = add_lot_spots(lot, current_spots + 1, new_max_spots)
         elif new_max_spots < current_spots:
             # Remove spots (only available ones)
             spots_to_remove = current_spots - new_max_spots
             available_spots = ParkingSpot.query.filter_by(
                 lot_id=lot.id, status='A'
-            ).limit(spots_to_remove).all()
+            ).filter(~advance_booking.has_upcoming_bookings()).limit(spots_to_remove).all()
             
             if len(available_spots) < spots_to_remove:
-                flash('Cannot reduce spots: some spots are occupied!', 'error')
+                flash('Cannot reduce spots: some spots are occupied or booked ahead!', 'error')
                 return render_template('edit_lot.html', lot=lot)
             
-            for spot in available_spots:
-                db.session.delete(spot)
+            # Their history moves to the archive first, so no reservation points at them
+            provisioning.delete_spots(available_spots)
         
         lot.maximum_number_of_spots = new_max_spots
         db.session.commit()
-        flash('Parking lot updated successfully!', 'success')
+        catalog.invalidate()
+        if job:
+            flash(f'Parking lot updated! {new_max_spots - current_spots} new spots are being added in the background '
+                  '(see Jobs).', 'success')
+        else:
+            lot_spots_changed(lot.id)
+            flash('Parking lot updated successfully!', 'success')
         return redirect(url_for('admin_dashboard'))
     
     return render_template('edit_lot.html', lot=lot)
@@ -564,8 +1267,8 @@ def delete_confirmation(lot_id):
     
     lot = ParkingLot.query.get_or_404(lot_id)
     
-    # Check if any spots are occupied
-    occupied_count = len([s for s in lot.spots if s.status == 'O'])
+    # Check if any spots are occupied or held for a waiter
+    occupied_count = len([s for s in lot.spots if s.status in ('O', 'H')])
     if occupied_count > 0:
         flash('Cannot delete lot: some spots are occupied!', 'error')
         return redirect(url_for('admin_dashboard'))
@@ -581,9 +1284,18 @@ def confirm_delete_lot():
     lot_id = request.form['lot_id']
     lot = ParkingLot.query.get_or_404(lot_id)
     
-    db.session.delete(lot)
-    db.session.commit()
+    blocker = lot_deletion_blocker(lot.id)
+    if blocker:
+        flash(blocker, 'error')
+        return redirect(url_for('admin_dashboard'))
+    
+    if ParkingSpot.query.filter_by(lot_id=lot.id).count() > app.config['JOB_INLINE_SPOTS']:
+        job_queue.enqueue('delete_lot', created_by=current_user.id, lot_id=lot.id,
+                          message=f'Deleting {lot.prime_location_name}')
+        flash('Parking lot is being deleted in the background (see Jobs).', 'success')
+        return redirect(url_for('admin_dashboard'))
     
+    delete_lot(lot)
     flash('Parking lot deleted successfully!', 'success')
     return redirect(url_for('admin_dashboard'))
 
@@ -595,7 +1307,8 @@ def spot_view(spot_id):
     
     spot = ParkingSpot.query.get_or_404(spot_id)
     
-    if spot.status == 'O':
+    # Spots marked occupied by a sensor have no booking to show
+    if spot.status == 'O' and spot.get_current_reservation():
         return redirect(url_for('spot_occupied', spot_id=spot_id))
     
     return render_template('spot_view.html', spot=spot)
@@ -614,9 +1327,8 @@ def spot_occupied(spot_id):
     
     # Calculate current estimated cost
     current_time = datetime.utcnow()
-    duration = current_time - reservation.parking_timestamp
-    est_hours = max(1, math.ceil(duration.total_seconds() / 3600))
-    est_cost = est_hours * spot.lot.price
+    est_hours = charged_hours_for(reservation.parking_timestamp, current_time)
+    est_cost = pricing.session_table(spot.lot, reservation.price_rates).cost(reservation.parking_timestamp, est_hours)
     
     return render_template('spot_occupied.html', 
                          spot=spot, 
@@ -635,8 +1347,8 @@ def delete_spot(spot_id):
     spot = ParkingSpot.query.get_or_404(spot_id)
     
     # Check if spot is currently occupied
-    if spot.status == 'O':
-        flash('Cannot delete spot: it is currently occupied!', 'error')
+    if spot.status in ('O', 'H'):
+        flash('Cannot delete spot: it is currently occupied or held!', 'error')
         return redirect(url_for('admin_dashboard'))
     
     # Check for active reservations
@@ -645,26 +1357,22 @@ def delete_spot(spot_id):
         flash('Cannot delete spot: it has active reservations!', 'error')
         return redirect(url_for('admin_dashboard'))
     
-    # Store the lot and reservation info before deletion
-    lot = spot.lot
-    reservation_count = len(spot.reservations)
+    if ParkingSpot.query.filter(ParkingSpot.id == spot.id, advance_booking.has_upcoming_bookings()).first():
+        flash('Cannot delete spot: it is booked ahead!', 'error')
+        return redirect(url_for('admin_dashboard'))
     
-    # Update all reservations to preserve historical data
-    for reservation in spot.reservations:
-        # Store spot and lot information in the reservation for historical purposes
-        reservation.spot_number = spot.spot_number
-        reservation.lot_name = lot.prime_location_name
-        # Set spot_id to None to break the relationship
-        reservation.spot_id = None
+    lot = spot.lot
     
-    # Now safe to delete the spot
-    db.session.delete(spot)
+    # Move the spot's history into the archive, which keeps the lot and spot
+    # names, so the reservations no longer point at the spot; then delete it
+    reservation_count = provisioning.delete_spots([spot])
     
     # Update lot max spots
     lot.maximum_number_of_spots -= 1
     
     try:
         db.session.commit()
+        lot_spots_changed(lot.id)
         if reservation_count > 0:
             flash(f'Parking spot deleted successfully! Historical data for {reservation_count} reservations preserved.', 'success')
         else:
@@ -685,77 +1393,21 @@ def user_analytics(user_id):
     
     user = User.query.get_or_404(user_id)
     
-    # Force refresh from database
-    db.session.refresh(user)
-    
-    # Get daily spending data grouped by location and date
-    daily_location_spending = {}
-    
-    for reservation in user.reservations:
-        if reservation.parking_cost and not reservation.is_active:
-            date_str = reservation.parking_timestamp.strftime('%Y-%m-%d')
-            location = reservation.spot.lot.prime_location_name
-            
-            if date_str not in daily_location_spending:
-                daily_location_spending[date_str] = {}
-            
-            if location not in daily_location_spending[date_str]:
-                daily_location_spending[date_str][location] = 0
-            
-            daily_location_spending[date_str][location] += reservation.parking_cost
-    
-    # Get all unique locations for consistent coloring
-    all_locations = set()
-    for day_data in daily_location_spending.values():
-        all_locations.update(day_data.keys())
-    all_locations = sorted(list(all_locations))
-    
-    # Prepare data for stacked chart
-    chart_data = {
-        'dates': sorted(daily_location_spending.keys()),
-        'locations': all_locations,
-        'spending_by_location': {}
-    }
-    
-    # Initialize spending arrays for each location
-    for location in all_locations:
-        chart_data['spending_by_location'][location] = []
-    
-    # Fill spending data for each date
-    for date in chart_data['dates']:
-        for location in all_locations:
-            amount = daily_location_spending.get(date, {}).get(location, 0)
-            chart_data['spending_by_location'][location].append(round(amount, 2))
-    
-    # Generate spending chart using matplotlib
-    spending_chart_url = ChartGenerator.generate_user_spending_chart(chart_data)
+    analytics = user_analytics_memo.get(user.id)
+    chart_data = analytics.spending_chart
     
-    # Monthly spending data for additional analysis
-    monthly_data = []
-    for i in range(12):
-        month_start = datetime.utcnow().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1)
-        
-        monthly_spending = db.session.query(func.sum(Reservation.parking_cost)).filter(
-            and_(
-                Reservation.user_id == user_id,
-                Reservation.parking_timestamp >= month_start,
-                Reservation.parking_timestamp < month_end,
-                Reservation.parking_cost.isnot(None),
-                Reservation.is_active == False
-            )
-        ).scalar() or 0
-        
-        monthly_data.append({
-            'month': month_start.strftime('%b %Y'),
-            'spending': round(monthly_spending, 2)
-        })
+    # Render the spending chart, or point the page at its JSON series
+    if ChartGenerator.client_side():
+        spending_chart_url = url_for('chart_series', chart='user_spending', user_id=user.id) if chart_data['dates'] else None
+    else:
+        spending_chart_url = ChartGenerator.generate_user_spending_chart(chart_data)
     
     return render_template('user_analytics.html',
                          user=user,
                          spending_chart_url=spending_chart_url,
                          chart_data=chart_data,
-                         monthly_data=list(reversed(monthly_data)))
+                         analytics=analytics,
+                         monthly_data=analytics.monthly_data)
 
 @app.route('/edit_profile', methods=['GET', 'POST'])
 @login_required
@@ -775,15 +1427,589 @@ def edit_profile():
             current_user.password = generate_password_hash(new_pw)
 
         db.session.commit()
+        user_changed(current_user.id)
         flash('Profile updated successfully!', 'success')
         return redirect(url_for('user_dashboard'))
 
     return render_template('edit_profile.html')
 
+@app.route('/metrics')
+@login_required
+def metrics_endpoint():
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+# ═══════════════════════════════════════════════════════════════
+# AVAILABILITY API ROUTES
+# ═══════════════════════════════════════════════════════════════
+
+@app.route('/api/availability')
+@login_required
+def availability_all_lots():
+    """Live spot counts for every lot, straight from the shared spot table"""
+    if spot_table is None:
+        stats = {lot.id: lot.get_occupancy_stats() for lot in ParkingLot.query.all()}
+    else:
+        if not spot_table.built:
+            spot_table.rebuild()
+        stats = spot_table.all_lot_stats()
+    return jsonify([dict(lot_id=lot_id, **lot_stats) for lot_id, lot_stats in sorted(stats.items())])
+
+@app.route('/api/availability/<int:lot_id>')
+@login_required
+def availability_lot(lot_id):
+    stats = spot_table.lot_stats(lot_id) if spot_table is not None and spot_table.built else None
+    if stats is None:
+        stats = ParkingLot.query.get_or_404(lot_id).get_occupancy_stats()
+    return jsonify(dict(lot_id=lot_id, **stats))
+
+@app.route('/api/availability/<int:lot_id>/free_spot')
+@login_required
+def free_spot_for_window(lot_id):
+    """A spot in the lot with no advance booking in [start, end) (UTC ISO times)"""
+    try:
+        start = parse_utc_time(request.args['start'])
+        end = parse_utc_time(request.args['end'])
+    except (KeyError, ValueError):
+        return jsonify({'error': 'start and end must be ISO timestamps'}), 400
+    if end <= start:
+        return jsonify({'error': 'end must be after start'}), 400
+    
+    bookings.sync()
+    bookings.ensure_lot(lot_id)
+    spot_id = bookings.find_free_spot(lot_id, start, end)
+    spot = db.session.get(ParkingSpot, spot_id) if spot_id is not None else None
+    if spot_id is not None and spot is None:
+        # Deleted by another worker since this one loaded the lot
+        bookings.reload_lots([lot_id])
+        spot_id = bookings.find_free_spot(lot_id, start, end)
+        spot = db.session.get(ParkingSpot, spot_id) if spot_id is not None else None
+    if spot is None:
+        return jsonify({'error': 'no spot is free for that window'}), 404
+    return jsonify({'lot_id': lot_id, 'spot_id': spot_id, 'spot_number': spot.spot_number,
+                    'start': start.isoformat(), 'end': end.isoformat()})
+
+# ═══════════════════════════════════════════════════════════════
+# FORECAST API ROUTES
+# ═══════════════════════════════════════════════════════════════
+
+@app.route('/api/forecast')
+@login_required
+def forecast_all_lots():
+    try:
+        when = parse_forecast_time(request.args.get('at'))
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO timestamp'}), 400
+    
+    refresh_forecasts_if_stale()
+    lots = ParkingLot.query.all()
+    forecasts = forecasting.expected_availability(lots, when, lot_occupancy)
+    return jsonify(list(forecasts.values()))
+
+@app.route('/api/forecast/<int:lot_id>')
+@login_required
+def forecast_lot(lot_id):
+    lot = ParkingLot.query.get_or_404(lot_id)
+    try:
+        when = parse_forecast_time(request.args.get('at'))
+    except ValueError:
+        return jsonify({'error': 'at must be an ISO timestamp'}), 400
+    
+    refresh_forecasts_if_stale()
+    forecasts = forecasting.expected_availability([lot], when, lot_occupancy)
+    return jsonify(forecasts[lot.id])
+
+@app.route('/api/heatmaps')
+@login_required
+def heatmap_all_lots():
+    """Average share of each lot's spots occupied per hour of the week (UTC, Monday 00:00 first)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'admin only'}), 403
+    
+    lots, heat = lot_heatmaps()
+    return jsonify([{
+        'lot_id': lot.id,
+        'name': lot.prime_location_name,
+        'capacity': lot.maximum_number_of_spots,
+        'occupancy': np.round(row, 3).tolist()
+    } for lot, row in zip(lots, heat)])
+
+@app.route('/api/heatmaps/<int:lot_id>')
+@login_required
+def heatmap_lot_spots(lot_id):
+    """Share of the last ?weeks= weeks each spot was occupied per hour of the day (UTC)"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'admin only'}), 403
+    
+    lot = ParkingLot.query.get_or_404(lot_id)
+    weeks = heatmap_weeks()
+    spots, heat = spot_heatmaps(lot, weeks)
+    return jsonify({
+        'lot_id': lot.id,
+        'weeks': weeks,
+        'spots': [{
+            'spot_id': spot.id,
+            'spot_number': spot.spot_number,
+            'occupancy': np.round(row, 3).tolist()
+        } for spot, row in zip(spots, heat)]
+    })
+
+# ═══════════════════════════════════════════════════════════════
+# CHART API ROUTES
+# ═══════════════════════════════════════════════════════════════
+
+@app.route('/api/charts/<chart>')
+@login_required
+def chart_series(chart):
+    """Chart data as JSON, for drawing the charts in the browser"""
+    if chart in ('occupancy', 'revenue'):
+        if not current_user.is_admin:
+            return jsonify({'error': 'admin only'}), 403
+        data = admin_chart_data()
+        if chart == 'occupancy':
+            return jsonify(ChartGenerator.occupancy_matrix_series(
+                data['dates'], data['lots'], data['occupied'], data['capacity']))
+        return jsonify(ChartGenerator.revenue_matrix_series(data['dates'], data['lots'], data['revenue']))
+    
+    if chart not in ('user_location', 'user_duration', 'user_spending'):
+        return jsonify({'error': f'unknown chart {chart}'}), 404
+    
+    # Users see their own charts; admins may ask for anyone's
+    user = current_user
+    user_id = request.args.get('user_id', type=int)
+    if user_id is not None and user_id != current_user.id:
+        if not current_user.is_admin:
+            return jsonify({'error': 'admin only'}), 403
+        user = User.query.get_or_404(user_id)
+    
+    analytics = user_analytics_memo.get(user.id)
+    if chart == 'user_spending':
+        return jsonify(ChartGenerator.user_spending_series(analytics.spending_chart))
+    if chart == 'user_location':
+        return jsonify(ChartGenerator.user_location_series(analytics.location_bookings))
+    return jsonify(ChartGenerator.user_duration_series(analytics.duration_data))
+
+# ═══════════════════════════════════════════════════════════════
+# LIVE UPDATE ROUTES
+# ═══════════════════════════════════════════════════════════════
+
+@app.route('/events')
+@login_required
+def live_events_stream():
+    """Server-sent event stream of the user's notifications"""
+    user_id = current_user.id
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('after', type=int)
+    if last_id is None:
+        last_id = live.latest_id(user_id)
+    return Response(stream_with_context(live.stream(user_id, last_id)),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/api/events')
+@login_required
+def live_events_poll():
+    """Polling fallback for /events: the user's notifications after ?after=<id>"""
+    after = request.args.get('after', type=int)
+    if after is None:
+        return jsonify({'events': [], 'last_id': live.latest_id(current_user.id)})
+    events = live.events_after(current_user.id, after)
+    return jsonify({'events': events, 'last_id': events[-1]['id'] if events else after})
+
+# ═══════════════════════════════════════════════════════════════
+# SPOT MAP API ROUTES
+# ═══════════════════════════════════════════════════════════════
+
+def spot_map_response(body, status=200, mimetype='application/json', **headers):
+    """A spot map API response, readable from the AR client's origin"""
+    response = Response(body, status=status, mimetype=mimetype, headers=headers)
+    origin = app.config['SPOT_MAP_CORS_ORIGIN']
+    if origin:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Expose-Headers'] = 'ETag'
+    return response
+
+def requested_tag(name='since'):
+    """The tag a client already holds, from ?since= or If-None-Match"""
+    tag = request.args.get(name)
+    if tag is None and request.if_none_match:
+        tag = next(iter(request.if_none_match), None)
+    return tag
+
+def spot_map_lot_or_404(lot_id):
+    """404 for unknown lots; known ones are found in the lot catalog, so polls cost no query"""
+    if catalog.get(lot_id) is None and db.session.get(ParkingLot, lot_id) is None:
+        abort(404)
+
+@app.route('/api/spot_map/<int:lot_id>/layout')
+def spot_map_layout(lot_id):
+    """Spot numbers and positions of a lot; changes only when spots are added or removed"""
+    spot_map_lot_or_404(lot_id)
+    layout = spot_maps.layout(lot_id)
+    etag = f'"{layout.tag}"'
+    if requested_tag('tag') == layout.tag:
+        return spot_map_response(b'', 304, ETag=etag)
+    # Clients revalidate with If-None-Match, so a changed layout is never served stale
+    return spot_map_response(layout.body, ETag=etag, **{'Cache-Control': 'no-cache'})
+
+@app.route('/api/spot_map/<int:lot_id>/status')
+def spot_map_status(lot_id):
+    """Spot statuses in layout order, as a delta from ?since=<tag> when possible"""
+    spot_map_lot_or_404(lot_id)
+    tag, payload = spot_maps.status(lot_id, requested_tag())
+    etag = f'"{tag}"'
+    if payload is None:
+        return spot_map_response(b'', 304, ETag=etag)
+    return spot_map_response(json.dumps(payload, separators=(',', ':')), ETag=etag,
+                             **{'Cache-Control': 'no-cache'})
+
+@app.route('/api/spot_map/<int:lot_id>/stream')
+def spot_map_stream(lot_id):
+    """Server-sent event stream of the lot's status deltas"""
+    spot_map_lot_or_404(lot_id)
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    return spot_map_response(stream_with_context(spot_maps.stream(lot_id, since)), mimetype='text/event-stream',
+                             **{'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ═══════════════════════════════════════════════════════════════
+# SENSOR API ROUTES
+# ═══════════════════════════════════════════════════════════════
+
+@app.route('/api/sensor/update', methods=['POST'])
+def sensor_update():
+    """Status report from an IR / ultrasonic sensor (see IR_Sensor.ino)"""
+    api_key = app.config['SENSOR_API_KEY']
+    if api_key and request.headers.get('X-Sensor-Key') != api_key:
+        return jsonify({'error': 'invalid sensor key'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    device_id = device_registry.normalize_device_id(data.get('device_id'))
+    status = data.get('status')
+    if not device_id or status not in ('A', 'O'):
+        return jsonify({'error': "device_id and status ('A' or 'O') are required"}), 400
+    
+    spot = device_registry.resolve_spot(data.get('spot_id'), data.get('lot_name'), data.get('spot_number'))
+    if spot is None:
+        return jsonify({'error': 'unknown spot'}), 404
+    
+    if devices.record_report(device_id, spot, status):
+        spots_freed(spot.lot_id)
+    
+    return jsonify({'device_id': device_id, 'spot_id': spot.id, 'status': spot.status})
+
+@app.route('/api/sensor/frames', methods=['POST'])
+def sensor_frames_ingest():
+    """Batch of binary status frames from sensors or a gateway (see app/sensor_frames.py)"""
+    api_key = app.config['SENSOR_API_KEY']
+    if api_key and request.headers.get('X-Sensor-Key') != api_key:
+        return jsonify({'error': 'invalid sensor key'}), 403
+    
+    max_frames = app.config['SENSOR_MAX_FRAMES']
+    if (request.content_length or 0) > sensor_frames.HEADER.size + max_frames * sensor_frames.FRAME.size:
+        return jsonify({'error': f'at most {max_frames} frames per request'}), 413
+    
+    try:
+        frames = sensor_frames.decode_frames(request.get_data(cache=False))
+    except sensor_frames.FrameError as e:
+        return jsonify({'error': str(e)}), 400
+    if len(frames) > max_frames:
+        return jsonify({'error': f'at most {max_frames} frames per request'}), 413
+    
+    readings, invalid = sensor_frames.readings_from_frames(frames)
+    accepted, lot_ids = devices.record_reports(readings)
+    if lot_ids:
+        spots_freed(*lot_ids)
+    
+    return jsonify({
+        'frames': len(frames),
+        'accepted': accepted,
+        'rejected': invalid + len(readings) - accepted,  # bad status, unknown spot or older than the last report
+        'changed_lots': lot_ids
+    })
+
+# ═══════════════════════════════════════════════════════════════
+# BACKGROUND JOBS
+# ═══════════════════════════════════════════════════════════════
+
+@job_queue.handler('create_spots')
+def create_spots_job(ctx, lot_id, first, last):
+    """Create a lot's spots first..last a chunk at a time, resuming after a retry"""
+    if db.session.get(ParkingLot, lot_id) is None:
+        raise jobs.JobError(f'Lot {lot_id} no longer exists')
+    # Spots are numbered on from the lot's count, so a retry skips the chunks already committed
+    start = max(first, ParkingSpot.query.filter_by(lot_id=lot_id).count() + 1)
+    total = last - first + 1
+    for chunk_start in range(start, last + 1, provisioning.SPOT_CHUNK_SIZE):
+        chunk_end = min(chunk_start + provisioning.SPOT_CHUNK_SIZE - 1, last)
+        provisioning.bulk_create_spots(lot_id, chunk_start, chunk_end)
+        ctx.progress((chunk_end - first + 1) / total, f'{chunk_end - first + 1} of {total} spots created')
+    lot_spots_changed(lot_id)
+    return {'created': last - start + 1}
+
+@job_queue.handler('delete_lot')
+def delete_lot_job(ctx, lot_id):
+    """Delete a lot that was free to delete when the job was queued"""
+    lot = db.session.get(ParkingLot, lot_id)
+    if lot is None:
+        return {'deleted': False}
+    blocker = lot_deletion_blocker(lot_id)
+    if blocker:
+        raise jobs.JobError(blocker)
+    ctx.progress(0.1, f'Deleting {lot.prime_location_name}')
+    delete_lot(lot)
+    return {'deleted': True}
+
+@job_queue.handler('import_lots')
+def import_lots_job(ctx, records):
+    """Create lots and spots from the rows of an uploaded file"""
+    lots_created, spots_created, errors = provisioning.import_lots(
+        records, progress=lambda done, total: ctx.progress(done / total, f'{done} of {total} lot(s) created'))
+    catalog.invalidate()
+    if spot_table is not None:
+        spot_table.rebuild()
+    bookings.load()
+    ctx.progress(1.0, f'Imported {lots_created} lot(s) with {spots_created} spot(s)'
+                      + (f'; {len(errors)} row(s) skipped' if errors else ''))
+    return {'lots': lots_created, 'spots': spots_created, 'errors': errors[:100]}
+
+@job_queue.handler('refresh_forecasts')
+def refresh_forecasts_job(ctx):
+    """Fold new reservations into the occupancy forecasts"""
+    processed = forecasting.refresh_forecasts()
+    pricing.invalidate_all()
+    ctx.progress(1.0, f'Forecasts refreshed from {processed} reservation(s)')
+    return {'reservations': processed}
+
+@job_queue.handler('archive_reservations')
+def archive_reservations_job(ctx):
+    """Move completed reservations past the retention window into the archive"""
+    moved = archive_old_reservations()
+    ctx.progress(1.0, f'Archived {moved} reservation(s)')
+    return {'archived': moved}
+
+# Jobs admins can start from the jobs page
+MANUAL_JOBS = {
+    'refresh_forecasts': 'Refresh forecasts',
+    'archive_reservations': 'Archive old reservations',
+}
+
+def job_summary(job):
+    return {
+        'id': job.id, 'kind': job.kind, 'status': job.status, 'progress': job.progress,
+        'message': job.message, 'attempts': job.attempts, 'max_attempts': job.max_attempts,
+    }
+
+@app.route('/admin_jobs')
+@login_required
+def admin_jobs():
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    recent = Job.query.order_by(Job.id.desc()).limit(100).all()
+    return render_template('admin_jobs.html', jobs=recent, manual_jobs=MANUAL_JOBS,
+                           pending=sum(job.active for job in recent))
+
+@app.route('/admin_jobs/start', methods=['POST'])
+@login_required
+def start_job():
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    kind = request.form.get('kind')
+    if kind not in MANUAL_JOBS:
+        flash('Unknown job.', 'error')
+    else:
+        job_queue.enqueue(kind, created_by=current_user.id, message='Waiting for a worker')
+        flash(f'{MANUAL_JOBS[kind]} queued.', 'success')
+    return redirect(url_for('admin_jobs'))
+
+@app.route('/admin_jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    if job_queue.cancel(job_id):
+        flash('Job cancelled.', 'success')
+    else:
+        flash('Only jobs that have not started can be cancelled.', 'error')
+    return redirect(url_for('admin_jobs'))
+
+@app.route('/admin_jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def retry_job(job_id):
+    if not current_user.is_admin:
+        return redirect(url_for('user_dashboard'))
+    
+    if job_queue.retry(job_id):
+        flash('Job queued again.', 'success')
+    else:
+        flash('Only failed jobs can be retried.', 'error')
+    return redirect(url_for('admin_jobs'))
+
+@app.route('/api/jobs')
+@login_required
+def job_status():
+    """Progress of the given jobs (?ids=1,2,3), for the jobs page to poll"""
+    if not current_user.is_admin:
+        return jsonify({'error': 'admin only'}), 403
+    ids = [int(i) for i in request.args.get('ids', '').split(',') if i.strip().isdigit()]
+    return jsonify({'jobs': [job_summary(job) for job in Job.query.filter(Job.id.in_(ids))]})
+
+# ═══════════════════════════════════════════════════════════════
+# MANAGEMENT COMMANDS  (python app.py <command>)
+# ═══════════════════════════════════════════════════════════════
+
+@app.cli.command('refresh-forecasts')
+def refresh_forecasts_command():
+    """Fold new reservations into the occupancy forecasts"""
+    processed = forecasting.refresh_forecasts()
+    pricing.invalidate_all()
+    print(f"Forecasts refreshed from {processed} reservation(s).")
+
+@app.cli.command('import-lots')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+def import_lots_command(path):
+    """Create lots and spots from a CSV or JSON file"""
+    with open(path, 'rb') as f:
+        records = provisioning.read_lot_file(path, f.read())
+    
+    lots_created, spots_created, errors = provisioning.import_lots(records)
+    catalog.invalidate()
+    if spot_table is not None:
+        spot_table.rebuild()
+    print(f"Imported {lots_created} lot(s) with {spots_created} spot(s).")
+    for row_number, message in errors:
+        print(f"  row {row_number} skipped: {message}")
+
+@app.cli.command('archive-reservations')
+@click.option('--older-than-days', type=int, default=None,
+              help='Archive completed sessions that ended more than this many days ago.')
+@click.option('--chunk-size', type=int, default=archival.ARCHIVE_CHUNK_SIZE,
+              help='Reservations moved per transaction.')
+def archive_reservations_command(older_than_days, chunk_size):
+    """Move old completed reservations into the monthly archive tables"""
+    if older_than_days is None:
+        cutoff = datetime.utcnow() - app.config['ARCHIVE_AFTER']
+    else:
+        cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    moved = archival.archive_reservations(cutoff, chunk_size=chunk_size)
+    print(f"Archived {moved} reservation(s) that ended before {cutoff:%Y-%m-%d}.")
+
+@app.cli.command('reconcile-sessions')
+@click.option('--watch', is_flag=True, help='Keep reconciling every SESSION_RECONCILE_INTERVAL seconds.')
+def reconcile_sessions_command(watch):
+    """Release sessions on spots the sensors see empty, and sessions over the time limit"""
+    if watch:
+        run_forever(app, app.config['SESSION_RECONCILE_INTERVAL'], reconciler.run, 'session-reconciler')
+    closed = reconciler.run()
+    print(f"Released {closed['vacant']} session(s) on empty spots and {closed['overdue']} overdue session(s).")
+
+@app.cli.command('check-sensors')
+@click.option('--watch', is_flag=True, help='Keep checking every SENSOR_CHECK_INTERVAL seconds.')
+def check_sensors_command(watch):
+    """Flag sensors that stopped reporting and show their spots as unknown"""
+    if watch:
+        run_forever(app, app.config['SENSOR_CHECK_INTERVAL'], devices.check, 'device-monitor')
+    flagged = devices.check()
+    print(f"Flagged {flagged} silent sensor(s).")
+
+@app.cli.command('check-waitlists')
+@click.option('--watch', is_flag=True, help='Keep checking every WAITLIST_CHECK_INTERVAL seconds.')
+def check_waitlists_command(watch):
+    """Pass lapsed waitlist holds on and serve waiters from freed spots"""
+    if watch:
+        run_forever(app, app.config['WAITLIST_CHECK_INTERVAL'], check_waitlists, 'waitlist')
+    check_waitlists()
+    print("Waitlists checked.")
+
+@app.cli.command('prune-history')
+def prune_history_command():
+    """Delete live update events and finished jobs past their retention"""
+    events, finished = prune_history()
+    print(f"Pruned {events} event(s) and {finished} finished job(s).")
+
+@app.cli.command('run-scheduler')
+def run_scheduler_command():
+    """Run every periodic maintenance task until stopped (for WSGI deployments)"""
+    tasks = maintenance_tasks()
+    print("Running " + ', '.join(name for _, _, name in tasks) + ". Press Ctrl+C to stop.")
+    run_all(app, tasks)
+
+@app.cli.command('rebuild-spot-table')
+def rebuild_spot_table_command():
+    """Reload the shared spot status table from the database"""
+    if spot_table is None:
+        print("SPOT_TABLE is disabled.")
+        return
+    spot_table.rebuild()
+    print(f"Spot table {spot_table.name} rebuilt with {len(spot_table.all_lot_stats())} lot(s).")
+
+def run_job_worker(once=False):
+    """Body of one `run-jobs` worker process"""
+    with app.app_context():
+        # Connections inherited from the parent process must not be shared
+        db.engine.dispose(close=False)
+        if once:
+            job_queue.run_pending()
+            return
+    job_queue.work(app)
+
+@app.cli.command('run-jobs')
+@click.option('--workers', type=int, default=1, help='Worker processes to start.')
+@click.option('--once', is_flag=True, help='Exit once the queue is empty instead of waiting for more jobs.')
+def run_jobs_command(workers, once):
+    """Run queued background jobs (lot builds, deletes, imports...)"""
+    if workers <= 1:
+        run_job_worker(once)
+        return
+    import multiprocessing
+    processes = [multiprocessing.Process(target=run_job_worker, args=(once,), name=f'job-worker-{n}')
+                 for n in range(workers)]
+    for process in processes:
+        process.start()
+    print(f"Started {workers} job worker(s).")
+    for process in processes:
+        process.join()
+
+def maintenance_tasks():
+    """(interval_seconds, func, name) of the database-wide periodic tasks.
+
+    Any one process can run them: the development server's threads, or
+    `python app.py run-scheduler` next to a WSGI server.
+    """
+    return [
+        (app.config['ARCHIVE_INTERVAL'].total_seconds(), archive_old_reservations, 'archiver'),
+        (app.config['SENSOR_CHECK_INTERVAL'], devices.check, 'device-monitor'),
+        (app.config['WAITLIST_CHECK_INTERVAL'], check_waitlists, 'waitlist'),
+        (3600, prune_history, 'prune-history'),
+        (app.config['SESSION_RECONCILE_INTERVAL'], reconciler.run, 'session-reconciler'),
+    ]
+
+def start_background_tasks():
+    """Start periodic maintenance threads for the development server"""
+    for interval_seconds, func, name in maintenance_tasks():
+        run_every(app, interval_seconds, func, name)
+    # The order book is per process; WSGI workers sync it whenever they use it
+    run_every(app, app.config['MARKET_SYNC_INTERVAL'], market.sync, 'market-sync')
+    if app.config['JOB_WORKER_THREAD']:
+        run_every(app, app.config['JOB_POLL_INTERVAL'], job_queue.run_pending, 'jobs')
+
 # ═══════════════════════════════════════════════════════════════
 # APPLICATION STARTUP
 # ═══════════════════════════════════════════════════════════════
 
 if __name__ == '__main__':
     init_database()
-    app.run(debug=True)
+    if len(sys.argv) > 1:
+        # `flask --app` would import the app/ package instead of this file,
+        # so management commands are run through this script instead
+        app.cli.main(args=sys.argv[1:], obj=ScriptInfo(create_app=lambda: app))
+    else:
+        # With the reloader on, only the child process that serves requests runs the tasks
+        if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+            start_background_tasks()
+        app.run(debug=True)
@@ -0,0 +1,351 @@
+# Advance bookings and the per-spot interval index
+#
+# Bookings on one spot never overlap, so each spot's upcoming bookings are
+# kept as parallel lists of start and end times sorted by start; the ends
+# are then sorted too, and "does [start, end) clash with anything?" is a
+# single bisect. Each lot also keeps the set of its spots with nothing
+# booked, which answers "any free spot in lot X for [t1, t2)?" in O(1) in
+# the common case, falling back to one bisect per booked spot.
+#
+# Every worker holds its own index, loaded from the database on first use
+# and kept current by re-reading bookings whose updated_at moved (the same
+# watermark pattern the sensor registry uses). The index only proposes a
+# spot: a new booking is written, then checked against the database before
+# it is committed, so a stale index can never double-book a spot.
+import itertools
+import threading
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from sqlalchemy import exists, update
+from app.models import db, ParkingSpot, AdvanceBooking
+
+BOOKED = 'booked'
+CHECKED_IN = 'checked_in'
+CANCELLED = 'cancelled'
+
+# Bookings in these states keep their spot's window blocked
+BLOCKING = (BOOKED, CHECKED_IN)
+
+# How often a worker re-reads bookings changed by other workers
+SYNC_INTERVAL = timedelta(seconds=2)
+
+# Bookings committed by other workers may carry a slightly older updated_at
+SYNC_MARGIN = timedelta(seconds=60)
+
+# Spot membership of every lot is reloaded this often (and on lot changes)
+RELOAD_INTERVAL = timedelta(minutes=10)
+
+# How early before its window a booking can be checked in
+CHECK_IN_EARLY = timedelta(minutes=15)
+
+class BookingError(Exception):
+    """Raised when a booking can't be made; the message is shown to the user"""
+
+# ═══════════════════════════════════════════════════════════════
+# PER-SPOT SCHEDULE
+# ═══════════════════════════════════════════════════════════════
+
+class SpotSchedule:
+    """Non-overlapping [start, end) intervals on one spot, sorted by start"""
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def conflicts(self, start, end):
+        """True if [start, end) overlaps any interval"""
+        # First interval that ends after `start`; it clashes if it starts before `end`
+        i = bisect_right(self.ends, start)
+        return i < len(self.starts) and self.starts[i] < end
+
+    def add(self, booking_id, start, end):
+        i = bisect_left(self.starts, start)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+        self.ids.insert(i, booking_id)
+
+    def remove(self, booking_id):
+        i = self.ids.index(booking_id)
+        del self.starts[i], self.ends[i], self.ids[i]
+
+    def next_start(self, after):
+        """Start of the first interval beginning at or after `after`, or None"""
+        i = bisect_left(self.starts, after)
+        return self.starts[i] if i < len(self.starts) else None
+
+    def prune(self, before):
+        """Drop intervals that ended by `before`; returns the dropped ids"""
+        i = bisect_right(self.ends, before)
+        dropped = self.ids[:i]
+        del self.starts[:i], self.ends[:i], self.ids[:i]
+        return dropped
+
+# ═══════════════════════════════════════════════════════════════
+# BOOKING INDEX
+# ═══════════════════════════════════════════════════════════════
+
+class BookingIndex:
+    """Upcoming advance bookings of every spot, grouped by lot"""
+
+    def __init__(self):
+        self.schedules = {}   # spot_id -> SpotSchedule (only spots with bookings)
+        self.lot_of = {}      # spot_id -> lot_id
+        self.lot_spots = {}   # lot_id -> set of spot ids
+        self.clear = {}       # lot_id -> spot ids with nothing booked
+        self.spot_of = {}     # booking id -> spot_id
+        self.loaded = False
+        self.synced_until = None
+        self.last_sync = None
+        self.last_reload = None
+        self._lock = threading.RLock()
+
+    # Loading and syncing
+
+    def _set_spots(self, rows, lot_ids=None):
+        """Replace lot membership for some lots (or all) from (spot_id, lot_id) rows"""
+        if lot_ids is None:
+            self.lot_of, self.lot_spots = {}, {}
+        else:
+            for lot_id in lot_ids:
+                for spot_id in self.lot_spots.pop(lot_id, ()):
+                    self.lot_of.pop(spot_id, None)
+        for spot_id, lot_id in rows:
+            self.lot_of[spot_id] = lot_id
+            self.lot_spots.setdefault(lot_id, set()).add(spot_id)
+        for lot_id in (self.lot_spots if lot_ids is None else lot_ids):
+            spots = self.lot_spots.get(lot_id, set())
+            self.clear[lot_id] = {s for s in spots if s not in self.schedules}
+            if not spots:
+                self.clear.pop(lot_id, None)
+
+    def _apply(self, booking_id, spot_id, start, end, status, now):
+        """Bring one booking's index entry in line with its database row"""
+        old_spot = self.spot_of.pop(booking_id, None)
+        if old_spot is not None:
+            schedule = self.schedules[old_spot]
+            schedule.remove(booking_id)
+            if not schedule:
+                self._spot_cleared(old_spot)
+        if status in BLOCKING and end > now:
+            schedule = self.schedules.get(spot_id)
+            if schedule is None:
+                schedule = self.schedules[spot_id] = SpotSchedule()
+                lot_id = self.lot_of.get(spot_id)
+                if lot_id is not None:
+                    self.clear[lot_id].discard(spot_id)
+            schedule.add(booking_id, start, end)
+            self.spot_of[booking_id] = spot_id
+
+    def _spot_cleared(self, spot_id):
+        del self.schedules[spot_id]
+        lot_id = self.lot_of.get(spot_id)
+        if lot_id is not None:
+            self.clear[lot_id].add(spot_id)
+
+    def _booking_rows(self, query):
+        return query.with_entities(
+            AdvanceBooking.id, AdvanceBooking.spot_id, AdvanceBooking.start_time,
+            AdvanceBooking.end_time, AdvanceBooking.status).all()
+
+    def load(self, now=None):
+        """Rebuild the whole index from the database (two queries)"""
+        now = now or datetime.utcnow()
+        spot_rows = db.session.query(ParkingSpot.id, ParkingSpot.lot_id).all()
+        booking_rows = self._booking_rows(AdvanceBooking.query.filter(
+            AdvanceBooking.status.in_(BLOCKING), AdvanceBooking.end_time > now))
+        with self._lock:
+            self.schedules, self.spot_of, self.clear = {}, {}, {}
+            self._set_spots(spot_rows)
+            for booking_id, spot_id, start, end, status in sorted(booking_rows, key=lambda r: r[2]):
+                self._apply(booking_id, spot_id, start, end, status, now)
+            self.loaded = True
+            self.synced_until = self.last_sync = self.last_reload = now
+
+    def reload_lots(self, lot_ids):
+        """Re-read which spots belong to these lots (after spots were added or removed)"""
+        if not self.loaded:
+            return
+        rows = db.session.query(ParkingSpot.id, ParkingSpot.lot_id).filter(
+            ParkingSpot.lot_id.in_(list(lot_ids))).all()
+        with self._lock:
+            self._set_spots(rows, list(lot_ids))
+
+    def ensure_lot(self, lot_id):
+        """Load a lot created by another worker since the last reload"""
+        if lot_id not in self.lot_spots:
+            self.reload_lots([lot_id])
+
+    def sync(self, now=None, force=False):
+        """Pick up bookings created or changed by other workers"""
+        now = now or datetime.utcnow()
+        if not self.loaded or now - self.last_reload >= RELOAD_INTERVAL:
+            self.load(now)
+            return
+        if not force and now - self.last_sync < SYNC_INTERVAL:
+            return
+        rows = self._booking_rows(AdvanceBooking.query.filter(
+            AdvanceBooking.updated_at >= self.synced_until - SYNC_MARGIN))
+        with self._lock:
+            for booking_id, spot_id, start, end, status in rows:
+                self._apply(booking_id, spot_id, start, end, status, now)
+            self.prune(now)
+            self.synced_until = self.last_sync = now
+
+    def prune(self, now):
+        """Forget bookings whose window has passed"""
+        with self._lock:
+            for spot_id in list(self.schedules):
+                schedule = self.schedules[spot_id]
+                for booking_id in schedule.prune(now):
+                    del self.spot_of[booking_id]
+                if not schedule:
+                    self._spot_cleared(spot_id)
+
+    def record(self, booking, now=None):
+        """Apply a booking this worker just committed"""
+        with self._lock:
+            self._apply(booking.id, booking.spot_id, booking.start_time, booking.end_time,
+                        booking.status, now or datetime.utcnow())
+
+    # Queries
+
+    def is_free(self, spot_id, start, end):
+        schedule = self.schedules.get(spot_id)
+        return schedule is None or not schedule.conflicts(start, end)
+
+    def free_spots(self, lot_id, start, end, exclude=()):
+        """Spots of a lot free for [start, end): never-booked spots first"""
+        with self._lock:
+            clear = list(self.clear.get(lot_id, ()))
+            booked = [s for s in self.lot_spots.get(lot_id, ()) if s in self.schedules]
+        for spot_id in clear:
+            if spot_id not in exclude:
+                yield spot_id
+        for spot_id in booked:
+            if spot_id not in exclude and self.is_free(spot_id, start, end):
+                yield spot_id
+
+    def find_free_spot(self, lot_id, start, end, exclude=()):
+        """Any spot in the lot free for [start, end), or None"""
+        with self._lock:
+            for spot_id in self.clear.get(lot_id, ()):
+                if spot_id not in exclude:
+                    return spot_id
+            for spot_id in self.lot_spots.get(lot_id, ()):
+                if spot_id not in exclude and spot_id in self.schedules and self.is_free(spot_id, start, end):
+                    return spot_id
+        return None
+
+    def walk_in_spot(self, spot_ids, now):
+        """Of these available spots, the one whose next booking is furthest away.
+
+        Spots with nothing booked ahead win outright; spots booked right now are skipped.
+        """
+        best, best_start = None, None
+        for spot_id in spot_ids:
+            schedule = self.schedules.get(spot_id)
+            if schedule is None:
+                return spot_id
+            if schedule.conflicts(now, now + timedelta(seconds=1)):
+                continue
+            next_start = schedule.next_start(now)
+            if next_start is None:
+                # Only bookings that are over, not pruned yet
+                return spot_id
+            if best is None or next_start > best_start:
+                best, best_start = spot_id, next_start
+        return best
+
+# ═══════════════════════════════════════════════════════════════
+# DATABASE HELPERS
+# ═══════════════════════════════════════════════════════════════
+
+def overlapping(spot_id, start, end, exclude_id=None):
+    """Blocking bookings on a spot that overlap [start, end)"""
+    query = AdvanceBooking.query.filter(
+        AdvanceBooking.spot_id == spot_id,
+        AdvanceBooking.status.in_(BLOCKING),
+        AdvanceBooking.start_time < end,
+        AdvanceBooking.end_time > start)
+    if exclude_id is not None:
+        query = query.filter(AdvanceBooking.id != exclude_id)
+    return query
+
+def has_upcoming_bookings():
+    """SQL condition: a spot has a booking that is not over yet (for filters)"""
+    return exists().where(
+        AdvanceBooking.spot_id == ParkingSpot.id,
+        AdvanceBooking.status.in_(BLOCKING),
+        AdvanceBooking.end_time > datetime.utcnow())
+
+def create_booking(index, user_id, lot_id, start, end, plate, color, attempts=3):
+    """Book any free spot in a lot for [start, end). Raises BookingError."""
+    now = datetime.utcnow()
+    index.sync(now)
+    index.ensure_lot(lot_id)
+    tried = set()
+    for _ in range(attempts):
+        spot_id = index.find_free_spot(lot_id, start, end, exclude=tried)
+        if spot_id is None:
+            break
+        tried.add(spot_id)
+        if db.session.get(ParkingSpot, spot_id) is None:
+            # Deleted by another worker since this one loaded the lot
+            index.reload_lots([lot_id])
+            continue
+        booking = AdvanceBooking(user_id=user_id, spot_id=spot_id, start_time=start, end_time=end,
+                                 vehicle_license_plate=plate, vehicle_color=color,
+                                 status=BOOKED, created_at=now, updated_at=now)
+        db.session.add(booking)
+        db.session.flush()
+        # The index may be behind another worker; the database has the last word
+        if overlapping(spot_id, start, end, exclude_id=booking.id).first() is None:
+            db.session.commit()
+            index.record(booking, now)
+            return booking
+        db.session.rollback()
+        index.sync(now, force=True)
+    raise BookingError('No spot in this lot is free for that whole window.')
+
+def move_to_free_spot(index, booking, now, attempts=5):
+    """At check-in, move a booking whose spot is taken to another spot of the lot.
+
+    Like create_booking, the index only proposes spots. Each one is claimed
+    with a conditional UPDATE from 'A' to 'O' and then checked against the
+    database for overlapping bookings before the move stands; the caller
+    commits. Returns the new spot, or None if no spot is free until the
+    booking ends.
+    """
+    index.sync(now)
+    lot_id = booking.spot.lot_id
+    candidates = index.free_spots(lot_id, now, booking.end_time, exclude={booking.spot_id})
+    for spot_id in itertools.islice(candidates, attempts):
+        claimed = db.session.execute(
+            update(ParkingSpot).where(ParkingSpot.id == spot_id, ParkingSpot.status == 'A').values(status='O'),
+            execution_options={'synchronize_session': False}).rowcount
+        if not claimed:
+            continue
+        if overlapping(spot_id, now, booking.end_time, exclude_id=booking.id).first() is not None:
+            # Booked by another worker that this index has not seen yet
+            db.session.rollback()
+            index.sync(now, force=True)
+            continue
+        booking.spot_id = spot_id
+        spot = db.session.get(ParkingSpot, spot_id)
+        db.session.refresh(spot)
+        return spot
+    return None
+
+def set_status(index, booking, status, reservation_id=None):
+    """Cancel or check in a booking"""
+    now = datetime.utcnow()
+    booking.status = status
+    booking.updated_at = now
+    if reservation_id is not None:
+        booking.reservation_id = reservation_id
+    db.session.commit()
+    index.record(booking, now)
@@ -0,0 +1,203 @@
+# Reservation archival into monthly partition tables
+#
+# Completed reservations older than a cutoff are moved out of the hot
+# `reservation` table into one table per month (reservation_archive_2024_05,
+# ...). Lot and spot names are copied into the archive rows so history
+# survives spots and lots being deleted. The `reservation_history` view
+# unions the hot table with every partition; totals such as a user's
+# spending or a lot's revenue read it so they don't drop when rows move.
+#
+# Reservation ids are AUTOINCREMENT, so an id moved into the archive is never
+# handed to a new reservation and stays unique across the history.
+import time
+from datetime import datetime
+from sqlalchemy import (MetaData, Table, Column, Integer, String, Float, Boolean,
+                        DateTime, inspect, select, delete, text, func, false)
+from app.models import db, ParkingLot, ParkingSpot, Reservation
+
+PARTITION_PREFIX = 'reservation_archive_'
+HISTORY_VIEW = 'reservation_history'
+
+# Rows moved per transaction; keeps every write lock on the hot table short
+ARCHIVE_CHUNK_SIZE = 500
+
+# Archive tables live outside db.metadata so create_all() never touches them
+archive_metadata = MetaData()
+
+def _history_columns():
+    """Columns shared by the partitions and the history view"""
+    return [
+        Column('id', Integer, primary_key=True),  # original reservation id
+        Column('user_id', Integer, nullable=False, index=True),
+        Column('lot_id', Integer, nullable=True),
+        Column('lot_name', String(100), nullable=False),
+        Column('spot_id', Integer, nullable=True),
+        Column('spot_number', String(10), nullable=False),
+        Column('vehicle_license_plate', String(20), nullable=False),
+        Column('vehicle_color', String(20), nullable=False),
+        Column('parking_timestamp', DateTime, nullable=False),
+        Column('leaving_timestamp', DateTime, nullable=False),
+        Column('parking_cost', Float, nullable=True),
+        Column('hours_charged', Integer, nullable=True),
+    ]
+
+# Read-only description of the union view, for querying it with Core
+reservation_history = Table(
+    HISTORY_VIEW, MetaData(),
+    *_history_columns(),
+    Column('is_active', Boolean),
+    Column('archived', Boolean),
+)
+
+def partition_name(when):
+    """Name of the monthly partition a reservation belongs to"""
+    return f"{PARTITION_PREFIX}{when.year:04d}_{when.month:02d}"
+
+def partition_table(name):
+    """Table object for a partition, created in the database if needed"""
+    table = archive_metadata.tables.get(name)
+    if table is None:
+        table = Table(name, archive_metadata, *_history_columns(),
+                      Column('archived_at', DateTime, default=datetime.utcnow))
+    table.create(db.session.connection(), checkfirst=True)
+    return table
+
+def existing_partitions():
+    """Names of all partition tables in the database, oldest first"""
+    names = inspect(db.engine).get_table_names()
+    return sorted(n for n in names if n.startswith(PARTITION_PREFIX))
+
+def rebuild_history_view():
+    """(Re)create the view that unions live and archived reservations"""
+    hot = (
+        "SELECT r.id, r.user_id, l.id AS lot_id, l.prime_location_name AS lot_name, "
+        "r.spot_id, s.spot_number, r.vehicle_license_plate, r.vehicle_color, "
+        "r.parking_timestamp, r.leaving_timestamp, r.parking_cost, r.hours_charged, "
+        "r.is_active, 0 AS archived "
+        "FROM reservation r "
+        "JOIN parking_spot s ON r.spot_id = s.id "
+        "JOIN parking_lot l ON s.lot_id = l.id"
+    )
+    parts = [hot] + [
+        f"SELECT id, user_id, lot_id, lot_name, spot_id, spot_number, vehicle_license_plate, "
+        f"vehicle_color, parking_timestamp, leaving_timestamp, parking_cost, hours_charged, "
+        f"0 AS is_active, 1 AS archived FROM {name}"
+        for name in existing_partitions()
+    ]
+    with db.engine.begin() as conn:
+        conn.execute(text(f"DROP VIEW IF EXISTS {HISTORY_VIEW}"))
+        conn.execute(text(f"CREATE VIEW {HISTORY_VIEW} AS " + " UNION ALL ".join(parts)))
+
+# ═══════════════════════════════════════════════════════════════
+# CHUNKED MOVER
+# ═══════════════════════════════════════════════════════════════
+
+def _move_chunk(conditions, chunk_size):
+    """Copy one chunk of completed reservations to their partitions and delete them.
+
+    Runs in its own transaction. Returns how many rows were moved.
+    """
+    rows = db.session.execute(
+        select(
+            Reservation.id, Reservation.user_id,
+            ParkingLot.id.label('lot_id'), ParkingLot.prime_location_name.label('lot_name'),
+            Reservation.spot_id, ParkingSpot.spot_number,
+            Reservation.vehicle_license_plate, Reservation.vehicle_color,
+            Reservation.parking_timestamp, Reservation.leaving_timestamp,
+            Reservation.parking_cost, Reservation.hours_charged
+        ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id)
+         .join(ParkingLot, ParkingSpot.lot_id == ParkingLot.id)
+         .where(Reservation.is_active == False,
+                Reservation.leaving_timestamp.isnot(None),
+                *conditions)
+         .order_by(Reservation.id)
+         .limit(chunk_size)
+    ).mappings().all()
+
+    if not rows:
+        return 0
+
+    # Group the chunk by month and write each group to its partition
+    by_partition = {}
+    for row in rows:
+        by_partition.setdefault(partition_name(row['leaving_timestamp']), []).append(dict(row))
+
+    archived_at = datetime.utcnow()
+    for name, records in by_partition.items():
+        table = partition_table(name)
+        for record in records:
+            record['archived_at'] = archived_at
+        db.session.execute(table.insert(), records)
+
+    db.session.execute(delete(Reservation).where(Reservation.id.in_([row['id'] for row in rows])))
+    db.session.commit()
+    return len(rows)
+
+def archive_reservations(cutoff, chunk_size=ARCHIVE_CHUNK_SIZE, pause=0.05, max_chunks=None):
+    """Move completed reservations that ended before `cutoff` into the archive.
+
+    Works in small chunks, each its own short transaction, and sleeps for
+    `pause` seconds between chunks so live bookings can get the write lock.
+    Returns the number of reservations archived.
+    """
+    partitions_before = set(existing_partitions())
+    moved = chunks = 0
+    while max_chunks is None or chunks < max_chunks:
+        count = _move_chunk([Reservation.leaving_timestamp < cutoff], chunk_size)
+        if not count:
+            break
+        moved += count
+        chunks += 1
+        if pause:
+            time.sleep(pause)
+
+    if set(existing_partitions()) != partitions_before:
+        rebuild_history_view()
+    return moved
+
+def archive_spot_history(spot_ids, chunk_size=ARCHIVE_CHUNK_SIZE):
+    """Archive every completed reservation of the given spots (before deleting them)"""
+    spot_ids = list(spot_ids)
+    partitions_before = set(existing_partitions())
+    moved = 0
+    # Chunk the id list too, so huge lots do not build giant IN clauses
+    for start in range(0, len(spot_ids), chunk_size):
+        batch = spot_ids[start:start + chunk_size]
+        while True:
+            count = _move_chunk([Reservation.spot_id.in_(batch)], chunk_size)
+            if not count:
+                break
+            moved += count
+
+    if set(existing_partitions()) != partitions_before:
+        rebuild_history_view()
+    return moved
+
+
+# ═══════════════════════════════════════════════════════════════
+# HISTORY TOTALS
+# ═══════════════════════════════════════════════════════════════
+
+def completed_totals(*conditions):
+    """(sessions, spending, hours charged) over completed reservations, archived ones included"""
+    h = reservation_history.c
+    sessions, spending, hours = db.session.execute(
+        select(func.count(), func.coalesce(func.sum(h.parking_cost), 0.0), func.coalesce(func.sum(h.hours_charged), 0))
+        .where(h.is_active == false(), *conditions)
+    ).one()
+    return sessions, float(spending), int(hours)
+
+def user_totals(user_id):
+    """completed_totals for one user"""
+    return completed_totals(reservation_history.c.user_id == user_id)
+
+def lot_revenue(lot_id):
+    """Money earned by a lot from completed sessions, including archived ones and deleted spots"""
+    return round(completed_totals(reservation_history.c.lot_id == lot_id)[1], 2)
+
+def recent_history(user_id, limit=10):
+    """A user's latest reservations (active, completed or archived), newest first"""
+    h = reservation_history.c
+    return db.session.execute(
+        select(reservation_history).where(h.user_id == user_id).order_by(h.parking_timestamp.desc()).limit(limit)
+    ).all()
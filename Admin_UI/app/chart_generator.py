@@ -1,212 +1,260 @@
 # Simple chart generator for parking management system
-import matplotlib
-matplotlib.use('Agg')  # Use backend that doesn't need display
-import matplotlib.pyplot as plt
+#
+# Every chart is built in two steps: a *_series() function turns the route's
+# data into a plain JSON-friendly dict (labels + datasets), and the matching
+# generate_*() function draws that series with matplotlib. In 'client' mode
+# the browser fetches the series from /api/charts/<chart> and draws it with
+# Chart.js instead; the matplotlib path stays as the fallback.
+#
+# Lot charts take dense day x lot NumPy matrices, so percentages and
+# stacking are array operations and charts with many lots fold everything
+# past the top N into a single "Other" series. The older list-of-dict entry
+# points are kept as thin adapters around the matrix ones.
+#
+# matplotlib is the slowest import in the app and most requests never draw a
+# chart, so it is only imported (and styled) the first time a chart is drawn.
 import numpy as np
 from datetime import datetime
 import os
+import threading
+from app.metrics import timed_chart
 
-# Set style for nice looking charts
-plt.style.use('seaborn-v0_8')
+_pyplot = None
+_pyplot_lock = threading.Lock()
+
+def pyplot():
+    """matplotlib.pyplot, imported and styled on first use"""
+    global _pyplot
+    if _pyplot is None:
+        with _pyplot_lock:
+            if _pyplot is None:
+                import matplotlib
+                matplotlib.use('Agg')  # Use backend that doesn't need display
+                import matplotlib.pyplot as plt
+
+                # Set style for nice looking charts
+                plt.style.use('seaborn-v0_8')
+                _pyplot = plt
+    return _pyplot
+
+# Colors for different parking lots
+COLORS = ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40']
+
+# matplotlib's Set3 palette, used for pie slices
+PIE_COLORS = ['#8dd3c7', '#ffffb3', '#bebada', '#fb8072', '#80b1d3', '#fdb462',
+              '#b3de69', '#fccde5', '#d9d9d9', '#bc80bd', '#ccebc5', '#ffed6f']
+
+# Series drawn individually before the rest are folded into "Other"
+TOP_N = 10
+OTHER_COLOR = '#C9CBCF'
+
+CHART_DIR = 'static/charts'
+
+# Output modes: file extension and savefig() options for each.
+# 'client' renders nothing on the server; the page draws the JSON series.
+OUTPUT_FORMATS = {
+    'png': {'ext': 'png', 'dpi': 300},              # original print-quality PNGs
+    'png-lite': {'ext': 'png', 'dpi': 96},          # screen resolution PNGs
+    'webp': {'ext': 'webp', 'dpi': 96, 'pil_kwargs': {'quality': 80}},
+    'svg': {'ext': 'svg', 'metadata': {'Date': None}},  # no timestamp, so output is stable
+    'client': None,
+}
+
+# ═══════════════════════════════════════════════════════════════
+# MATRIX HELPERS
+# ═══════════════════════════════════════════════════════════════
+
+def lot_colors(n):
+    """The palette repeated to cover n series"""
+    return [COLORS[i % len(COLORS)] for i in range(n)]
+
+def top_columns(scores, top_n):
+    """Column indices to keep (in original order) and to fold into "Other".
+
+    Keeps the top_n columns with the highest score; nothing is folded when
+    there are at most top_n + 1 columns, since "Other" would save nothing.
+    """
+    scores = np.asarray(scores)
+    everything = np.arange(len(scores))
+    if top_n is None or len(scores) <= top_n + 1:
+        return everything, everything[:0]
+    order = np.argsort(-scores, kind='stable')
+    return np.sort(order[:top_n]), np.sort(order[top_n:])
+
+def fold_labels(labels, colors, keep, rest):
+    """Labels and colors once the `rest` columns are folded into one series"""
+    labels = [labels[i] for i in keep] + [f'Other ({len(rest)} lots)']
+    colors = [colors[i] for i in keep] + [OTHER_COLOR]
+    return labels, colors
+
+def matrix_datasets(matrix, labels, colors):
+    """One JSON-friendly dataset per matrix column"""
+    columns = np.round(matrix, 2).T.tolist()
+    return [{'label': label, 'data': data, 'color': color}
+            for label, data, color in zip(labels, columns, colors)]
+
+def records_to_matrix(records, lots, field):
+    """Day x lot matrix of one field from the old per-day list-of-dicts format"""
+    index = {name: j for j, name in enumerate(lots)}
+    matrix = np.zeros((len(records), len(lots)))
+    for i, day in enumerate(records):
+        for lot in day['lots']:
+            j = index.get(lot['name'])
+            if j is not None:
+                matrix[i, j] = lot[field]
+    return matrix
 
 class ChartGenerator:
-    
+
+    # Selected with ChartGenerator.configure(app.config['CHART_FORMAT'])
+    output_format = 'png'
+
+    @classmethod
+    def configure(cls, output_format):
+        """Choose how charts are delivered (one of OUTPUT_FORMATS)"""
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown chart format {output_format!r}; "
+                             f"expected one of {', '.join(OUTPUT_FORMATS)}")
+        cls.output_format = output_format
+
+    @classmethod
+    def client_side(cls):
+        """True when the browser draws charts from the JSON series"""
+        return cls.output_format == 'client'
+
+    @classmethod
+    def save(cls, fig, name, output_format=None):
+        """Write a finished figure in the chosen format and return its URL"""
+        output_format = output_format or cls.output_format
+        if OUTPUT_FORMATS.get(output_format) is None:
+            # Client mode still needs a server image when called directly
+            output_format = 'png-lite'
+        options = dict(OUTPUT_FORMATS[output_format])
+        ext = options.pop('ext')
+
+        chart_path = f'{CHART_DIR}/{name}.{ext}'
+        os.makedirs(CHART_DIR, exist_ok=True)
+        plt = pyplot()
+        # Keep SVG text as <text> elements instead of one path per glyph
+        with plt.rc_context({'svg.fonttype': 'none', 'svg.hashsalt': name}):
+            fig.savefig(chart_path, bbox_inches='tight', **options)
+        plt.close(fig)
+
+        return '/' + chart_path
+
+    # ═══════════════════════════════════════════════════════════════
+    # SERIES (shared by the server renderer and /api/charts)
+    # ═══════════════════════════════════════════════════════════════
+
     @staticmethod
-    def generate_occupancy_chart(occupancy_data, lots):
-        """Create a line chart showing how busy each parking lot is over time"""
-        # Create a new chart with specific size
-        fig, ax = plt.subplots(figsize=(12, 6))
-        
-        # Get the dates from our data
-        dates = []
-        for item in occupancy_data:
-            dates.append(item['date'])
-        
-        # Colors for different parking lots
-        colors = ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40']
-        
-        # Draw a line for each parking lot
-        for i, lot_name in enumerate(lots):
-            occupancy_rates = []
-            
-            # Calculate occupancy rate for each day
-            for day in occupancy_data:
-                # Find data for this specific lot
-                lot_data = None
-                for lot in day['lots']:
-                    if lot['name'] == lot_name:
-                        lot_data = lot
-                        break
-                
-                # Calculate occupancy percentage
-                if lot_data and lot_data['total'] > 0:
-                    rate = (lot_data['occupied'] / lot_data['total']) * 100
-                else:
-                    rate = 0
-                occupancy_rates.append(rate)
-            
-            # Draw the line for this parking lot
-            ax.plot(dates, occupancy_rates, 
-                   marker='o', linewidth=2, markersize=4,
-                   color=colors[i % len(colors)], label=lot_name)
-        
-        # Set chart titles and labels
-        ax.set_title('Daily Occupancy by Parking Lot', fontsize=16, fontweight='bold')
-        ax.set_xlabel('Date', fontsize=12)
-        ax.set_ylabel('Occupancy Rate (%)', fontsize=12)
-        ax.set_ylim(0, 100)  # Y-axis from 0 to 100%
-        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        ax.grid(True, alpha=0.3)  # Add grid lines
-        
-        # Rotate date labels so they don't overlap
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        # Create folder if it doesn't exist and save chart
-        chart_path = 'static/charts/occupancy_chart.png'
-        os.makedirs('static/charts', exist_ok=True)
-        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return '/static/charts/occupancy_chart.png'
-    
+    def occupancy_matrix_series(dates, lots, occupied, capacity, colors=None, top_n=TOP_N):
+        """Daily occupancy rate (%) from a day x lot matrix of occupied spots.
+
+        capacity is either one total per lot or a day x lot matrix.
+        """
+        occupied = np.asarray(occupied, dtype=np.float64).reshape(len(dates), len(lots))
+        capacity = np.broadcast_to(np.asarray(capacity, dtype=np.float64), occupied.shape)
+        colors = lot_colors(len(lots)) if colors is None else list(colors)
+
+        # Fold the quietest lots into one "Other" line: its rate is the
+        # combined occupancy of those lots, not an average of their rates
+        keep, rest = top_columns(occupied.sum(axis=0), top_n)
+        if len(rest):
+            occupied = np.column_stack([occupied[:, keep], occupied[:, rest].sum(axis=1)])
+            capacity = np.column_stack([capacity[:, keep], capacity[:, rest].sum(axis=1)])
+            lots, colors = fold_labels(lots, colors, keep, rest)
+
+        rates = np.divide(occupied * 100, capacity, out=np.zeros_like(occupied), where=capacity > 0)
+        return {
+            'chart': 'occupancy', 'type': 'line',
+            'title': 'Daily Occupancy by Parking Lot',
+            'x_label': 'Date', 'y_label': 'Occupancy Rate (%)', 'y_max': 100,
+            'labels': list(dates), 'datasets': matrix_datasets(rates, lots, colors),
+        }
+
     @staticmethod
-    def generate_revenue_chart(revenue_data, lots):
-        """Create a stacked bar chart showing daily revenue from each parking lot"""
-        # Create a new chart
-        fig, ax = plt.subplots(figsize=(12, 6))
-        
-        # Get dates from data
-        dates = []
-        for item in revenue_data:
-            dates.append(item['date'])
-        
-        # Colors for different parking lots
-        colors = ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40']
-        
-        # Create array to stack bars on top of each other
-        bottom = np.zeros(len(dates))
-        
-        # Create a bar for each parking lot
-        for i, lot_name in enumerate(lots):
-            revenues = []
-            
-            # Get revenue for each day
-            for day in revenue_data:
-                # Find data for this specific lot
-                lot_data = None
-                for lot in day['lots']:
-                    if lot['name'] == lot_name:
-                        lot_data = lot
-                        break
-                
-                revenue = lot_data['revenue'] if lot_data else 0
-                revenues.append(revenue)
-            
-            # Draw the bar for this parking lot
-            ax.bar(dates, revenues, bottom=bottom, 
-                  color=colors[i % len(colors)], label=lot_name)
-            
-            # Add this lot's revenue to bottom for stacking
-            for j in range(len(bottom)):
-                bottom[j] = bottom[j] + revenues[j]
-        
-        # Set chart titles and labels
-        ax.set_title('Daily Revenue by Parking Lot', fontsize=16, fontweight='bold')
-        ax.set_xlabel('Date', fontsize=12)
-        ax.set_ylabel('Revenue (₹)', fontsize=12)
-        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
-        ax.grid(True, alpha=0.3, axis='y')
-        
-        # Format y-axis to show rupee symbol
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'₹{x:.0f}'))
-        
-        # Rotate date labels
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        
-        # Save chart
-        chart_path = 'static/charts/revenue_chart.png'
-        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return '/static/charts/revenue_chart.png'
-    
+    def stacked_matrix_series(dates, labels, values, colors=None, top_n=TOP_N, **chart):
+        """Stacked bar series from a day x label matrix of amounts"""
+        values = np.asarray(values, dtype=np.float64).reshape(len(dates), len(labels))
+        colors = lot_colors(len(labels)) if colors is None else list(colors)
+
+        keep, rest = top_columns(values.sum(axis=0), top_n)
+        if len(rest):
+            values = np.column_stack([values[:, keep], values[:, rest].sum(axis=1)])
+            labels, colors = fold_labels(labels, colors, keep, rest)
+
+        series = {'type': 'stacked-bar', 'x_label': 'Date', 'y_prefix': '₹'}
+        series.update(chart)
+        series.update(labels=list(dates), datasets=matrix_datasets(values, labels, colors))
+        return series
+
     @staticmethod
-    def generate_user_location_chart(location_bookings):
-        """Create a bar chart showing which locations a user visits most"""
+    def revenue_matrix_series(dates, lots, revenue, colors=None, top_n=TOP_N):
+        """Daily revenue from a day x lot matrix, for stacking"""
+        return ChartGenerator.stacked_matrix_series(
+            dates, lots, revenue, colors, top_n,
+            chart='revenue', title='Daily Revenue by Parking Lot', y_label='Revenue (₹)')
+
+    @staticmethod
+    def occupancy_series(occupancy_data, lots):
+        """Daily occupancy rate (%) of each parking lot, from per-day records"""
+        dates = [item['date'] for item in occupancy_data]
+        occupied = records_to_matrix(occupancy_data, lots, 'occupied')
+        capacity = records_to_matrix(occupancy_data, lots, 'total')
+        return ChartGenerator.occupancy_matrix_series(dates, lots, occupied, capacity)
+
+    @staticmethod
+    def revenue_series(revenue_data, lots):
+        """Daily revenue of each parking lot, from per-day records"""
+        dates = [item['date'] for item in revenue_data]
+        revenue = records_to_matrix(revenue_data, lots, 'revenue')
+        return ChartGenerator.revenue_matrix_series(dates, lots, revenue)
+
+    @staticmethod
+    def user_location_series(location_bookings):
+        """Number of bookings per location, or None without data"""
         # Check if we have data
         if not location_bookings:
             return None
-            
-        # Create new chart
-        fig, ax = plt.subplots(figsize=(10, 6))
-        
+
         # Split the data into locations and counts
         locations = []
         counts = []
         for item in location_bookings:
             locations.append(item[0])  # Location name
             counts.append(item[1])     # Number of visits
-        
-        # Create bars
-        bars = ax.bar(locations, counts, color='#36A2EB', alpha=0.7)
-        
-        # Add numbers on top of each bar
-        for bar in bars:
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height,
-                   f'{int(height)}', ha='center', va='bottom')
-        
-        # Set chart titles and labels
-        ax.set_title('Booking Frequency by Location', fontsize=16, fontweight='bold')
-        ax.set_xlabel('Parking Location', fontsize=12)
-        ax.set_ylabel('Number of Bookings', fontsize=12)
-        ax.grid(True, alpha=0.3, axis='y')
-        
-        # Rotate location names so they don't overlap
-        plt.xticks(rotation=45, ha='right')
-        plt.tight_layout()
-        
-        # Save chart
-        chart_path = 'static/charts/user_location_chart.png'
-        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return '/static/charts/user_location_chart.png'
-    
+
+        return {
+            'chart': 'user_location', 'type': 'bar',
+            'title': 'Booking Frequency by Location',
+            'x_label': 'Parking Location', 'y_label': 'Number of Bookings',
+            'labels': locations,
+            'datasets': [{'label': 'Bookings', 'data': counts, 'color': '#36A2EB'}],
+        }
+
     @staticmethod
-    def generate_user_duration_chart(duration_data):
-        """Create a pie chart showing how long a user parks each day"""
+    def user_duration_series(duration_data):
+        """Time parked per day and location, in minutes when all are under an hour"""
         # Check if we have data
         if not duration_data:
             return None
-        
-        # Create new chart
-        fig, ax = plt.subplots(figsize=(10, 8))
-    
+
         # Get dates and hours from data
         dates = []
         hours = []
         for item in duration_data:
             dates.append(item['date'])
             hours.append(item['hours'])
-    
-        # Decide if we should show minutes or hours
-        max_duration = 0
-        for hour in hours:
-            if hour > max_duration:
-                max_duration = hour
-        
-        use_minutes = max_duration < 1.0  # If less than 1 hour, show minutes
-    
+
+        use_minutes = max(hours) < 1.0  # If less than 1 hour, show minutes
+
         if use_minutes:
             # Convert hours to minutes for display
             values = []
             labels = []
             for i in range(len(hours)):
                 minutes = hours[i] * 60
-                values.append(minutes)
+                values.append(round(minutes, 2))
                 labels.append(f'{dates[i]}\n{int(minutes)}m')
             unit = 'minutes'
             title = 'Daily Parking Duration Distribution (Minutes)'
@@ -218,82 +266,192 @@ class ChartGenerator:
                 labels.append(f'{dates[i]}\n{hours[i]:.1f}h')
             unit = 'hours'
             title = 'Daily Parking Duration Distribution (Hours)'
-    
-        # Create colors for pie slices
-        colors = plt.cm.Set3(range(len(values)))
-    
+
+        colors = [PIE_COLORS[i % len(PIE_COLORS)] for i in range(len(values))]
+        return {
+            'chart': 'user_duration', 'type': 'pie', 'title': title, 'unit': unit,
+            'labels': labels,
+            'datasets': [{'label': unit, 'data': values, 'colors': colors}],
+        }
+
+    @staticmethod
+    def user_spending_series(chart_data):
+        """Daily spending per location, for stacking, or None without data"""
+        # Check if we have data
+        if not chart_data['dates']:
+            return None
+
+        locations = chart_data['locations']
+        spending = np.array([chart_data['spending_by_location'][l] for l in locations]).T
+        return ChartGenerator.stacked_matrix_series(
+            chart_data['dates'], locations, spending.reshape(len(chart_data['dates']), len(locations)),
+            chart='user_spending', title='Daily Spending Breakdown by Parking Location',
+            y_label='Spending (₹)')
+
+    # ═══════════════════════════════════════════════════════════════
+    # MATPLOTLIB RENDERERS
+    # ═══════════════════════════════════════════════════════════════
+
+    @staticmethod
+    @timed_chart
+    def generate_occupancy_chart(occupancy_data, lots):
+        """Create a line chart showing how busy each parking lot is over time"""
+        return ChartGenerator._lines(ChartGenerator.occupancy_series(occupancy_data, lots), 'occupancy_chart')
+
+    @staticmethod
+    @timed_chart
+    def generate_occupancy_matrix_chart(dates, lots, occupied, capacity, colors=None, top_n=TOP_N):
+        """Occupancy line chart from a day x lot matrix of occupied spots"""
+        series = ChartGenerator.occupancy_matrix_series(dates, lots, occupied, capacity, colors, top_n)
+        return ChartGenerator._lines(series, 'occupancy_chart')
+
+    @staticmethod
+    @timed_chart
+    def generate_revenue_chart(revenue_data, lots):
+        """Create a stacked bar chart showing daily revenue from each parking lot"""
+        series = ChartGenerator.revenue_series(revenue_data, lots)
+        return ChartGenerator._stacked_bars(series, 'revenue_chart')
+
+    @staticmethod
+    @timed_chart
+    def generate_revenue_matrix_chart(dates, lots, revenue, colors=None, top_n=TOP_N):
+        """Stacked revenue bar chart from a day x lot matrix"""
+        series = ChartGenerator.revenue_matrix_series(dates, lots, revenue, colors, top_n)
+        return ChartGenerator._stacked_bars(series, 'revenue_chart')
+
+    @staticmethod
+    @timed_chart
+    def generate_user_location_chart(location_bookings):
+        """Create a bar chart showing which locations a user visits most"""
+        series = ChartGenerator.user_location_series(location_bookings)
+        if series is None:
+            return None
+
+        # Create new chart
+        plt = pyplot()
+        fig, ax = plt.subplots(figsize=(10, 6))
+
+        # Create bars
+        dataset = series['datasets'][0]
+        bars = ax.bar(series['labels'], dataset['data'], color=dataset['color'], alpha=0.7)
+
+        # Add numbers on top of each bar
+        for bar in bars:
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height,
+                   f'{int(height)}', ha='center', va='bottom')
+
+        # Set chart titles and labels
+        ax.set_title(series['title'], fontsize=16, fontweight='bold')
+        ax.set_xlabel(series['x_label'], fontsize=12)
+        ax.set_ylabel(series['y_label'], fontsize=12)
+        ax.grid(True, alpha=0.3, axis='y')
+
+        # Rotate location names so they don't overlap
+        plt.xticks(rotation=45, ha='right')
+        plt.tight_layout()
+
+        return ChartGenerator.save(fig, 'user_location_chart')
+
+    @staticmethod
+    @timed_chart
+    def generate_user_duration_chart(duration_data):
+        """Create a pie chart showing how long a user parks each day"""
+        series = ChartGenerator.user_duration_series(duration_data)
+        if series is None:
+            return None
+
+        # Create new chart
+        plt = pyplot()
+        fig, ax = plt.subplots(figsize=(10, 8))
+
         # Create the pie chart
-        wedges, texts, autotexts = ax.pie(values, labels=labels, autopct='%1.1f%%',
-                                     colors=colors, startangle=90,
+        dataset = series['datasets'][0]
+        wedges, texts, autotexts = ax.pie(dataset['data'], labels=series['labels'], autopct='%1.1f%%',
+                                     colors=dataset['colors'], startangle=90,
                                      textprops={'fontsize': 10})
-    
+
         # Set chart title
-        ax.set_title(title, fontsize=16, fontweight='bold', pad=20)
-    
+        ax.set_title(series['title'], fontsize=16, fontweight='bold', pad=20)
+
         # Make percentage text bold and white
         for autotext in autotexts:
             autotext.set_color('white')
             autotext.set_fontweight('bold')
             autotext.set_fontsize(9)
-    
+
         # Make pie chart circular
         ax.axis('equal')
-    
+
         plt.tight_layout()
-    
-        # Save chart
-        chart_path = 'static/charts/user_duration_chart.png'
-        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
-    
-        return '/static/charts/user_duration_chart.png'
+
+        return ChartGenerator.save(fig, 'user_duration_chart')
 
     @staticmethod
+    @timed_chart
     def generate_user_spending_chart(chart_data):
         """Create a stacked bar chart showing daily spending by location"""
-        # Check if we have data
-        if not chart_data['dates']:
+        series = ChartGenerator.user_spending_series(chart_data)
+        if series is None:
             return None
-            
-        # Create new chart
+        return ChartGenerator._stacked_bars(series, 'user_spending_chart')
+
+    @staticmethod
+    def _lines(series, name):
+        """Draw a line series on a 0-100% axis"""
+        # Create a new chart with specific size
+        plt = pyplot()
         fig, ax = plt.subplots(figsize=(12, 6))
-        
-        dates = chart_data['dates']
-        locations = chart_data['locations']
-        colors = ['#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF', '#FF9F40']
-        
-        # Create array to stack bars
-        bottom = np.zeros(len(dates))
-        
-        # Create a bar for each location
-        for i, location in enumerate(locations):
-            spending = chart_data['spending_by_location'][location]
-            
-            # Draw bar for this location
-            ax.bar(dates, spending, bottom=bottom, 
-                  color=colors[i % len(colors)], label=location)
-            
-            # Add this location's spending to bottom for stacking
-            for j in range(len(bottom)):
-                bottom[j] = bottom[j] + spending[j]
-        
+
+        # Draw a line for each parking lot
+        for dataset in series['datasets']:
+            ax.plot(series['labels'], dataset['data'],
+                   marker='o', linewidth=2, markersize=4,
+                   color=dataset['color'], label=dataset['label'])
+
+        # Set chart titles and labels
+        ax.set_title(series['title'], fontsize=16, fontweight='bold')
+        ax.set_xlabel(series['x_label'], fontsize=12)
+        ax.set_ylabel(series['y_label'], fontsize=12)
+        ax.set_ylim(0, 100)  # Y-axis from 0 to 100%
+        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
+        ax.grid(True, alpha=0.3)  # Add grid lines
+
+        # Rotate date labels so they don't overlap
+        plt.xticks(rotation=45)
+        plt.tight_layout()
+
+        return ChartGenerator.save(fig, name)
+
+    @staticmethod
+    def _stacked_bars(series, name):
+        """Draw a stacked bar series with a rupee y-axis"""
+        # Create a new chart
+        plt = pyplot()
+        fig, ax = plt.subplots(figsize=(12, 6))
+
+        # Each bar starts where the previous series ended: an exclusive
+        # cumulative sum down the series axis gives every bottom at once
+        values = np.array([dataset['data'] for dataset in series['datasets']], dtype=np.float64)
+        bottoms = np.cumsum(values, axis=0) - values
+
+        # Create a bar for each lot / location
+        for dataset, row, bottom in zip(series['datasets'], values, bottoms):
+            ax.bar(series['labels'], row, bottom=bottom,
+                  color=dataset['color'], label=dataset['label'])
+
         # Set chart titles and labels
-        ax.set_title('Daily Spending Breakdown by Parking Location', fontsize=16, fontweight='bold')
-        ax.set_xlabel('Date', fontsize=12)
-        ax.set_ylabel('Spending (₹)', fontsize=12)
+        ax.set_title(series['title'], fontsize=16, fontweight='bold')
+        ax.set_xlabel(series['x_label'], fontsize=12)
+        ax.set_ylabel(series['y_label'], fontsize=12)
         ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
         ax.grid(True, alpha=0.3, axis='y')
-        
+
         # Format y-axis to show rupee symbol
         ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'₹{x:.0f}'))
-        
+
         # Rotate date labels
         plt.xticks(rotation=45)
         plt.tight_layout()
-        
-        # Save chart
-        chart_path = 'static/charts/user_spending_chart.png'
-        plt.savefig(chart_path, dpi=300, bbox_inches='tight')
-        plt.close()
-        
-        return '/static/charts/user_spending_chart.png'
+
+        return ChartGenerator.save(fig, name)
@@ -0,0 +1,435 @@
+# Sensor device registry and silent-device detection
+#
+# IR and ultrasonic sensors identify themselves by MAC address and report
+# their spot's status on every change and at least every 5 minutes. Each
+# device's deadline (last report + timeout) lives in a hashed timer wheel,
+# so a monitor tick only looks at the devices whose deadlines fell into the
+# slots that just expired: no per-device timers and no query that scans the
+# whole fleet.
+#
+# Reports can land on any worker, so the database stays the source of truth.
+# Before a device is flagged its last_seen is re-read; devices that reported
+# elsewhere in the meantime are simply rescheduled. Devices registered or
+# recovered by other workers are picked up through the indexed
+# healthy_since column.
+#
+# Binary frames carry the device's uptime clock (millis()), not wall time.
+# Each device row keeps the uptime of its last frame next to last_seen, so a
+# later frame is dated last_seen + the uptime elapsed since: a batch a
+# gateway held back is dated when it was read, not when it arrived, and a
+# frame whose uptime is not past the last report's (a retried or reordered
+# batch) is dropped. A frame that would land within CLOCK_TOLERANCE of
+# arrival, in the future, or further back than max_delay is dated on
+# arrival instead, which keeps drifting device clocks and unnoticed
+# restarts from pushing last_seen away from the truth.
+#
+# Booked spots keep status 'O' whatever their sensor says, so the
+# spot_vacancy table remembers when each spot was first reported empty;
+# the session reconciler uses it to release sessions whose car has left.
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, update, delete, exists
+from app.models import db, ParkingLot, ParkingSpot, Reservation, SensorDevice, SpotVacancy
+from app import metrics
+
+HEALTH_OK = 'ok'
+HEALTH_SILENT = 'silent'
+
+# Spot status for spots whose sensor stopped reporting
+SPOT_UNKNOWN = 'U'
+
+# Spots held for a waitlisted user keep their hold whatever the sensor says
+SPOT_HELD = 'H'
+
+# Three missed 5-minute force-reports
+DEFAULT_TIMEOUT = timedelta(minutes=15)
+
+# Devices re-read per confirmation query
+CONFIRM_CHUNK = 500
+
+# Rows committed by other workers may carry a healthy_since slightly in the past
+PICKUP_MARGIN = timedelta(seconds=60)
+
+# Frames dated this close to their arrival are taken as sent on arrival
+CLOCK_TOLERANCE = timedelta(seconds=2)
+
+# Longest a gateway is expected to hold frames before forwarding them
+DEFAULT_MAX_DELAY = timedelta(minutes=5)
+
+sensor_reports = metrics.registry.counter(
+    'ecolot_sensor_reports_total', 'Status reports received from sensors', ('status',))
+devices_flagged = metrics.registry.counter(
+    'ecolot_sensor_devices_flagged_total', 'Devices flagged as silent')
+devices_by_health = metrics.registry.gauge(
+    'ecolot_sensor_devices', 'Registered sensor devices by health', ('health',))
+
+def to_epoch(when):
+    """Seconds since the epoch for a naive UTC datetime"""
+    return (when - datetime(1970, 1, 1)).total_seconds()
+
+# ═══════════════════════════════════════════════════════════════
+# HASHED TIMER WHEEL
+# ═══════════════════════════════════════════════════════════════
+
+class TimerWheel:
+    """Keys with deadlines (epoch seconds), bucketed by deadline tick.
+
+    schedule() and cancel() are O(1). advance() only visits the slots
+    between the previous call and now; deadlines more than one revolution
+    away simply stay in their slot until a later pass.
+    """
+
+    def __init__(self, tick_seconds=5.0, n_slots=512, now=None):
+        self.tick_seconds = tick_seconds
+        self.n_slots = n_slots
+        self.slots = [{} for _ in range(n_slots)]  # key -> deadline
+        self.slot_of = {}                          # key -> slot index
+        self.current = self._tick(time.time() if now is None else now)
+
+    def _tick(self, when):
+        return int(when // self.tick_seconds)
+
+    def __len__(self):
+        return len(self.slot_of)
+
+    def __contains__(self, key):
+        return key in self.slot_of
+
+    def schedule(self, key, deadline):
+        """Add a key, or move it to a new deadline"""
+        self.cancel(key)
+        # Overdue deadlines go in the current slot so the next advance sees them
+        slot = max(self._tick(deadline), self.current) % self.n_slots
+        self.slots[slot][key] = deadline
+        self.slot_of[key] = slot
+
+    def cancel(self, key):
+        slot = self.slot_of.pop(key, None)
+        if slot is not None:
+            del self.slots[slot][key]
+
+    def advance(self, now):
+        """Remove and return every key whose deadline is <= now"""
+        target = self._tick(now)
+        expired = []
+        for step in range(min(target - self.current + 1, self.n_slots)):
+            slot = self.slots[(self.current + step) % self.n_slots]
+            due = [key for key, deadline in slot.items() if deadline <= now]
+            for key in due:
+                del slot[key]
+                del self.slot_of[key]
+            expired.extend(due)
+        self.current = target
+        return expired
+
+# ═══════════════════════════════════════════════════════════════
+# SENSOR REPORTS
+# ═══════════════════════════════════════════════════════════════
+
+def normalize_device_id(value):
+    """MAC addresses are compared upper-case with colons"""
+    return str(value or '').strip().upper().replace('-', ':')
+
+def resolve_spot(spot_id, lot_name, spot_number):
+    """The spot a report refers to.
+
+    The configured spot_id is used when it exists and its spot number
+    matches; otherwise the spot is looked up by lot name and spot number.
+    A spot_id whose number disagrees is never trusted on its own: without a
+    lot name to look the number up in, the report is rejected (None).
+    """
+    spot = None
+    if spot_id is not None:
+        try:
+            spot = db.session.get(ParkingSpot, int(spot_id))
+        except (TypeError, ValueError):
+            spot = None
+        if spot is not None and (not spot_number or spot.spot_number == spot_number):
+            return spot
+
+    if lot_name and spot_number:
+        return ParkingSpot.query.join(ParkingLot).filter(
+            ParkingLot.prime_location_name == lot_name,
+            ParkingSpot.spot_number == spot_number
+        ).first()
+    return None
+
+# ═══════════════════════════════════════════════════════════════
+# REGISTRY / MONITOR
+# ═══════════════════════════════════════════════════════════════
+
+class DeviceRegistry:
+    """Tracks device deadlines and flags devices that go silent"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, tick_seconds=5.0, n_slots=512, on_spots_changed=None,
+                 max_delay=DEFAULT_MAX_DELAY):
+        self.timeout = timeout
+        self.max_delay = max_delay
+        self.wheel = TimerWheel(tick_seconds, n_slots)
+        self.on_spots_changed = on_spots_changed  # called with the lot ids whose spots changed
+        self.loaded = False
+        self.synced_until = None  # healthy_since watermark for picking up devices
+        self._lock = threading.Lock()
+
+    def _schedule_rows(self, rows):
+        with self._lock:
+            for device_pk, last_seen in rows:
+                self.wheel.schedule(device_pk, to_epoch(last_seen + self.timeout))
+
+    def load(self, now=None):
+        """Schedule every healthy device (one query, at monitor start)"""
+        now = now or datetime.utcnow()
+        rows = db.session.query(SensorDevice.id, SensorDevice.last_seen).filter(
+            SensorDevice.health == HEALTH_OK).all()
+        self._schedule_rows(rows)
+        self.synced_until = now
+        self.loaded = True
+
+    def pick_up_changes(self, now):
+        """Schedule devices registered or recovered since the last pick-up"""
+        rows = db.session.query(SensorDevice.id, SensorDevice.last_seen).filter(
+            SensorDevice.healthy_since >= self.synced_until - PICKUP_MARGIN,
+            SensorDevice.health == HEALTH_OK
+        ).all()
+        self._schedule_rows(rows)
+        self.synced_until = now
+
+    def record_report(self, device_id, spot, status, now=None):
+        """Register or refresh a device and apply its reading to the spot.
+
+        Returns True when the spot's status changed.
+        """
+        _, lot_ids = self.record_reports([(device_id, spot.id, status)], now)
+        return bool(lot_ids)
+
+    def frame_time(self, uptime_ms, last_seen, last_uptime_ms, now):
+        """When a frame was read, from the device's uptime clock; None if it predates the last report"""
+        if uptime_ms is None or last_uptime_ms is None:
+            return now
+        if uptime_ms <= last_uptime_ms:
+            # The clock went back: a restart (or the 49-day wrap) since the
+            # last report, unless it counted more time than has passed
+            return now if timedelta(milliseconds=uptime_ms) <= now - last_seen else None
+        read_at = last_seen + timedelta(milliseconds=uptime_ms - last_uptime_ms)
+        if read_at > now - CLOCK_TOLERANCE or read_at < now - self.max_delay:
+            return now
+        return read_at
+
+    def record_reports(self, readings, now=None):
+        """Apply a batch of (device_id, spot_id, status[, uptime_ms]) readings in one commit.
+
+        Devices are loaded and inserted with a handful of IN queries and
+        written back with executemany updates, so the cost per reading stays
+        flat as batches grow. When a device or spot appears more than once,
+        the last reading wins. Readings for unknown spots are dropped, and so
+        are frames (readings with an uptime_ms) older than the device's last
+        report; see frame_time.
+
+        Returns (accepted, lot_ids) where lot_ids are the lots whose spots changed.
+        """
+        now = now or datetime.utcnow()
+        latest = {}
+        counts = {}
+        for device_id, spot_id, status, *uptime_ms in readings:
+            latest[device_id] = (spot_id, status, uptime_ms[0] if uptime_ms else None)
+            counts[device_id] = counts.get(device_id, 0) + 1
+
+        spots = {}
+        spot_ids = list({spot_id for spot_id, _, _ in latest.values()})
+        for start in range(0, len(spot_ids), CONFIRM_CHUNK):
+            for spot_id, lot_id, current in db.session.query(
+                    ParkingSpot.id, ParkingSpot.lot_id, ParkingSpot.status).filter(
+                    ParkingSpot.id.in_(spot_ids[start:start + CONFIRM_CHUNK])):
+                spots[spot_id] = (lot_id, current)
+        latest = {device_id: reading for device_id, reading in latest.items() if reading[0] in spots}
+        if not latest:
+            return 0, []
+
+        device_ids = list(latest)
+        existing = {}
+        for start in range(0, len(device_ids), CONFIRM_CHUNK):
+            for device_pk, device_id, health, report_count, last_seen, last_uptime_ms in db.session.query(
+                    SensorDevice.id, SensorDevice.device_id, SensorDevice.health,
+                    SensorDevice.report_count, SensorDevice.last_seen, SensorDevice.uptime_ms).filter(
+                    SensorDevice.device_id.in_(device_ids[start:start + CONFIRM_CHUNK])):
+                existing[device_id] = (device_pk, health, report_count or 0, last_seen, last_uptime_ms)
+
+        read_at = {}
+        for device_id, (_, _, uptime_ms) in latest.items():
+            if device_id in existing:
+                read_at[device_id] = self.frame_time(uptime_ms, *existing[device_id][3:], now)
+            else:
+                read_at[device_id] = now
+        latest = {device_id: reading for device_id, reading in latest.items() if read_at[device_id] is not None}
+        if not latest:
+            return 0, []
+
+        new_rows = []
+        updates = []
+        for device_id, (spot_id, status, uptime_ms) in latest.items():
+            row = {'spot_id': spot_id, 'last_seen': read_at[device_id], 'last_status': status,
+                   'uptime_ms': uptime_ms}
+            if device_id not in existing:
+                new_rows.append(dict(row, device_id=device_id, report_count=counts[device_id],
+                                     health=HEALTH_OK, healthy_since=now, registered_at=now))
+                continue
+            device_pk, health, report_count = existing[device_id][:3]
+            row.update(id=device_pk, report_count=report_count + counts[device_id])
+            if health != HEALTH_OK:
+                # Back from the dead
+                row.update(health=HEALTH_OK, healthy_since=now, flagged_at=None)
+            updates.append(row)
+        if new_rows:
+            db.session.execute(insert(SensorDevice), new_rows)
+        if updates:
+            db.session.execute(update(SensorDevice), updates)
+
+        # Last reading per spot, skipping spots that already show it
+        wanted = {}
+        wanted_at = {}
+        for device_id, (spot_id, status, _) in latest.items():
+            wanted[spot_id] = status
+            wanted_at[spot_id] = read_at[device_id]
+        candidates = [spot_id for spot_id, status in wanted.items()
+                      if spots[spot_id][1] not in (status, SPOT_HELD)]
+
+        # Booked spots stay 'O' until the booking is released
+        booked = set()
+        for start in range(0, len(candidates), CONFIRM_CHUNK):
+            booked.update(spot_id for (spot_id,) in db.session.query(Reservation.spot_id).filter(
+                Reservation.spot_id.in_(candidates[start:start + CONFIRM_CHUNK]),
+                Reservation.is_active == True).distinct())
+        changed = [spot_id for spot_id in candidates if spot_id not in booked]
+        for status in ('A', 'O'):
+            ids = [spot_id for spot_id in changed if wanted[spot_id] == status]
+            for start in range(0, len(ids), CONFIRM_CHUNK):
+                db.session.execute(
+                    update(ParkingSpot)
+                    .where(ParkingSpot.id.in_(ids[start:start + CONFIRM_CHUNK]))
+                    .values(status=status)
+                )
+        self._track_vacancies(wanted, wanted_at)
+        db.session.commit()
+
+        for status in ('A', 'O'):
+            reported = sum(1 for _, s, _ in latest.values() if s == status)
+            if reported:
+                sensor_reports.inc(reported, status=status)
+        if self.loaded:
+            rows = [(row['id'], row['last_seen']) for row in updates]
+            added = [row['device_id'] for row in new_rows]
+            for start in range(0, len(added), CONFIRM_CHUNK):
+                rows += db.session.query(SensorDevice.id, SensorDevice.last_seen).filter(
+                    SensorDevice.device_id.in_(added[start:start + CONFIRM_CHUNK])).all()
+            self._schedule_rows(rows)
+        return len(latest), sorted({spots[spot_id][0] for spot_id in changed})
+
+    def _track_vacancies(self, wanted, wanted_at):
+        """Start a spot's vacancy on its first 'A' reading and end it on an 'O' (not committed)"""
+        vacant = [spot_id for spot_id, status in wanted.items() if status == 'A']
+        occupied = [spot_id for spot_id, status in wanted.items() if status == 'O']
+        for start in range(0, len(occupied), CONFIRM_CHUNK):
+            db.session.execute(delete(SpotVacancy).where(
+                SpotVacancy.spot_id.in_(occupied[start:start + CONFIRM_CHUNK])))
+        for start in range(0, len(vacant), CONFIRM_CHUNK):
+            chunk = vacant[start:start + CONFIRM_CHUNK]
+            known = {spot_id for (spot_id,) in db.session.query(SpotVacancy.spot_id).filter(
+                SpotVacancy.spot_id.in_(chunk))}
+            new_rows = [{'spot_id': spot_id, 'vacant_since': wanted_at[spot_id]}
+                        for spot_id in chunk if spot_id not in known]
+            if new_rows:
+                db.session.execute(insert(SpotVacancy), new_rows)
+
+    def check(self, now=None):
+        """Flag devices whose deadline passed. Returns how many were flagged."""
+        now = now or datetime.utcnow()
+        if not self.loaded:
+            self.load(now)
+        else:
+            self.pick_up_changes(now)
+
+        with self._lock:
+            due = self.wheel.advance(to_epoch(now))
+
+        silent = []
+        reschedule = []
+        for start in range(0, len(due), CONFIRM_CHUNK):
+            rows = db.session.query(SensorDevice.id, SensorDevice.last_seen, SensorDevice.health).filter(
+                SensorDevice.id.in_(due[start:start + CONFIRM_CHUNK])).all()
+            for device_pk, last_seen, health in rows:
+                if health != HEALTH_OK:
+                    continue
+                if last_seen + self.timeout <= now:
+                    silent.append(device_pk)
+                else:
+                    # Reported to another worker since we scheduled it
+                    reschedule.append((device_pk, last_seen))
+        self._schedule_rows(reschedule)
+
+        if silent:
+            self.flag_silent(silent, now)
+        self.update_gauges()
+        return len(silent)
+
+    def flag_silent(self, device_pks, now):
+        """Mark devices silent and their spots unknown, in a few bulk statements"""
+        lot_ids = set()
+        for start in range(0, len(device_pks), CONFIRM_CHUNK):
+            chunk = device_pks[start:start + CONFIRM_CHUNK]
+            db.session.execute(
+                update(SensorDevice)
+                .where(SensorDevice.id.in_(chunk), SensorDevice.health == HEALTH_OK)
+                .values(health=HEALTH_SILENT, flagged_at=now)
+            )
+
+            # Spots watched only by silent devices, not booked or held, not already unknown
+            spot_ids = [spot_id for (spot_id,) in db.session.query(SensorDevice.spot_id).filter(
+                SensorDevice.id.in_(chunk), SensorDevice.spot_id.isnot(None)).distinct()]
+            if not spot_ids:
+                continue
+            still_watched = {spot_id for (spot_id,) in db.session.query(SensorDevice.spot_id).filter(
+                SensorDevice.spot_id.in_(spot_ids), SensorDevice.health == HEALTH_OK).distinct()}
+            candidates = [spot_id for spot_id in spot_ids if spot_id not in still_watched]
+            if not candidates:
+                continue
+            rows = db.session.query(ParkingSpot.id, ParkingSpot.lot_id).filter(
+                ParkingSpot.id.in_(candidates),
+                ParkingSpot.status.notin_((SPOT_UNKNOWN, SPOT_HELD)),
+                ~exists().where(Reservation.spot_id == ParkingSpot.id, Reservation.is_active == True)
+            ).all()
+            if rows:
+                db.session.execute(
+                    update(ParkingSpot)
+                    .where(ParkingSpot.id.in_([spot_id for spot_id, _ in rows]))
+                    .values(status=SPOT_UNKNOWN)
+                )
+                lot_ids.update(lot_id for _, lot_id in rows)
+
+        db.session.commit()
+        devices_flagged.inc(len(device_pks))
+        if lot_ids and self.on_spots_changed:
+            self.on_spots_changed(*sorted(lot_ids))
+
+    def update_gauges(self):
+        counts = dict(db.session.query(SensorDevice.health, func.count(SensorDevice.id))
+                      .group_by(SensorDevice.health).all())
+        for health in (HEALTH_OK, HEALTH_SILENT):
+            devices_by_health.set(counts.get(health, 0), health=health)
+
+def fleet_health(recent=10):
+    """Device counts by health plus the most recently silenced devices"""
+    counts = dict(db.session.query(SensorDevice.health, func.count(SensorDevice.id))
+                  .group_by(SensorDevice.health).all())
+    unassigned = SensorDevice.query.filter(SensorDevice.spot_id.is_(None)).count()
+    unknown_spots = ParkingSpot.query.filter_by(status=SPOT_UNKNOWN).count()
+    recently_silent = SensorDevice.query.filter_by(health=HEALTH_SILENT).order_by(
+        SensorDevice.flagged_at.desc()).limit(recent).all()
+    return {
+        'total': sum(counts.values()),
+        'ok': counts.get(HEALTH_OK, 0),
+        'silent': counts.get(HEALTH_SILENT, 0),
+        'unassigned': unassigned,
+        'unknown_spots': unknown_spots,
+        'recently_silent': recently_silent
+    }
@@ -0,0 +1,352 @@
+# Occupancy forecasting for parking lots
+#
+# Reservations are turned into hour-by-hour occupancy with a vectorized
+# interval sweep, folded into an hour-of-week profile per lot and stored in
+# the LotForecast table. Each refresh only looks at the time window since
+# the previous one, so the model is updated incrementally. The same sweep
+# feeds the admin heatmaps: per lot from the stored hour-of-week totals,
+# per spot from a fresh sweep over the last few weeks.
+import numpy as np
+from datetime import datetime, timedelta
+from sqlalchemy import insert, update, or_
+from app.models import db, ParkingLot, LotForecast, ForecastState
+from app.archival import reservation_history
+
+HOURS_PER_WEEK = 168
+HOURS_PER_DAY = 24
+
+# The Unix epoch (hour 0) was a Thursday, which is hour 72 of a Monday-based week
+EPOCH_HOUR_OF_WEEK = 72
+
+# How many "virtual weeks" of the lot's overall average are blended into each
+# slot. Keeps forecasts sensible for slots that have only been seen a few times.
+SHRINKAGE_WEEKS = 2.0
+
+# ═══════════════════════════════════════════════════════════════
+# TIME HELPERS
+# ═══════════════════════════════════════════════════════════════
+
+def to_epoch_hours(timestamps):
+    """Convert datetimes (or a datetime64 array) to float hours since the epoch"""
+    values = np.asarray(timestamps, dtype='datetime64[s]')
+    return values.astype(np.int64) / 3600.0
+
+def hour_of_week(when):
+    """Hour of the week for a datetime, 0 = Monday 00:00"""
+    return when.weekday() * 24 + when.hour
+
+def floor_to_hour(when):
+    """Drop minutes, seconds and microseconds from a datetime"""
+    return when.replace(minute=0, second=0, microsecond=0)
+
+# ═══════════════════════════════════════════════════════════════
+# VECTORIZED INTERVAL SWEEP
+# ═══════════════════════════════════════════════════════════════
+
+def hourly_occupancy(group_index, starts, ends, n_groups, origin_hour, n_hours):
+    """Spot-hours occupied in each hourly bucket, per group.
+
+    group_index, starts and ends are parallel arrays (starts/ends in epoch
+    hours). Returns an (n_groups, n_hours) array where cell [g, k] is the
+    total time intervals of group g spent inside hour origin_hour + k.
+    Intervals are clipped to the window, partial hours count fractionally.
+    """
+    width = n_hours + 1  # one spare column so end-of-window indices stay in range
+    group_index = np.asarray(group_index, dtype=np.int64)
+    s = np.clip(np.asarray(starts, dtype=np.float64) - origin_hour, 0, n_hours)
+    e = np.clip(np.asarray(ends, dtype=np.float64) - origin_hour, 0, n_hours)
+
+    keep = e > s
+    group_index, s, e = group_index[keep], s[keep], e[keep]
+
+    first = np.floor(s).astype(np.int64)
+    last = np.floor(e).astype(np.int64)
+    base = group_index * width
+    size = n_groups * width
+
+    # Intervals that start and end inside the same hour
+    same = first == last
+    partial = np.zeros(size)
+    partial += np.bincount(base[same] + first[same], weights=(e - s)[same], minlength=size)
+
+    # Longer intervals: fractional first and last hours ...
+    span = ~same
+    partial += np.bincount(base[span] + first[span], weights=(first[span] + 1 - s[span]), minlength=size)
+    partial += np.bincount(base[span] + last[span], weights=(e[span] - last[span]), minlength=size)
+
+    # ... plus every whole hour in between, via a difference array sweep
+    steps = np.bincount(base[span] + first[span] + 1, minlength=size).astype(np.float64)
+    steps -= np.bincount(base[span] + last[span], minlength=size)
+    full = np.cumsum(steps.reshape(n_groups, width), axis=1)
+
+    return (partial.reshape(n_groups, width) + full)[:, :n_hours]
+
+def fold_hour_of_week(occupancy, origin_hour):
+    """Sum an (n_groups, n_hours) occupancy matrix into (n_groups, 168) hour-of-week totals"""
+    n_groups, n_hours = occupancy.shape
+    slots = (origin_hour + EPOCH_HOUR_OF_WEEK + np.arange(n_hours)) % HOURS_PER_WEEK
+    flat = (np.arange(n_groups)[:, None] * HOURS_PER_WEEK + slots[None, :]).ravel()
+    totals = np.bincount(flat, weights=occupancy.ravel(), minlength=n_groups * HOURS_PER_WEEK)
+    return totals.reshape(n_groups, HOURS_PER_WEEK)
+
+def fold_hour_of_day(occupancy, origin_hour):
+    """Sum an (n_groups, n_hours) occupancy matrix into (n_groups, 24) hour-of-day totals"""
+    n_groups, n_hours = occupancy.shape
+    slots = (origin_hour + np.arange(n_hours)) % HOURS_PER_DAY
+    flat = (np.arange(n_groups)[:, None] * HOURS_PER_DAY + slots[None, :]).ravel()
+    totals = np.bincount(flat, weights=occupancy.ravel(), minlength=n_groups * HOURS_PER_DAY)
+    return totals.reshape(n_groups, HOURS_PER_DAY)
+
+def slot_counts(window_starts, window_ends):
+    """How many times each hour-of-week slot occurs in [start, end) hour windows.
+
+    Takes parallel integer arrays of epoch hours, returns (n_windows, 168).
+    """
+    window_starts = np.asarray(window_starts, dtype=np.int64)
+    lengths = np.maximum(np.asarray(window_ends, dtype=np.int64) - window_starts, 0)
+    first_slot = (window_starts + EPOCH_HOUR_OF_WEEK) % HOURS_PER_WEEK
+
+    # Every slot is seen once per whole week, plus once more if it falls in the remainder
+    offsets = (np.arange(HOURS_PER_WEEK)[None, :] - first_slot[:, None]) % HOURS_PER_WEEK
+    extra = offsets < (lengths % HOURS_PER_WEEK)[:, None]
+    return (lengths // HOURS_PER_WEEK)[:, None] + extra
+
+def fit_forecast(occupied_hours, observed_slots, capacity):
+    """Fit the per-lot model: shrunk hour-of-week averages, clipped to capacity.
+
+    Each slot's average is blended with the lot's overall average so slots
+    with little history fall back to the lot's typical occupancy.
+    """
+    occupied_hours = np.asarray(occupied_hours, dtype=np.float64)
+    observed_slots = np.asarray(observed_slots, dtype=np.float64)
+    capacity = np.asarray(capacity, dtype=np.float64)
+
+    total_slots = observed_slots.sum(axis=1, keepdims=True)
+    lot_mean = np.divide(occupied_hours.sum(axis=1, keepdims=True), total_slots,
+                         out=np.zeros_like(total_slots), where=total_slots > 0)
+
+    expected = (occupied_hours + SHRINKAGE_WEEKS * lot_mean) / (observed_slots + SHRINKAGE_WEEKS)
+    return np.clip(expected, 0, capacity[:, None])
+
+# ═══════════════════════════════════════════════════════════════
+# FORECAST CACHE TABLE
+# ═══════════════════════════════════════════════════════════════
+
+def refresh_forecasts(now=None):
+    """Fold reservations since the last refresh into the LotForecast table.
+
+    Only the window [trained_until, now) is swept, so running this often is
+    cheap. Live and archived reservations are both swept, so a first (or
+    rebuilt) refresh sees the whole history. Returns the number of
+    reservations that were processed.
+    """
+    cutoff = floor_to_hour(now or datetime.utcnow())
+    state = ForecastState.query.first()
+    if state is None:
+        state = ForecastState(trained_until=None)
+        db.session.add(state)
+
+    lots = ParkingLot.query.order_by(ParkingLot.id).all()
+    if not lots:
+        db.session.commit()
+        return 0
+
+    # Reservations that overlap the window we have not trained on yet
+    h = reservation_history.c
+    query = reservation_history.select().with_only_columns(
+        h.lot_id, h.parking_timestamp, h.leaving_timestamp
+    ).where(
+        h.lot_id.in_([lot.id for lot in lots]),
+        h.parking_timestamp < cutoff
+    )
+    if state.trained_until:
+        query = query.where(or_(
+            h.leaving_timestamp.is_(None),
+            h.leaving_timestamp > state.trained_until
+        ))
+    rows = db.session.execute(query).all()
+
+    # Work out where the window starts
+    if state.trained_until:
+        window_start = state.trained_until
+    else:
+        earliest = [lot.created_date for lot in lots if lot.created_date]
+        earliest += [row[1] for row in rows]
+        window_start = floor_to_hour(min(earliest)) if earliest else cutoff
+
+    origin_hour = int(to_epoch_hours([window_start])[0])
+    cutoff_hour = int(to_epoch_hours([cutoff])[0])
+    n_hours = cutoff_hour - origin_hour
+    if n_hours <= 0:
+        db.session.commit()
+        return 0
+
+    lot_position = {lot.id: i for i, lot in enumerate(lots)}
+
+    # Sweep the reservations into hourly buckets and fold by hour of week
+    if rows:
+        group_index = np.fromiter((lot_position[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+        starts = to_epoch_hours([row[1] for row in rows])
+        ends = to_epoch_hours([row[2] or cutoff for row in rows])
+        occupancy = hourly_occupancy(group_index, starts, ends, len(lots), origin_hour, n_hours)
+        new_hours = fold_hour_of_week(occupancy, origin_hour)
+    else:
+        new_hours = np.zeros((len(lots), HOURS_PER_WEEK))
+
+    # A lot only "observes" the hours since it was created
+    lot_starts = [
+        max(origin_hour, int(to_epoch_hours([floor_to_hour(lot.created_date)])[0])) if lot.created_date else origin_hour
+        for lot in lots
+    ]
+    new_slots = slot_counts(lot_starts, [cutoff_hour] * len(lots))
+
+    # Add the new totals to what is already stored
+    occupied_hours = np.zeros((len(lots), HOURS_PER_WEEK))
+    observed_slots = np.zeros((len(lots), HOURS_PER_WEEK), dtype=np.int64)
+    existing = {}
+    for row in db.session.query(LotForecast.id, LotForecast.lot_id, LotForecast.hour_of_week,
+                                LotForecast.occupied_hours, LotForecast.observed_slots):
+        if row.lot_id not in lot_position:
+            continue
+        i = lot_position[row.lot_id]
+        occupied_hours[i, row.hour_of_week] = row.occupied_hours
+        observed_slots[i, row.hour_of_week] = row.observed_slots
+        existing[(row.lot_id, row.hour_of_week)] = row.id
+
+    occupied_hours += new_hours
+    observed_slots += new_slots
+    capacity = [lot.maximum_number_of_spots for lot in lots]
+    expected = fit_forecast(occupied_hours, observed_slots, capacity)
+
+    # Write everything back in two bulk statements
+    updates, inserts = [], []
+    for lot in lots:
+        i = lot_position[lot.id]
+        for slot in range(HOURS_PER_WEEK):
+            values = {
+                'occupied_hours': float(occupied_hours[i, slot]),
+                'observed_slots': int(observed_slots[i, slot]),
+                'expected_occupied': round(float(expected[i, slot]), 3),
+                'updated_at': cutoff
+            }
+            row_id = existing.get((lot.id, slot))
+            if row_id:
+                updates.append(dict(values, id=row_id))
+            else:
+                inserts.append(dict(values, lot_id=lot.id, hour_of_week=slot))
+
+    if updates:
+        db.session.execute(update(LotForecast), updates)
+    if inserts:
+        db.session.execute(insert(LotForecast), inserts)
+
+    state.trained_until = cutoff
+    db.session.commit()
+    return len(rows)
+
+def forecasts_are_stale(max_age):
+    """True when the forecasts have not been refreshed within max_age"""
+    state = ForecastState.query.first()
+    if state is None or state.trained_until is None:
+        return True
+    return datetime.utcnow() - state.trained_until > max_age
+
+# ═══════════════════════════════════════════════════════════════
+# PREDICTIONS
+# ═══════════════════════════════════════════════════════════════
+
+def expected_availability(lots, when, live_stats=None):
+    """Expected free spots in each lot at time `when`.
+
+    Returns {lot_id: {...}} with the capacity and expected occupied/available
+    counts. Lots without a forecast yet fall back to their live occupancy,
+    from live_stats(lot) when given (else the lot's own spot rows).
+    """
+    slot = hour_of_week(when)
+    lot_ids = [lot.id for lot in lots]
+    forecasts = {
+        row.lot_id: row.expected_occupied
+        for row in LotForecast.query.filter(
+            LotForecast.lot_id.in_(lot_ids),
+            LotForecast.hour_of_week == slot
+        )
+    }
+
+    results = {}
+    for lot in lots:
+        capacity = lot.maximum_number_of_spots
+        if lot.id in forecasts:
+            occupied = min(forecasts[lot.id], capacity)
+            source = 'forecast'
+        else:
+            stats = live_stats(lot) if live_stats else lot.get_occupancy_stats()
+            occupied = stats['occupied']
+            source = 'live'
+
+        results[lot.id] = {
+            'lot_id': lot.id,
+            'name': lot.prime_location_name,
+            'at': when.isoformat(),
+            'capacity': capacity,
+            'expected_occupied': round(occupied, 1),
+            'expected_available': max(0, int(round(capacity - occupied))),
+            'source': source
+        }
+    return results
+
+# ═══════════════════════════════════════════════════════════════
+# HEATMAPS
+# ═══════════════════════════════════════════════════════════════
+
+def lot_heatmap(lots):
+    """(n_lots, 168) share of each lot's spots occupied, on average, in each hour of the week.
+
+    Read from the stored forecast totals, so it is as fresh as the last
+    refresh and costs one query however much history there is.
+    """
+    position = {lot.id: i for i, lot in enumerate(lots)}
+    occupied_hours = np.zeros((len(lots), HOURS_PER_WEEK))
+    observed_slots = np.zeros((len(lots), HOURS_PER_WEEK))
+    rows = db.session.query(
+        LotForecast.lot_id, LotForecast.hour_of_week, LotForecast.occupied_hours, LotForecast.observed_slots
+    ).filter(LotForecast.lot_id.in_(list(position)))
+    for lot_id, slot, hours, slots in rows:
+        occupied_hours[position[lot_id], slot] = hours
+        observed_slots[position[lot_id], slot] = slots
+
+    capacity = np.array([lot.maximum_number_of_spots or 0 for lot in lots], dtype=np.float64)[:, None]
+    spot_slots = observed_slots * capacity
+    return np.divide(occupied_hours, spot_slots, out=np.zeros_like(occupied_hours), where=spot_slots > 0)
+
+def spot_heatmap(spot_ids, weeks=4, now=None):
+    """(n_spots, 24) share of the last `weeks` weeks each spot was occupied in each hour of the day.
+
+    Sweeps live and archived reservations of the given spots; sessions still
+    running count up to now.
+    """
+    now = now or datetime.utcnow()
+    cutoff = floor_to_hour(now)
+    origin = cutoff - timedelta(weeks=weeks)
+    origin_hour = int(to_epoch_hours([origin])[0])
+    n_hours = weeks * HOURS_PER_WEEK
+    position = {spot_id: i for i, spot_id in enumerate(spot_ids)}
+    if not position:
+        return np.zeros((0, HOURS_PER_DAY))
+
+    h = reservation_history.c
+    rows = db.session.execute(
+        reservation_history.select().with_only_columns(h.spot_id, h.parking_timestamp, h.leaving_timestamp).where(
+            h.spot_id.in_(list(position)),
+            h.parking_timestamp < cutoff,
+            or_(h.leaving_timestamp.is_(None), h.leaving_timestamp > origin)
+        )
+    ).all()
+    if not rows:
+        return np.zeros((len(position), HOURS_PER_DAY))
+
+    group_index = np.fromiter((position[row[0]] for row in rows), dtype=np.int64, count=len(rows))
+    starts = to_epoch_hours([row[1] for row in rows])
+    ends = to_epoch_hours([row[2] or cutoff for row in rows])
+    occupancy = hourly_occupancy(group_index, starts, ends, len(position), origin_hour, n_hours)
+    # Every hour of the day occurs once per day in the window
+    return np.clip(fold_hour_of_day(occupancy, origin_hour) / (weeks * 7), 0, 1)
@@ -0,0 +1,70 @@
+# Fragment caching for lot cards on the dashboards
+#
+# Each lot has a version number in the LotVersion table that is bumped on
+# every booking, release, edit or sensor update touching the lot. Rendered
+# lot cards are cached under (card kind, lot id, version, ...), so a
+# dashboard only re-renders the cards whose lot actually changed. Versions
+# live in the database, which keeps every worker process in agreement.
+import threading
+from collections import OrderedDict
+from sqlalchemy import update
+from app.models import db, LotVersion
+from app import metrics
+
+fragment_hits = metrics.registry.counter('ecolot_fragment_cache_hits_total', 'Template fragments served from the cache')
+fragment_misses = metrics.registry.counter('ecolot_fragment_cache_misses_total', 'Template fragments rendered')
+
+def lot_versions(lot_ids):
+    """Current version of each lot, in one query ({lot_id: version})"""
+    lot_ids = list(lot_ids)
+    if not lot_ids:
+        return {}
+    rows = db.session.query(LotVersion.lot_id, LotVersion.version).filter(
+        LotVersion.lot_id.in_(lot_ids)
+    )
+    versions = dict.fromkeys(lot_ids, 0)
+    versions.update(dict(rows))
+    return versions
+
+def bump_lot_versions(lot_ids):
+    """Mark lots as changed so their cached cards are re-rendered (commits)"""
+    lot_ids = set(lot_ids)
+    if not lot_ids:
+        return
+    db.session.execute(
+        update(LotVersion).where(LotVersion.lot_id.in_(lot_ids)).values(version=LotVersion.version + 1)
+    )
+    known = {row[0] for row in db.session.query(LotVersion.lot_id).filter(LotVersion.lot_id.in_(lot_ids))}
+    for lot_id in lot_ids - known:
+        db.session.add(LotVersion(lot_id=lot_id, version=1))
+    db.session.commit()
+
+class FragmentCache:
+    """LRU cache of rendered template fragments"""
+
+    def __init__(self, max_entries=5000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, *key, caller):
+        """Jinja helper: {% call fragment_cache('kind', lot.id, version) %}...{% endcall %}"""
+        with self._lock:
+            html = self._entries.get(key)
+            if html is not None:
+                self._entries.move_to_end(key)
+        if html is not None:
+            fragment_hits.inc()
+            return html
+
+        fragment_misses.inc()
+        html = caller()
+        with self._lock:
+            self._entries[key] = html
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return html
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,76 @@
+# Process-local cache of logged-in users
+#
+# Flask-Login calls load_user on every authenticated request. Instead of a
+# SELECT each time we keep a detached copy of the user's columns and merge it
+# into the request's session without loading (no SQL at all).
+#
+# Each entry carries a version stamp. The same stamp is stored in the user's
+# signed session cookie and is renewed whenever the profile changes, so a
+# worker whose cached copy is older than the cookie reloads from the database
+# even if the change happened in another worker. Entries also expire after a
+# TTL, which bounds staleness for changes made on someone else's behalf.
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from sqlalchemy.orm import make_transient_to_detached
+from app.models import db, User
+from app import metrics
+
+cache_hits = metrics.registry.counter('ecolot_user_cache_hits_total', 'load_user calls served from the cache')
+cache_misses = metrics.registry.counter('ecolot_user_cache_misses_total', 'load_user calls that queried the database')
+
+def new_stamp():
+    """A fresh version stamp for a user's cached identity"""
+    return uuid.uuid4().hex[:12]
+
+class UserCache:
+    """TTL + LRU cache of detached User snapshots keyed by user id"""
+
+    def __init__(self, ttl_seconds=300, max_entries=10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # user_id -> (snapshot, stamp, expires_at)
+        self._lock = threading.Lock()
+
+    def load(self, user_id, stamp):
+        """Return a session-bound User, from the cache when the stamp still matches"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[1] == stamp and entry[2] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                snapshot = entry[0]
+            else:
+                snapshot = None
+
+        if snapshot is not None:
+            cache_hits.inc()
+            # load=False attaches a copy to this request's session without a SELECT
+            return db.session.merge(snapshot, load=False)
+
+        cache_misses.inc()
+        user = db.session.get(User, user_id)
+        if user is not None:
+            self._store(user, stamp)
+        return user
+
+    def _store(self, user, stamp):
+        """Keep a detached copy of the user's column values"""
+        columns = {c.key: getattr(user, c.key) for c in User.__table__.columns}
+        snapshot = User(**columns)
+        make_transient_to_detached(snapshot)
+
+        with self._lock:
+            self._entries[user.id] = (snapshot, stamp, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Forget one user, e.g. after their profile was edited"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,206 @@
+# Background jobs for heavy admin work
+#
+# Routes that would otherwise run for seconds (creating thousands of spots,
+# deleting a big lot, imports, forecast refreshes) insert a row into the job
+# table and return. Workers - `python app.py run-jobs` processes, or a thread
+# in the development server - claim queued rows with a conditional UPDATE,
+# so any number of them can share the table with no broker. A claim is a
+# lease: the handler's progress reports extend it, and a job whose worker
+# died is claimed again once the lease runs out.
+#
+# A handler that raises is retried with exponential backoff until
+# max_attempts; JobError marks a failure that retrying can't fix.
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from sqlalchemy import update, or_, and_
+from app.models import db, Job
+from app import metrics
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+# How long a claim lasts without a progress report
+LEASE = timedelta(minutes=5)
+
+# First retry waits this long, doubling on every further attempt
+RETRY_DELAY = timedelta(seconds=10)
+
+# Finished jobs are kept this long for the jobs page
+KEEP_JOBS = timedelta(days=7)
+
+logger = logging.getLogger(__name__)
+
+jobs_finished = metrics.registry.counter(
+    'ecolot_jobs_total', 'Background jobs finished', labels=('kind', 'outcome'))
+job_seconds = metrics.registry.histogram(
+    'ecolot_job_seconds', 'Time spent running background jobs', labels=('kind',))
+
+class JobError(Exception):
+    """Raised by a handler for a failure that retrying won't fix; the message is shown to admins"""
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+class JobContext:
+    """Handed to a running handler for progress reports"""
+
+    def __init__(self, queue, job_id, worker):
+        self.queue = queue
+        self.job_id = job_id
+        self.worker = worker
+
+    def progress(self, fraction, message=None):
+        """Record how far the job has got (committed) and extend its lease"""
+        values = {'progress': max(0.0, min(1.0, fraction)), 'lease_until': datetime.utcnow() + self.queue.lease}
+        if message is not None:
+            values['message'] = message[:255]
+        db.session.execute(update(Job).where(Job.id == self.job_id, Job.worker == self.worker).values(**values))
+        db.session.commit()
+
+class JobQueue:
+    """Registered handlers and the job table they are run from"""
+
+    def __init__(self, lease=LEASE, retry_delay=RETRY_DELAY):
+        self.lease = lease
+        self.retry_delay = retry_delay
+        self.handlers = {}
+
+    def handler(self, kind):
+        """Decorator registering handler(ctx, **payload) for jobs of this kind"""
+        def register(func):
+            self.handlers[kind] = func
+            return func
+        return register
+
+    # Queueing
+
+    def enqueue(self, kind, created_by=None, max_attempts=3, message=None, **payload):
+        """Queue a job and return it (committed)"""
+        if kind not in self.handlers:
+            raise ValueError(f'No handler for job kind {kind!r}')
+        job = Job(kind=kind, payload=json.dumps(payload), created_by=created_by,
+                  max_attempts=max_attempts, message=message, run_after=datetime.utcnow())
+        db.session.add(job)
+        db.session.commit()
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a job that hasn't started; returns whether it was still queued"""
+        cancelled = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == QUEUED)
+            .values(status=CANCELLED, finished_at=datetime.utcnow())).rowcount
+        db.session.commit()
+        return bool(cancelled)
+
+    def retry(self, job_id):
+        """Queue a failed job again with a fresh set of attempts"""
+        retried = db.session.execute(
+            update(Job).where(Job.id == job_id, Job.status == FAILED)
+            .values(status=QUEUED, attempts=0, run_after=datetime.utcnow(), progress=0.0,
+                    error=None, finished_at=None)).rowcount
+        db.session.commit()
+        return bool(retried)
+
+    def pending(self):
+        """Number of queued and running jobs"""
+        return Job.query.filter(Job.status.in_((QUEUED, RUNNING))).count()
+
+    # Running
+
+    def claim(self, worker, now=None):
+        """Take the oldest runnable job for this worker, or return None"""
+        now = now or datetime.utcnow()
+        runnable = or_(
+            and_(Job.status == QUEUED, Job.run_after <= now),
+            and_(Job.status == RUNNING, Job.lease_until < now),   # its worker went away
+        )
+        for (job_id,) in db.session.query(Job.id).filter(runnable).order_by(Job.id).limit(5).all():
+            claimed = db.session.execute(
+                update(Job).where(Job.id == job_id, runnable)
+                .values(status=RUNNING, worker=worker, lease_until=now + self.lease, started_at=now,
+                        attempts=Job.attempts + 1)).rowcount
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+        return None
+
+    def _finish(self, job_id, worker, **values):
+        values.setdefault('finished_at', datetime.utcnow())
+        db.session.rollback()
+        db.session.execute(
+            update(Job).where(Job.id == job_id, Job.worker == worker).values(lease_until=None, **values))
+        db.session.commit()
+
+    def run(self, job, worker):
+        """Run a claimed job to completion, recording its result or failure"""
+        job_id, kind, attempts, max_attempts = job.id, job.kind, job.attempts, job.max_attempts
+        payload = json.loads(job.payload)
+        started = time.perf_counter()
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise JobError(f'No handler for job kind {kind!r}')
+            if attempts > max_attempts:
+                # Reclaimed after its last attempt's worker stopped mid-run
+                raise JobError('The worker running this job stopped before it finished')
+            ctx = JobContext(self, job_id, worker)
+            if attempts > 1:
+                ctx.progress(0.0, f'Attempt {attempts} of {max_attempts}')
+            result = handler(ctx, **payload)
+        except Exception as e:
+            retry = not isinstance(e, JobError) and attempts < max_attempts
+            message = str(e)[:255] if isinstance(e, JobError) else f'{type(e).__name__}: {e}'[:255]
+            if retry:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                self._finish(job_id, worker, status=QUEUED, run_after=datetime.utcnow() + delay,
+                             message=f'Attempt {attempts} failed, retrying: {message}'[:255],
+                             error=traceback.format_exc(), finished_at=None)
+            else:
+                self._finish(job_id, worker, status=FAILED, message=message, error=traceback.format_exc())
+                jobs_finished.inc(kind=kind, outcome=FAILED)
+            logger.warning('Job %s (%s) failed on attempt %s', job_id, kind, attempts, exc_info=True)
+        else:
+            self._finish(job_id, worker, status=DONE, progress=1.0,
+                         result=json.dumps(result) if result is not None else None)
+            jobs_finished.inc(kind=kind, outcome=DONE)
+        job_seconds.observe(time.perf_counter() - started, kind=kind)
+
+    def run_pending(self, worker=None, limit=None):
+        """Run runnable jobs until none are left (or `limit` have run); returns how many ran"""
+        worker = worker or worker_name()
+        ran = 0
+        while limit is None or ran < limit:
+            job = self.claim(worker)
+            if job is None:
+                break
+            self.run(job, worker)
+            ran += 1
+        return ran
+
+    def work(self, app, worker=None, poll_seconds=1.0, stop=None):
+        """Worker loop: run jobs as they become runnable until `stop` is set"""
+        worker = worker or worker_name()
+        while stop is None or not stop.is_set():
+            with app.app_context():
+                ran = self.run_pending(worker)
+            if not ran:
+                if stop is not None:
+                    stop.wait(poll_seconds)
+                else:
+                    time.sleep(poll_seconds)
+
+    def prune(self, now=None):
+        """Delete finished jobs older than KEEP_JOBS"""
+        cutoff = (now or datetime.utcnow()) - KEEP_JOBS
+        removed = Job.query.filter(Job.status.in_((DONE, FAILED, CANCELLED)),
+                                   Job.finished_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return removed
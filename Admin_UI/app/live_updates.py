@@ -0,0 +1,93 @@
+# Live notifications pushed to users' browsers
+#
+# Events are rows in user_event, so any worker can publish one and whichever
+# worker holds the user's connection delivers it. Browsers listen on a
+# server-sent event stream (each message's data is the same JSON object the
+# polling endpoint returns); each stream checks for new rows when a local
+# publish wakes it and otherwise every POLL_SECONDS, and resumes from
+# Last-Event-ID after a reconnect. Where EventSource is unavailable the
+# page polls the JSON endpoint with ?after=<last id> instead.
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from app.models import db, UserEvent
+from app import metrics
+
+# How often an open stream looks for events published by other workers
+POLL_SECONDS = 2.0
+
+# Comment lines keep idle connections from being dropped by proxies
+HEARTBEAT_SECONDS = 15.0
+
+# Streams end after this long and the browser reconnects, freeing the thread
+STREAM_SECONDS = 300.0
+
+# Events are only needed until the browser has picked them up
+KEEP_EVENTS = timedelta(days=1)
+
+events_published = metrics.registry.counter(
+    'ecolot_live_events_total', 'Live notifications published', labels=('kind',))
+open_streams = metrics.registry.gauge('ecolot_live_streams', 'Open server-sent event streams in this worker')
+
+class LiveChannel:
+    """Per-user notifications, delivered by stream or by polling"""
+
+    def __init__(self, poll_seconds=POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self._published = threading.Condition()
+        self._streams = 0
+
+    def publish(self, user_id, kind, **data):
+        """Queue a notification for a user (committed straight away)"""
+        event = UserEvent(user_id=user_id, kind=kind, payload=json.dumps(data), created_at=datetime.utcnow())
+        db.session.add(event)
+        db.session.commit()
+        events_published.inc(kind=kind)
+        with self._published:
+            self._published.notify_all()
+        return event.id
+
+    def events_after(self, user_id, after_id, limit=50):
+        """The user's events newer than after_id, oldest first"""
+        rows = db.session.query(UserEvent.id, UserEvent.kind, UserEvent.payload).filter(
+            UserEvent.user_id == user_id, UserEvent.id > after_id
+        ).order_by(UserEvent.id).limit(limit).all()
+        # End the read so a long-lived stream never holds SQLite's shared lock
+        db.session.rollback()
+        return [{'id': event_id, 'kind': kind, 'data': json.loads(payload)} for event_id, kind, payload in rows]
+
+    def latest_id(self, user_id):
+        """Id of the user's newest event, or 0; new streams start after it"""
+        latest = db.session.query(db.func.max(UserEvent.id)).filter(UserEvent.user_id == user_id).scalar()
+        db.session.rollback()
+        return latest or 0
+
+    def stream(self, user_id, last_id, lifetime=STREAM_SECONDS):
+        """Server-sent event lines for a user, until `lifetime` seconds have passed"""
+        with self._published:
+            self._streams += 1
+            open_streams.set(self._streams)
+        try:
+            yield f"retry: {int(self.poll_seconds * 1000)}\n\n"
+            started = last_beat = time.monotonic()
+            while time.monotonic() - started < lifetime:
+                for event in self.events_after(user_id, last_id):
+                    last_id = event['id']
+                    yield f"id: {event['id']}\ndata: {json.dumps(event)}\n\n"
+                if time.monotonic() - last_beat >= HEARTBEAT_SECONDS:
+                    last_beat = time.monotonic()
+                    yield ": keep-alive\n\n"
+                with self._published:
+                    self._published.wait(self.poll_seconds)
+        finally:
+            with self._published:
+                self._streams -= 1
+                open_streams.set(self._streams)
+
+    def prune(self, now=None):
+        """Delete events older than KEEP_EVENTS"""
+        cutoff = (now or datetime.utcnow()) - KEEP_EVENTS
+        removed = UserEvent.query.filter(UserEvent.created_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return removed
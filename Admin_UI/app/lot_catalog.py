@@ -0,0 +1,141 @@
+# Read-through cache of the lot catalog
+#
+# Both dashboards list (or search) every lot on each hit, but lots only
+# change when an admin creates, edits, imports or deletes one. The catalog
+# keeps each lot's columns in memory and answers listings and searches
+# from there; each distinct search is memoized too.
+#
+# Writers call invalidate(), which bumps a generation counter. With the
+# shared spot table the counter lives in its header, so every worker sees
+# the bump on its next read at the cost of one memory load; without it the
+# counter is per process and other workers fall back to a short TTL. A
+# reload happens once per generation: the first reader loads under a lock
+# while any others arriving at the same moment wait and reuse its result.
+#
+# Cached lots are CachedLot snapshots, not ORM rows (those belong to one
+# request's session). Anything beyond the columns - lot.spots, revenue,
+# occupancy - loads the real row on first use.
+import threading
+import time
+from collections import OrderedDict
+from app.models import db, ParkingLot
+from app import metrics
+
+COLUMNS = ('id', 'prime_location_name', 'address', 'pin_code', 'price', 'maximum_number_of_spots', 'created_date')
+
+# How long a worker trusts its catalog when there's no shared generation
+DEFAULT_TTL = 30.0
+
+# Distinct searches remembered per generation
+MAX_SEARCHES = 256
+
+catalog_hits = metrics.registry.counter(
+    'ecolot_lot_catalog_hits_total', 'Lot listings and searches answered from the catalog cache', labels=('kind',))
+catalog_misses = metrics.registry.counter(
+    'ecolot_lot_catalog_misses_total', 'Lot listings and searches that had to be computed', labels=('kind',))
+catalog_loads = metrics.registry.counter('ecolot_lot_catalog_loads_total', 'Lot catalog reloads from the database')
+
+class CachedLot:
+    """A lot's column values; other attributes come from its database row"""
+    __slots__ = COLUMNS
+
+    def __init__(self, row):
+        for name, value in zip(COLUMNS, row):
+            setattr(self, name, value)
+
+    def __getattr__(self, name):
+        # Only reached for names that aren't columns
+        if name.startswith('__'):
+            raise AttributeError(name)
+        lot = db.session.get(ParkingLot, self.id)
+        if lot is None:
+            raise AttributeError(f'lot {self.id} no longer exists')
+        return getattr(lot, name)
+
+    def __repr__(self):
+        return f'<CachedLot {self.id} {self.prime_location_name!r}>'
+
+def matches(lot, needle):
+    """The dashboards' search: a case-insensitive substring of name, address or pin code"""
+    return (needle in lot.prime_location_name.lower() or needle in lot.address.lower()
+            or needle in lot.pin_code.lower())
+
+class LotCatalog:
+    """Every lot's columns, reloaded when the catalog generation moves"""
+
+    def __init__(self, generation=None, bump=None, ttl=DEFAULT_TTL, max_searches=MAX_SEARCHES):
+        self.generation = generation    # () -> shared generation, or None for per-process only
+        self.bump = bump                # () -> None, advances the shared generation
+        self.ttl = ttl
+        self.max_searches = max_searches
+        self._local = 0
+        self._state = None              # (shared generation, local generation, loaded at, lots, lots by id)
+        self._searches = OrderedDict()  # needle -> tuple of lots, for the current state
+        self._lock = threading.Lock()
+
+    def _version(self):
+        return (self.generation() if self.generation else None), self._local
+
+    def _fresh(self, state, version):
+        return (state is not None and state[:2] == version
+                and (self.generation is not None or time.monotonic() - state[2] < self.ttl))
+
+    def _current(self):
+        version = self._version()
+        state = self._state
+        if self._fresh(state, version):
+            return state, True
+        with self._lock:
+            # Someone else may have reloaded while we waited
+            state = self._state
+            if self._fresh(state, version):
+                return state, True
+            rows = db.session.query(*(getattr(ParkingLot, name) for name in COLUMNS)).order_by(ParkingLot.id).all()
+            lots = tuple(CachedLot(row) for row in rows)
+            state = (*version, time.monotonic(), lots, {lot.id: lot for lot in lots})
+            self._state = state
+            self._searches = OrderedDict()
+            catalog_loads.inc()
+            return state, False
+
+    def all(self):
+        """Every lot, in id order"""
+        state, cached = self._current()
+        (catalog_hits if cached else catalog_misses).inc(kind='all')
+        return list(state[3])
+
+    def get(self, lot_id):
+        """The lot with this id, or None if the catalog doesn't have it"""
+        state, cached = self._current()
+        (catalog_hits if cached else catalog_misses).inc(kind='get')
+        return state[4].get(lot_id)
+
+    def search(self, query):
+        """Lots whose name, address or pin code contains query (every lot for an empty query)"""
+        needle = (query or '').strip().lower()
+        if not needle:
+            return self.all()
+        state, _ = self._current()
+        with self._lock:
+            found = self._searches.get(needle) if self._state is state else None
+            if found is not None:
+                self._searches.move_to_end(needle)
+        if found is not None:
+            catalog_hits.inc(kind='search')
+            return list(found)
+
+        catalog_misses.inc(kind='search')
+        found = tuple(lot for lot in state[3] if matches(lot, needle))
+        with self._lock:
+            if self._state is state:
+                self._searches[needle] = found
+                while len(self._searches) > self.max_searches:
+                    self._searches.popitem(last=False)
+        return list(found)
+
+    def invalidate(self):
+        """Lots were created, edited or deleted: reload on the next read, in every worker"""
+        with self._lock:
+            self._local += 1
+        if self.bump:
+            self.bump()
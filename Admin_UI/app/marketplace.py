@@ -0,0 +1,363 @@
+# Peer-to-peer spot marketplace and its matching engine
+#
+# Owners list a private spot for a window at an hourly price; drivers post
+# requests with a location, a window, a price cap and how far they will
+# walk. A listing can serve a request when its window covers the request's,
+# it is within the driver's distance and it is priced at or below the cap.
+# An owner's listing never fills a request the same user posted.
+#
+# Resting orders sit in a grid of ~1 km cells with one priority queue per
+# cell and side: listings keyed on (price, arrival), requests on (-price
+# cap, arrival). A new order reads only the queues of the cells around it,
+# nearest first, each in price order and only as far as the best price
+# found so far, so the cost of a match depends on the neighbourhood, not on
+# the size of the book. Among equally priced candidates the nearest wins,
+# then the oldest.
+#
+# Each worker runs its own engine, loaded from the database on first use
+# and synced through updated_at. A match only stands once both rows are
+# claimed with a conditional UPDATE, so two workers can never sell the same
+# listing or fill the same request twice.
+import itertools
+import math
+import threading
+from bisect import insort
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app.models import db, SpotListing, SpotRequest, MarketMatch
+from app import metrics
+
+OPEN = 'open'
+MATCHED = 'matched'
+WITHDRAWN = 'withdrawn'
+CANCELLED = 'cancelled'
+
+KM_PER_DEGREE = 111.32
+CELL_KM = 1.0
+
+# Furthest a driver can ask to walk; also the search radius for new listings
+MAX_DISTANCE_KM = 5.0
+
+# How often a worker re-reads orders placed or withdrawn by other workers
+SYNC_INTERVAL = timedelta(seconds=2)
+SYNC_MARGIN = timedelta(seconds=60)
+
+# How often expired orders are swept out of the book
+EXPIRE_INTERVAL = timedelta(minutes=5)
+
+matches_made = metrics.registry.counter('ecolot_market_matches_total', 'Listings matched with requests')
+claims_lost = metrics.registry.counter(
+    'ecolot_market_claims_lost_total', 'Matches dropped because another worker took one side first')
+
+Match = namedtuple('Match', 'listing request price distance_km')
+
+class Order:
+    """A listing (price = asking price) or a request (price = price cap)"""
+    __slots__ = ('side', 'id', 'lat', 'lon', 'start', 'end', 'price', 'max_km', 'user_id', 'seq')
+
+    def __init__(self, side, order_id, lat, lon, start, end, price, max_km=MAX_DISTANCE_KM, user_id=None):
+        self.side = side
+        self.id = order_id
+        self.lat = lat
+        self.lon = lon
+        self.start = start
+        self.end = end
+        self.price = price
+        self.max_km = min(max_km, MAX_DISTANCE_KM)
+        self.user_id = user_id  # owner of a listing, driver of a request
+        self.seq = None
+
+    def covers(self, other):
+        """A listing's window covers a request's"""
+        return self.start <= other.start and self.end >= other.end
+
+    def can_fill(self, request):
+        """A listing can serve a request: its window covers it and it isn't the same user's"""
+        return self.covers(request) and (self.user_id is None or self.user_id != request.user_id)
+
+def distance_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance (haversine)"""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lon2 - lon1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 12742.0 * math.asin(math.sqrt(a))
+
+# ═══════════════════════════════════════════════════════════════
+# SPATIAL GRID
+# ═══════════════════════════════════════════════════════════════
+
+def _row(lat):
+    return math.floor(lat * KM_PER_DEGREE / CELL_KM)
+
+def _row_scale(row, at=0.5):
+    """Length of a degree of longitude relative to one of latitude, `at` of the way up a grid row"""
+    return max(math.cos(math.radians((row + at) * CELL_KM / KM_PER_DEGREE)), 0.01)
+
+def _col(row, lon):
+    return math.floor(lon * KM_PER_DEGREE * _row_scale(row) / CELL_KM)
+
+def cell_of(lat, lon):
+    row = _row(lat)
+    return row, _col(row, lon)
+
+def cells_near(lat, lon, km):
+    """Every cell that may hold a point within `km` of (lat, lon)"""
+    lat_span = km / KM_PER_DEGREE
+    for row in range(_row(lat - lat_span), _row(lat + lat_span) + 1):
+        # Degrees of longitude are shortest along the row's poleward edge
+        edge = min(_row_scale(row, 0.0), _row_scale(row, 1.0))
+        lon_span = km / (KM_PER_DEGREE * edge)
+        for col in range(_col(row, lon - lon_span), _col(row, lon + lon_span) + 1):
+            yield row, col
+
+# ═══════════════════════════════════════════════════════════════
+# ORDER BOOK
+# ═══════════════════════════════════════════════════════════════
+
+class OrderBook:
+    """Resting orders of one side, in one priority queue per grid cell.
+
+    Each queue is a list kept sorted by (priority, arrival), so it can be
+    read in order without popping. Removed orders are dropped lazily; a
+    cell's queue is rebuilt once most of its entries are dead.
+    """
+
+    def __init__(self, key):
+        self.key = key          # order -> priority (lower is better)
+        self.cells = {}         # cell -> sorted list of (priority, seq, order id)
+        self.orders = {}        # order id -> Order
+        self.cell = {}          # order id -> cell
+        self.dead = {}          # cell -> removed entries still in its queue
+
+    def __len__(self):
+        return len(self.orders)
+
+    def __contains__(self, order_id):
+        return order_id in self.orders
+
+    def add(self, order):
+        cell = cell_of(order.lat, order.lon)
+        insort(self.cells.setdefault(cell, []), (self.key(order), order.seq, order.id))
+        self.orders[order.id] = order
+        self.cell[order.id] = cell
+
+    def remove(self, order_id):
+        if self.orders.pop(order_id, None) is None:
+            return
+        cell = self.cell.pop(order_id)
+        queue = self.cells[cell]
+        self.dead[cell] = self.dead.get(cell, 0) + 1
+        if self.dead[cell] * 2 > len(queue):
+            live = [entry for entry in queue if entry[2] in self.orders]
+            if live:
+                self.cells[cell] = live
+            else:
+                del self.cells[cell]
+            self.dead.pop(cell)
+
+    def best(self, lat, lon, km, limit, fits):
+        """The order ranked first by (priority, distance, arrival) within reach.
+
+        Only orders with priority up to `limit` that `fits(order)` allows, and
+        that lie within both `km` and their own max_km, are considered. Cells
+        are read nearest first and each stops at the best priority found so
+        far. Returns (order, distance) or (None, None).
+        """
+        best, best_key = None, None
+        row, col = cell_of(lat, lon)
+        cells = sorted(cells_near(lat, lon, km), key=lambda cell: abs(cell[0] - row) + abs(cell[1] - col))
+        for cell in cells:
+            for priority, seq, order_id in self.cells.get(cell, ()):
+                if priority > limit:
+                    break
+                order = self.orders.get(order_id)
+                if order is None or not fits(order):
+                    continue
+                distance = distance_km(lat, lon, order.lat, order.lon)
+                if distance > km or distance > order.max_km:
+                    continue
+                key = (priority, distance, seq)
+                if best_key is None or key < best_key:
+                    best, best_key, limit = order, key, priority
+        return (best, best_key[1]) if best is not None else (None, None)
+
+class MatchingEngine:
+    """Continuous matching of listings against requests"""
+
+    def __init__(self, claim=None):
+        self.listings = OrderBook(key=lambda order: order.price)
+        self.requests = OrderBook(key=lambda order: -order.price)
+        self.claim = claim  # claim(listing, request, distance) -> (listing claimed, request claimed)
+        self.reach_km = 0.0  # furthest any resting request will go, so listings search no wider
+        self._seq = itertools.count()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.listings) + len(self.requests)
+
+    def __contains__(self, key):
+        side, order_id = key
+        return order_id in (self.listings if side == 'listing' else self.requests)
+
+    def _best_listing(self, request):
+        if not self.listings:
+            return None, None
+        return self.listings.best(request.lat, request.lon, request.max_km, request.price,
+                                  lambda listing: listing.can_fill(request))
+
+    def _best_request(self, listing):
+        if not self.requests:
+            return None, None
+        return self.requests.best(listing.lat, listing.lon, self.reach_km, -listing.price, listing.can_fill)
+
+    def submit(self, order):
+        """Match a new order against the book, or rest it. Returns a Match or None."""
+        with self._lock:
+            order.seq = next(self._seq)
+            incoming_listing = order.side == 'listing'
+            resting = self.requests if incoming_listing else self.listings
+            while True:
+                if incoming_listing:
+                    other, km = self._best_request(order)
+                else:
+                    other, km = self._best_listing(order)
+                if other is None:
+                    if incoming_listing:
+                        self.listings.add(order)
+                    else:
+                        self.requests.add(order)
+                        self.reach_km = max(self.reach_km, order.max_km)
+                    return None
+                listing, request = (order, other) if incoming_listing else (other, order)
+                listing_ok, request_ok = self.claim(listing, request, km) if self.claim else (True, True)
+                if listing_ok and request_ok:
+                    resting.remove(other.id)
+                    return Match(listing, request, listing.price, km)
+                # Another worker took a side first: forget only the side that lost
+                order_ok, other_ok = (listing_ok, request_ok) if incoming_listing else (request_ok, listing_ok)
+                if not other_ok:
+                    resting.remove(other.id)
+                if not order_ok:
+                    # The new order itself was stale; it must not rest in the book
+                    return None
+
+    def cancel(self, side, order_id):
+        with self._lock:
+            (self.listings if side == 'listing' else self.requests).remove(order_id)
+
+    def expire(self, now):
+        """Drop orders whose window has ended"""
+        with self._lock:
+            for book in (self.listings, self.requests):
+                for order_id in [o.id for o in book.orders.values() if o.end <= now]:
+                    book.remove(order_id)
+
+# ═══════════════════════════════════════════════════════════════
+# DATABASE-BACKED MARKET
+# ═══════════════════════════════════════════════════════════════
+
+def listing_order(row):
+    return Order('listing', row.id, row.latitude, row.longitude, row.start_time, row.end_time,
+                 row.price_per_hour, user_id=row.owner_id)
+
+def request_order(row):
+    return Order('request', row.id, row.latitude, row.longitude, row.start_time, row.end_time,
+                 row.max_price_per_hour, row.max_distance_km, user_id=row.driver_id)
+
+def claim_match(listing, request, km):
+    """Mark both rows matched and record the match, if both are still open.
+
+    Returns (listing claimed, request claimed); unless both are, nothing is
+    written and the False side is the one another worker already took.
+    """
+    now = datetime.utcnow()
+    listing_ok = db.session.execute(
+        update(SpotListing).where(SpotListing.id == listing.id, SpotListing.status == OPEN)
+        .values(status=MATCHED, updated_at=now)).rowcount == 1
+    request_ok = db.session.execute(
+        update(SpotRequest).where(SpotRequest.id == request.id, SpotRequest.status == OPEN)
+        .values(status=MATCHED, updated_at=now)).rowcount == 1
+    if not (listing_ok and request_ok):
+        db.session.rollback()
+        claims_lost.inc()
+        return listing_ok, request_ok
+    db.session.add(MarketMatch(listing_id=listing.id, request_id=request.id, price_per_hour=listing.price,
+                               distance_km=round(km, 3), matched_at=now))
+    db.session.commit()
+    matches_made.inc()
+    return True, True
+
+class Market:
+    """The worker's matching engine, kept in step with the database"""
+
+    def __init__(self):
+        self.engine = None
+        self.synced_until = None
+        self.last_sync = None
+        self.last_expire = None
+        self._lock = threading.Lock()
+
+    def load(self, now=None):
+        """Rebuild the book from every open order (matching any that cross)"""
+        now = now or datetime.utcnow()
+        engine = MatchingEngine(claim=claim_match)
+        listings = SpotListing.query.filter(SpotListing.status == OPEN, SpotListing.end_time > now).all()
+        requests = SpotRequest.query.filter(SpotRequest.status == OPEN, SpotRequest.end_time > now).all()
+        orders = [(row.created_at, listing_order(row)) for row in listings]
+        orders += [(row.created_at, request_order(row)) for row in requests]
+        for _, order in sorted(orders, key=lambda pair: pair[0]):
+            engine.submit(order)
+        self.engine = engine
+        self.synced_until = self.last_sync = self.last_expire = now
+
+    def sync(self, now=None, force=False):
+        """Pick up orders placed, withdrawn or matched by other workers"""
+        now = now or datetime.utcnow()
+        with self._lock:
+            if self.engine is None:
+                self.load(now)
+                return
+            if not force and now - self.last_sync < SYNC_INTERVAL:
+                return
+            since = self.synced_until - SYNC_MARGIN
+            changed = [('listing', row) for row in SpotListing.query.filter(SpotListing.updated_at >= since)]
+            changed += [('request', row) for row in SpotRequest.query.filter(SpotRequest.updated_at >= since)]
+            for side, row in sorted(changed, key=lambda pair: pair[1].created_at):
+                if row.status != OPEN or row.end_time <= now:
+                    self.engine.cancel(side, row.id)
+                elif (side, row.id) not in self.engine:
+                    self.engine.submit(listing_order(row) if side == 'listing' else request_order(row))
+            if now - self.last_expire >= EXPIRE_INTERVAL:
+                self.engine.expire(now)
+                self.last_expire = now
+            self.synced_until = self.last_sync = now
+
+    def place(self, row):
+        """Submit a just-committed SpotListing or SpotRequest; returns its MarketMatch, if any"""
+        self.sync()
+        is_listing = isinstance(row, SpotListing)
+        with self._lock:
+            # The sync may already have picked it up (and matched it)
+            if ('listing' if is_listing else 'request', row.id) not in self.engine and row.status == OPEN:
+                self.engine.submit(listing_order(row) if is_listing else request_order(row))
+        return row.match
+
+    def withdraw(self, row):
+        """Take an open listing or request off the market"""
+        now = datetime.utcnow()
+        is_listing = isinstance(row, SpotListing)
+        model = SpotListing if is_listing else SpotRequest
+        status = WITHDRAWN if is_listing else CANCELLED
+        done = db.session.execute(
+            update(model).where(model.id == row.id, model.status == OPEN)
+            .values(status=status, updated_at=now)).rowcount
+        db.session.commit()
+        if self.engine is not None:
+            self.engine.cancel('listing' if is_listing else 'request', row.id)
+        return bool(done)
+
+    def depth(self):
+        """Resting listings and requests in this worker's book"""
+        self.sync()
+        return {'listings': len(self.engine.listings), 'requests': len(self.engine.requests)}
@@ -0,0 +1,298 @@
+# Request instrumentation and Prometheus-style metrics
+#
+# Records per-route latency, SQL statement counts and time (through
+# SQLAlchemy cursor events), template render time and chart render time,
+# and renders everything in the Prometheus text exposition format.
+import cProfile
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    """Escape a label value for the exposition format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+# ═══════════════════════════════════════════════════════════════
+# METRIC TYPES
+# ═══════════════════════════════════════════════════════════════
+
+class Counter:
+    """A monotonically increasing value per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1.0, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(labels.get(n, '') for n in self.labels), 0.0)
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labels, key)} {value:g}' for key, value in items]
+
+class Gauge(Counter):
+    """A value that can go up and down, or be set outright"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, '') for n in self.labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                labels = _format_labels(self.labels, key, 'le="%g"' % bound)
+                lines.append(f'{self.name}_bucket{labels} {count}')
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {series[-1]}')
+            labels = _format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {series[-2]:g}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+class MetricsRegistry:
+    """Holds every metric and renders them as one text document"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._metrics.get(name) or self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._metrics.get(name) or self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._metrics.get(name) or self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help_text}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = MetricsRegistry()
+
+request_duration = registry.histogram(
+    'ecolot_http_request_duration_seconds', 'Time spent handling requests', ('route', 'method', 'status'))
+sql_statements = registry.counter(
+    'ecolot_sql_statements_total', 'SQL statements executed', ('route',))
+sql_time = registry.counter(
+    'ecolot_sql_seconds_total', 'Time spent executing SQL statements', ('route',))
+sql_per_request = registry.histogram(
+    'ecolot_sql_statements_per_request', 'SQL statements executed per request', ('route',),
+    buckets=(0, 1, 2, 5, 10, 25, 50, 100, 250, 1000))
+slow_queries = registry.counter(
+    'ecolot_sql_slow_queries_total', 'SQL statements slower than the slow query threshold', ('route',))
+template_duration = registry.histogram(
+    'ecolot_template_render_seconds', 'Time spent rendering templates', ('template',))
+chart_duration = registry.histogram(
+    'ecolot_chart_render_seconds', 'Time spent rendering charts', ('chart',))
+
+# ═══════════════════════════════════════════════════════════════
+# INSTRUMENTATION HOOKS
+# ═══════════════════════════════════════════════════════════════
+
+def current_route():
+    """Route label for the active request ('-' outside of requests)"""
+    if not has_request_context():
+        return '-'
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+def timed_chart(func):
+    """Decorator recording how long a ChartGenerator method takes"""
+    chart = func.__name__.replace('generate_', '').replace('_chart', '')
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            chart_duration.observe(time.perf_counter() - started, chart=chart)
+    return wrapper
+
+# Shared with the SQLAlchemy listeners, which have no access to app.config
+_slow_query_seconds = [None]
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    elapsed = time.perf_counter() - started
+    route = current_route()
+
+    sql_statements.inc(route=route)
+    sql_time.inc(elapsed, route=route)
+    if has_request_context():
+        g.sql_count = g.get('sql_count', 0) + 1
+
+    threshold = _slow_query_seconds[0]
+    if threshold is not None and elapsed >= threshold:
+        slow_queries.inc(route=route)
+        logger.warning("Slow query (%.1f ms) on %s: %s", elapsed * 1000, route,
+                       ' '.join(statement.split())[:500])
+
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute; drop its timer
+    conn = context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+def _before_render(sender, template, context, **extra):
+    if has_request_context():
+        g.setdefault('template_started', []).append(time.perf_counter())
+
+def _after_render(sender, template, context, **extra):
+    if has_request_context() and g.get('template_started'):
+        elapsed = time.perf_counter() - g.template_started.pop()
+        template_duration.observe(elapsed, template=template.name or '-')
+
+def init_app(app):
+    """Install the request, SQL and template hooks on a Flask app"""
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    _slow_query_seconds[0] = app.config['SLOW_QUERY_MS'] / 1000.0
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        event.listen(Engine, 'handle_error', _handle_error)
+
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+
+    @app.after_request
+    def record_request(response):
+        started = g.get('request_started')
+        if started is not None:
+            route = current_route()
+            request_duration.observe(time.perf_counter() - started, route=route,
+                                     method=request.method, status=response.status_code)
+            sql_per_request.observe(g.get('sql_count', 0), route=route)
+        return response
+
+    app.wsgi_app = ProfilerMiddleware(app.wsgi_app, app)
+
+# ═══════════════════════════════════════════════════════════════
+# ON-DEMAND cProfile DUMPS
+# ═══════════════════════════════════════════════════════════════
+
+class ProfilerMiddleware:
+    """Profiles a single request with cProfile when it carries X-Profile: 1.
+
+    Only active when app.config['REQUEST_PROFILING'] is true. The .prof file
+    is written to REQUEST_PROFILE_DIR and its name is returned in the
+    X-Profile-File response header; open it with pstats or snakeviz.
+    """
+
+    def __init__(self, wsgi_app, flask_app):
+        self.wsgi_app = wsgi_app
+        self.flask_app = flask_app
+
+    def __call__(self, environ, start_response):
+        config = self.flask_app.config
+        if not config.get('REQUEST_PROFILING') or environ.get('HTTP_X_PROFILE') != '1':
+            return self.wsgi_app(environ, start_response)
+
+        profile_dir = config.get('REQUEST_PROFILE_DIR') or os.path.join(self.flask_app.instance_path, 'profiles')
+        os.makedirs(profile_dir, exist_ok=True)
+        path = environ.get('PATH_INFO', '/').strip('/').replace('/', '.') or 'root'
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{environ['REQUEST_METHOD']}-{re.sub(r'[^A-Za-z0-9_.-]', '_', path)}.prof"
+
+        streaming = []
+
+        def start_with_header(status, headers, exc_info=None):
+            if any(name.lower() == 'content-type' and value.startswith('text/event-stream')
+                   for name, value in headers):
+                streaming.append(True)
+            else:
+                headers.append(('X-Profile-File', filename))
+            return start_response(status, headers, exc_info)
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        result = None
+        try:
+            result = self.wsgi_app(environ, start_with_header)
+            if streaming:
+                # Event streams stay open as long as the client listens; pass them through unprofiled
+                return result
+            # Consume the body inside the profiler so streamed responses count too
+            body = list(result)
+        finally:
+            profiler.disable()
+            if not streaming:
+                # Runs the response's close callbacks (request teardown included)
+                if hasattr(result, 'close'):
+                    result.close()
+                profiler.dump_stats(os.path.join(profile_dir, filename))
+        return body
@@ -27,53 +27,29 @@ class User(UserMixin, db.Model):
     reservations = db.relationship('Reservation', backref='user', lazy=True)
     
     def get_total_spending(self):
-        """Calculate how much money this user has spent"""
-        total = 0.0
-        for reservation in self.reservations:
-            if reservation.parking_cost and not reservation.is_active:
-                total = total + reservation.parking_cost
-        return round(total, 2)
+        """Calculate how much money this user has spent (archived sessions included)"""
+        from app.archival import user_totals
+        return round(user_totals(self.id)[1], 2)
     
     def get_total_hours(self):
-        """Calculate total hours this user has been charged for"""
-        total_hours = 0
-        for reservation in self.reservations:
-            if reservation.hours_charged and not reservation.is_active:
-                total_hours = total_hours + reservation.hours_charged
-        return total_hours
+        """Calculate total hours this user has been charged for (archived sessions included)"""
+        from app.archival import user_totals
+        return user_totals(self.id)[2]
     
     def get_parking_frequency(self):
-        """Count how many times this user has parked (completed sessions)"""
-        count = 0
-        for reservation in self.reservations:
-            if not reservation.is_active:
-                count = count + 1
-        return count
+        """Count how many times this user has parked (completed sessions, archived ones included)"""
+        from app.archival import user_totals
+        return user_totals(self.id)[0]
     
     def get_favorite_location(self):
-        """Find which parking lot this user uses most often"""
-        location_count = {}
-        
-        # Count visits to each location
-        for reservation in self.reservations:
-            if not reservation.is_active and reservation.spot and reservation.spot.lot:
-                location_name = reservation.spot.lot.prime_location_name
-                if location_name in location_count:
-                    location_count[location_name] = location_count[location_name] + 1
-                else:
-                    location_count[location_name] = 1
-        
-        # Find the location with the highest count
-        if location_count:
-            max_count = 0
-            favorite_location = "No parking history"
-            for location, count in location_count.items():
-                if count > max_count:
-                    max_count = count
-                    favorite_location = location
-            return favorite_location
-        else:
-            return "No parking history"
+        """Find which parking lot this user uses most often (archived sessions included)"""
+        from app.archival import reservation_history
+        h = reservation_history.c
+        favorite = db.session.execute(
+            db.select(h.lot_name).where(h.user_id == self.id, h.is_active == db.false())
+            .group_by(h.lot_name).order_by(db.func.count().desc(), h.lot_name).limit(1)
+        ).scalar()
+        return favorite or "No parking history"
 
 # ═══════════════════════════════════════════════════════════════
 # PARKING LOT TABLE - Different parking locations
@@ -91,17 +67,23 @@ class ParkingLot(db.Model):
     # Connection to parking spots (one lot has many spots)
     spots = db.relationship('ParkingSpot', backref='lot', lazy=True, cascade='all, delete-orphan')
     
+    # Cached hour-of-week occupancy forecasts for this lot
+    forecasts = db.relationship('LotForecast', backref='lot', lazy=True, cascade='all, delete-orphan')
+    
     def get_occupancy_stats(self):
         """Calculate how many spots are occupied vs available right now"""
         total_spots = len(self.spots)
         occupied_spots = 0
+        unknown_spots = 0
         
         # Count how many spots are occupied
         for spot in self.spots:
-            if spot.status == 'O':  # 'O' means Occupied
+            if spot.status in ('O', 'H'):  # 'O' means Occupied, 'H' held for someone on the waitlist
                 occupied_spots = occupied_spots + 1
+            elif spot.status == 'U':  # 'U' means its sensor went silent
+                unknown_spots = unknown_spots + 1
         
-        available_spots = total_spots - occupied_spots
+        available_spots = total_spots - occupied_spots - unknown_spots
         
         # Calculate occupancy percentage
         if total_spots > 0:
@@ -113,30 +95,27 @@ class ParkingLot(db.Model):
             "total": total_spots,
             "occupied": occupied_spots,
             "available": available_spots,
+            "unknown": unknown_spots,
             "occupancy_rate": occupancy_rate
         }
     
     def get_total_revenue(self):
-        """Calculate total money earned from this parking lot (completed sessions only)"""
-        total_revenue = 0.0
-        
-        # Go through each parking spot in this lot
-        for spot in self.spots:
-            # Go through each reservation for this spot
-            for reservation in spot.reservations:
-                # Only count completed reservations that have been paid
-                if reservation.parking_cost and not reservation.is_active:
-                    total_revenue = total_revenue + reservation.parking_cost
+        """Calculate total money earned from this parking lot (completed sessions only).
         
-        return round(total_revenue, 2)
+        Reads the reservation history, so archived sessions and sessions on
+        since-deleted spots still count.
+        """
+        from app.archival import lot_revenue
+        return lot_revenue(self.id)
     
     def get_total_spots_ever_occupied(self):
         """Count unique spots that have been used at least once"""
-        used_spots = 0
-        for spot in self.spots:
-            if len(spot.reservations) > 0:
-                used_spots = used_spots + 1
-        return used_spots
+        from app.archival import reservation_history
+        h = reservation_history.c
+        return db.session.execute(
+            db.select(db.func.count(h.spot_id.distinct())).where(
+                h.lot_id == self.id, h.spot_id.in_(db.select(ParkingSpot.id).where(ParkingSpot.lot_id == self.id)))
+        ).scalar()
 
 # ═══════════════════════════════════════════════════════════════
 # PARKING SPOT TABLE - Individual parking spaces within a lot
@@ -146,11 +125,14 @@ class ParkingSpot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
     spot_number = db.Column(db.String(10), nullable=False)  # Like A001, A002, etc.
-    status = db.Column(db.String(1), default='A', nullable=False)  # 'A'=Available, 'O'=Occupied
+    status = db.Column(db.String(1), default='A', nullable=False)  # 'A'=Available, 'O'=Occupied, 'U'=Unknown (sensor silent), 'H'=Held for a waitlisted user
     
     # Connection to reservations (one spot can have many reservations over time)
     reservations = db.relationship('Reservation', backref='spot', lazy=True)
     
+    # Sensors watching this spot (their spot_id is cleared if the spot is deleted)
+    devices = db.relationship('SensorDevice', backref='spot', lazy=True)
+    
     def get_current_reservation(self):
         """Find if someone is currently parked in this spot"""
         for reservation in self.reservations:
@@ -162,6 +144,9 @@ class ParkingSpot(db.Model):
 # RESERVATION TABLE - Records of parking sessions
 # ═══════════════════════════════════════════════════════════════
 class Reservation(db.Model):
+    # AUTOINCREMENT: ids of archived rows are never reused (see archival.py)
+    __table_args__ = {'sqlite_autoincrement': True}
+    
     # Basic reservation information
     id = db.Column(db.Integer, primary_key=True)
     spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
@@ -178,12 +163,17 @@ class Reservation(db.Model):
     # Cost information
     parking_cost = db.Column(db.Float, nullable=True)
     hours_charged = db.Column(db.Integer, nullable=True)
+    price_rates = db.Column(db.LargeBinary, nullable=True)  # the lot's hourly rates when the car parked (see pricing.py)
     
     # Status
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     
-    def calculate_cost(self, hourly_rate):
-        """Calculate parking cost based on duration and hourly rate"""
+    def calculate_cost(self, hourly_rate, price_table=None):
+        """Calculate parking cost based on duration and hourly rate.
+        
+        When a PriceTable is given each charged hour is billed at the rate of
+        its own hour slot instead of the flat hourly rate.
+        """
         if not self.leaving_timestamp:
             return 0.0, 0
         
@@ -199,6 +189,8 @@ class Reservation(db.Model):
             charged_hours = math.ceil(duration_in_hours)  # Round up to next hour
         
         # Calculate total cost
+        if price_table is not None:
+            return price_table.cost(self.parking_timestamp, charged_hours), charged_hours
         total_cost = charged_hours * hourly_rate
         
         return round(total_cost, 2), charged_hours
@@ -225,3 +217,235 @@ class Reservation(db.Model):
             return f"{hours}h {minutes}m"
         else:
             return f"{minutes}m"
+
+# ═══════════════════════════════════════════════════════════════
+# FORECAST TABLES - Cached occupancy forecasts per lot
+# ═══════════════════════════════════════════════════════════════
+class LotForecast(db.Model):
+    # One row per lot per hour of the week (0 = Monday 00:00 UTC)
+    id = db.Column(db.Integer, primary_key=True)
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False, index=True)
+    hour_of_week = db.Column(db.Integer, nullable=False)
+    
+    # Running totals used to refit the model incrementally
+    occupied_hours = db.Column(db.Float, default=0.0, nullable=False)  # spot-hours seen in this slot
+    observed_slots = db.Column(db.Integer, default=0, nullable=False)  # times this slot was observed
+    
+    # Fitted value: how many spots we expect to be occupied in this slot
+    expected_occupied = db.Column(db.Float, default=0.0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (db.UniqueConstraint('lot_id', 'hour_of_week'),)
+
+class ForecastState(db.Model):
+    # Single row remembering how far the forecasts have been trained
+    id = db.Column(db.Integer, primary_key=True)
+    trained_until = db.Column(db.DateTime, nullable=True)
+
+# ═══════════════════════════════════════════════════════════════
+# LOT VERSION TABLE - Bumped whenever anything shown on a lot card changes
+# ═══════════════════════════════════════════════════════════════
+class LotVersion(db.Model):
+    lot_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+# ═══════════════════════════════════════════════════════════════
+# SENSOR DEVICE TABLE - IR / ultrasonic sensors reporting spot status
+# ═══════════════════════════════════════════════════════════════
+class SensorDevice(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.String(32), unique=True, nullable=False)  # MAC address sent by the sensor
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=True, index=True)
+    
+    # Last report
+    last_seen = db.Column(db.DateTime, nullable=False)
+    last_status = db.Column(db.String(1), nullable=True)  # 'A' or 'O' as reported
+    report_count = db.Column(db.Integer, default=0, nullable=False)
+    uptime_ms = db.Column(db.BigInteger, nullable=True)  # device clock at the last binary frame (see device_registry.py)
+    
+    # Health: 'ok' while reporting, 'silent' once it missed its deadline
+    health = db.Column(db.String(10), default='ok', nullable=False)
+    healthy_since = db.Column(db.DateTime, nullable=False, index=True)  # registration or recovery time
+    flagged_at = db.Column(db.DateTime, nullable=True)
+    registered_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# When a sensor first reported its spot empty; removed when it reports a car again
+class SpotVacancy(db.Model):
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), primary_key=True)
+    vacant_since = db.Column(db.DateTime, nullable=False)
+
+# ═══════════════════════════════════════════════════════════════
+# ADVANCE BOOKING TABLE - Spots reserved for a future time window
+# ═══════════════════════════════════════════════════════════════
+class AdvanceBooking(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=False)
+    
+    # The booked window, [start_time, end_time)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    
+    # Vehicle information
+    vehicle_license_plate = db.Column(db.String(20), nullable=False)
+    vehicle_color = db.Column(db.String(20), nullable=False)
+    
+    # 'booked' until the user checks in ('checked_in') or cancels ('cancelled')
+    status = db.Column(db.String(10), default='booked', nullable=False)
+    reservation_id = db.Column(db.Integer, db.ForeignKey('reservation.id'), nullable=True)  # set at check-in
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)  # other workers sync from this
+    
+    # Finished bookings go with their spot (upcoming ones block deleting it)
+    spot = db.relationship('ParkingSpot', backref=db.backref('advance_bookings', lazy=True, cascade='all, delete-orphan'))
+    user = db.relationship('User', backref=db.backref('advance_bookings', lazy=True))
+    
+    __table_args__ = (db.Index('ix_advance_booking_spot_start', 'spot_id', 'start_time'),)
+
+# ═══════════════════════════════════════════════════════════════
+# MARKETPLACE TABLES - Private spots offered by owners, requested by drivers
+# ═══════════════════════════════════════════════════════════════
+class SpotListing(db.Model):
+    # A private spot offered for one window, [start_time, end_time)
+    id = db.Column(db.Integer, primary_key=True)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    title = db.Column(db.String(100), nullable=False)  # Like "Driveway near MG Road"
+    address = db.Column(db.Text, nullable=False)
+    pin_code = db.Column(db.String(10), nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    price_per_hour = db.Column(db.Float, nullable=False)
+    
+    # 'open' until matched with a request ('matched') or withdrawn ('withdrawn')
+    status = db.Column(db.String(10), default='open', nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)  # other workers sync from this
+    
+    owner = db.relationship('User', backref=db.backref('spot_listings', lazy=True))
+
+class SpotRequest(db.Model):
+    # A driver looking for a spot near a point for a window
+    id = db.Column(db.Integer, primary_key=True)
+    driver_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+    max_price_per_hour = db.Column(db.Float, nullable=False)
+    max_distance_km = db.Column(db.Float, nullable=False)
+    vehicle_license_plate = db.Column(db.String(20), nullable=False)
+    
+    # 'open' until matched with a listing ('matched') or cancelled ('cancelled')
+    status = db.Column(db.String(10), default='open', nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    driver = db.relationship('User', backref=db.backref('spot_requests', lazy=True))
+
+class MarketMatch(db.Model):
+    # A listing paired with a request by the matching engine
+    id = db.Column(db.Integer, primary_key=True)
+    listing_id = db.Column(db.Integer, db.ForeignKey('spot_listing.id'), nullable=False, unique=True)
+    request_id = db.Column(db.Integer, db.ForeignKey('spot_request.id'), nullable=False, unique=True)
+    price_per_hour = db.Column(db.Float, nullable=False)  # the owner's asking price
+    distance_km = db.Column(db.Float, nullable=False)
+    matched_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    listing = db.relationship('SpotListing', backref=db.backref('match', uselist=False))
+    request = db.relationship('SpotRequest', backref=db.backref('match', uselist=False))
+
+# ═══════════════════════════════════════════════════════════════
+# WAITLIST TABLE - Users queued for a full lot, served first come first served
+# ═══════════════════════════════════════════════════════════════
+class WaitlistEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # queue order within a lot
+    lot_id = db.Column(db.Integer, db.ForeignKey('parking_lot.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    
+    # 'waiting' -> 'offered' (a spot is held for them) -> 'booked' or 'expired'; 'left' if they gave up
+    status = db.Column(db.String(10), default='waiting', nullable=False)
+    spot_id = db.Column(db.Integer, db.ForeignKey('parking_spot.id'), nullable=True)  # the held spot
+    hold_until = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)  # other workers sync from this
+    
+    lot = db.relationship('ParkingLot', backref=db.backref('waitlist', lazy=True, cascade='all, delete-orphan'))
+    spot = db.relationship('ParkingSpot')
+    user = db.relationship('User', backref=db.backref('waitlist_entries', lazy=True))
+    
+    __table_args__ = (
+        db.Index('ix_waitlist_lot_status', 'lot_id', 'status', 'id'),
+        db.Index('ix_waitlist_status_hold', 'status', 'hold_until'),
+    )
+
+# ═══════════════════════════════════════════════════════════════
+# LIVE UPDATE TABLE - Notifications waiting to be pushed to a user's browser
+# ═══════════════════════════════════════════════════════════════
+class UserEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)  # also the SSE event id
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)  # Like 'waitlist_offer'
+    payload = db.Column(db.Text, nullable=False)     # JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (db.Index('ix_user_event_user_id', 'user_id', 'id'),)
+
+# ═══════════════════════════════════════════════════════════════
+# BACKGROUND JOB TABLE - Heavy admin work queued for the job workers
+# ═══════════════════════════════════════════════════════════════
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(40), nullable=False)  # Like 'create_spots'; names a registered handler
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments for the handler
+    
+    # 'queued' -> 'running' -> 'done' or 'failed' (retried through 'queued' first); 'cancelled' before it ran
+    status = db.Column(db.String(10), default='queued', nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    max_attempts = db.Column(db.Integer, default=3, nullable=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # retries wait until then
+    
+    # Reported by the handler while it runs
+    progress = db.Column(db.Float, default=0.0, nullable=False)  # 0 to 1
+    message = db.Column(db.String(255), nullable=True)
+    result = db.Column(db.Text, nullable=True)  # JSON returned by the handler
+    error = db.Column(db.Text, nullable=True)   # traceback of the last failure
+    
+    # A running job belongs to one worker until its lease runs out
+    worker = db.Column(db.String(64), nullable=True)
+    lease_until = db.Column(db.DateTime, nullable=True)
+    
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    user = db.relationship('User')
+    
+    __table_args__ = (db.Index('ix_job_status_run_after', 'status', 'run_after'),)
+    
+    @property
+    def active(self):
+        return self.status in ('queued', 'running')
+
+# ═══════════════════════════════════════════════════════════════
+# AUTO-CLOSED SESSION TABLE - Sessions the reconciler released for users
+# ═══════════════════════════════════════════════════════════════
+class AutoClosedSession(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    reservation_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    lot_id = db.Column(db.Integer, nullable=True)
+    spot_id = db.Column(db.Integer, nullable=True)
+    
+    # 'vacant' (the sensor saw the spot empty past the grace period) or 'overdue' (over the maximum duration)
+    reason = db.Column(db.String(10), nullable=False)
+    parked_at = db.Column(db.DateTime, nullable=False)
+    closed_at = db.Column(db.DateTime, nullable=False)  # the leaving time billed
+    parking_cost = db.Column(db.Float, nullable=True)
+    hours_charged = db.Column(db.Integer, nullable=True)
+    detected_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    
+    user = db.relationship('User')
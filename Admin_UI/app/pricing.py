@@ -0,0 +1,159 @@
+# Occupancy-driven dynamic pricing
+#
+# Every lot gets a precomputed table of 168 hourly rates (one per hour of the
+# week) built from the forecast demand and the lot's live occupancy. Looking
+# up a rate is a single array index and pricing a session of any length is a
+# couple of prefix-sum lookups, so the release and estimate pages never do
+# more work for a week-long stay than for a one-hour stay.
+#
+# A session is billed from the table in force when the car parked: its rates
+# are snapshotted onto the reservation (168 values in paise, 672 bytes), so
+# the hours already parked are not repriced by whatever the lot's occupancy
+# is at release time. Tables are rebuilt on a short TTL rather than on every
+# booking and release, which keeps a busy lot from rebuilding on every hit.
+import math
+import time
+import threading
+import numpy as np
+from datetime import datetime
+from app.models import db, ParkingSpot, LotForecast
+from app.forecasting import HOURS_PER_WEEK, hour_of_week
+
+# Occupancy we aim for; busier slots cost more, quieter slots cost less
+TARGET_OCCUPANCY = 0.6
+
+# How strongly the rate reacts to demand above or below the target
+SENSITIVITY = 1.5
+
+# Rates never leave this band around the lot's base price
+MIN_MULTIPLIER = 0.8
+MAX_MULTIPLIER = 2.0
+
+# Multipliers are rounded to this step so prices stay readable
+MULTIPLIER_STEP = 0.05
+
+# The next few hours lean on live occupancy rather than the forecast
+LIVE_HOURS = 3
+
+# Tables are rebuilt this often, which is how live occupancy reaches them
+TABLE_TTL_SECONDS = 60
+
+class PriceTable:
+    """Hourly rates for one lot, indexed by hour of the week"""
+
+    __slots__ = ('lot_id', 'base_price', 'rates', 'prefix', 'week_total', 'built_at')
+
+    def __init__(self, lot_id, base_price, rates):
+        self.lot_id = lot_id
+        self.base_price = base_price
+        self.rates = np.asarray(rates, dtype=np.float64)
+
+        # Prefix sums over two weeks so any run of up to 168 slots is one subtraction
+        self.prefix = np.concatenate(([0.0], np.cumsum(np.tile(self.rates, 2))))
+        self.week_total = float(self.prefix[HOURS_PER_WEEK])
+        self.built_at = time.monotonic()
+
+    def rate_at(self, when):
+        """Hourly rate in force at a given time"""
+        return float(self.rates[hour_of_week(when)])
+
+    def cost(self, start, charged_hours):
+        """Total price of `charged_hours` consecutive hours beginning at `start`"""
+        slot = hour_of_week(start)
+        weeks, remainder = divmod(int(charged_hours), HOURS_PER_WEEK)
+        partial = self.prefix[slot + remainder] - self.prefix[slot]
+        return round(weeks * self.week_total + float(partial), 2)
+
+    def hourly_breakdown(self, start, charged_hours):
+        """Rate charged for each hour of a session, as an array"""
+        slots = (hour_of_week(start) + np.arange(int(charged_hours))) % HOURS_PER_WEEK
+        return self.rates[slots]
+
+    def snapshot(self):
+        """The rates as bytes, to be stored on a reservation when the car parks"""
+        return np.round(self.rates * 100).astype('<u4').tobytes()
+
+    @classmethod
+    def from_snapshot(cls, lot_id, base_price, data):
+        """The table a snapshot() was taken from"""
+        return cls(lot_id, base_price, np.frombuffer(data, dtype='<u4') / 100.0)
+
+def flat_price_table(lot):
+    """A table that charges the lot's base price around the clock"""
+    return PriceTable(lot.id, lot.price, np.full(HOURS_PER_WEEK, lot.price))
+
+def build_rates(base_price, expected_occupied, capacity, live_occupied, now):
+    """Turn forecast demand plus live occupancy into 168 hourly rates"""
+    capacity = max(capacity, 1)
+    if expected_occupied is None:
+        # No forecast yet: treat every slot as running at the target
+        demand = np.full(HOURS_PER_WEEK, TARGET_OCCUPANCY)
+    else:
+        demand = np.asarray(expected_occupied, dtype=np.float64) / capacity
+
+    # Fade from live occupancy (this hour) to the forecast (a few hours out)
+    upcoming = (hour_of_week(now) + np.arange(LIVE_HOURS)) % HOURS_PER_WEEK
+    live_weight = np.linspace(1.0, 0.0, LIVE_HOURS, endpoint=False)
+    demand[upcoming] = live_weight * (live_occupied / capacity) + (1 - live_weight) * demand[upcoming]
+
+    multiplier = np.clip(1 + SENSITIVITY * (demand - TARGET_OCCUPANCY), MIN_MULTIPLIER, MAX_MULTIPLIER)
+    multiplier = np.round(multiplier / MULTIPLIER_STEP) * MULTIPLIER_STEP
+    return np.round(base_price * multiplier, 2)
+
+class PricingEngine:
+    """Keeps one precomputed PriceTable per lot and hands them out"""
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def price_table(self, lot):
+        """Current price table for a lot, rebuilding it if it is out of date"""
+        if not self.enabled:
+            return flat_price_table(lot)
+
+        table = self._tables.get(lot.id)
+        if (table is None or table.base_price != lot.price
+                or time.monotonic() - table.built_at > TABLE_TTL_SECONDS):
+            table = self._build(lot)
+            with self._lock:
+                self._tables[lot.id] = table
+        return table
+
+    def session_table(self, lot, snapshot=None):
+        """The table a session is billed from: its snapshot, else the lot's current table"""
+        if snapshot is not None and len(snapshot) == HOURS_PER_WEEK * 4:
+            return PriceTable.from_snapshot(lot.id, lot.price, snapshot)
+        return self.price_table(lot)
+
+    def _build(self, lot):
+        """Build a lot's table from its forecast rows and live occupancy"""
+        rows = db.session.query(LotForecast.hour_of_week, LotForecast.expected_occupied).filter(
+            LotForecast.lot_id == lot.id
+        ).all()
+        expected = None
+        if rows:
+            expected = np.zeros(HOURS_PER_WEEK)
+            for slot, occupied in rows:
+                expected[slot] = occupied
+
+        live_occupied = ParkingSpot.query.filter_by(lot_id=lot.id, status='O').count()
+        rates = build_rates(lot.price, expected, lot.maximum_number_of_spots,
+                            live_occupied, datetime.utcnow())
+        return PriceTable(lot.id, lot.price, rates)
+
+    def invalidate(self, lot_id):
+        """Drop a lot's table so the next read rebuilds it"""
+        with self._lock:
+            self._tables.pop(lot_id, None)
+
+    def invalidate_all(self):
+        """Drop every table, e.g. after the forecasts are refreshed"""
+        with self._lock:
+            self._tables.clear()
+
+def charged_hours_for(start, end):
+    """Hours billed for a stay: rounded up, never less than one"""
+    hours = (end - start).total_seconds() / 3600
+    return max(1, math.ceil(hours))
@@ -0,0 +1,154 @@
+# Bulk provisioning of parking lots and spots
+#
+# Spots are written with Core executemany inserts instead of one ORM object
+# per spot, and large batches are committed in chunks so a 5,000-spot garage
+# never holds thousands of pending objects in the session.
+import csv
+import io
+import json
+from app.models import db, ParkingLot, ParkingSpot
+from app import archival
+
+# Rows written per executemany call / per commit
+SPOT_CHUNK_SIZE = 1000
+
+# Most lots written per import transaction; lots with many spots go fewer
+# at a time, so a transaction holds about SPOT_CHUNK_SIZE spots
+LOT_CHUNK_SIZE = 200
+
+class LotImportError(ValueError):
+    """Raised when an import file cannot be read at all"""
+
+def spot_number(index):
+    """Spot label for the index-th spot of a lot: A001, A002, ..."""
+    return f"A{index:03d}"
+
+def bulk_create_spots(lot_id, first, last, chunk_size=SPOT_CHUNK_SIZE, commit=True):
+    """Create spots numbered first..last (inclusive) for a lot.
+
+    Rows go through a Core INSERT with executemany, one chunk at a time.
+    With commit=True every chunk is committed so long runs never hold a
+    big transaction open. Returns the number of spots created.
+    """
+    table = ParkingSpot.__table__
+    created = 0
+    for chunk_start in range(first, last + 1, chunk_size):
+        chunk_end = min(chunk_start + chunk_size - 1, last)
+        rows = [
+            {'lot_id': lot_id, 'spot_number': spot_number(i), 'status': 'A'}
+            for i in range(chunk_start, chunk_end + 1)
+        ]
+        db.session.execute(table.insert(), rows)
+        if commit:
+            db.session.commit()
+        created += len(rows)
+    return created
+
+def delete_spots(spots):
+    """Archive the parking history of some spots, then delete them.
+
+    Their finished advance bookings go with them. The history is moved
+    (and committed) first; the deletes are left for the caller to commit.
+    Returns the number of reservations archived.
+    """
+    moved = archival.archive_spot_history([spot.id for spot in spots])
+    for spot in spots:
+        db.session.delete(spot)
+    return moved
+
+# ═══════════════════════════════════════════════════════════════
+# LOT IMPORT (CSV / JSON)
+# ═══════════════════════════════════════════════════════════════
+
+# Accepted column names for each lot field
+FIELD_ALIASES = {
+    'prime_location_name': ('prime_location_name', 'location_name', 'name'),
+    'address': ('address',),
+    'pin_code': ('pin_code', 'pincode', 'pin'),
+    'price': ('price', 'price_per_hour'),
+    'maximum_number_of_spots': ('maximum_number_of_spots', 'max_spots', 'spots'),
+}
+
+def read_lot_file(filename, data):
+    """Parse an uploaded CSV or JSON file into a list of raw records"""
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+
+    if filename.lower().endswith('.json'):
+        try:
+            parsed = json.loads(data)
+        except json.JSONDecodeError as e:
+            raise LotImportError(f'Invalid JSON: {e}')
+        if isinstance(parsed, dict):
+            parsed = parsed.get('lots', [])
+        if not isinstance(parsed, list):
+            raise LotImportError('JSON must be a list of lots or {"lots": [...]}')
+        return parsed
+
+    if filename.lower().endswith('.csv'):
+        return list(csv.DictReader(io.StringIO(data)))
+
+    raise LotImportError('Only .csv and .json files can be imported')
+
+def clean_lot_record(record):
+    """Validate one raw record and return the ParkingLot column values"""
+    values = {}
+    for field, aliases in FIELD_ALIASES.items():
+        raw = next((record[a] for a in aliases if record.get(a) not in (None, '')), None)
+        if raw is None:
+            raise ValueError(f'missing {aliases[0]}')
+        values[field] = raw.strip() if isinstance(raw, str) else raw
+
+    try:
+        values['price'] = float(values['price'])
+        values['maximum_number_of_spots'] = int(values['maximum_number_of_spots'])
+    except (TypeError, ValueError):
+        raise ValueError('price and max_spots must be numbers')
+
+    if values['price'] < 0 or values['maximum_number_of_spots'] < 1:
+        raise ValueError('price must be >= 0 and max_spots >= 1')
+    values['pin_code'] = str(values['pin_code'])
+    return values
+
+def import_lots(records, chunk_size=LOT_CHUNK_SIZE, spot_chunk_size=SPOT_CHUNK_SIZE, progress=None):
+    """Create many lots (and all their spots) from raw records.
+
+    Invalid rows are skipped and reported; valid ones are created in chunks
+    of about spot_chunk_size spots (at most chunk_size lots), calling
+    progress(lots_done, lots_total) after each. A lot with more spots than
+    that is a chunk of its own, committed as its spots are written. Returns
+    (lots_created, spots_created, errors) where errors is a list of
+    (row_number, message).
+    """
+    valid, errors = [], []
+    for row_number, record in enumerate(records, start=1):
+        try:
+            valid.append(clean_lot_record(record))
+        except (ValueError, AttributeError) as e:
+            errors.append((row_number, str(e)))
+
+    lots_created = spots_created = 0
+    chunk_start = 0
+    while chunk_start < len(valid):
+        chunk_end, spots = chunk_start, 0
+        while chunk_end < len(valid) and chunk_end - chunk_start < chunk_size:
+            size = valid[chunk_end]['maximum_number_of_spots']
+            if chunk_end > chunk_start and spots + size > spot_chunk_size:
+                break
+            spots += size
+            chunk_end += 1
+
+        lots = [ParkingLot(**values) for values in valid[chunk_start:chunk_end]]
+        db.session.add_all(lots)
+        db.session.flush()  # assigns ids
+
+        for lot in lots:
+            spots_created += bulk_create_spots(lot.id, 1, lot.maximum_number_of_spots,
+                                               chunk_size=spot_chunk_size, commit=len(lots) == 1)
+        db.session.commit()
+        lots_created += len(lots)
+        if progress:
+            progress(lots_created, len(valid))
+        chunk_start = chunk_end
+
+    return lots_created, spots_created, errors
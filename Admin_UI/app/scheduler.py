@@ -0,0 +1,54 @@
+# Tiny in-process scheduler for periodic maintenance work
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+def run_every(app, interval_seconds, func, name):
+    """Call func() inside an app context every interval_seconds on a daemon thread.
+
+    Errors are logged and the loop keeps going. Returns a threading.Event
+    that stops the loop when set.
+    """
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval_seconds):
+            try:
+                with app.app_context():
+                    func()
+            except Exception:
+                logger.exception("Scheduled task %s failed", name)
+
+    thread = threading.Thread(target=loop, name=f"scheduler-{name}", daemon=True)
+    thread.start()
+    return stop
+
+def run_forever(app, interval_seconds, func, name):
+    """Call func() inside an app context now and every interval_seconds after, on this thread.
+
+    For management commands that do a background task's work under a WSGI
+    server, where the development server's threads never start.
+    """
+    while True:
+        try:
+            with app.app_context():
+                func()
+        except Exception:
+            logger.exception("Scheduled task %s failed", name)
+        time.sleep(interval_seconds)
+
+def run_all(app, tasks):
+    """Run (interval_seconds, func, name) tasks with run_every and block until interrupted.
+
+    Does for a WSGI deployment what the development server's threads do,
+    in one long-running process.
+    """
+    stops = [run_every(app, interval_seconds, func, name) for interval_seconds, func, name in tasks]
+    try:
+        while True:
+            time.sleep(3600)
+    finally:
+        for stop in stops:
+            stop.set()
@@ -0,0 +1,88 @@
+# Compact binary sensor frames
+#
+# A request body is a 4-byte header followed by any number of fixed-size
+# frames, all little-endian:
+#
+#   header  magic 'EL' (2s) | version (u8) | frame size in bytes (u8)
+#   frame   spot_id (u32) | device MAC (6 bytes) | status (u8, 'A' or 'O')
+#           | flags (u8, reserved) | timestamp_ms (u32, device uptime)
+#
+# 16 bytes per reading instead of ~130 bytes of JSON. Frames are parsed with
+# np.frombuffer, which is a zero-copy view over the request body.
+import struct
+import numpy as np
+
+MAGIC = b'EL'
+VERSION = 1
+
+HEADER = struct.Struct('<2sBB')
+FRAME = struct.Struct('<I6sBBI')
+
+FRAME_DTYPE = np.dtype([
+    ('spot_id', '<u4'),
+    ('device', 'u1', (6,)),
+    ('status', 'u1'),
+    ('flags', 'u1'),
+    ('timestamp_ms', '<u4'),
+])
+
+STATUS_CODES = {ord('A'): 'A', ord('O'): 'O'}
+
+class FrameError(ValueError):
+    """Raised when a request body is not a valid frame batch"""
+
+def decode_frames(body):
+    """Structured array of the frames in a request body (a view, not a copy)"""
+    if len(body) < HEADER.size:
+        raise FrameError('body is shorter than the frame header')
+    magic, version, frame_size = HEADER.unpack_from(body)
+    if magic != MAGIC:
+        raise FrameError('bad magic, expected EL')
+    if version != VERSION or frame_size != FRAME_DTYPE.itemsize:
+        raise FrameError(f'unsupported frame version {version} / size {frame_size}')
+    if (len(body) - HEADER.size) % frame_size:
+        raise FrameError('body length is not a whole number of frames')
+    return np.frombuffer(body, dtype=FRAME_DTYPE, offset=HEADER.size)
+
+def encode_frames(readings):
+    """Request body for (spot_id, mac_bytes, status, timestamp_ms) readings"""
+    parts = [HEADER.pack(MAGIC, VERSION, FRAME.size)]
+    for spot_id, mac, status, timestamp_ms in readings:
+        parts.append(FRAME.pack(spot_id, mac, ord(status), 0, timestamp_ms & 0xFFFFFFFF))
+    return b''.join(parts)
+
+def mac_to_int(macs):
+    """(n, 6) uint8 MAC bytes -> n uint64 values, for fast de-duplication"""
+    padded = np.zeros((len(macs), 8), dtype=np.uint8)
+    padded[:, 2:] = macs
+    return padded.view('>u8').ravel()
+
+def format_mac(value):
+    """48-bit integer -> 'AA:BB:CC:DD:EE:FF', the form the JSON path uses"""
+    return value.to_bytes(6, 'big').hex(':').upper()
+
+def readings_from_frames(frames):
+    """(device_id, spot_id, status, timestamp_ms) readings, keeping each device's last frame.
+
+    Returns (readings, invalid) where invalid counts frames with a bad status.
+    """
+    status = frames['status']
+    valid = (status == ord('A')) | (status == ord('O'))
+    invalid = int(len(frames) - np.count_nonzero(valid))
+    frames = frames[valid]
+    if not len(frames):
+        return [], invalid
+
+    # Later frames from the same device supersede earlier ones
+    macs = mac_to_int(frames['device'])
+    _, first_from_end = np.unique(macs[::-1], return_index=True)
+    last = np.sort(len(frames) - 1 - first_from_end)
+
+    readings = [
+        (format_mac(mac), spot_id, STATUS_CODES[code], timestamp_ms)
+        for mac, spot_id, code, timestamp_ms in zip(macs[last].tolist(),
+                                                    frames['spot_id'][last].tolist(),
+                                                    frames['status'][last].tolist(),
+                                                    frames['timestamp_ms'][last].tolist())
+    ]
+    return readings, invalid
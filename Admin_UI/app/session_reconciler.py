@@ -0,0 +1,154 @@
+# Automatic release of stale parking sessions
+#
+# A session stays active until its user presses release, so a forgotten
+# one keeps its spot 'O' and out of everyone's reach. On every run the
+# reconciler closes two kinds of session:
+#
+#   vacant  - the spot's sensor (healthy, reporting since the session began)
+#             has seen it empty for longer than the grace period. The stay
+#             is billed up to when the spot emptied.
+#   overdue - the session has run longer than the maximum duration. It is
+#             billed up to now.
+#
+# Sessions are found a batch at a time with one join each and closed with
+# one executemany UPDATE per batch, guarded by is_active so a user who
+# releases at the same moment wins, then one UPDATE frees the spots and the
+# closures are written to the auto_closed_session report table. Billing is
+# the same as a manual release: whole hours, at least one, priced from the
+# rates snapshotted when the car parked.
+from datetime import datetime, timedelta
+from sqlalchemy import update, insert, bindparam, exists
+from app.models import db, ParkingLot, ParkingSpot, Reservation, SensorDevice, SpotVacancy, AutoClosedSession
+from app.pricing import charged_hours_for
+from app.device_registry import HEALTH_OK
+from app import metrics
+
+VACANT = 'vacant'
+OVERDUE = 'overdue'
+
+# How long a sensor must see a booked spot empty before its session is closed
+DEFAULT_GRACE = timedelta(minutes=20)
+
+# Sessions running longer than this are closed whatever the sensors say
+DEFAULT_MAX_DURATION = timedelta(hours=24)
+
+# Sessions closed per transaction, and transactions per run
+BATCH_SIZE = 500
+MAX_BATCHES = 20
+
+sessions_closed = metrics.registry.counter(
+    'ecolot_sessions_auto_closed_total', 'Parking sessions released by the reconciler', labels=('reason',))
+
+class SessionReconciler:
+    """Finds and closes stale sessions; price_table(lot, snapshot) prices them like a manual release"""
+
+    def __init__(self, price_table, grace=DEFAULT_GRACE, max_duration=DEFAULT_MAX_DURATION,
+                 batch_size=BATCH_SIZE, max_batches=MAX_BATCHES, on_closed=None):
+        self.price_table = price_table
+        self.grace = grace
+        self.max_duration = max_duration
+        self.batch_size = batch_size
+        self.max_batches = max_batches
+        self.on_closed = on_closed      # on_closed(rows), rows as written to the report table
+
+    # Finding
+
+    def vacant_sessions(self, now):
+        """(reservation, user, spot, lot, parked at, leaving time) for sessions whose spot emptied"""
+        cutoff = now - self.grace
+        rows = db.session.query(
+            Reservation.id, Reservation.user_id, Reservation.spot_id, ParkingSpot.lot_id,
+            Reservation.parking_timestamp, SpotVacancy.vacant_since
+        ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id).join(
+            SpotVacancy, SpotVacancy.spot_id == Reservation.spot_id
+        ).filter(
+            Reservation.is_active == True,
+            SpotVacancy.vacant_since <= cutoff,
+            Reservation.parking_timestamp <= cutoff,
+            # The reading must be from this session, not left over from before it
+            exists().where(SensorDevice.spot_id == Reservation.spot_id, SensorDevice.health == HEALTH_OK,
+                           SensorDevice.last_status == 'A',
+                           SensorDevice.last_seen >= Reservation.parking_timestamp)
+        ).order_by(Reservation.id).limit(self.batch_size).all()
+        # Empty since before the session began means the car never arrived
+        return [(rid, uid, sid, lid, parked, max(parked, since)) for rid, uid, sid, lid, parked, since in rows]
+
+    def overdue_sessions(self, now):
+        """The same, for sessions over the maximum duration (billed up to now)"""
+        rows = db.session.query(
+            Reservation.id, Reservation.user_id, Reservation.spot_id, ParkingSpot.lot_id,
+            Reservation.parking_timestamp
+        ).join(ParkingSpot, Reservation.spot_id == ParkingSpot.id).filter(
+            Reservation.is_active == True,
+            Reservation.parking_timestamp <= now - self.max_duration
+        ).order_by(Reservation.id).limit(self.batch_size).all()
+        return [(rid, uid, sid, lid, parked, now) for rid, uid, sid, lid, parked in rows]
+
+    # Closing
+
+    def close(self, sessions, reason, now):
+        """Bill and close a batch of sessions and free their spots; returns the report rows"""
+        lots = {lot.id: lot for lot in ParkingLot.query.filter(
+            ParkingLot.id.in_({lot_id for _, _, _, lot_id, _, _ in sessions}))}
+        snapshots = dict(db.session.query(Reservation.id, Reservation.price_rates).filter(
+            Reservation.id.in_([rid for rid, _, _, _, _, _ in sessions])))
+        bills = {}
+        for rid, _, _, lot_id, parked, leaving in sessions:
+            hours = charged_hours_for(parked, leaving)
+            bills[rid] = (self.price_table(lots[lot_id], snapshots.get(rid)).cost(parked, hours), hours)
+
+        table = Reservation.__table__
+        db.session.execute(
+            update(table).where(table.c.id == bindparam('rid'), table.c.is_active == True).values(
+                leaving_timestamp=bindparam('leaving'), parking_cost=bindparam('cost'),
+                hours_charged=bindparam('hours'), is_active=False),
+            [{'rid': rid, 'leaving': leaving, 'cost': bills[rid][0], 'hours': bills[rid][1]}
+             for rid, _, _, _, _, leaving in sessions]
+        )
+
+        # Sessions their user released in the meantime kept that user's leaving time
+        leaving_by_id = {rid: leaving for rid, _, _, _, _, leaving in sessions}
+        closed_ids = {rid for rid, leaving in db.session.query(Reservation.id, Reservation.leaving_timestamp).filter(
+            Reservation.id.in_(list(leaving_by_id))) if leaving == leaving_by_id[rid]}
+        closed = [session for session in sessions if session[0] in closed_ids]
+        if not closed:
+            db.session.commit()
+            return []
+
+        # Free the spots, unless another session holds them or a sensor still sees a car
+        spot_ids = list({spot_id for _, _, spot_id, _, _, _ in closed})
+        other_session = exists().where(Reservation.spot_id == ParkingSpot.id, Reservation.is_active == True)
+        car_seen = exists().where(SensorDevice.spot_id == ParkingSpot.id, SensorDevice.health == HEALTH_OK,
+                                  SensorDevice.last_status == 'O')
+        db.session.execute(
+            update(ParkingSpot).where(ParkingSpot.id.in_(spot_ids), ParkingSpot.status == 'O',
+                                      ~other_session, ~car_seen).values(status='A'),
+            execution_options={'synchronize_session': False}
+        )
+
+        rows = [{
+            'reservation_id': rid, 'user_id': uid, 'lot_id': lot_id, 'spot_id': spot_id, 'reason': reason,
+            'parked_at': parked, 'closed_at': leaving, 'parking_cost': bills[rid][0],
+            'hours_charged': bills[rid][1], 'detected_at': now,
+        } for rid, uid, spot_id, lot_id, parked, leaving in closed]
+        db.session.execute(insert(AutoClosedSession), rows)
+        db.session.commit()
+        sessions_closed.inc(len(rows), reason=reason)
+        return rows
+
+    def run(self, now=None):
+        """Close every stale session (up to max_batches batches of each kind); returns {reason: count}"""
+        now = now or datetime.utcnow()
+        closed = {VACANT: 0, OVERDUE: 0}
+        for reason, find in ((VACANT, self.vacant_sessions), (OVERDUE, self.overdue_sessions)):
+            for _ in range(self.max_batches):
+                sessions = find(now)
+                if not sessions:
+                    break
+                rows = self.close(sessions, reason, now)
+                closed[reason] += len(rows)
+                if rows and self.on_closed:
+                    self.on_closed(rows)
+                if len(sessions) < self.batch_size:
+                    break
+        return closed
@@ -0,0 +1,163 @@
+# Spot maps for the AR spot finder
+#
+# A lot's map comes in two parts. The layout (every spot's number and where
+# it sits on the lot's ground plane, in metres from the entrance) only
+# changes when spots are added or removed; it is served with an ETag that
+# is a digest of its bytes, and clients keep it until the tag changes. The
+# status is one character per spot in layout order ('A', 'O', 'U' or 'H'),
+# tagged with a digest of its own: a client sends the tag it holds and gets
+# back nothing (304), just the spots that changed, or - when this worker
+# never produced that tag - the whole string, still one byte per spot.
+# Clients that can hold a connection open get the same deltas as
+# server-sent events instead of polling.
+#
+# Statuses come from the shared spot table when it is built, so polling a
+# map costs no database query; the layout is rebuilt only when the lot's
+# set of spot ids changes.
+#
+# Spots have no surveyed positions, so the layout is a grid in spot-id
+# order: rows of SPOTS_PER_ROW spots parked nose-in on both sides of an
+# aisle, the first row nearest the entrance.
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+import numpy as np
+from app.models import db, ParkingLot, ParkingSpot
+from app.spot_table import STATUS_CODES, STATUS_NAMES
+
+SPOT_WIDTH_M = 2.5
+SPOT_DEPTH_M = 5.0
+AISLE_M = 6.0
+SPOTS_PER_ROW = 10
+
+# Status snapshots kept per lot, so clients a few changes behind get a delta
+HISTORY = 16
+
+# Lots whose layout and snapshots are kept in memory
+MAX_LOTS = 512
+
+# Streams compare the lot's status this often and end after STREAM_SECONDS
+POLL_SECONDS = 1.0
+HEARTBEAT_SECONDS = 15.0
+STREAM_SECONDS = 300.0
+
+Layout = namedtuple('Layout', 'tag body ids_digest count')
+
+def _digest(data):
+    return hashlib.blake2b(data, digest_size=8).hexdigest()
+
+def grid_positions(count):
+    """(x, y, heading) of `count` spots; heading 0 faces away from the entrance"""
+    index = np.arange(count)
+    pair, side, col = index // (2 * SPOTS_PER_ROW), (index // SPOTS_PER_ROW) % 2, index % SPOTS_PER_ROW
+    x = (col + 0.5) * SPOT_WIDTH_M
+    y = pair * (2 * SPOT_DEPTH_M + AISLE_M) + np.where(side == 0, SPOT_DEPTH_M / 2, 1.5 * SPOT_DEPTH_M + AISLE_M)
+    heading = np.where(side == 0, 180, 0)
+    return x, y, heading
+
+def build_layout(lot_id, spot_ids):
+    """Layout JSON of a lot whose spots (in id order) are spot_ids"""
+    lot = db.session.get(ParkingLot, lot_id)
+    numbers = dict(db.session.query(ParkingSpot.id, ParkingSpot.spot_number).filter(
+        ParkingSpot.lot_id == lot_id))
+    ids = [int(spot_id) for spot_id in spot_ids]
+    x, y, heading = grid_positions(len(ids))
+    body = json.dumps({
+        'lot_id': lot_id,
+        'name': lot.prime_location_name,
+        'address': lot.address,
+        'spot_size': [SPOT_WIDTH_M, SPOT_DEPTH_M],
+        'spot_ids': ids,
+        'numbers': [numbers.get(spot_id) for spot_id in ids],
+        'x': np.round(x, 2).tolist(),
+        'y': np.round(y, 2).tolist(),
+        'heading': heading.tolist(),
+    }, separators=(',', ':')).encode()
+    return body
+
+class SpotMaps:
+    """Per-lot layouts and recent status snapshots for the spot map API"""
+
+    def __init__(self, spot_table=None, history=HISTORY, max_lots=MAX_LOTS):
+        self.spot_table = spot_table
+        self.history = history
+        self.max_lots = max_lots
+        self._layouts = OrderedDict()     # lot_id -> Layout
+        self._snapshots = OrderedDict()   # lot_id -> OrderedDict(status tag -> (layout tag, codes))
+        self._lock = threading.Lock()
+
+    def _current(self, lot_id):
+        """(spot ids, status bytes) of a lot, from the shared table or the database"""
+        if self.spot_table is not None:
+            if not self.spot_table.built:
+                self.spot_table.rebuild()
+            held = self.spot_table.lot_spots(lot_id)
+            if held is not None:
+                return held[0], held[1].tobytes()
+        rows = db.session.query(ParkingSpot.id, ParkingSpot.status).filter(
+            ParkingSpot.lot_id == lot_id).order_by(ParkingSpot.id).all()
+        spot_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        return spot_ids, bytes(STATUS_CODES.get(r[1], STATUS_CODES['U']) for r in rows)
+
+    def _layout(self, lot_id, spot_ids):
+        ids_digest = _digest(np.ascontiguousarray(spot_ids, dtype=np.int64).tobytes())
+        with self._lock:
+            layout = self._layouts.get(lot_id)
+            if layout is not None and layout.ids_digest == ids_digest:
+                self._layouts.move_to_end(lot_id)
+                return layout
+        body = build_layout(lot_id, spot_ids)
+        layout = Layout(_digest(body), body, ids_digest, len(spot_ids))
+        with self._lock:
+            self._layouts[lot_id] = layout
+            while len(self._layouts) > self.max_lots:
+                self._layouts.popitem(last=False)
+        return layout
+
+    def layout(self, lot_id):
+        """The lot's current Layout"""
+        spot_ids, _ = self._current(lot_id)
+        return self._layout(lot_id, spot_ids)
+
+    def status(self, lot_id, since=None):
+        """(status tag, payload) for a client holding status tag `since`; payload is None if unchanged"""
+        spot_ids, codes = self._current(lot_id)
+        layout = self._layout(lot_id, spot_ids)
+        tag = _digest(layout.tag.encode() + codes)
+        if since == tag:
+            return tag, None
+        with self._lock:
+            snapshots = self._snapshots.setdefault(lot_id, OrderedDict())
+            self._snapshots.move_to_end(lot_id)
+            snapshots[tag] = (layout.tag, codes)
+            snapshots.move_to_end(tag)
+            while len(snapshots) > self.history:
+                snapshots.popitem(last=False)
+            while len(self._snapshots) > self.max_lots:
+                self._snapshots.popitem(last=False)
+            base = snapshots.get(since) if since else None
+
+        if base is not None and base[0] == layout.tag:
+            old = np.frombuffer(base[1], dtype=np.uint8)
+            new = np.frombuffer(codes, dtype=np.uint8)
+            changes = [[int(i), STATUS_NAMES.get(int(new[i]), 'U')] for i in np.flatnonzero(old != new)]
+            return tag, {'layout': layout.tag, 'tag': tag, 'base': since, 'changes': changes}
+        return tag, {'layout': layout.tag, 'tag': tag, 'status': codes.decode('ascii')}
+
+    def stream(self, lot_id, since=None, lifetime=STREAM_SECONDS):
+        """Server-sent event lines carrying status deltas, until `lifetime` seconds have passed"""
+        yield f"retry: {int(POLL_SECONDS * 1000)}\n\n"
+        started = last_beat = time.monotonic()
+        while time.monotonic() - started < lifetime:
+            tag, payload = self.status(lot_id, since)
+            # End the read so a long-lived stream never holds SQLite's shared lock
+            db.session.rollback()
+            if payload is not None:
+                since = tag
+                yield f"id: {tag}\ndata: {json.dumps(payload, separators=(',', ':'))}\n\n"
+            elif time.monotonic() - last_beat >= HEARTBEAT_SECONDS:
+                last_beat = time.monotonic()
+                yield ": keep-alive\n\n"
+            time.sleep(POLL_SECONDS)
@@ -0,0 +1,350 @@
+# Shared-memory spot status table
+#
+# Every worker process maps the same shared memory segment, which holds
+# each spot's status (indexed by spot id) and per-lot counters, so live
+# availability is read without a database query and without workers
+# drifting apart the way per-process caches do.
+#
+# One writer at a time owns the segment: writers hold an exclusive lock on
+# a lock file next to the database. The header carries a sequence number
+# (a seqlock) that is odd while a write is in progress. Readers never take
+# the lock; they copy what they need and retry if the sequence moved.
+# (This relies on stores becoming visible in order, as they do on x86; a
+# reader that keeps losing the race falls back to taking the lock.)
+#
+# The database stays the source of truth. A lot's rows are reloaded from it
+# whenever the lot changes, and the whole table is rebuilt when the segment
+# is first created.
+import hashlib
+import os
+import threading
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from app.models import db, ParkingSpot
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = 0x45434F4C4F54  # 'ECOLOT'
+LAYOUT_VERSION = 1
+
+# Header words (uint64); H_CATALOG counts lot edits for the lot catalog cache
+H_MAGIC, H_VERSION, H_SEQ, H_SPOTS, H_LOTS, H_BUILT, H_TOP, H_CATALOG = range(8)
+HEADER_WORDS = 8
+
+# Per-lot counter columns (int32); a total of -1 means "not in the table"
+C_TOTAL, C_OCCUPIED, C_UNKNOWN = range(3)
+
+EMPTY = 0
+STATUS_CODES = {'A': ord('A'), 'O': ord('O'), 'U': ord('U'), 'H': ord('H')}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+# Optimistic read attempts before a reader waits for the writer instead
+READ_RETRIES = 100
+
+def segment_name(key):
+    """Short, stable shared memory name for a deployment (e.g. its database URI)"""
+    return 'ecolot_' + hashlib.blake2b(key.encode(), digest_size=6).hexdigest()
+
+def _untrack(segment):
+    """Keep the segment alive when this process exits.
+
+    Python's resource tracker would otherwise unlink it as soon as the
+    worker that created (or merely attached to) it is recycled.
+    """
+    if os.name == 'posix':
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(segment._name, 'shared_memory')
+
+def _destroy(segment):
+    """Close and unlink a segment that _untrack() took away from the tracker"""
+    if os.name == 'posix':
+        from multiprocessing import resource_tracker
+        # unlink() unregisters it again, so it has to be registered first
+        resource_tracker.register(segment._name, 'shared_memory')
+    segment.close()
+    segment.unlink()
+
+class OwnerLock:
+    """Exclusive lock across processes (a lock file) and threads"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a+b')
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self._thread_lock.release()
+
+def spot_rows(lot_ids=None):
+    """(spot ids, lot ids, status codes) arrays for some or all lots, in one query"""
+    query = db.session.query(ParkingSpot.id, ParkingSpot.lot_id, ParkingSpot.status)
+    if lot_ids is not None:
+        query = query.filter(ParkingSpot.lot_id.in_(list(lot_ids)))
+    rows = query.all()
+    spot_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    lot_of = np.fromiter((r[1] for r in rows), dtype=np.int64, count=len(rows))
+    codes = np.fromiter((STATUS_CODES.get(r[2], EMPTY) for r in rows), dtype=np.uint8, count=len(rows))
+    return spot_ids, lot_of, codes
+
+class SpotTable:
+    """Spot statuses and per-lot counters shared by every worker process"""
+
+    def __init__(self, name, lock_path, max_spots=1 << 20, max_lots=1 << 16):
+        self.name = name
+        self.max_spots = max_spots
+        self.max_lots = max_lots
+        self.lock = OwnerLock(lock_path)
+        self.segment = None
+        self._members = {}  # lot_id -> spot ids last found for it (per process, checked on every read)
+        self._open_lock = threading.Lock()
+
+    # Segment
+
+    def _size(self):
+        return HEADER_WORDS * 8 + self.max_spots * 5 + self.max_lots * 3 * 4
+
+    def _map(self, segment):
+        buf = segment.buf
+        offset = HEADER_WORDS * 8
+        self.header = np.ndarray((HEADER_WORDS,), dtype=np.uint64, buffer=buf)
+        self.lot_of = np.ndarray((self.max_spots,), dtype=np.uint32, buffer=buf, offset=offset)
+        offset += self.max_spots * 4
+        self.counters = np.ndarray((self.max_lots, 3), dtype=np.int32, buffer=buf, offset=offset)
+        offset += self.max_lots * 3 * 4
+        self.status = np.ndarray((self.max_spots,), dtype=np.uint8, buffer=buf, offset=offset)
+        self.segment = segment
+
+    def _matches(self):
+        return (int(self.header[H_MAGIC]) == MAGIC and int(self.header[H_VERSION]) == LAYOUT_VERSION
+                and int(self.header[H_SPOTS]) == self.max_spots and int(self.header[H_LOTS]) == self.max_lots)
+
+    def _create(self):
+        segment = shared_memory.SharedMemory(self.name, create=True, size=self._size())
+        _untrack(segment)
+        self._map(segment)
+        self.counters[:, C_TOTAL] = -1
+        self.header[:] = 0
+        self.header[H_MAGIC] = MAGIC
+        self.header[H_VERSION] = LAYOUT_VERSION
+        self.header[H_SPOTS] = self.max_spots
+        self.header[H_LOTS] = self.max_lots
+
+    def open(self):
+        """Attach to the segment, creating it if this is the first process"""
+        if self.segment is not None:
+            return
+        with self._open_lock, self.lock:
+            if self.segment is not None:
+                return
+            try:
+                self._create()
+                return
+            except FileExistsError:
+                pass
+            segment = shared_memory.SharedMemory(self.name)
+            _untrack(segment)
+            self._map(segment)
+            if not self._matches():
+                # Left behind by a different layout or capacity
+                self._release_views()
+                _destroy(segment)
+                self._create()
+
+    def _release_views(self):
+        # numpy views must go before the memory map can be closed
+        self.header = self.lot_of = self.counters = self.status = None
+        self.segment = None
+
+    def close(self):
+        if self.segment is not None:
+            segment = self.segment
+            self._release_views()
+            segment.close()
+
+    def unlink(self):
+        """Remove the segment for every process (it is rebuilt on next use)"""
+        self.open()
+        segment = self.segment
+        self._release_views()
+        _destroy(segment)
+
+    @property
+    def built(self):
+        self.open()
+        return bool(self.header[H_BUILT])
+
+    # Writes (under the owner lock)
+
+    def _write(self, lots, spot_ids, lot_of, codes, reset=False):
+        """Replace the rows of `lots` (or of every lot, with reset) with the given spots"""
+        lots = np.asarray(lots, dtype=np.int64)
+        top = 0 if reset else int(self.header[H_TOP])
+        stale = np.flatnonzero(np.isin(self.lot_of[:top], lots))
+
+        fits = spot_ids < self.max_spots
+        overflowing = np.unique(lot_of[~fits])
+        spot_ids, lot_of, codes = spot_ids[fits], lot_of[fits], codes[fits]
+        lots = lots[(lots > 0) & (lots < self.max_lots)]
+        lot_of = np.where(lot_of < self.max_lots, lot_of, 0)
+
+        size = self.max_lots
+        total = np.bincount(lot_of, minlength=size)[:size]
+        # Spots held for a waitlisted user are as good as taken
+        taken = (codes == STATUS_CODES['O']) | (codes == STATUS_CODES['H'])
+        occupied = np.bincount(lot_of[taken], minlength=size)[:size]
+        unknown = np.bincount(lot_of[codes == STATUS_CODES['U']], minlength=size)[:size]
+        # Lots without spots (deleted ones included) are left to the database,
+        # as are lots with spots beyond max_spots
+        totals = np.where(total[lots] > 0, total[lots], -1)
+        overflowing = overflowing[overflowing < self.max_lots]
+
+        self.header[H_SEQ] += 1  # odd: write in progress
+        if reset:
+            self.status[:] = EMPTY
+            self.lot_of[:] = 0
+            self.counters[:, C_TOTAL] = -1
+            self.counters[:, C_OCCUPIED:] = 0
+        self.status[stale] = EMPTY
+        self.lot_of[stale] = 0
+        self.status[spot_ids] = codes
+        self.lot_of[spot_ids] = lot_of
+        self.counters[lots, C_TOTAL] = totals
+        self.counters[lots, C_OCCUPIED] = occupied[lots]
+        self.counters[lots, C_UNKNOWN] = unknown[lots]
+        self.counters[overflowing, C_TOTAL] = -1
+        if len(spot_ids):
+            self.header[H_TOP] = max(top, int(spot_ids.max()) + 1)
+        if reset:
+            self.header[H_BUILT] = 1
+        self.header[H_SEQ] += 1  # even again
+
+    def write_lots(self, lots, spot_ids, lot_of, codes):
+        """Store the current spots of some lots (arrays as from spot_rows)"""
+        self.open()
+        with self.lock:
+            self._write(lots, spot_ids, lot_of, codes)
+
+    def write_all(self, spot_ids, lot_of, codes):
+        """Replace the whole table"""
+        self.open()
+        with self.lock:
+            self._write(np.unique(lot_of), spot_ids, lot_of, codes, reset=True)
+
+    def refresh(self, lot_ids):
+        """Reload some lots from the database (after they changed)"""
+        if lot_ids and self.built:
+            self.write_lots(list(lot_ids), *spot_rows(lot_ids))
+
+    def rebuild(self):
+        """Reload every lot from the database"""
+        self.write_all(*spot_rows())
+
+    def bump_catalog_generation(self):
+        """Tell every worker that lots were created, edited or deleted"""
+        self.open()
+        with self.lock:
+            self.header[H_CATALOG] += 1
+
+    # Reads (lock-free)
+
+    def _read(self, copy):
+        for _ in range(READ_RETRIES):
+            before = int(self.header[H_SEQ])
+            if not before & 1:
+                value = copy()
+                if int(self.header[H_SEQ]) == before:
+                    return value
+            time.sleep(0)
+        # A writer kept getting in the way: wait for it
+        with self.lock:
+            return copy()
+
+    @staticmethod
+    def _stats(total, occupied, unknown):
+        return {
+            "total": total,
+            "occupied": occupied,
+            "available": total - occupied - unknown,
+            "unknown": unknown,
+            "occupancy_rate": round(occupied / total * 100, 1) if total > 0 else 0
+        }
+
+    def lot_stats(self, lot_id):
+        """Same dict as ParkingLot.get_occupancy_stats, or None if the table can't answer"""
+        if not self.built or not 0 < lot_id < self.max_lots:
+            return None
+        total, occupied, unknown = self._read(lambda: self.counters[lot_id].tolist())
+        if total < 0:
+            return None
+        return self._stats(total, occupied, unknown)
+
+    def all_lot_stats(self):
+        """{lot_id: stats} for every lot in the table"""
+        if not self.built:
+            return {}
+        counters = self._read(self.counters.copy)
+        lot_ids = np.flatnonzero(counters[:, C_TOTAL] >= 0)
+        return {lot_id: self._stats(*counters[lot_id].tolist()) for lot_id in lot_ids.tolist()}
+
+    def spot_status(self, spot_id):
+        """'A', 'O', 'U' or 'H', or None for spots the table doesn't hold"""
+        if not self.built or not 0 < spot_id < self.max_spots:
+            return None
+        return STATUS_NAMES.get(self._read(lambda: int(self.status[spot_id])))
+
+    def catalog_generation(self):
+        """Number of catalog changes so far (a single word, so read without the seqlock)"""
+        self.open()
+        return int(self.header[H_CATALOG])
+
+    def lot_spots(self, lot_id):
+        """(spot ids in id order, status codes) of one lot, or None if the table can't answer.
+
+        The lot's spot ids are remembered, so a read only touches its own
+        rows. They still hold while the lot's total matches and each of them
+        still belongs to the lot; otherwise the table is scanned again.
+        """
+        if not self.built or not 0 < lot_id < self.max_lots:
+            return None
+
+        def copy():
+            total = int(self.counters[lot_id, C_TOTAL])
+            if total < 0:
+                return None
+            spot_ids = self._members.get(lot_id)
+            if spot_ids is None or len(spot_ids) != total or not (self.lot_of[spot_ids] == lot_id).all():
+                top = int(self.header[H_TOP])
+                spot_ids = np.flatnonzero(self.lot_of[:top] == lot_id)
+            return spot_ids, self.status[spot_ids]
+
+        held = self._read(copy)
+        if held is not None:
+            self._members[lot_id] = held[0]
+        return held
@@ -0,0 +1,140 @@
+# Per-user parking analytics
+#
+# The user summary, the admin's user analytics page and their chart series
+# all describe a user's completed sessions. They are computed here from one
+# grouped query over the reservation_history view (live and archived rows),
+# bucketed by calendar day and location; the monthly, daily spending,
+# per-location and duration series are folded from those groups in Python.
+#
+# Results are memoized per user under a version read from the hot
+# reservation table: the number of the user's completed sessions and their
+# latest leaving time, plus the current month for the monthly series.
+# Releasing a spot (or archiving, which moves rows out) changes it, so every
+# worker recomputes after the user's next release and nothing has to be
+# invalidated by hand. Archival keeps the hot table small, so the version
+# query stays cheap.
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from sqlalchemy import select, func, false
+from app.models import db, Reservation
+from app.archival import reservation_history
+from app import metrics
+
+# Monthly spending series length, the current month included
+MONTHS = 12
+
+# Users whose analytics are kept in memory
+MAX_USERS = 1000
+
+analytics_hits = metrics.registry.counter('ecolot_user_analytics_hits_total', 'User analytics served from the memo')
+analytics_misses = metrics.registry.counter('ecolot_user_analytics_misses_total', 'User analytics computed from the database')
+
+def month_starts(today, count=MONTHS):
+    """First day of the last `count` calendar months, oldest first"""
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(count):
+        starts.append(datetime(year, month, 1))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+    return starts[::-1]
+
+def history_groups(user_id):
+    """(day, location, sessions, spending, hours, hours charged) for each day and lot a user parked in"""
+    h = reservation_history.c
+    day = func.date(h.parking_timestamp)
+    hours = (func.julianday(h.leaving_timestamp) - func.julianday(h.parking_timestamp)) * 24
+    query = select(
+        day, h.lot_name, func.count(), func.coalesce(func.sum(h.parking_cost), 0.0), func.sum(hours),
+        func.coalesce(func.sum(h.hours_charged), 0)
+    ).where(
+        h.user_id == user_id, h.is_active == false(), h.leaving_timestamp.isnot(None)
+    ).group_by(day, h.lot_name).order_by(day, h.lot_name)
+    return db.session.execute(query).all()
+
+class UserAnalytics:
+    """A user's completed-session series, built from the grouped history rows"""
+
+    def __init__(self, groups, today=None):
+        today = today or datetime.utcnow()
+        self.hours_charged = sum(int(row[5]) for row in groups)
+        groups = [(d, lot, n, float(spent), float(hours or 0.0)) for d, lot, n, spent, hours, _ in groups]
+
+        self.sessions = sum(g[2] for g in groups)
+        self.spending = round(sum(g[3] for g in groups), 2)
+        self.hours = round(sum(g[4] for g in groups), 2)
+
+        # Bookings per location, busiest first
+        bookings = {}
+        for _, lot, n, _, _ in groups:
+            bookings[lot] = bookings.get(lot, 0) + n
+        self.location_bookings = sorted(bookings.items(), key=lambda item: (-item[1], item[0]))
+
+        # Time parked per day and location
+        self.duration_data = [
+            {'date': d, 'location': lot, 'sessions': n, 'hours': round(hours, 2)}
+            for d, lot, n, _, hours in groups
+        ]
+
+        # Daily spending per location, for the stacked chart
+        dates = sorted({d for d, _, _, spent, _ in groups if spent})
+        locations = sorted({lot for _, lot, _, spent, _ in groups if spent})
+        row = {d: i for i, d in enumerate(dates)}
+        spending_by_location = {lot: [0.0] * len(dates) for lot in locations}
+        for d, lot, _, spent, _ in groups:
+            if spent:
+                spending_by_location[lot][row[d]] += spent
+        self.spending_chart = {
+            'dates': dates,
+            'locations': locations,
+            'spending_by_location': {lot: [round(v, 2) for v in values]
+                                     for lot, values in spending_by_location.items()},
+        }
+
+        # Spending per calendar month, oldest first
+        monthly = {}
+        for d, _, _, spent, _ in groups:
+            monthly[d[:7]] = monthly.get(d[:7], 0.0) + spent
+        self.monthly_data = [
+            {'month': start.strftime('%b %Y'), 'spending': round(monthly.get(start.strftime('%Y-%m'), 0.0), 2)}
+            for start in month_starts(today)
+        ]
+
+    @property
+    def favorite_location(self):
+        return self.location_bookings[0][0] if self.location_bookings else 'No parking history'
+
+class AnalyticsMemo:
+    """UserAnalytics per user, kept until the user's completed sessions change"""
+
+    def __init__(self, max_users=MAX_USERS):
+        self.max_users = max_users
+        self._entries = OrderedDict()  # user_id -> (version, UserAnalytics)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def version(user_id):
+        """Changes whenever one of the user's sessions is released (or archived)"""
+        count, latest = db.session.query(func.count(), func.max(Reservation.leaving_timestamp)).filter(
+            Reservation.user_id == user_id, Reservation.is_active == false()
+        ).one()
+        return count, latest
+
+    def get(self, user_id):
+        """A user's analytics, recomputed when their sessions or the calendar month change"""
+        version = (*self.version(user_id), datetime.utcnow().strftime('%Y-%m'))
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                analytics_hits.inc()
+                return entry[1]
+
+        analytics_misses.inc()
+        analytics = UserAnalytics(history_groups(user_id))
+        with self._lock:
+            self._entries[user_id] = (version, analytics)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_users:
+                self._entries.popitem(last=False)
+        return analytics
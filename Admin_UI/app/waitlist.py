@@ -0,0 +1,280 @@
+# Per-lot waitlists for full lots
+#
+# When a lot has no free spot, users join its waitlist instead of retrying.
+# Each worker keeps every lot's waiting entries as a FIFO deque, loaded from
+# the database on first use and synced through updated_at like the booking
+# index. When a spot frees up the next waiter is popped in O(1) and the
+# spot is held for them ('H') for a few minutes; they are told through the
+# live update channel and book it as usual, or the hold lapses and the spot
+# goes to the next in line. Offers are claimed with conditional UPDATEs on
+# both the entry and the spot, so two workers can never hand out the same
+# spot or serve one waiter twice.
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy import update
+from app.models import db, ParkingSpot, WaitlistEntry
+from app import metrics
+
+WAITING = 'waiting'
+OFFERED = 'offered'
+BOOKED = 'booked'
+EXPIRED = 'expired'
+LEFT = 'left'
+
+# Entries in these states still count as "on the waitlist"
+ACTIVE = (WAITING, OFFERED)
+
+SPOT_AVAILABLE = 'A'
+SPOT_HELD = 'H'
+
+# How long a freed spot is held for the waiter it was offered to
+DEFAULT_HOLD = timedelta(minutes=5)
+
+# How often a worker re-reads entries changed by other workers
+SYNC_INTERVAL = timedelta(seconds=2)
+SYNC_MARGIN = timedelta(seconds=60)
+RELOAD_INTERVAL = timedelta(minutes=10)
+
+waitlist_joins = metrics.registry.counter('ecolot_waitlist_joins_total', 'Users who joined a lot waitlist')
+waitlist_offers = metrics.registry.counter('ecolot_waitlist_offers_total', 'Spots held for waitlisted users')
+waitlist_lapsed = metrics.registry.counter('ecolot_waitlist_lapsed_total', 'Holds that ran out unused')
+
+class WaitlistError(Exception):
+    """Raised when a user can't join a waitlist; the message is shown to the user"""
+
+class Waitlist:
+    """Waiting users of every lot, oldest first"""
+
+    def __init__(self, hold=DEFAULT_HOLD, choose_spot=None, notify=None):
+        self.hold = hold
+        self.choose_spot = choose_spot  # (spot_ids, now) -> spot id or None; the first spot by default
+        self.notify = notify            # notify(kind, entry) after an offer is made or lapses
+        self.queues = {}                # lot_id -> deque of (entry id, user id)
+        self.queued = {}                # entry id -> lot_id
+        self.loaded = False
+        self.synced_until = None
+        self.last_sync = None
+        self.last_reload = None
+        self._lock = threading.RLock()
+
+    # Queues
+
+    def _enqueue(self, entry_id, lot_id, user_id):
+        if entry_id in self.queued:
+            return
+        queue = self.queues.setdefault(lot_id, deque())
+        if not queue or queue[-1][0] < entry_id:
+            queue.append((entry_id, user_id))
+        elif queue[0][0] > entry_id:
+            queue.appendleft((entry_id, user_id))
+        else:
+            # Committed by another worker behind a newer local entry; keep id order
+            self.queues[lot_id] = deque(sorted([*queue, (entry_id, user_id)]))
+        self.queued[entry_id] = lot_id
+
+    def _dequeue(self, entry_id):
+        lot_id = self.queued.pop(entry_id, None)
+        if lot_id is None:
+            return
+        queue = self.queues[lot_id]
+        if queue[0][0] == entry_id:
+            queue.popleft()
+        else:
+            queue.remove(next(item for item in queue if item[0] == entry_id))
+        if not queue:
+            del self.queues[lot_id]
+
+    def _pop(self, lot_id):
+        """The lot's next waiter as (entry id, user id), or None"""
+        queue = self.queues.get(lot_id)
+        if not queue:
+            return None
+        entry_id, user_id = queue.popleft()
+        del self.queued[entry_id]
+        if not queue:
+            del self.queues[lot_id]
+        return entry_id, user_id
+
+    # Loading and syncing
+
+    def load(self, now=None):
+        """Rebuild every queue from the database"""
+        now = now or datetime.utcnow()
+        rows = db.session.query(WaitlistEntry.id, WaitlistEntry.lot_id, WaitlistEntry.user_id).filter(
+            WaitlistEntry.status == WAITING).order_by(WaitlistEntry.id).all()
+        with self._lock:
+            self.queues, self.queued = {}, {}
+            for entry_id, lot_id, user_id in rows:
+                self._enqueue(entry_id, lot_id, user_id)
+            self.loaded = True
+            self.synced_until = self.last_sync = self.last_reload = now
+
+    def sync(self, now=None, force=False):
+        """Pick up entries added, served or withdrawn by other workers"""
+        now = now or datetime.utcnow()
+        if not self.loaded or now - self.last_reload >= RELOAD_INTERVAL:
+            self.load(now)
+            return
+        if not force and now - self.last_sync < SYNC_INTERVAL:
+            return
+        rows = db.session.query(
+            WaitlistEntry.id, WaitlistEntry.lot_id, WaitlistEntry.user_id, WaitlistEntry.status).filter(
+            WaitlistEntry.updated_at >= self.synced_until - SYNC_MARGIN).order_by(WaitlistEntry.id).all()
+        with self._lock:
+            for entry_id, lot_id, user_id, status in rows:
+                if status == WAITING:
+                    self._enqueue(entry_id, lot_id, user_id)
+                else:
+                    self._dequeue(entry_id)
+            self.synced_until = self.last_sync = now
+
+    def has_waiters(self, lot_id):
+        self.sync()
+        return bool(self.queues.get(lot_id))
+
+    # Joining and leaving
+
+    def join(self, lot_id, user_id):
+        """Put a user at the back of a lot's queue (or return their place in it)"""
+        existing = WaitlistEntry.query.filter(
+            WaitlistEntry.user_id == user_id, WaitlistEntry.status.in_(ACTIVE)).first()
+        if existing is not None:
+            if existing.lot_id == lot_id:
+                return existing
+            raise WaitlistError(f'You are already on the waitlist for {existing.lot.prime_location_name}.')
+        now = datetime.utcnow()
+        entry = WaitlistEntry(lot_id=lot_id, user_id=user_id, status=WAITING, created_at=now, updated_at=now)
+        db.session.add(entry)
+        db.session.commit()
+        with self._lock:
+            self._enqueue(entry.id, lot_id, user_id)
+        waitlist_joins.inc()
+        return entry
+
+    def leave(self, entry):
+        """Take a user off the waitlist, passing on any spot held for them"""
+        now = datetime.utcnow()
+        lot_id, entry_id = entry.lot_id, entry.id
+        left = db.session.execute(
+            update(WaitlistEntry).where(WaitlistEntry.id == entry_id, WaitlistEntry.status == WAITING)
+            .values(status=LEFT, updated_at=now)).rowcount
+        released = False
+        if not left:
+            spot_id = db.session.query(WaitlistEntry.spot_id).filter_by(id=entry_id).scalar()
+            left = released = bool(db.session.execute(
+                update(WaitlistEntry).where(WaitlistEntry.id == entry_id, WaitlistEntry.status == OFFERED)
+                .values(status=LEFT, updated_at=now)).rowcount)
+            if released:
+                self._release(spot_id)
+        db.session.commit()
+        with self._lock:
+            self._dequeue(entry_id)
+        if released:
+            self.offer([lot_id], now)
+        return bool(left)
+
+    def position(self, entry):
+        """1-based place of a waiting entry in its lot's queue"""
+        return WaitlistEntry.query.filter(
+            WaitlistEntry.lot_id == entry.lot_id, WaitlistEntry.status == WAITING,
+            WaitlistEntry.id < entry.id).count() + 1
+
+    def active_entry(self, user_id):
+        """The user's waiting or offered entry, if any"""
+        return WaitlistEntry.query.filter(
+            WaitlistEntry.user_id == user_id, WaitlistEntry.status.in_(ACTIVE)).first()
+
+    # Offers
+
+    def _release(self, spot_id):
+        db.session.execute(
+            update(ParkingSpot).where(ParkingSpot.id == spot_id, ParkingSpot.status == SPOT_HELD)
+            .values(status=SPOT_AVAILABLE))
+
+    def offer(self, lot_ids, now=None):
+        """Hold free spots in these lots for their next waiters. Returns the lots whose spots changed."""
+        now = now or datetime.utcnow()
+        self.sync(now)
+        changed = []
+        for lot_id in lot_ids:
+            if not self.queues.get(lot_id):
+                continue
+            free = [spot_id for (spot_id,) in db.session.query(ParkingSpot.id).filter_by(
+                lot_id=lot_id, status=SPOT_AVAILABLE)]
+            while free:
+                spot_id = self.choose_spot(free, now) if self.choose_spot else free[0]
+                if spot_id is None:
+                    break
+                free.remove(spot_id)
+                with self._lock:
+                    waiter = self._pop(lot_id)
+                if waiter is None:
+                    break
+                entry_id, user_id = waiter
+
+                held = db.session.execute(
+                    update(ParkingSpot).where(ParkingSpot.id == spot_id, ParkingSpot.status == SPOT_AVAILABLE)
+                    .values(status=SPOT_HELD)).rowcount
+                if not held:
+                    # Taken since the query; the waiter keeps their place
+                    db.session.rollback()
+                    with self._lock:
+                        self._enqueue(entry_id, lot_id, user_id)
+                    continue
+                offered = db.session.execute(
+                    update(WaitlistEntry).where(WaitlistEntry.id == entry_id, WaitlistEntry.status == WAITING)
+                    .values(status=OFFERED, spot_id=spot_id, hold_until=now + self.hold, updated_at=now)).rowcount
+                if not offered:
+                    # Left or served through another worker; the spot is still free
+                    db.session.rollback()
+                    free.append(spot_id)
+                    continue
+                db.session.commit()
+                waitlist_offers.inc()
+                if lot_id not in changed:
+                    changed.append(lot_id)
+                if self.notify:
+                    self.notify('waitlist_offer', db.session.get(WaitlistEntry, entry_id))
+        return changed
+
+    def claim_offer(self, user_id, spot_id, now=None):
+        """Mark the user's unexpired hold on this spot as booked (the caller commits)"""
+        now = now or datetime.utcnow()
+        return bool(db.session.execute(
+            update(WaitlistEntry).where(
+                WaitlistEntry.user_id == user_id, WaitlistEntry.spot_id == spot_id,
+                WaitlistEntry.status == OFFERED, WaitlistEntry.hold_until > now)
+            .values(status=BOOKED, updated_at=now)).rowcount)
+
+    def expire_holds(self, now=None):
+        """Release holds that ran out and offer the spots on. Returns the lots whose spots changed."""
+        now = now or datetime.utcnow()
+        lapsed = db.session.query(WaitlistEntry.id, WaitlistEntry.lot_id, WaitlistEntry.spot_id).filter(
+            WaitlistEntry.status == OFFERED, WaitlistEntry.hold_until <= now).all()
+        lots = []
+        for entry_id, lot_id, spot_id in lapsed:
+            expired = db.session.execute(
+                update(WaitlistEntry).where(WaitlistEntry.id == entry_id, WaitlistEntry.status == OFFERED)
+                .values(status=EXPIRED, updated_at=now)).rowcount
+            if not expired:
+                continue
+            self._release(spot_id)
+            db.session.commit()
+            waitlist_lapsed.inc()
+            if lot_id not in lots:
+                lots.append(lot_id)
+            if self.notify:
+                self.notify('waitlist_expired', db.session.get(WaitlistEntry, entry_id))
+        db.session.commit()
+        changed = self.offer(lots, now)
+        return lots + [lot_id for lot_id in changed if lot_id not in lots]
+
+    def tick(self, now=None):
+        """Periodic upkeep: lapse old holds, then serve every lot with waiters"""
+        now = now or datetime.utcnow()
+        changed = self.expire_holds(now)
+        for lot_id in self.offer(list(self.queues), now):
+            if lot_id not in changed:
+                changed.append(lot_id)
+        return changed
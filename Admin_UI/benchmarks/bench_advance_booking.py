@@ -0,0 +1,102 @@
+# Benchmark: advance-booking availability checks on a large lot
+#
+# Times the in-memory interval index (a bisect per spot, plus the set of
+# never-booked spots) against the SQL query the routes would otherwise run
+# ("first spot in the lot with no overlapping booking"), for a single-spot
+# conflict check and for "find any free spot in lot X for [t1, t2)".
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_advance_booking.py [spots] [bookings_per_spot]
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from flask import Flask
+from sqlalchemy import insert
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.models import db, ParkingLot, ParkingSpot, AdvanceBooking
+from app import advance_booking, provisioning
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    return app
+
+def book_lot(lot_id, spot_ids, per_spot, start, rng, leave_clear=0):
+    """Back-to-back bookings with random gaps on every spot but the last `leave_clear`"""
+    rows = []
+    for spot_id in spot_ids[:len(spot_ids) - leave_clear]:
+        t = start + timedelta(minutes=rng.randint(0, 180))
+        for _ in range(per_spot):
+            length = timedelta(minutes=rng.choice((30, 60, 90, 120, 240)))
+            rows.append(dict(user_id=1, spot_id=spot_id, start_time=t, end_time=t + length,
+                             vehicle_license_plate='BENCH', vehicle_color='White',
+                             status='booked', created_at=start, updated_at=start))
+            t += length + timedelta(minutes=rng.choice((0, 15, 60, 240)))
+    db.session.execute(insert(AdvanceBooking), rows)
+    db.session.commit()
+    return len(rows)
+
+def sql_free_spot(lot_id, start, end):
+    overlapping = advance_booking.overlapping(ParkingSpot.id, start, end).with_entities(AdvanceBooking.id)
+    return db.session.query(ParkingSpot.id).filter(
+        ParkingSpot.lot_id == lot_id, ~overlapping.exists()).first()
+
+def per_call(func, calls):
+    """Median of a few runs, in microseconds per call"""
+    runs = []
+    for _ in range(5):
+        began = time.perf_counter()
+        for args in calls:
+            func(*args)
+        runs.append((time.perf_counter() - began) / len(calls) * 1e6)
+    return sorted(runs)[2]
+
+def main():
+    n_spots = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    per_spot = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    rng = random.Random(3)
+    start = datetime(2030, 1, 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            lot_ids = []
+            for name, clear in (('Busy', 0), ('Mostly booked', 10)):
+                lot = ParkingLot(prime_location_name=name, address='x', pin_code='0',
+                                 price=10, maximum_number_of_spots=n_spots)
+                db.session.add(lot)
+                db.session.commit()
+                provisioning.bulk_create_spots(lot.id, 1, n_spots)
+                spot_ids = [s for (s,) in db.session.query(ParkingSpot.id).filter_by(lot_id=lot.id).order_by(ParkingSpot.id)]
+                total = book_lot(lot.id, spot_ids, per_spot, start, rng, leave_clear=clear)
+                lot_ids.append((name, lot.id, spot_ids))
+                print(f"{name}: {n_spots:,} spots, {total:,} bookings")
+
+            index = advance_booking.BookingIndex()
+            began = time.perf_counter()
+            index.load(start)
+            print(f"index load: {(time.perf_counter() - began) * 1000:.1f} ms")
+
+            windows = []
+            for _ in range(200):
+                t1 = start + timedelta(minutes=15 * rng.randint(0, 4 * 24 * 7))
+                windows.append((t1, t1 + timedelta(hours=rng.choice((1, 2, 4)))))
+
+            for name, lot_id, spot_ids in lot_ids:
+                checks = [(rng.choice(spot_ids), t1, t2) for t1, t2 in windows]
+                finds = [(lot_id, t1, t2) for t1, t2 in windows[:20]]
+                index_check = per_call(index.is_free, checks)
+                sql_check = per_call(lambda s, a, b: advance_booking.overlapping(s, a, b).first(), checks[:50])
+                index_find = per_call(index.find_free_spot, finds)
+                sql_find = per_call(sql_free_spot, finds[:5])
+                print(f"  {name}")
+                print(f"    conflict check   index {index_check:9.1f} us   SQL {sql_check:9.1f} us")
+                print(f"    find free spot   index {index_find:9.1f} us   SQL {sql_find:9.1f} us")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+# Benchmark: chart data preparation for many lots (no drawing)
+#
+# Compares the old per-day list-of-dicts path, which searched each day's
+# lot list for every lot, with the day x lot matrix entry points.
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_chart_prep.py [lots] [days]
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.chart_generator import ChartGenerator
+
+def legacy_prep(occupancy_data, revenue_data, lots):
+    """The old generate_occupancy_chart / generate_revenue_chart data loops"""
+    occupancy = []
+    for lot_name in lots:
+        rates = []
+        for day in occupancy_data:
+            lot_data = None
+            for lot in day['lots']:
+                if lot['name'] == lot_name:
+                    lot_data = lot
+                    break
+            if lot_data and lot_data['total'] > 0:
+                rates.append((lot_data['occupied'] / lot_data['total']) * 100)
+            else:
+                rates.append(0)
+        occupancy.append(rates)
+
+    bottom = np.zeros(len(revenue_data))
+    for lot_name in lots:
+        revenues = []
+        for day in revenue_data:
+            lot_data = None
+            for lot in day['lots']:
+                if lot['name'] == lot_name:
+                    lot_data = lot
+                    break
+            revenues.append(lot_data['revenue'] if lot_data else 0)
+        for j in range(len(bottom)):
+            bottom[j] = bottom[j] + revenues[j]
+    return occupancy, bottom
+
+def matrix_prep(dates, lots, occupied, capacity, revenue):
+    occupancy = ChartGenerator.occupancy_matrix_series(dates, lots, occupied, capacity)
+    stacked = ChartGenerator.revenue_matrix_series(dates, lots, revenue)
+    values = np.array([d['data'] for d in stacked['datasets']])
+    return occupancy, np.cumsum(values, axis=0) - values
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+def main():
+    n_lots = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+
+    rng = np.random.default_rng(7)
+    lots = [f'Lot {i}' for i in range(n_lots)]
+    dates = [f'day {d}' for d in range(n_days)]
+    capacity = rng.integers(10, 200, n_lots).astype(np.float64)
+    occupied = np.floor(rng.random((n_days, n_lots)) * capacity)
+    revenue = np.round(rng.random((n_days, n_lots)) * 900, 2)
+
+    # The same numbers in the old per-day format
+    occupancy_data = [{'date': d, 'lots': [{'name': l, 'occupied': occupied[i, j], 'total': capacity[j]}
+                                           for j, l in enumerate(lots)]} for i, d in enumerate(dates)]
+    revenue_data = [{'date': d, 'lots': [{'name': l, 'revenue': revenue[i, j]}
+                                         for j, l in enumerate(lots)]} for i, d in enumerate(dates)]
+
+    legacy = timed(legacy_prep, occupancy_data, revenue_data, lots)
+    adapters = timed(lambda: (ChartGenerator.occupancy_series(occupancy_data, lots),
+                              ChartGenerator.revenue_series(revenue_data, lots)))
+    matrix = timed(matrix_prep, dates, lots, occupied, capacity, revenue)
+
+    print(f"{n_lots} lots x {n_days} days")
+    print(f"  nested search (old)      {legacy * 1000:9.1f} ms")
+    print(f"  list-of-dict adapters    {adapters * 1000:9.1f} ms")
+    print(f"  day x lot matrices       {matrix * 1000:9.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+# Benchmark: render time and bytes per chart for every chart output mode
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_charts.py [lots] [days] [repeats]
+#
+# 'client' only builds the JSON series; the browser does the drawing, so its
+# numbers are the server-side cost and the response size.
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.chart_generator import ChartGenerator, OUTPUT_FORMATS
+
+def sample_data(n_lots, n_days):
+    """Synthetic inputs shaped like the routes' chart data"""
+    random.seed(7)
+    lots = [f'Lot {i}' for i in range(n_lots)]
+    dates = [f'2025-01-{d + 1:02d}' for d in range(n_days)]
+    occupancy = [{'date': d, 'lots': [{'name': l, 'occupied': random.randint(0, 50), 'total': 50}
+                                      for l in lots]} for d in dates]
+    revenue = [{'date': d, 'lots': [{'name': l, 'revenue': round(random.uniform(0, 900), 2)}
+                                    for l in lots]} for d in dates]
+    locations = [(l, random.randint(1, 20)) for l in lots]
+    durations = [{'date': d, 'hours': round(random.uniform(0.5, 6), 2), 'location': lots[0]}
+                 for d in dates[:12]]
+    spending = {'dates': dates, 'locations': lots,
+                'spending_by_location': {l: [round(random.uniform(0, 200), 2) for _ in dates]
+                                         for l in lots}}
+    return {
+        'occupancy': ((occupancy, lots), ChartGenerator.generate_occupancy_chart, ChartGenerator.occupancy_series),
+        'revenue': ((revenue, lots), ChartGenerator.generate_revenue_chart, ChartGenerator.revenue_series),
+        'user_location': ((locations,), ChartGenerator.generate_user_location_chart, ChartGenerator.user_location_series),
+        'user_duration': ((durations,), ChartGenerator.generate_user_duration_chart, ChartGenerator.user_duration_series),
+        'user_spending': ((spending,), ChartGenerator.generate_user_spending_chart, ChartGenerator.user_spending_series),
+    }
+
+def measure(mode, args, render, series, repeats):
+    """Average seconds per chart and bytes of the output"""
+    ChartGenerator.configure(mode)
+    started = time.perf_counter()
+    for _ in range(repeats):
+        if mode == 'client':
+            body = json.dumps(series(*args)).encode()
+        else:
+            url = render(*args)
+    elapsed = (time.perf_counter() - started) / repeats
+    size = len(body) if mode == 'client' else os.path.getsize(url.lstrip('/'))
+    return elapsed, size
+
+def main():
+    n_lots = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    repeats = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    charts = sample_data(n_lots, n_days)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Charts are written relative to the working directory
+        os.chdir(tmp)
+        # Warm up fonts and the style sheet so the first mode is not penalised
+        ChartGenerator.configure('png-lite')
+        ChartGenerator.generate_user_location_chart([('warm-up', 1)])
+
+        print(f"{n_lots} lots x {n_days} days, {repeats} repeat(s) per chart\n")
+        print(f"{'chart':<15}" + ''.join(f"{mode:>20}" for mode in OUTPUT_FORMATS))
+        totals = {mode: [0.0, 0] for mode in OUTPUT_FORMATS}
+        for name, (args, render, series) in charts.items():
+            cells = []
+            for mode in OUTPUT_FORMATS:
+                elapsed, size = measure(mode, args, render, series, repeats)
+                totals[mode][0] += elapsed
+                totals[mode][1] += size
+                cells.append(f"{elapsed * 1000:8.1f}ms {size / 1024:7.1f}KB")
+            print(f"{name:<15}" + ''.join(f"{cell:>20}" for cell in cells))
+        print(f"{'total':<15}" + ''.join(
+            f"{f'{t * 1000:8.1f}ms {b / 1024:7.1f}KB':>20}" for t, b in totals.values()))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+# Benchmark: training the occupancy forecaster on synthetic reservations
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_forecast.py [reservations] [lots]
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.forecasting import hourly_occupancy, fold_hour_of_week, slot_counts, fit_forecast
+
+def make_reservations(n_reservations, n_lots, n_hours, seed=42):
+    """Random sessions: mostly short stays, a few that run for days"""
+    rng = np.random.default_rng(seed)
+    lots = rng.integers(0, n_lots, n_reservations)
+    starts = rng.uniform(0, n_hours, n_reservations)
+    durations = rng.gamma(shape=1.5, scale=2.0, size=n_reservations)
+    return lots, starts, starts + durations
+
+def main():
+    n_reservations = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    n_lots = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    n_hours = 365 * 24  # one year of history
+    origin_hour = 480_000  # somewhere in 2024
+
+    lots, starts, ends = make_reservations(n_reservations, n_lots, n_hours)
+    starts += origin_hour
+    ends += origin_hour
+
+    began = time.perf_counter()
+    occupancy = hourly_occupancy(lots, starts, ends, n_lots, origin_hour, n_hours)
+    swept = time.perf_counter()
+    profile = fold_hour_of_week(occupancy, origin_hour)
+    slots = slot_counts([origin_hour] * n_lots, [origin_hour + n_hours] * n_lots)
+    fit_forecast(profile, slots, [500] * n_lots)
+    finished = time.perf_counter()
+
+    # Sanity check: every reservation-hour ends up somewhere in the profile
+    expected_hours = np.clip(ends, None, origin_hour + n_hours) - starts
+    assert abs(profile.sum() - expected_hours.sum()) < 1e-6 * expected_hours.sum()
+
+    total = finished - began
+    print(f"reservations:      {n_reservations:,} across {n_lots} lots, {n_hours:,} hours")
+    print(f"interval sweep:    {swept - began:.3f}s")
+    print(f"fold + fit:        {finished - swept:.3f}s")
+    print(f"total:             {total:.3f}s ({n_reservations / total:,.0f} reservations/s)")
+
+if __name__ == '__main__':
+    main()
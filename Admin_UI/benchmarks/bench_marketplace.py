@@ -0,0 +1,95 @@
+# Benchmark: marketplace matching throughput at large order-book sizes
+#
+# Fills the matching engine with resting listings spread over a ~30 km
+# city, then streams orders at it: each driver request is followed by a new
+# listing, so the book stays about the same size while matches happen. The
+# same requests are also run through a naive scan of every resting listing
+# (what matching would cost without the per-cell price queues). No database
+# is involved; claims always succeed.
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_marketplace.py [book sizes, e.g. 10000,100000,500000]
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.marketplace import MatchingEngine, Order, distance_km
+
+CENTRE = (12.97, 77.59)
+SPAN_DEG = 0.135            # +-15 km
+START = datetime(2030, 1, 1)
+
+def window(rng, hours):
+    start = START + timedelta(minutes=30 * rng.randint(0, 48))
+    return start, start + timedelta(hours=rng.choice(hours))
+
+def point(rng):
+    return CENTRE[0] + rng.uniform(-SPAN_DEG, SPAN_DEG), CENTRE[1] + rng.uniform(-SPAN_DEG, SPAN_DEG)
+
+def new_listing(rng, order_id):
+    start, end = window(rng, (4, 8, 12, 24))
+    return Order('listing', order_id, *point(rng), start, end, rng.randint(10, 60))
+
+def new_request(rng, order_id):
+    start, end = window(rng, (1, 2, 3))
+    return Order('request', order_id, *point(rng), start, end, rng.randint(15, 60),
+                 rng.choice((0.5, 1.0, 2.0)))
+
+def naive_match(listings, request):
+    """Cheapest, then nearest, covering listing in range, by scanning all of them"""
+    best = None
+    for listing in listings.values():
+        if listing.price > request.price or not listing.covers(request):
+            continue
+        km = distance_km(request.lat, request.lon, listing.lat, listing.lon)
+        if km <= request.max_km:
+            key = (listing.price, km, listing.seq)
+            if best is None or key < best[0]:
+                best = (key, listing)
+    return best and best[1]
+
+def run(book_size, n_orders, rng):
+    engine = MatchingEngine()
+    ids = iter(range(1, 10 ** 9))
+
+    began = time.perf_counter()
+    for _ in range(book_size):
+        engine.submit(new_listing(rng, next(ids)))
+    fill = book_size / (time.perf_counter() - began)
+
+    orders = []
+    for _ in range(n_orders):
+        orders.append(new_request(rng, next(ids)))
+        orders.append(new_listing(rng, next(ids)))
+
+    # The naive scan answers the first few requests against the same book
+    sample = [o for o in orders if o.side == 'request'][:20]
+    began = time.perf_counter()
+    naive = [naive_match(engine.listings.orders, r) for r in sample]
+    naive_us = (time.perf_counter() - began) / len(sample) * 1e6
+
+    results = []
+    began = time.perf_counter()
+    for order in orders:
+        results.append(engine.submit(order))
+    elapsed = time.perf_counter() - began
+    matches = sum(match is not None for match in results)
+
+    # The first request ran on the untouched book, so both must pick the same listing
+    agree = (naive[0] and naive[0].id) == (results[0] and results[0].listing.id)
+    return fill, len(orders) / elapsed, matches / elapsed, matches, elapsed / len(orders) * 1e6, naive_us, agree
+
+def main():
+    sizes = [int(s) for s in sys.argv[1].split(',')] if len(sys.argv) > 1 else [10_000, 100_000, 500_000]
+    n_orders = 20_000
+    print(f"{n_orders:,} requests interleaved with {n_orders:,} new listings per book size")
+    for size in sizes:
+        fill, orders_s, matches_s, matches, order_us, naive_us, agree = run(size, n_orders, random.Random(7))
+        print(f"  book {size:>9,}: fill {fill:9,.0f} listings/s   stream {orders_s:9,.0f} orders/s   "
+              f"{matches_s:8,.0f} matches/s ({matches:,})   {order_us:6.1f} us/order vs naive scan "
+              f"{naive_us:9.1f} us/request{'' if agree else '   MISMATCH'}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+# Benchmark: spots inserted per second, one ORM object at a time vs. bulk Core inserts
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_provisioning.py [spots]
+import os
+import sys
+import tempfile
+import time
+from flask import Flask
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.models import db, ParkingLot, ParkingSpot
+from app import provisioning
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    return app
+
+def new_lot(n_spots):
+    lot = ParkingLot(prime_location_name='Bench', address='x', pin_code='0',
+                     price=10, maximum_number_of_spots=n_spots)
+    db.session.add(lot)
+    db.session.commit()
+    return lot.id
+
+def orm_path(lot_id, n_spots):
+    """The old create_parking_spots: one ParkingSpot object per spot, one commit"""
+    for i in range(1, n_spots + 1):
+        db.session.add(ParkingSpot(lot_id=lot_id, spot_number=f"A{i:03d}", status='A'))
+    db.session.commit()
+
+def bulk_path(lot_id, n_spots):
+    provisioning.bulk_create_spots(lot_id, 1, n_spots)
+
+def main():
+    n_spots = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'))
+        with app.app_context():
+            db.create_all()
+            for name, create in (('ORM one-by-one', orm_path), ('bulk Core insert', bulk_path)):
+                lot_id = new_lot(n_spots)
+                began = time.perf_counter()
+                create(lot_id, n_spots)
+                elapsed = time.perf_counter() - began
+                assert ParkingSpot.query.filter_by(lot_id=lot_id).count() == n_spots
+                print(f"{name:18s} {n_spots:,} spots in {elapsed:.3f}s  ({n_spots / elapsed:,.0f} spots/s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+# Benchmark: sensor readings ingested per second, JSON reports vs. binary frames
+#
+# Both paths go through a Flask test client, so request handling is
+# included: one JSON report per request and reading (what IR_Sensor.ino
+# sends) against batches of 16-byte frames. Parsing alone is timed as well.
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_sensor_ingest.py [devices] [batch]
+import json
+import os
+import sys
+import tempfile
+import time
+from flask import Flask, request, jsonify
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'tools'))
+from app.models import db, ParkingLot
+from app import device_registry, provisioning, sensor_frames
+import sensor_simulator
+
+def make_app(path):
+    """A bare app with the two ingest routes, minus auth and cache invalidation"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    db.init_app(app)
+    registry = device_registry.DeviceRegistry()
+
+    @app.route('/api/sensor/update', methods=['POST'])
+    def sensor_update():
+        data = request.get_json(silent=True) or {}
+        device_id = device_registry.normalize_device_id(data.get('device_id'))
+        spot = device_registry.resolve_spot(data.get('spot_id'), data.get('lot_name'), data.get('spot_number'))
+        registry.record_report(device_id, spot, data['status'])
+        return jsonify({'device_id': device_id, 'spot_id': spot.id, 'status': spot.status})
+
+    @app.route('/api/sensor/frames', methods=['POST'])
+    def sensor_frames_ingest():
+        frames = sensor_frames.decode_frames(request.get_data(cache=False))
+        readings, invalid = sensor_frames.readings_from_frames(frames)
+        accepted, lot_ids = registry.record_reports(readings)
+        return jsonify({'frames': len(frames), 'accepted': accepted, 'changed_lots': lot_ids})
+
+    return app
+
+def make_rounds(spot_ids, n_rounds):
+    fleet = sensor_simulator.Fleet(spot_ids, flip_chance=0.3, seed=11)
+    return [list(fleet.readings()) for _ in range(n_rounds)]
+
+def json_bodies(readings):
+    return [json.dumps({'device_id': sensor_simulator.mac_string(mac), 'spot_id': spot_id,
+                        'status': status, 'timestamp': ts}).encode()
+            for spot_id, mac, status, ts in readings]
+
+def run_json(client, rounds):
+    bodies = [json_bodies(readings) for readings in rounds]
+    began = time.perf_counter()
+    for round_bodies in bodies:
+        for body in round_bodies:
+            client.post('/api/sensor/update', data=body, content_type='application/json')
+    return time.perf_counter() - began
+
+def run_frames(client, rounds, batch):
+    bodies = [[sensor_simulator.encode(readings[start:start + batch]) for start in range(0, len(readings), batch)]
+              for readings in rounds]
+    began = time.perf_counter()
+    for round_bodies in bodies:
+        for body in round_bodies:
+            client.post('/api/sensor/frames', data=body, content_type='application/octet-stream')
+    return time.perf_counter() - began
+
+def parse_only(readings):
+    bodies = json_bodies(readings)
+    frames_body = sensor_simulator.encode(readings)
+
+    began = time.perf_counter()
+    for body in bodies:
+        data = json.loads(body)
+        device_registry.normalize_device_id(data['device_id'])
+    json_time = time.perf_counter() - began
+
+    began = time.perf_counter()
+    sensor_frames.readings_from_frames(sensor_frames.decode_frames(frames_body))
+    frames_time = time.perf_counter() - began
+    return json_time, frames_time, sum(map(len, bodies)), len(frames_body)
+
+def main():
+    n_devices = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    batch = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    n_rounds = 3
+
+    print(f"{n_devices:,} devices x {n_rounds} rounds, frame batches of {batch}")
+    for name in ('JSON per reading', 'binary frames'):
+        # A fresh database per path so both start from unregistered devices
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(os.path.join(tmp, 'bench.db'))
+            with app.app_context():
+                db.create_all()
+                lot = ParkingLot(prime_location_name='Bench', address='x', pin_code='0',
+                                 price=10, maximum_number_of_spots=n_devices)
+                db.session.add(lot)
+                db.session.commit()
+                provisioning.bulk_create_spots(lot.id, 1, n_devices)
+                rounds = make_rounds(list(range(1, n_devices + 1)), n_rounds)
+
+                client = app.test_client()
+                if name == 'binary frames':
+                    elapsed = run_frames(client, rounds, batch)
+                else:
+                    elapsed = run_json(client, rounds)
+                readings = n_devices * n_rounds
+                print(f"  {name:18s} {readings:,} readings in {elapsed:7.3f}s  ({readings / elapsed:,.0f} readings/s)")
+                db.session.remove()
+
+    json_time, frames_time, json_bytes, frames_bytes = parse_only(rounds[0])
+    print(f"  parse only: JSON {json_time * 1000:.1f} ms / {json_bytes:,} bytes, "
+          f"frames {frames_time * 1000:.1f} ms / {frames_bytes:,} bytes")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+# Benchmark: live availability reads from several worker processes at once
+#
+# Reader processes ask for one lot's counts in a loop while a writer process
+# keeps changing lots, first against the shared-memory spot table and then
+# against SQLite (a COUNT over the lot's spots, as every worker would run
+# without the table). The writer keeps every spot either occupied or
+# unknown, so a reader that sees available != 0 caught a torn write.
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_spot_table.py [readers] [seconds]
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from app.spot_table import SpotTable, STATUS_CODES
+
+N_LOTS = 200
+SPOTS_PER_LOT = 100
+
+def lot_rows(lot_id, occupied):
+    """Spots of one lot: the first `occupied` are 'O', the rest 'U'"""
+    spot_ids = np.arange((lot_id - 1) * SPOTS_PER_LOT + 1, lot_id * SPOTS_PER_LOT + 1)
+    lot_of = np.full(SPOTS_PER_LOT, lot_id, dtype=np.int64)
+    codes = np.full(SPOTS_PER_LOT, STATUS_CODES['U'], dtype=np.uint8)
+    codes[:occupied] = STATUS_CODES['O']
+    return spot_ids, lot_of, codes
+
+def open_table(name, lock_path):
+    return SpotTable(name, lock_path, max_spots=N_LOTS * SPOTS_PER_LOT + 1, max_lots=N_LOTS + 1)
+
+# Shared memory
+
+def shm_writer(name, lock_path, start, stop, counts):
+    table = open_table(name, lock_path)
+    rng = random.Random(1)
+    writes = 0
+    start.wait()
+    while not stop.is_set():
+        lot_id = rng.randint(1, N_LOTS)
+        table.write_lots([lot_id], *lot_rows(lot_id, rng.randint(0, SPOTS_PER_LOT)))
+        writes += 1
+    counts.put(('writes', writes, 0))
+    table.close()
+
+def shm_reader(name, lock_path, start, stop, counts):
+    table = open_table(name, lock_path)
+    rng = random.Random(os.getpid())
+    reads = torn = 0
+    start.wait()
+    while not stop.is_set():
+        stats = table.lot_stats(rng.randint(1, N_LOTS))
+        reads += 1
+        if stats['available'] != 0 or stats['total'] != SPOTS_PER_LOT:
+            torn += 1
+    counts.put(('reads', reads, torn))
+    table.close()
+
+# SQLite
+
+def db_writer(path, start, stop, counts):
+    conn = sqlite3.connect(path, timeout=30)
+    rng = random.Random(1)
+    writes = 0
+    start.wait()
+    while not stop.is_set():
+        lot_id = rng.randint(1, N_LOTS)
+        first = (lot_id - 1) * SPOTS_PER_LOT + 1
+        cut = first + rng.randint(0, SPOTS_PER_LOT)
+        conn.execute("UPDATE parking_spot SET status = CASE WHEN id < ? THEN 'O' ELSE 'U' END "
+                     "WHERE lot_id = ?", (cut, lot_id))
+        conn.commit()
+        writes += 1
+    counts.put(('writes', writes, 0))
+    conn.close()
+
+def db_reader(path, start, stop, counts):
+    conn = sqlite3.connect(path, timeout=30)
+    rng = random.Random(os.getpid())
+    reads = torn = 0
+    start.wait()
+    while not stop.is_set():
+        total, occupied, unknown = conn.execute(
+            "SELECT COUNT(*), SUM(status = 'O'), SUM(status = 'U') FROM parking_spot WHERE lot_id = ?",
+            (rng.randint(1, N_LOTS),)).fetchone()
+        reads += 1
+        if total - occupied - unknown != 0:
+            torn += 1
+    counts.put(('reads', reads, torn))
+    conn.close()
+
+def make_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE parking_spot (id INTEGER PRIMARY KEY, lot_id INTEGER, status TEXT)")
+    conn.execute("CREATE INDEX ix_spot_lot ON parking_spot (lot_id)")
+    conn.executemany("INSERT INTO parking_spot VALUES (?, ?, 'U')",
+                     [((lot - 1) * SPOTS_PER_LOT + i + 1, lot)
+                      for lot in range(1, N_LOTS + 1) for i in range(SPOTS_PER_LOT)])
+    conn.commit()
+    conn.close()
+
+def run(ctx, writer, reader, args, n_readers, seconds):
+    start = ctx.Barrier(n_readers + 2)
+    stop = ctx.Event()
+    counts = ctx.Queue()
+    procs = [ctx.Process(target=writer, args=(*args, start, stop, counts))]
+    procs += [ctx.Process(target=reader, args=(*args, start, stop, counts)) for _ in range(n_readers)]
+    for p in procs:
+        p.start()
+    # Time only the steady state, not process start-up
+    start.wait()
+    time.sleep(seconds)
+    stop.set()
+    results = [counts.get() for _ in procs]
+    for p in procs:
+        p.join()
+    reads = sum(n for kind, n, _ in results if kind == 'reads')
+    torn = sum(t for _, _, t in results)
+    writes = sum(n for kind, n, _ in results if kind == 'writes')
+    return reads / seconds, writes / seconds, torn
+
+def main():
+    n_readers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    ctx = multiprocessing.get_context('spawn')
+
+    with tempfile.TemporaryDirectory() as tmp:
+        name = f'ecolot_bench_{os.getpid()}'
+        lock_path = os.path.join(tmp, 'spot_table.lock')
+        table = open_table(name, lock_path)
+        table.write_all(*(np.concatenate(parts) for parts in zip(*(lot_rows(lot, 0)
+                                                                   for lot in range(1, N_LOTS + 1)))))
+        db_path = os.path.join(tmp, 'bench.db')
+        make_db(db_path)
+
+        print(f"{n_readers} reader process(es) + 1 writer, {N_LOTS} lots x {SPOTS_PER_LOT} spots, {seconds:g}s each")
+        for label, writer, reader, args in (('shared memory', shm_writer, shm_reader, (name, lock_path)),
+                                            ('SQLite COUNT', db_writer, db_reader, (db_path,))):
+            reads, writes, torn = run(ctx, writer, reader, args, n_readers, seconds)
+            print(f"  {label:14s} {reads:12,.0f} reads/s  {writes:9,.0f} writes/s  torn reads: {torn}")
+        table.unlink()
+
+if __name__ == '__main__':
+    main()
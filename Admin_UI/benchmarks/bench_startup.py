@@ -0,0 +1,87 @@
+# Benchmark: how fast a fresh worker process is ready to serve requests
+#
+# Starts new Python processes that import app.py and answer one request,
+# and reports the median import time and time to first response. With
+# --imports it also prints an import-time profile (python -X importtime)
+# of the slowest modules, to see what a worker pays for at boot.
+#
+# Run from the Admin_UI folder:  python benchmarks/bench_startup.py [runs] [--imports]
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ADMIN_UI = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Modules that should only be imported when a chart is actually drawn
+DEFERRED = ('matplotlib', 'matplotlib.pyplot')
+
+# Runs in the child process: argv[1] is the Admin_UI folder, argv[2] says
+# whether to also draw a chart. app.py is loaded by path because the app/
+# package shadows it for a plain `import app`.
+CHILD = """
+import importlib.util, json, os, sys, time
+started = time.perf_counter()
+sys.path.insert(0, sys.argv[1])
+spec = importlib.util.spec_from_file_location('ecolot_main', os.path.join(sys.argv[1], 'app.py'))
+main = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(main)
+imported = time.perf_counter()
+main.app.test_client().get('/login')
+ready = time.perf_counter()
+deferred = [name for name in %r if name in sys.modules]
+first_chart = None
+if sys.argv[2] == 'chart':
+    main.ChartGenerator.generate_user_location_chart([('Bench', 1)])
+    first_chart = time.perf_counter() - ready
+print(json.dumps({'import': imported - started, 'ready': ready - started,
+                  'loaded': deferred, 'first_chart': first_chart}))
+""" % (DEFERRED,)
+
+def run_child(extra_args=(), mode='chart'):
+    # Charts are written relative to the working directory, so use a scratch one
+    with tempfile.TemporaryDirectory() as tmp:
+        return subprocess.run([sys.executable, *extra_args, '-c', CHILD, ADMIN_UI, mode], cwd=tmp,
+                              capture_output=True, text=True, check=True)
+
+def import_report(limit=15):
+    """Slowest modules by cumulative import time, from python -X importtime"""
+    stderr = run_child(['-X', 'importtime'], mode='boot').stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((int(cumulative_us), int(self_us), depth, name.strip()))
+
+    # Only top-level imports add up to the total without double counting
+    total = sum(r[0] for r in rows if r[2] == 0)
+    print(f"\nImport-time profile (total {total / 1e6:.3f}s, top {limit} by cumulative time)")
+    print(f"  {'cumulative':>10} {'self':>8}  module")
+    for cumulative, own, depth, name in sorted(rows, reverse=True)[:limit]:
+        print(f"  {cumulative / 1e6:9.3f}s {own / 1e6:7.3f}s  {'  ' * depth}{name}")
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith('--')]
+    runs = int(args[0]) if args else 5
+
+    samples = [json.loads(run_child().stdout.strip().splitlines()[-1]) for _ in range(runs)]
+    imports = [s['import'] for s in samples]
+    ready = [s['ready'] for s in samples]
+    charts = [s['first_chart'] for s in samples]
+
+    print(f"{runs} fresh worker process(es)")
+    print(f"  import app.py          median {statistics.median(imports):.3f}s  max {max(imports):.3f}s")
+    print(f"  ready (first response) median {statistics.median(ready):.3f}s  max {max(ready):.3f}s")
+    print(f"  first chart (deferred) median {statistics.median(charts):.3f}s")
+    loaded = sorted({name for s in samples for name in s['loaded']})
+    print(f"  chart stack loaded at boot: {', '.join(loaded) if loaded else 'no'}")
+
+    if '--imports' in sys.argv:
+        import_report()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+// Client-side chart rendering (CHART_FORMAT = 'client')
+//
+// Every <canvas data-chart-src="..."> fetches its series from /api/charts/<chart>
+// and is drawn with Chart.js. Series come from the same ChartGenerator.*_series()
+// functions the server renderer uses, so both look alike.
+(function () {
+    function rupees(value) {
+        return '₹' + Math.round(value);
+    }
+
+    function config(series) {
+        if (series.type === 'pie') {
+            var pie = series.datasets[0];
+            return {
+                type: 'pie',
+                data: {
+                    labels: series.labels.map(function (l) { return l.split('\n'); }),
+                    datasets: [{ label: pie.label, data: pie.data, backgroundColor: pie.colors }]
+                },
+                options: { plugins: { title: { display: true, text: series.title } } }
+            };
+        }
+
+        var stacked = series.type === 'stacked-bar';
+        var line = series.type === 'line';
+        var yTicks = series.y_prefix ? { callback: rupees } : {};
+        return {
+            type: line ? 'line' : 'bar',
+            data: {
+                labels: series.labels,
+                datasets: series.datasets.map(function (d) {
+                    return {
+                        label: d.label, data: d.data,
+                        borderColor: d.color, backgroundColor: d.color,
+                        pointRadius: line ? 3 : undefined
+                    };
+                })
+            },
+            options: {
+                plugins: {
+                    title: { display: true, text: series.title },
+                    legend: { display: series.datasets.length > 1 }
+                },
+                scales: {
+                    x: { stacked: stacked, title: { display: true, text: series.x_label } },
+                    y: {
+                        stacked: stacked, beginAtZero: true, max: series.y_max,
+                        ticks: yTicks, title: { display: true, text: series.y_label }
+                    }
+                }
+            }
+        };
+    }
+
+    function showEmpty(canvas) {
+        var note = document.createElement('p');
+        note.className = 'text-muted py-4';
+        note.textContent = 'No data available';
+        canvas.replaceWith(note);
+    }
+
+    document.querySelectorAll('canvas[data-chart-src]').forEach(function (canvas) {
+        fetch(canvas.dataset.chartSrc, { credentials: 'same-origin' })
+            .then(function (response) { return response.json(); })
+            .then(function (series) {
+                if (!series || !series.labels || !series.labels.length) {
+                    showEmpty(canvas);
+                    return;
+                }
+                new Chart(canvas, config(series));
+            })
+            .catch(function () { showEmpty(canvas); });
+    });
+})();
@@ -0,0 +1,69 @@
+// Live notifications (waitlist offers and the like)
+//
+// Listens on the server-sent event stream named by this script tag's
+// data-stream, or polls data-poll where EventSource is unavailable. Each
+// event is shown as a dismissible alert and re-dispatched on document as a
+// 'live-update' CustomEvent, so pages can react to the kinds they care about.
+// The last id seen is kept per tab, so nothing is missed between pages.
+(function () {
+    var script = document.currentScript;
+    var POLL_MS = 3000;
+    var KEY = 'ecolot-last-event';
+    var lastId = sessionStorage.getItem(KEY);
+
+    function show(event) {
+        var container = document.querySelector('.container.mt-4');
+        if (!container || !event.data.message) {
+            return;
+        }
+        var alert = document.createElement('div');
+        alert.className = 'alert alert-info alert-dismissible fade show';
+        alert.appendChild(document.createTextNode(event.data.message + ' '));
+        if (event.data.url) {
+            var link = document.createElement('a');
+            link.href = event.data.url;
+            link.className = 'alert-link';
+            link.textContent = 'Book it now';
+            alert.appendChild(link);
+        }
+        var close = document.createElement('button');
+        close.type = 'button';
+        close.className = 'btn-close';
+        close.setAttribute('data-bs-dismiss', 'alert');
+        alert.appendChild(close);
+        container.insertBefore(alert, container.firstChild);
+    }
+
+    function deliver(event) {
+        if (lastId !== null && event.id <= Number(lastId)) {
+            return;
+        }
+        lastId = event.id;
+        sessionStorage.setItem(KEY, lastId);
+        show(event);
+        document.dispatchEvent(new CustomEvent('live-update', { detail: event }));
+    }
+
+    function poll() {
+        var url = script.dataset.poll + (lastId !== null ? '?after=' + lastId : '');
+        fetch(url, { credentials: 'same-origin' })
+            .then(function (response) { return response.json(); })
+            .then(function (body) {
+                if (lastId === null) {
+                    lastId = body.last_id;
+                }
+                body.events.forEach(deliver);
+            })
+            .catch(function () {})
+            .then(function () { setTimeout(poll, POLL_MS); });
+    }
+
+    if (window.EventSource) {
+        var source = new EventSource(script.dataset.stream + (lastId !== null ? '?after=' + lastId : ''));
+        source.onmessage = function (message) {
+            deliver(JSON.parse(message.data));
+        };
+    } else {
+        poll();
+    }
+})();
@@ -0,0 +1,40 @@
+# Shared fixtures: a bare Flask app around the models on a throwaway SQLite file
+import os
+import sys
+import pytest
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import db, User, ParkingLot, ParkingSpot
+from app import archival
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'test.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        archival.rebuild_history_view()
+        yield app
+        db.session.remove()
+        # Partition tables are registered on a module-level MetaData
+        archival.archive_metadata.clear()
+
+@pytest.fixture
+def user(app):
+    user = User(username='driver', password='x', email='driver@example.com', phone='1',
+                full_name='Driver', address='addr', pin_code='000000')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+@pytest.fixture
+def lot(app):
+    lot = ParkingLot(prime_location_name='Central', address='Main St', pin_code='000000', price=10.0,
+                     maximum_number_of_spots=3)
+    lot.spots = [ParkingSpot(spot_number=f'A{i:03d}', status='A') for i in range(1, 4)]
+    db.session.add(lot)
+    db.session.commit()
+    return lot
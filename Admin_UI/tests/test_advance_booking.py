@@ -0,0 +1,149 @@
+from datetime import datetime, timedelta
+import pytest
+from app.models import db, AdvanceBooking, ParkingLot, ParkingSpot
+from app import advance_booking
+
+START = datetime(2024, 5, 10, 9)
+
+def book(user, spot, start, hours=2, status=advance_booking.BOOKED):
+    booking = AdvanceBooking(user_id=user.id, spot_id=spot.id, start_time=start,
+                             end_time=start + timedelta(hours=hours), vehicle_license_plate='KA01',
+                             vehicle_color='red', status=status)
+    db.session.add(booking)
+    db.session.commit()
+    return booking
+
+def hours(a, b):
+    return START + timedelta(hours=a), START + timedelta(hours=b)
+
+def test_spot_schedule_conflicts_are_half_open():
+    schedule = advance_booking.SpotSchedule()
+    schedule.add(2, *hours(4, 6))
+    schedule.add(1, *hours(0, 2))
+    assert schedule.ids == [1, 2]
+    assert schedule.conflicts(*hours(1, 3))
+    assert schedule.conflicts(*hours(3, 5))
+    assert schedule.conflicts(*hours(-1, 7))
+    # Touching intervals do not clash
+    assert not schedule.conflicts(*hours(2, 4))
+    assert not schedule.conflicts(*hours(6, 8))
+    assert not schedule.conflicts(*hours(-2, 0))
+
+def test_spot_schedule_next_start_and_prune():
+    schedule = advance_booking.SpotSchedule()
+    schedule.add(1, *hours(0, 2))
+    schedule.add(2, *hours(4, 6))
+    assert schedule.next_start(hours(1, 1)[0]) == hours(4, 4)[0]
+    assert schedule.next_start(hours(5, 5)[0]) is None
+    assert schedule.prune(hours(2, 2)[0]) == [1]
+    assert len(schedule) == 1
+    schedule.remove(2)
+    assert not schedule
+
+def test_index_finds_free_spots(user, lot):
+    a, b, c = lot.spots
+    book(user, a, START)
+    book(user, b, START + timedelta(hours=3))
+    index = advance_booking.BookingIndex()
+    index.load(START)
+
+    assert set(index.free_spots(lot.id, *hours(0, 1))) == {b.id, c.id}
+    assert set(index.free_spots(lot.id, *hours(2, 4))) == {a.id, c.id}
+    # Never-booked spots come first
+    assert next(index.free_spots(lot.id, *hours(0, 1))) == c.id
+    assert index.find_free_spot(lot.id, *hours(0, 4), exclude={c.id}) is None
+
+def test_index_tracks_bookings_as_they_change(user, lot):
+    a, b, c = lot.spots
+    index = advance_booking.BookingIndex()
+    index.load(START)
+    booking = book(user, a, START)
+    index.record(booking, START)
+    assert not index.is_free(a.id, *hours(1, 3))
+    assert a.id not in index.clear[lot.id]
+
+    booking.status = advance_booking.CANCELLED
+    index.record(booking, START)
+    assert index.is_free(a.id, *hours(1, 3))
+    assert a.id in index.clear[lot.id]
+
+def test_index_sync_picks_up_other_workers(user, lot):
+    a = lot.spots[0]
+    now = datetime.utcnow()
+    index = advance_booking.BookingIndex()
+    index.load(now)
+    book(user, a, now + timedelta(hours=1))
+    # Within SYNC_INTERVAL the index is not re-read...
+    index.sync(now)
+    assert index.is_free(a.id, now + timedelta(hours=1), now + timedelta(hours=2))
+    index.sync(now, force=True)
+    assert not index.is_free(a.id, now + timedelta(hours=1), now + timedelta(hours=2))
+
+def test_walk_in_prefers_the_spot_booked_furthest_ahead(user, lot):
+    a, b, c = lot.spots
+    book(user, a, START + timedelta(hours=1))
+    book(user, b, START + timedelta(hours=5))
+    book(user, c, START - timedelta(hours=1))
+    index = advance_booking.BookingIndex()
+    index.load(START)
+    assert index.walk_in_spot([a.id, b.id, c.id], START) == b.id
+    assert index.walk_in_spot([c.id], START) is None
+
+def test_create_booking_never_double_books(user, lot):
+    index = advance_booking.BookingIndex()
+    start, end = datetime.utcnow() + timedelta(hours=1), datetime.utcnow() + timedelta(hours=3)
+    spots = {advance_booking.create_booking(index, user.id, lot.id, start, end, 'KA01', 'red').spot_id
+             for _ in range(3)}
+    assert spots == {spot.id for spot in lot.spots}
+    with pytest.raises(advance_booking.BookingError):
+        advance_booking.create_booking(index, user.id, lot.id, start, end, 'KA01', 'red')
+
+def test_create_booking_rechecks_a_stale_index(user, lot):
+    start, end = datetime.utcnow() + timedelta(hours=1), datetime.utcnow() + timedelta(hours=3)
+    index = advance_booking.BookingIndex()
+    index.load()
+    # Booked by another worker after this index loaded
+    for spot in lot.spots[:2]:
+        book(user, spot, start)
+    booking = advance_booking.create_booking(index, user.id, lot.id, start, end, 'KA01', 'red')
+    assert booking.spot_id == lot.spots[2].id
+
+def test_deleting_a_spot_drops_its_finished_bookings(user, lot):
+    spot = lot.spots[0]
+    book(user, spot, START, status=advance_booking.CANCELLED)
+    book(user, spot, START + timedelta(days=1), status=advance_booking.CHECKED_IN)
+
+    db.session.delete(spot)
+    db.session.commit()
+    assert AdvanceBooking.query.count() == 0
+
+def test_deleting_a_lot_drops_its_spots_finished_bookings(user, lot):
+    book(user, lot.spots[1], START, status=advance_booking.CANCELLED)
+
+    db.session.delete(lot)
+    db.session.commit()
+    assert ParkingLot.query.count() == 0 and ParkingSpot.query.count() == 0
+    assert AdvanceBooking.query.count() == 0
+
+def test_check_in_moves_to_a_free_spot(user, lot):
+    taken, free, walk_in = lot.spots
+    taken.status = walk_in.status = 'O'
+    booking = book(user, taken, START)
+    index = advance_booking.BookingIndex()
+
+    spot = advance_booking.move_to_free_spot(index, booking, START)
+    assert spot.id == free.id and spot.status == 'O'
+    assert booking.spot_id == free.id
+
+def test_check_in_skips_a_spot_booked_behind_the_index(user, lot):
+    taken, free, walk_in = lot.spots
+    taken.status = walk_in.status = 'O'
+    booking = book(user, taken, START)
+    index = advance_booking.BookingIndex()
+    index.load(START)
+    # Another worker books the only free spot; this index has not synced yet
+    book(user, free, START + timedelta(minutes=30))
+
+    assert advance_booking.move_to_free_spot(index, booking, START) is None
+    assert db.session.get(ParkingSpot, free.id).status == 'A'
+    assert db.session.get(AdvanceBooking, booking.id).spot_id == taken.id
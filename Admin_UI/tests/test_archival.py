@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.models import db, Reservation
+from app import archival
+
+def park(user, spot, parked, hours=2, cost=20.0):
+    reservation = Reservation(spot_id=spot.id, user_id=user.id, vehicle_license_plate='KA01', vehicle_color='red',
+                              parking_timestamp=parked, leaving_timestamp=parked + timedelta(hours=hours),
+                              parking_cost=cost, hours_charged=hours, is_active=False)
+    db.session.add(reservation)
+    db.session.commit()
+    return reservation
+
+def test_archiving_twice_in_one_month_keeps_ids_unique(user, lot):
+    first_spot, second_spot = lot.spots[:2]
+    day = datetime(2024, 5, 10, 9)
+    park(user, first_spot, day)
+    newest_id = park(user, second_spot, day + timedelta(days=1)).id
+
+    # Moving the newest row out must not free its id for the next reservation
+    assert archival.archive_spot_history([second_spot.id]) == 1
+    later = park(user, first_spot, day + timedelta(days=2))
+    assert later.id != newest_id
+
+    assert archival.archive_spot_history([first_spot.id]) == 2
+    ids = db.session.execute(select(archival.reservation_history.c.id)).scalars().all()
+    assert len(ids) == 3 and len(set(ids)) == 3
+
+def test_totals_include_archived_sessions(user, lot):
+    day = datetime(2024, 5, 10, 9)
+    park(user, lot.spots[0], day, hours=2, cost=20.0)
+    park(user, lot.spots[1], day, hours=3, cost=30.0)
+    archival.archive_spot_history([lot.spots[0].id])
+
+    assert user.get_total_spending() == 50.0
+    assert user.get_total_hours() == 5
+    assert user.get_parking_frequency() == 2
+    assert lot.get_total_revenue() == 50.0
@@ -0,0 +1,152 @@
+from datetime import datetime, timedelta
+from app.models import db, ParkingSpot, SensorDevice, SpotVacancy
+from app.device_registry import (TimerWheel, DeviceRegistry, HEALTH_OK, HEALTH_SILENT, SPOT_UNKNOWN, to_epoch,
+                                 resolve_spot)
+
+NOW = datetime(2024, 5, 10, 12)
+
+def registry_at(now, **kwargs):
+    """A registry whose wheel starts at `now` rather than the wall clock"""
+    registry = DeviceRegistry(**kwargs)
+    registry.wheel = TimerWheel(now=to_epoch(now))
+    return registry
+
+def test_wheel_expires_due_keys_only():
+    wheel = TimerWheel(tick_seconds=5, n_slots=8, now=0)
+    wheel.schedule('a', 12)
+    wheel.schedule('b', 14.9)
+    wheel.schedule('c', 30)
+    assert wheel.advance(10) == []
+    assert wheel.advance(13) == ['a']
+    assert wheel.advance(15) == ['b']
+    assert 'c' in wheel and len(wheel) == 1
+
+def test_wheel_reschedule_and_cancel():
+    wheel = TimerWheel(tick_seconds=5, n_slots=8, now=0)
+    wheel.schedule('a', 10)
+    wheel.schedule('a', 20)
+    wheel.schedule('b', 10)
+    wheel.cancel('b')
+    assert wheel.advance(12) == []
+    assert wheel.advance(20) == ['a']
+
+def test_wheel_keeps_deadlines_beyond_one_revolution():
+    wheel = TimerWheel(tick_seconds=5, n_slots=8, now=0)
+    # 8 slots of 5s cover 40s; this shares a slot with t=5 but is due a lap later
+    wheel.schedule('far', 45)
+    assert wheel.advance(10) == []
+    assert wheel.advance(50) == ['far']
+
+def test_wheel_puts_overdue_deadlines_in_the_current_slot():
+    wheel = TimerWheel(tick_seconds=5, n_slots=8, now=100)
+    wheel.schedule('late', 50)
+    assert wheel.advance(100) == ['late']
+
+def test_reports_update_spots_and_vacancies(lot):
+    registry = DeviceRegistry()
+    spot = lot.spots[0]
+    accepted, lot_ids = registry.record_reports([('AA:01', spot.id, 'O'), ('AA:01', spot.id, 'A'),
+                                                 ('AA:02', 9999, 'O')], NOW)
+    assert accepted == 1 and lot_ids == []
+    assert SensorDevice.query.one().report_count == 2
+    assert db.session.get(SpotVacancy, spot.id).vacant_since == NOW
+
+    _, lot_ids = registry.record_reports([('AA:01', spot.id, 'O')], NOW + timedelta(minutes=1))
+    assert lot_ids == [lot.id]
+    assert db.session.get(ParkingSpot, spot.id).status == 'O'
+    assert db.session.get(SpotVacancy, spot.id) is None
+
+def test_frames_are_dated_by_the_device_clock(lot):
+    registry = DeviceRegistry()
+    spot = lot.spots[0]
+    registry.record_reports([('AA:01', spot.id, 'O', 600_000)], NOW)
+    device = SensorDevice.query.one()
+    assert device.last_seen == NOW and device.uptime_ms == 600_000
+
+    # A batch held back by a gateway: read 60s after the last report, delivered 3 minutes later
+    registry.record_reports([('AA:01', spot.id, 'A', 660_000)], NOW + timedelta(minutes=4))
+    db.session.refresh(device)
+    assert device.last_seen == NOW + timedelta(seconds=60)
+    assert db.session.get(SpotVacancy, spot.id).vacant_since == NOW + timedelta(seconds=60)
+
+    # Delivered on time (within CLOCK_TOLERANCE) or a clock running ahead: dated on arrival
+    registry.record_reports([('AA:01', spot.id, 'A', 961_000)], NOW + timedelta(minutes=6))
+    db.session.refresh(device)
+    assert device.last_seen == NOW + timedelta(minutes=6)
+    registry.record_reports([('AA:01', spot.id, 'A', 1_020_000)], NOW + timedelta(minutes=7))
+    db.session.refresh(device)
+    assert device.last_seen == NOW + timedelta(minutes=7)
+
+    # Further back than a gateway holds frames: the device restarted unnoticed
+    registry.record_reports([('AA:01', spot.id, 'A', 1_080_000)], NOW + timedelta(minutes=20))
+    db.session.refresh(device)
+    assert device.last_seen == NOW + timedelta(minutes=20)
+
+def test_frames_older_than_the_last_report_are_dropped(lot):
+    registry = DeviceRegistry()
+    spot = lot.spots[0]
+    registry.record_reports([('AA:01', spot.id, 'A', 600_000)], NOW)
+
+    # A retried or reordered batch
+    accepted, lot_ids = registry.record_reports([('AA:01', spot.id, 'O', 590_000)], NOW + timedelta(seconds=30))
+    assert accepted == 0 and lot_ids == []
+    device = SensorDevice.query.one()
+    assert device.last_seen == NOW and device.report_count == 1
+    assert db.session.get(ParkingSpot, spot.id).status == 'A'
+
+    # A restarted device counts from zero again
+    accepted, _ = registry.record_reports([('AA:01', spot.id, 'O', 20_000)], NOW + timedelta(minutes=1))
+    db.session.refresh(device)
+    assert accepted == 1 and device.last_seen == NOW + timedelta(minutes=1) and device.uptime_ms == 20_000
+
+def test_json_reports_reset_the_device_clock(lot):
+    registry = DeviceRegistry()
+    spot = lot.spots[0]
+    registry.record_reports([('AA:01', spot.id, 'A', 600_000)], NOW)
+    registry.record_reports([('AA:01', spot.id, 'A')], NOW + timedelta(minutes=2))
+    device = SensorDevice.query.one()
+    assert device.uptime_ms is None
+    registry.record_reports([('AA:01', spot.id, 'A', 500_000)], NOW + timedelta(minutes=3))
+    db.session.refresh(device)
+    assert device.last_seen == NOW + timedelta(minutes=3) and device.uptime_ms == 500_000
+
+def test_silent_device_is_flagged_and_its_spot_unknown(lot):
+    registry = registry_at(NOW, timeout=timedelta(minutes=15))
+    spot = lot.spots[0]
+    registry.record_reports([('AA:01', spot.id, 'A')], NOW)
+    registry.load(NOW)
+
+    assert registry.check(NOW + timedelta(minutes=14)) == 0
+    assert registry.check(NOW + timedelta(minutes=16)) == 1
+    device = SensorDevice.query.one()
+    assert device.health == HEALTH_SILENT
+    assert db.session.get(ParkingSpot, spot.id).status == SPOT_UNKNOWN
+
+    # Reporting again brings it back
+    registry.record_reports([('AA:01', spot.id, 'A')], NOW + timedelta(minutes=20))
+    db.session.refresh(device)
+    assert device.health == HEALTH_OK and db.session.get(ParkingSpot, spot.id).status == 'A'
+
+def test_device_that_reported_elsewhere_is_rescheduled(lot):
+    registry = registry_at(NOW, timeout=timedelta(minutes=15))
+    spot = lot.spots[0]
+    registry.record_reports([('AA:01', spot.id, 'A')], NOW)
+    registry.load(NOW)
+
+    # Another worker took a report this registry did not see
+    device = SensorDevice.query.one()
+    device.last_seen = NOW + timedelta(minutes=10)
+    db.session.commit()
+    assert registry.check(NOW + timedelta(minutes=16)) == 0
+    assert registry.check(NOW + timedelta(minutes=26)) == 1
+
+def test_reports_resolve_to_the_spot_whose_number_matches(lot):
+    a, b, _ = lot.spots
+    assert resolve_spot(a.id, None, None) is a
+    assert resolve_spot(str(a.id), None, 'A001') is a
+    assert resolve_spot(a.id, 'Central', 'A002') is b
+    assert resolve_spot(None, 'Central', 'A002') is b
+    # A spot id whose number disagrees is rejected, not trusted
+    assert resolve_spot(a.id, None, 'A002') is None
+    assert resolve_spot(a.id, 'Elsewhere', 'A002') is None
+    assert resolve_spot('junk', None, None) is None
@@ -0,0 +1,103 @@
+from datetime import datetime, timedelta
+import numpy as np
+from app.models import db, Reservation, LotForecast
+from app import forecasting, archival
+from app.forecasting import (hourly_occupancy, fold_hour_of_week, fold_hour_of_day, slot_counts, fit_forecast,
+                             to_epoch_hours, refresh_forecasts, spot_heatmap)
+
+# A Monday
+MONDAY = datetime(2024, 1, 1)
+
+def epoch_hour(when):
+    return int(to_epoch_hours([when])[0])
+
+def parked(user, spot, start, end=None):
+    reservation = Reservation(spot_id=spot.id, user_id=user.id, vehicle_license_plate='KA01',
+                              vehicle_color='red', parking_timestamp=start, leaving_timestamp=end,
+                              is_active=end is None)
+    db.session.add(reservation)
+    db.session.commit()
+    return reservation
+
+def test_sweep_counts_partial_and_whole_hours():
+    occupancy = hourly_occupancy(
+        group_index=[0, 0, 1], starts=[0.5, 2.25, 1.0], ends=[3.5, 2.75, 9.0], n_groups=2,
+        origin_hour=0, n_hours=4)
+    assert np.allclose(occupancy, [[0.5, 1.0, 1.5, 0.5], [0.0, 1.0, 1.0, 1.0]])
+
+def test_sweep_clips_to_the_window():
+    occupancy = hourly_occupancy([0, 0], [-5.0, 3.0], [-1.0, 3.5], 1, origin_hour=0, n_hours=3)
+    assert np.allclose(occupancy, [[0.0, 0.0, 0.0]])
+
+def test_folds_line_up_with_the_calendar():
+    origin = epoch_hour(MONDAY + timedelta(hours=10))
+    occupancy = np.ones((1, 3))
+    week = fold_hour_of_week(occupancy, origin)
+    assert np.flatnonzero(week[0]).tolist() == [10, 11, 12]
+    day = fold_hour_of_day(np.ones((1, 26)), origin)
+    assert day[0, 10] == day[0, 11] == 2 and day[0, 12] == 1
+
+def test_slot_counts_over_a_week_and_a_bit():
+    start = epoch_hour(MONDAY)
+    counts = slot_counts([start], [start + forecasting.HOURS_PER_WEEK + 2])
+    assert counts[0, 0] == counts[0, 1] == 2 and counts[0, 2] == 1 and counts[0].sum() == 170
+
+def test_fit_shrinks_towards_the_lot_mean_and_clips():
+    occupied = np.zeros((1, forecasting.HOURS_PER_WEEK))
+    observed = np.ones((1, forecasting.HOURS_PER_WEEK))
+    occupied[0, 0] = 168.0
+    expected = fit_forecast(occupied, observed, capacity=[100])
+    # lot mean 1.0: the busy slot is pulled down, the quiet ones up
+    assert np.isclose(expected[0, 0], (168 + 2) / 3) and np.isclose(expected[0, 1], 2 / 3)
+    assert fit_forecast(occupied, observed, capacity=[10])[0, 0] == 10
+
+def test_incremental_refreshes_match_one_refresh(user, lot):
+    lot.created_date = MONDAY
+    parked(user, lot.spots[0], MONDAY + timedelta(hours=9), MONDAY + timedelta(hours=11, minutes=30))
+    parked(user, lot.spots[1], MONDAY + timedelta(days=1, hours=23), MONDAY + timedelta(days=2, hours=1))
+
+    refresh_forecasts(MONDAY + timedelta(days=1, hours=23, minutes=30))
+    refresh_forecasts(MONDAY + timedelta(days=3))
+    stepwise = {row.hour_of_week: (row.occupied_hours, row.observed_slots) for row in LotForecast.query}
+
+    LotForecast.query.delete()
+    forecasting.ForecastState.query.delete()
+    db.session.commit()
+    refresh_forecasts(MONDAY + timedelta(days=3))
+    at_once = {row.hour_of_week: (row.occupied_hours, row.observed_slots) for row in LotForecast.query}
+
+    assert stepwise == at_once
+    assert at_once[9] == (1.0, 1) and at_once[11] == (0.5, 1)
+    assert at_once[24 + 23] == (1.0, 1) and at_once[48] == (1.0, 1)
+    assert at_once[72] == (0.0, 0)
+
+def test_spot_heatmap_counts_running_sessions_until_now(user, lot):
+    now = MONDAY + timedelta(days=7, hours=12)
+    parked(user, lot.spots[0], now - timedelta(hours=2))
+    heatmap = spot_heatmap([lot.spots[0].id, lot.spots[1].id], weeks=1, now=now)
+    assert heatmap.shape == (2, 24)
+    assert np.isclose(heatmap[0, 10], 1 / 7) and np.isclose(heatmap[0, 11], 1 / 7) and heatmap[0, 12] == 0
+    assert not heatmap[1].any()
+
+def test_lot_heatmap_is_the_share_of_spots_taken(user, lot):
+    lot.created_date = MONDAY
+    parked(user, lot.spots[0], MONDAY + timedelta(hours=9), MONDAY + timedelta(hours=10))
+    parked(user, lot.spots[1], MONDAY + timedelta(hours=9), MONDAY + timedelta(hours=9, minutes=30))
+    refresh_forecasts(MONDAY + timedelta(days=1))
+
+    heatmap = forecasting.lot_heatmap([lot])
+    assert heatmap.shape == (1, forecasting.HOURS_PER_WEEK)
+    # 1.5 spot-hours of 3 spots, seen once
+    assert np.isclose(heatmap[0, 9], 0.5)
+    assert heatmap[0, 10] == 0 and heatmap[0, 24 + 9] == 0
+
+def test_refresh_sweeps_archived_reservations(user, lot):
+    lot.created_date = MONDAY
+    parked(user, lot.spots[0], MONDAY + timedelta(hours=9), MONDAY + timedelta(hours=11))
+    parked(user, lot.spots[1], MONDAY + timedelta(hours=9), MONDAY + timedelta(hours=10))
+    assert archival.archive_reservations(MONDAY + timedelta(hours=10, minutes=30)) == 1
+    assert Reservation.query.count() == 1
+
+    assert refresh_forecasts(MONDAY + timedelta(days=1)) == 2
+    at_once = {row.hour_of_week: row.occupied_hours for row in LotForecast.query}
+    assert at_once[9] == 2.0 and at_once[10] == 1.0
@@ -0,0 +1,117 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from app.models import db, Job
+from app.jobs import JobQueue, JobError, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+
+@pytest.fixture
+def queue(app):
+    queue = JobQueue(retry_delay=timedelta(seconds=10))
+    calls = queue.calls = []
+
+    @queue.handler('add')
+    def add(ctx, a, b):
+        calls.append((a, b))
+        ctx.progress(0.5, 'halfway')
+        return a + b
+
+    @queue.handler('flaky')
+    def flaky(ctx):
+        calls.append('flaky')
+        raise RuntimeError('boom')
+
+    @queue.handler('broken')
+    def broken(ctx):
+        raise JobError('bad input')
+
+    return queue
+
+def refreshed(job):
+    db.session.expire_all()
+    return db.session.get(Job, job.id)
+
+def test_enqueued_job_runs_once(queue):
+    job = queue.enqueue('add', a=2, b=3)
+    assert queue.pending() == 1
+
+    assert queue.run_pending('w1') == 1
+    job = refreshed(job)
+    assert job.status == DONE and json.loads(job.result) == 5 and job.progress == 1.0
+    assert job.lease_until is None
+    assert queue.run_pending('w1') == 0 and queue.calls == [(2, 3)]
+
+def test_unknown_kind_is_refused(queue):
+    with pytest.raises(ValueError):
+        queue.enqueue('nope')
+
+def test_claim_is_exclusive_while_leased(queue):
+    job = queue.enqueue('add', a=1, b=1)
+    assert queue.claim('w1').id == job.id
+    assert queue.claim('w2') is None
+
+def test_expired_lease_is_reclaimed(queue):
+    job = queue.enqueue('add', a=1, b=1)
+    now = datetime.utcnow()
+    queue.claim('w1', now)
+
+    # w1 died; once the lease runs out another worker takes the job over
+    assert queue.claim('w2', now + queue.lease - timedelta(seconds=1)) is None
+    reclaimed = queue.claim('w2', now + queue.lease + timedelta(seconds=1))
+    assert reclaimed.id == job.id and reclaimed.worker == 'w2' and reclaimed.attempts == 2
+
+    # The dead worker can no longer finish or report on it
+    queue._finish(job.id, 'w1', status=DONE)
+    assert refreshed(job).status == RUNNING
+
+def test_failure_is_retried_with_backoff(queue):
+    job = queue.enqueue('flaky', max_attempts=2)
+    before = datetime.utcnow()
+    queue.run_pending('w1')
+    job = refreshed(job)
+    assert job.status == QUEUED and job.attempts == 1
+    assert job.run_after >= before + timedelta(seconds=10)
+    # Not runnable until the backoff has passed
+    assert queue.run_pending('w1') == 0
+
+    job.run_after = datetime.utcnow()
+    db.session.commit()
+    queue.run_pending('w1')
+    job = refreshed(job)
+    assert job.status == FAILED and job.attempts == 2 and 'boom' in job.message
+    assert queue.calls == ['flaky', 'flaky']
+
+def test_job_error_is_not_retried(queue):
+    job = queue.enqueue('broken', max_attempts=3)
+    queue.run_pending('w1')
+    job = refreshed(job)
+    assert job.status == FAILED and job.attempts == 1 and job.message == 'bad input'
+
+def test_retry_and_cancel(queue):
+    job = queue.enqueue('broken')
+    queue.run_pending('w1')
+    assert queue.retry(job.id)
+    job = refreshed(job)
+    assert job.status == QUEUED and job.attempts == 0 and job.error is None
+
+    assert queue.cancel(job.id)
+    assert refreshed(job).status == CANCELLED
+    assert not queue.cancel(job.id) and not queue.retry(job.id)
+
+def test_reclaimed_after_the_last_attempt_fails(queue):
+    job = queue.enqueue('add', max_attempts=1, a=1, b=1)
+    now = datetime.utcnow()
+    queue.claim('w1', now)
+    reclaimed = queue.claim('w2', now + queue.lease + timedelta(seconds=1))
+    queue.run(reclaimed, 'w2')
+    job = refreshed(job)
+    assert job.status == FAILED and queue.calls == []
+
+def test_prune_keeps_recent_and_unfinished_jobs(queue):
+    old, recent, queued = (queue.enqueue('add', a=1, b=1) for _ in range(3))
+    queue.run_pending('w1', limit=2)
+    now = datetime.utcnow()
+    refreshed(old).finished_at = now - timedelta(days=8)
+    db.session.commit()
+
+    assert queue.prune(now) == 1
+    assert {job.id for job in Job.query} == {recent.id, queued.id}
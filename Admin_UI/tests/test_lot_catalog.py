@@ -0,0 +1,69 @@
+from app.models import db, ParkingLot
+from app.lot_catalog import LotCatalog, CachedLot
+
+def add_lot(name, pin_code='000000'):
+    lot = ParkingLot(prime_location_name=name, address=f'{name} Road', pin_code=pin_code, price=10.0,
+                     maximum_number_of_spots=0)
+    db.session.add(lot)
+    db.session.commit()
+    return lot
+
+class SharedGeneration:
+    """Stands in for the generation counter in the spot table header"""
+
+    def __init__(self):
+        self.value = 0
+
+    def read(self):
+        return self.value
+
+    def bump(self):
+        self.value += 1
+
+def test_listing_is_served_from_memory_until_invalidated(lot):
+    catalog = LotCatalog()
+    assert [cached.id for cached in catalog.all()] == [lot.id]
+    add_lot('North')
+    assert len(catalog.all()) == 1
+
+    catalog.invalidate()
+    assert [cached.prime_location_name for cached in catalog.all()] == ['Central', 'North']
+
+def test_shared_generation_reaches_other_workers(lot):
+    shared = SharedGeneration()
+    ours = LotCatalog(generation=shared.read, bump=shared.bump)
+    theirs = LotCatalog(generation=shared.read, bump=shared.bump)
+    assert len(ours.all()) == len(theirs.all()) == 1
+
+    add_lot('North')
+    theirs.invalidate()
+    assert len(ours.all()) == 2
+
+def test_ttl_expires_an_unshared_catalog(lot):
+    catalog = LotCatalog(ttl=0)
+    catalog.all()
+    add_lot('North')
+    assert len(catalog.all()) == 2
+
+def test_searches_are_memoized_per_generation(lot):
+    add_lot('North', pin_code='560001')
+    catalog = LotCatalog()
+    assert [cached.prime_location_name for cached in catalog.search(' NORTH ')] == ['North']
+    assert [cached.prime_location_name for cached in catalog.search('5600')] == ['North']
+    assert len(catalog.search('')) == 2
+    assert set(catalog._searches) == {'north', '5600'}
+
+    add_lot('Northgate')
+    catalog.invalidate()
+    assert len(catalog.search('north')) == 2
+
+def test_search_memo_is_bounded(lot):
+    catalog = LotCatalog(max_searches=2)
+    for needle in ('a', 'b', 'c'):
+        catalog.search(needle)
+    assert list(catalog._searches) == ['b', 'c']
+
+def test_cached_lot_loads_other_attributes_from_its_row(lot):
+    cached = LotCatalog().get(lot.id)
+    assert isinstance(cached, CachedLot) and cached.price == 10.0
+    assert len(cached.spots) == 3
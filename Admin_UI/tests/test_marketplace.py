@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta
+from app.marketplace import MatchingEngine, Order, cells_near, cell_of, distance_km
+
+START = datetime(2024, 5, 10, 9)
+# Bangalore; 0.009 degrees of latitude is about 1 km
+LAT, LON = 12.97, 77.59
+
+def listing(order_id, price, lat=LAT, lon=LON, hours=(0, 8), user_id=None):
+    return Order('listing', order_id, lat, lon, START + timedelta(hours=hours[0]),
+                 START + timedelta(hours=hours[1]), price, user_id=user_id)
+
+def request(order_id, cap, lat=LAT, lon=LON, hours=(1, 3), max_km=2.0, user_id=None):
+    return Order('request', order_id, lat, lon, START + timedelta(hours=hours[0]),
+                 START + timedelta(hours=hours[1]), cap, max_km, user_id=user_id)
+
+def test_cheapest_covering_listing_wins():
+    engine = MatchingEngine()
+    for order in (listing(1, 50), listing(2, 30), listing(3, 20, hours=(2, 8)), listing(4, 40)):
+        assert engine.submit(order) is None
+    match = engine.submit(request(10, 45))
+    assert match.listing.id == 2 and match.price == 30
+    assert ('listing', 2) not in engine and len(engine) == 3
+
+def test_price_cap_and_distance_are_respected():
+    engine = MatchingEngine()
+    engine.submit(listing(1, 60))
+    engine.submit(listing(2, 10, lat=LAT + 0.05))      # ~5.5 km away
+    assert engine.submit(request(10, 50)) is None
+    assert ('request', 10) in engine
+    # A new listing in reach and under the cap fills the resting request
+    match = engine.submit(listing(3, 45, lat=LAT + 0.009))
+    assert match.request.id == 10 and 0.9 < match.distance_km < 1.1
+
+def test_equal_prices_go_to_the_nearest_then_the_oldest():
+    engine = MatchingEngine()
+    engine.submit(listing(1, 30, lat=LAT + 0.009))
+    engine.submit(listing(2, 30))
+    engine.submit(listing(3, 30))
+    assert engine.submit(request(10, 30)).listing.id == 2
+    assert engine.submit(request(11, 30)).listing.id == 3
+
+def test_requests_queue_by_highest_cap():
+    engine = MatchingEngine()
+    engine.submit(request(10, 30))
+    engine.submit(request(11, 40))
+    assert engine.submit(listing(1, 25)).request.id == 11
+
+def test_owners_never_fill_their_own_requests():
+    engine = MatchingEngine()
+    engine.submit(listing(1, 20, user_id=7))
+    engine.submit(listing(2, 30, user_id=8))
+    assert engine.submit(request(10, 40, user_id=7)).listing.id == 2
+
+    # Incoming listings skip their owner's resting requests too
+    engine = MatchingEngine()
+    engine.submit(request(11, 40, user_id=9))
+    engine.submit(request(12, 50, user_id=7))
+    assert engine.submit(listing(3, 30, user_id=7)).request.id == 11
+
+def test_lost_claim_drops_only_the_losing_side():
+    taken = {('request', 10)}
+
+    def claim(listing, request, km):
+        return ('listing', listing.id) not in taken, ('request', request.id) not in taken
+    engine = MatchingEngine(claim=claim)
+    engine.submit(request(10, 40))
+    engine.submit(request(11, 35))
+    match = engine.submit(listing(1, 30))
+    assert match.request.id == 11 and ('request', 10) not in engine
+
+def test_expire_and_cancel():
+    engine = MatchingEngine()
+    engine.submit(listing(1, 30, hours=(0, 2)))
+    engine.submit(listing(2, 30, hours=(0, 8)))
+    engine.expire(START + timedelta(hours=2))
+    assert ('listing', 1) not in engine
+    engine.cancel('listing', 2)
+    assert len(engine) == 0
+
+def test_grid_search_covers_the_radius():
+    near = set(cells_near(LAT, LON, 2.0))
+    for dlat, dlon in ((0.017, 0), (0, 0.018), (-0.012, -0.012)):
+        assert distance_km(LAT, LON, LAT + dlat, LON + dlon) < 2.0
+        assert cell_of(LAT + dlat, LON + dlon) in near
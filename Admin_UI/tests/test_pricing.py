@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+import numpy as np
+from app.models import db
+from app.forecasting import HOURS_PER_WEEK
+from app.pricing import (PriceTable, PricingEngine, build_rates, charged_hours_for, flat_price_table,
+                         MIN_MULTIPLIER, MAX_MULTIPLIER, LIVE_HOURS)
+
+# A Monday
+MONDAY = datetime(2024, 1, 1)
+
+def test_cost_matches_the_hourly_breakdown():
+    table = PriceTable(1, 10.0, np.arange(HOURS_PER_WEEK, dtype=np.float64))
+    start = MONDAY + timedelta(hours=5)
+    assert table.rate_at(start) == 5.0
+    assert table.cost(start, 3) == 5 + 6 + 7
+    for hours in (1, 20, 167, 168, 200, 500):
+        assert table.cost(start, hours) == round(float(table.hourly_breakdown(start, hours).sum()), 2)
+
+def test_cost_wraps_past_the_end_of_the_week():
+    table = PriceTable(1, 10.0, np.arange(HOURS_PER_WEEK, dtype=np.float64))
+    sunday_night = MONDAY - timedelta(hours=1)
+    assert table.cost(sunday_night, 2) == 167 + 0
+
+def test_flat_table_charges_the_base_price(lot):
+    assert flat_price_table(lot).cost(MONDAY, 5) == 50.0
+
+def test_rates_stay_in_the_band_and_on_the_step():
+    expected = np.linspace(0, 100, HOURS_PER_WEEK)
+    rates = build_rates(10.0, expected, 100, live_occupied=50, now=MONDAY + timedelta(days=3))
+    assert rates.min() == 10.0 * MIN_MULTIPLIER and rates.max() <= 10.0 * MAX_MULTIPLIER
+    # A full lot: 1 + 1.5 * (1.0 - 0.6)
+    assert rates[-1] == 16.0
+    assert np.allclose(np.round(rates / 0.5), rates / 0.5)
+
+def test_live_occupancy_drives_the_next_hours():
+    now = MONDAY + timedelta(hours=8)
+    rates = build_rates(10.0, np.zeros(HOURS_PER_WEEK), 10, live_occupied=10, now=now)
+    assert rates[8] == 16.0
+    assert rates[8] > rates[9] > rates[8 + LIVE_HOURS - 1] >= rates[8 + LIVE_HOURS] == 10.0 * MIN_MULTIPLIER
+
+def test_no_forecast_prices_at_the_target(lot):
+    rates = build_rates(10.0, None, 10, live_occupied=6, now=MONDAY)
+    assert (rates == 10.0).all()
+
+def test_engine_reuses_tables_until_the_price_changes(lot):
+    engine = PricingEngine()
+    table = engine.price_table(lot)
+    assert engine.price_table(lot) is table
+    lot.price = 20.0
+    db.session.commit()
+    assert engine.price_table(lot).base_price == 20.0
+
+def test_disabled_engine_is_flat(lot):
+    assert PricingEngine(enabled=False).price_table(lot).cost(MONDAY, 2) == 20.0
+
+def test_charged_hours_round_up_to_at_least_one():
+    assert charged_hours_for(MONDAY, MONDAY) == 1
+    assert charged_hours_for(MONDAY, MONDAY + timedelta(minutes=61)) == 2
+    assert charged_hours_for(MONDAY, MONDAY + timedelta(hours=3)) == 3
+
+def test_snapshot_round_trips_the_rates():
+    rates = np.round(np.linspace(8, 16, HOURS_PER_WEEK), 2)
+    table = PriceTable(1, 10.0, rates)
+    data = table.snapshot()
+    assert len(data) == HOURS_PER_WEEK * 4
+    restored = PriceTable.from_snapshot(1, 10.0, data)
+    assert np.array_equal(restored.rates, rates)
+    assert restored.cost(MONDAY, 200) == table.cost(MONDAY, 200)
+
+def test_sessions_keep_the_rates_they_parked_at(lot):
+    engine = PricingEngine()
+    parked_at = engine.price_table(lot).snapshot()
+    lot.price = 50.0
+    db.session.commit()
+    assert engine.session_table(lot, parked_at).cost(MONDAY, 2) == PriceTable.from_snapshot(
+        lot.id, 10.0, parked_at).cost(MONDAY, 2)
+    assert engine.session_table(lot, parked_at).cost(MONDAY, 2) < engine.session_table(lot).cost(MONDAY, 2)
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from app.models import db, AdvanceBooking, ParkingLot, ParkingSpot, Reservation
+from app import provisioning
+
+def test_deleting_spots_archives_their_history(user, lot):
+    spot = lot.spots[2]
+    parked = datetime(2024, 5, 10, 9)
+    db.session.add(Reservation(spot_id=spot.id, user_id=user.id, vehicle_license_plate='KA01', vehicle_color='red',
+                               parking_timestamp=parked, leaving_timestamp=parked + timedelta(hours=2),
+                               parking_cost=20.0, hours_charged=2, is_active=False))
+    db.session.add(AdvanceBooking(user_id=user.id, spot_id=spot.id, start_time=parked, end_time=parked + timedelta(hours=1),
+                                  vehicle_license_plate='KA01', vehicle_color='red', status='cancelled'))
+    db.session.commit()
+
+    assert provisioning.delete_spots([spot]) == 1
+    db.session.commit()
+    assert ParkingSpot.query.count() == 2
+    assert Reservation.query.count() == 0 and AdvanceBooking.query.count() == 0
+    assert lot.get_total_revenue() == 20.0
+
+def record(name, spots):
+    return {'name': name, 'address': 'Main St', 'pin_code': '000000', 'price': '10', 'spots': str(spots)}
+
+def test_import_commits_by_spot_count(app):
+    records = [record('a', 4), record('b', 4), record('c', 3), record('bad', 0), record('d', 25), record('e', 1)]
+    done = []
+    lots, spots, errors = provisioning.import_lots(records, chunk_size=200, spot_chunk_size=10,
+                                                   progress=lambda n, total: done.append(n))
+    assert (lots, spots) == (5, 37) and errors == [(4, 'price must be >= 0 and max_spots >= 1')]
+    # 4 + 4 fit in 10 spots, 3 more would not; the 25-spot lot is a chunk of its own
+    assert done == [2, 3, 4, 5]
+    assert ParkingLot.query.count() == 5 and ParkingSpot.query.count() == 37
+
+def test_import_caps_lots_per_chunk(app):
+    done = []
+    provisioning.import_lots([record(str(i), 1) for i in range(5)], chunk_size=2, spot_chunk_size=100,
+                             progress=lambda n, total: done.append(n))
+    assert done == [2, 4, 5]
@@ -0,0 +1,39 @@
+import pytest
+from app.sensor_frames import (decode_frames, encode_frames, readings_from_frames, format_mac, FrameError,
+                               HEADER, FRAME)
+
+MAC_A = bytes.fromhex('aabbccddee01')
+MAC_B = bytes.fromhex('aabbccddee02')
+
+def test_frames_round_trip():
+    body = encode_frames([(7, MAC_A, 'O', 1000), (8, MAC_B, 'A', 2000)])
+    assert len(body) == HEADER.size + 2 * FRAME.size
+    frames = decode_frames(body)
+    assert frames['spot_id'].tolist() == [7, 8]
+    assert frames['timestamp_ms'].tolist() == [1000, 2000]
+    assert bytes(frames['device'][1]) == MAC_B
+
+def test_empty_batch_is_valid():
+    assert len(decode_frames(encode_frames([]))) == 0
+    assert readings_from_frames(decode_frames(encode_frames([])))[0] == []
+
+@pytest.mark.parametrize('body', [
+    b'EL',                                              # shorter than the header
+    b'XX' + encode_frames([])[2:],                      # bad magic
+    HEADER.pack(b'EL', 2, FRAME.size),                  # unknown version
+    HEADER.pack(b'EL', 1, FRAME.size + 1),              # wrong frame size
+    encode_frames([(7, MAC_A, 'O', 0)])[:-1],           # truncated frame
+])
+def test_malformed_bodies_are_rejected(body):
+    with pytest.raises(FrameError):
+        decode_frames(body)
+
+def test_last_frame_per_device_wins():
+    frames = decode_frames(encode_frames([
+        (7, MAC_A, 'O', 1), (8, MAC_B, 'O', 2), (7, MAC_A, 'A', 3), (9, MAC_B, 'X', 4)]))
+    readings, invalid = readings_from_frames(frames)
+    assert invalid == 1
+    assert readings == [('AA:BB:CC:DD:EE:02', 8, 'O', 2), ('AA:BB:CC:DD:EE:01', 7, 'A', 3)]
+
+def test_format_mac_matches_the_json_form():
+    assert format_mac(0xAABBCCDDEE01) == 'AA:BB:CC:DD:EE:01'
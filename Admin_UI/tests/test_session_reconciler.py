@@ -0,0 +1,110 @@
+from datetime import datetime, timedelta
+from app.models import db, Reservation, SensorDevice, SpotVacancy, AutoClosedSession
+from app.session_reconciler import SessionReconciler, VACANT, OVERDUE
+from app.pricing import PricingEngine, flat_price_table
+
+NOW = datetime(2024, 5, 10, 12)
+
+class FlatRate:
+    """Stands in for a session's price table: the lot's base price per hour"""
+
+    def __init__(self, lot, snapshot=None):
+        self.lot = lot
+
+    def cost(self, parked, hours):
+        return self.lot.price * hours
+
+def park(user, spot, parked_at, price_rates=None):
+    spot.status = 'O'
+    reservation = Reservation(spot_id=spot.id, user_id=user.id, vehicle_license_plate='KA01',
+                              vehicle_color='red', parking_timestamp=parked_at, price_rates=price_rates)
+    db.session.add(reservation)
+    db.session.commit()
+    return reservation
+
+def sensor(spot, status, last_seen, vacant_since=None):
+    db.session.add(SensorDevice(device_id=f'dev-{spot.id}', spot_id=spot.id, last_seen=last_seen,
+                                last_status=status, healthy_since=last_seen - timedelta(days=1)))
+    if vacant_since is not None:
+        db.session.add(SpotVacancy(spot_id=spot.id, vacant_since=vacant_since))
+    db.session.commit()
+
+def test_vacant_session_is_billed_until_the_spot_emptied(user, lot):
+    spot = lot.spots[0]
+    reservation = park(user, spot, NOW - timedelta(hours=3))
+    sensor(spot, 'A', NOW - timedelta(minutes=1), vacant_since=NOW - timedelta(hours=1, minutes=30))
+    reconciler = SessionReconciler(FlatRate)
+
+    assert reconciler.run(NOW) == {VACANT: 1, OVERDUE: 0}
+    db.session.refresh(reservation)
+    db.session.refresh(spot)
+    assert not reservation.is_active
+    assert reservation.leaving_timestamp == NOW - timedelta(hours=1, minutes=30)
+    assert reservation.hours_charged == 2 and reservation.parking_cost == 20.0
+    assert spot.status == 'A'
+    assert AutoClosedSession.query.one().reason == VACANT
+
+def test_reading_from_before_the_session_is_ignored(user, lot):
+    spot = lot.spots[0]
+    park(user, spot, NOW - timedelta(hours=1))
+    sensor(spot, 'A', NOW - timedelta(hours=2), vacant_since=NOW - timedelta(hours=5))
+    assert SessionReconciler(FlatRate).vacant_sessions(NOW) == []
+
+def test_overdue_session_is_billed_until_now(user, lot):
+    reservation = park(user, lot.spots[0], NOW - timedelta(hours=30))
+    reconciler = SessionReconciler(FlatRate)
+
+    assert reconciler.run(NOW) == {VACANT: 0, OVERDUE: 1}
+    db.session.refresh(reservation)
+    assert reservation.leaving_timestamp == NOW and reservation.hours_charged == 30
+
+def test_a_user_release_during_the_run_wins(user, lot):
+    spot = lot.spots[0]
+    reservation = park(user, spot, NOW - timedelta(hours=30))
+    reconciler = SessionReconciler(FlatRate)
+    sessions = reconciler.overdue_sessions(NOW)
+
+    # The user releases between the reconciler's query and its UPDATE
+    released_at = NOW - timedelta(minutes=5)
+    reservation.is_active = False
+    reservation.leaving_timestamp = released_at
+    reservation.parking_cost = 1.0
+    spot.status = 'A'
+    db.session.commit()
+
+    assert reconciler.close(sessions, OVERDUE, NOW) == []
+    db.session.refresh(reservation)
+    assert reservation.leaving_timestamp == released_at and reservation.parking_cost == 1.0
+    assert AutoClosedSession.query.count() == 0
+
+def test_spot_stays_occupied_while_a_car_is_seen(user, lot):
+    spot = lot.spots[0]
+    park(user, spot, NOW - timedelta(hours=30))
+    sensor(spot, 'O', NOW - timedelta(minutes=1))
+
+    assert SessionReconciler(FlatRate).run(NOW)[OVERDUE] == 1
+    db.session.refresh(spot)
+    assert spot.status == 'O'
+
+def test_sessions_are_closed_in_batches(user, lot):
+    for spot in lot.spots:
+        park(user, spot, NOW - timedelta(hours=30))
+    closed = []
+    reconciler = SessionReconciler(FlatRate, batch_size=2, on_closed=closed.append)
+
+    assert reconciler.run(NOW)[OVERDUE] == 3
+    assert [len(rows) for rows in closed] == [2, 1]
+    assert Reservation.query.filter_by(is_active=True).count() == 0
+
+def test_sessions_are_billed_from_the_rates_they_parked_at(user, lot):
+    rates = flat_price_table(lot).snapshot()
+    parked_cheap = park(user, lot.spots[0], NOW - timedelta(hours=30), price_rates=rates)
+    parked_before_snapshots = park(user, lot.spots[1], NOW - timedelta(hours=30))
+    lot.price = 20.0
+    db.session.commit()
+
+    SessionReconciler(PricingEngine(enabled=False).session_table).run(NOW)
+    db.session.refresh(parked_cheap)
+    db.session.refresh(parked_before_snapshots)
+    assert parked_cheap.parking_cost == 300.0
+    assert parked_before_snapshots.parking_cost == 600.0
@@ -0,0 +1,75 @@
+import uuid
+import numpy as np
+import pytest
+from app.spot_table import SpotTable, STATUS_CODES, H_SEQ, segment_name
+
+@pytest.fixture
+def table(tmp_path):
+    table = SpotTable(segment_name(uuid.uuid4().hex), str(tmp_path / 'spots.lock'), max_spots=64, max_lots=8)
+    table.open()
+    yield table
+    table.unlink()
+
+def rows(*spots):
+    """(spot ids, lot ids, codes) arrays from (spot_id, lot_id, status) tuples"""
+    spot_ids, lot_of, statuses = zip(*spots)
+    return (np.array(spot_ids, dtype=np.int64), np.array(lot_of, dtype=np.int64),
+            np.array([STATUS_CODES[s] for s in statuses], dtype=np.uint8))
+
+def test_nothing_is_answered_before_the_first_build(table):
+    assert not table.built
+    assert table.lot_stats(1) is None and table.spot_status(1) is None and table.all_lot_stats() == {}
+
+def test_counters_follow_the_spots(table):
+    table.write_all(*rows((1, 1, 'A'), (2, 1, 'O'), (3, 1, 'H'), (4, 1, 'U'), (5, 2, 'A')))
+    assert table.lot_stats(1) == {'total': 4, 'occupied': 2, 'available': 1, 'unknown': 1, 'occupancy_rate': 50.0}
+    assert table.spot_status(3) == 'H'
+    assert set(table.all_lot_stats()) == {1, 2}
+    assert table.lot_stats(3) is None
+
+def test_writing_a_lot_replaces_only_its_rows(table):
+    table.write_all(*rows((1, 1, 'A'), (2, 1, 'A'), (5, 2, 'O')))
+    table.lot_spots(1)
+    # Spot 2 was deleted and spot 9 added
+    table.write_lots([1], *rows((1, 1, 'O'), (9, 1, 'A')))
+    spot_ids, codes = table.lot_spots(1)
+    assert spot_ids.tolist() == [1, 9] and codes.tolist() == [STATUS_CODES['O'], STATUS_CODES['A']]
+    assert table.spot_status(2) is None
+    assert table.lot_stats(2)['occupied'] == 1
+
+def test_emptied_lot_is_left_to_the_database(table):
+    table.write_all(*rows((1, 1, 'A'), (5, 2, 'O')))
+    table.write_lots([1], np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.uint8))
+    assert table.lot_stats(1) is None
+
+def test_spots_beyond_capacity_leave_their_lot_to_the_database(table):
+    table.write_all(*rows((1, 1, 'A'), (64, 1, 'A'), (5, 2, 'A')))
+    assert table.lot_stats(1) is None and table.lot_stats(2)['total'] == 1
+
+def test_reader_retries_when_a_write_overlaps_its_copy(table):
+    table.write_all(*rows((1, 1, 'A')))
+    copies = []
+
+    def copy():
+        copies.append(len(copies))
+        if len(copies) == 1:
+            table.header[H_SEQ] += 2   # a whole write happened meanwhile
+            return 'torn'
+        return 'clean'
+    assert table._read(copy) == 'clean' and len(copies) == 2
+
+def test_reader_falls_back_to_the_lock_during_a_long_write(table):
+    table.write_all(*rows((1, 1, 'A')))
+    table.header[H_SEQ] += 1   # a writer that never finishes its write
+    try:
+        assert table.spot_status(1) == 'A'
+    finally:
+        table.header[H_SEQ] += 1
+
+def test_every_process_sees_the_catalog_generation(table, tmp_path):
+    other = SpotTable(table.name, str(tmp_path / 'spots.lock'), max_spots=64, max_lots=8)
+    other.open()
+    before = other.catalog_generation()
+    table.bump_catalog_generation()
+    assert other.catalog_generation() == before + 1
+    other.close()
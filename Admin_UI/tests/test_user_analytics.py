@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from app.models import db, Reservation
+from app.user_analytics import UserAnalytics, AnalyticsMemo, history_groups, month_starts
+
+def parked(user, spot, start, hours, cost):
+    db.session.add(Reservation(spot_id=spot.id, user_id=user.id, vehicle_license_plate='KA01',
+                               vehicle_color='red', parking_timestamp=start,
+                               leaving_timestamp=start + timedelta(hours=hours),
+                               parking_cost=cost, hours_charged=hours, is_active=False))
+    db.session.commit()
+
+def test_month_starts_cross_the_year():
+    starts = month_starts(datetime(2024, 2, 17), count=4)
+    assert starts == [datetime(2023, 11, 1), datetime(2023, 12, 1), datetime(2024, 1, 1), datetime(2024, 2, 1)]
+
+def test_sessions_are_bucketed_by_calendar_day(user, lot):
+    spot = lot.spots[0]
+    parked(user, spot, datetime(2024, 1, 31, 23, 30), 1, 10.0)
+    parked(user, spot, datetime(2024, 2, 1, 0, 15), 2, 20.0)
+    parked(user, spot, datetime(2024, 2, 1, 9), 1, 10.0)
+    # Still parked: left out
+    db.session.add(Reservation(spot_id=spot.id, user_id=user.id, vehicle_license_plate='KA01',
+                               vehicle_color='red', parking_timestamp=datetime(2024, 2, 2)))
+    db.session.commit()
+
+    groups = history_groups(user.id)
+    assert [(day, lot_name, n) for day, lot_name, n, *_ in groups] == [
+        ('2024-01-31', 'Central', 1), ('2024-02-01', 'Central', 2)]
+
+    analytics = UserAnalytics(groups, today=datetime(2024, 2, 10))
+    assert analytics.sessions == 3 and analytics.spending == 40.0 and analytics.hours == 4.0
+    assert analytics.hours_charged == 4
+    assert analytics.favorite_location == 'Central'
+    assert analytics.spending_chart['dates'] == ['2024-01-31', '2024-02-01']
+    assert analytics.spending_chart['spending_by_location'] == {'Central': [10.0, 30.0]}
+    monthly = {row['month']: row['spending'] for row in analytics.monthly_data}
+    assert len(analytics.monthly_data) == 12
+    assert monthly['Jan 2024'] == 10.0 and monthly['Feb 2024'] == 30.0 and monthly['Dec 2023'] == 0.0
+
+def test_empty_history():
+    analytics = UserAnalytics([], today=datetime(2024, 2, 10))
+    assert analytics.sessions == 0 and analytics.favorite_location == 'No parking history'
+    assert all(row['spending'] == 0.0 for row in analytics.monthly_data)
+
+def test_memo_recomputes_after_a_release(user, lot):
+    memo = AnalyticsMemo()
+    parked(user, lot.spots[0], datetime(2024, 2, 1, 9), 1, 10.0)
+    first = memo.get(user.id)
+    assert memo.get(user.id) is first
+
+    parked(user, lot.spots[0], datetime(2024, 2, 2, 9), 1, 10.0)
+    assert memo.get(user.id).sessions == 2
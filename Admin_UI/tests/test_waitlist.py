@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+import pytest
+from app.models import db, User, ParkingLot, ParkingSpot, WaitlistEntry
+from app.waitlist import Waitlist, WaitlistError, WAITING, OFFERED, BOOKED, EXPIRED, LEFT
+
+@pytest.fixture
+def drivers(app):
+    drivers = [User(username=f'driver{i}', password='x', email=f'driver{i}@example.com', phone='1',
+                    full_name='Driver', address='addr', pin_code='000000') for i in range(3)]
+    db.session.add_all(drivers)
+    db.session.commit()
+    return drivers
+
+@pytest.fixture
+def full_lot(lot):
+    for spot in lot.spots:
+        spot.status = 'O'
+    db.session.commit()
+    return lot
+
+def free(spot):
+    spot.status = 'A'
+    db.session.commit()
+
+def status(entry):
+    db.session.expire_all()
+    return db.session.get(WaitlistEntry, entry.id).status
+
+def test_freed_spot_is_held_for_the_first_waiter(full_lot, drivers):
+    notified = []
+    waitlist = Waitlist(notify=lambda kind, entry: notified.append((kind, entry.user_id)))
+    first, second = (waitlist.join(full_lot.id, driver.id) for driver in drivers[:2])
+    assert waitlist.position(second) == 2
+
+    spot = full_lot.spots[1]
+    free(spot)
+    assert waitlist.offer([full_lot.id]) == [full_lot.id]
+    assert status(first) == OFFERED and status(second) == WAITING
+    assert db.session.get(ParkingSpot, spot.id).status == 'H'
+    assert notified == [('waitlist_offer', drivers[0].id)]
+    # Nothing else is free, so the second waiter keeps waiting
+    assert waitlist.offer([full_lot.id]) == []
+
+def test_one_active_entry_per_user(full_lot, drivers):
+    waitlist = Waitlist()
+    entry = waitlist.join(full_lot.id, drivers[0].id)
+    assert waitlist.join(full_lot.id, drivers[0].id).id == entry.id
+
+    other = ParkingLot(prime_location_name='North', address='x', pin_code='000000', price=5.0,
+                       maximum_number_of_spots=0)
+    db.session.add(other)
+    db.session.commit()
+    with pytest.raises(WaitlistError):
+        waitlist.join(other.id, drivers[0].id)
+
+def test_claiming_an_offer_books_it(full_lot, drivers):
+    waitlist = Waitlist()
+    entry = waitlist.join(full_lot.id, drivers[0].id)
+    spot = full_lot.spots[0]
+    free(spot)
+    waitlist.offer([full_lot.id])
+
+    assert not waitlist.claim_offer(drivers[1].id, spot.id)
+    assert waitlist.claim_offer(drivers[0].id, spot.id)
+    db.session.commit()
+    assert status(entry) == BOOKED
+
+def test_lapsed_hold_passes_the_spot_on(full_lot, drivers):
+    now = datetime.utcnow()
+    waitlist = Waitlist(hold=timedelta(minutes=5))
+    first, second = (waitlist.join(full_lot.id, driver.id) for driver in drivers[:2])
+    spot = full_lot.spots[0]
+    free(spot)
+    waitlist.offer([full_lot.id], now)
+
+    assert waitlist.expire_holds(now + timedelta(minutes=4)) == []
+    later = now + timedelta(minutes=6)
+    assert waitlist.expire_holds(later) == [full_lot.id]
+    assert status(first) == EXPIRED and status(second) == OFFERED
+    assert not waitlist.claim_offer(drivers[0].id, spot.id, later)
+    assert db.session.get(ParkingSpot, spot.id).status == 'H'
+
+def test_leaving_with_a_hold_offers_it_to_the_next_waiter(full_lot, drivers):
+    waitlist = Waitlist()
+    first, second = (waitlist.join(full_lot.id, driver.id) for driver in drivers[:2])
+    free(full_lot.spots[0])
+    waitlist.offer([full_lot.id])
+
+    assert waitlist.leave(first)
+    assert status(first) == LEFT and status(second) == OFFERED
+
+def test_queue_syncs_entries_from_other_workers(full_lot, drivers):
+    ours, theirs = Waitlist(), Waitlist()
+    ours.load()
+    theirs.join(full_lot.id, drivers[0].id)
+    mine = ours.join(full_lot.id, drivers[1].id)
+
+    # The other worker's older entry is slotted in ahead of ours
+    ours.sync(force=True)
+    assert [user_id for _, user_id in ours.queues[full_lot.id]] == [drivers[0].id, drivers[1].id]
+    assert ours.leave(mine)
+    assert [user_id for _, user_id in ours.queues[full_lot.id]] == [drivers[0].id]
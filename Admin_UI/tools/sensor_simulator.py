@@ -0,0 +1,140 @@
+# Sensor fleet simulator
+#
+# Pretends to be a fleet of parking sensors (or a gateway in front of them)
+# and reports spot status to a running Admin_UI server, either as batches of
+# binary frames (POST /api/sensor/frames) or one JSON report per reading the
+# way IR_Sensor.ino does (POST /api/sensor/update).
+#
+# Only the standard library is used, so this file doubles as the reference
+# encoder for the frame format when porting it to firmware:
+#
+#   header  '<2sBB'   magic b'EL', version 1, frame size 16
+#   frame   '<I6sBBI' spot_id, MAC bytes, status ord('A'|'O'), flags 0,
+#                     timestamp_ms (millis() on the device, wraps at 2**32)
+#
+# Run from the Admin_UI folder, with the server running:
+#   python tools/sensor_simulator.py --spots 1-200 --rounds 10 [--json]
+import argparse
+import json
+import random
+import struct
+import time
+import urllib.error
+import urllib.request
+
+HEADER = struct.Struct('<2sBB')
+FRAME = struct.Struct('<I6sBBI')
+MAGIC = b'EL'
+VERSION = 1
+
+# Espressif's OUI, like the ESP32 boards in the field
+OUI = bytes.fromhex('246F28')
+
+def device_mac(index):
+    """Stable MAC address for the index-th simulated device"""
+    return OUI + index.to_bytes(3, 'big')
+
+def mac_string(mac):
+    return ':'.join('%02X' % b for b in mac)
+
+def encode(readings):
+    """Frame batch body for (spot_id, mac, status, timestamp_ms) readings"""
+    body = bytearray(HEADER.pack(MAGIC, VERSION, FRAME.size))
+    for spot_id, mac, status, timestamp_ms in readings:
+        body += FRAME.pack(spot_id, mac, ord(status), 0, timestamp_ms & 0xFFFFFFFF)
+    return bytes(body)
+
+def parse_spots(text):
+    """'1-50,60,70-72' -> [1, ..., 50, 60, 70, 71, 72]"""
+    spots = []
+    for part in text.split(','):
+        low, _, high = part.partition('-')
+        spots.extend(range(int(low), int(high or low) + 1))
+    return spots
+
+def post(url, body, content_type, key=None):
+    request = urllib.request.Request(url, data=body, method='POST', headers={'Content-Type': content_type})
+    if key:
+        request.add_header('X-Sensor-Key', key)
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b'{}')
+
+class Fleet:
+    """One simulated device per spot, each flipping between 'A' and 'O'"""
+
+    def __init__(self, spot_ids, flip_chance=0.2, seed=None):
+        self.rng = random.Random(seed)
+        self.devices = [(spot_id, device_mac(i)) for i, spot_id in enumerate(spot_ids)]
+        self.status = {spot_id: 'A' for spot_id in spot_ids}
+        self.flip_chance = flip_chance
+        self.started = time.monotonic()
+
+    def readings(self):
+        """Every device reports once per round (a change or a force-report)"""
+        uptime_ms = int((time.monotonic() - self.started) * 1000)
+        for spot_id, mac in self.devices:
+            if self.rng.random() < self.flip_chance:
+                self.status[spot_id] = 'O' if self.status[spot_id] == 'A' else 'A'
+            yield spot_id, mac, self.status[spot_id], uptime_ms
+
+def send_frames(base_url, readings, batch, key):
+    totals = {'requests': 0, 'accepted': 0, 'rejected': 0, 'errors': 0}
+    for start in range(0, len(readings), batch):
+        status, reply = post(base_url + '/api/sensor/frames', encode(readings[start:start + batch]),
+                             'application/octet-stream', key)
+        totals['requests'] += 1
+        if status != 200:
+            totals['errors'] += 1
+            print(f"  frames: HTTP {status} {reply.get('error', '')}")
+            continue
+        totals['accepted'] += reply['accepted']
+        totals['rejected'] += reply['rejected']
+    return totals
+
+def send_json(base_url, readings, key):
+    totals = {'requests': 0, 'accepted': 0, 'rejected': 0, 'errors': 0}
+    for spot_id, mac, status, _ in readings:
+        body = json.dumps({'device_id': mac_string(mac), 'spot_id': spot_id, 'status': status}).encode()
+        code, reply = post(base_url + '/api/sensor/update', body, 'application/json', key)
+        totals['requests'] += 1
+        if code == 200:
+            totals['accepted'] += 1
+        elif code == 404:
+            totals['rejected'] += 1
+        else:
+            totals['errors'] += 1
+    return totals
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Simulate a fleet of parking sensors')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Admin_UI server')
+    parser.add_argument('--spots', default='1-100', help="spot ids to cover, e.g. '1-50,60'")
+    parser.add_argument('--rounds', type=int, default=5, help='reports per device')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between rounds')
+    parser.add_argument('--batch', type=int, default=500, help='frames per request')
+    parser.add_argument('--json', action='store_true', help='one JSON report per reading instead of frames')
+    parser.add_argument('--key', help='X-Sensor-Key, if the server requires one')
+    parser.add_argument('--seed', type=int, help='random seed')
+    args = parser.parse_args(argv)
+
+    fleet = Fleet(parse_spots(args.spots), seed=args.seed)
+    base_url = args.url.rstrip('/')
+    for round_no in range(1, args.rounds + 1):
+        readings = list(fleet.readings())
+        started = time.perf_counter()
+        if args.json:
+            totals = send_json(base_url, readings, args.key)
+        else:
+            totals = send_frames(base_url, readings, args.batch, args.key)
+        elapsed = time.perf_counter() - started
+        print(f"round {round_no}: {len(readings)} readings in {totals['requests']} request(s), "
+              f"{totals['accepted']} accepted, {totals['rejected']} rejected, {totals['errors']} errors, "
+              f"{len(readings) / elapsed:,.0f} readings/s")
+        if round_no < args.rounds:
+            time.sleep(args.interval)
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,37 @@
 
 
+import json
 import streamlit as st
-from ultralytics import YOLO
-import cv2
 import numpy as np
+import tiling
+from detection_cache import DetectionCache, settings_tag
+from profiling import Profiler, timed
+
+# ultralytics (torch) and OpenCV take seconds to import, so they are only
+# imported where they are used; the page renders before either is loaded.
 
-# Load Model
-model = YOLO("best.pt")  # Ensure best.pt exists
 st.set_page_config(
     page_title="EcoLot - Smart Parking System",
     page_icon="assets/logo.png",  # Your logo
     layout="wide"
 )
 
+@st.cache_resource(show_spinner="Loading detection model...")
+def load_model():
+    """Import the vision stack and load the YOLO weights once per server process"""
+    from ultralytics import YOLO
+    return YOLO("best.pt")  # Ensure best.pt exists
+
+@st.cache_resource
+def detection_cache():
+    """Results of earlier uploads, shared by every session and kept on disk"""
+    return DetectionCache(".detection_cache")
+
+@st.cache_resource
+def pipeline_profiler():
+    """Stage timings of every upload since the server started"""
+    return Profiler()
+
 # Hide Streamlit default menu & footer
 hide_st_ui = """
 <style>
@@ -31,15 +50,46 @@ st.markdown("""
 
 uploaded_file = st.file_uploader("Upload Parking Lot Image", type=["jpg", "png", "jpeg"])
 
+with st.expander("Large images"):
+    st.caption("Images bigger than one tile are scanned tile by tile, so small cars in drone "
+               "or panorama shots are not shrunk away.")
+    tile_size = st.select_slider("Tile size (px)", options=[0, 320, 480, 640, 960, 1280],
+                                 value=tiling.DEFAULT_TILE, help="0 runs the model on the whole image")
+    tile_batch = st.slider("Tiles per batch", 1, 32, tiling.DEFAULT_BATCH)
+    reuse_near = st.checkbox("Reuse results for near-identical images",
+                             help="Frames from a fixed camera that differ only by noise skip detection")
+
 if uploaded_file is not None:
+    import cv2
 
-    # Store bytes once ✅
-    file_bytes = np.asarray(bytearray(uploaded_file.read()), dtype=np.uint8)
-    input_img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)  # Keep original copy
-    img = input_img.copy()  # We'll draw boxes on this
+    profiler = pipeline_profiler()
 
-    # Run YOLO
-    results = model(img)
+    # Store bytes once ✅
+    with timed(profiler, "decode"):
+        file_bytes = np.asarray(bytearray(uploaded_file.read()), dtype=np.uint8)
+        input_img = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)  # Keep original copy
+        img = input_img.copy()  # We'll draw boxes on this
+
+    # Run YOLO, tile by tile on large images, unless these pixels were seen before
+    # The cache is shared by every session, so the tolerance goes with each lookup
+    cache = detection_cache()
+    settings = settings_tag("best.pt", tile=tile_size, batch=tile_batch)
+    with timed(profiler, "cache lookup"):
+        detections = cache.get(file_bytes, settings, input_img, near=6 if reuse_near else 0)
+    if detections is None:
+        with timed(profiler, "load model"):
+            model = load_model()
+        with timed(profiler, "detect"):
+            if tile_size:
+                progress_bar = st.progress(0.0, text="Detecting...")
+                detections = tiling.detect(
+                    model, input_img, tile_size, batch=tile_batch, profiler=profiler, verbose=False,
+                    progress=lambda done, total: progress_bar.progress(done / total, text=f"Detecting... tile {done} of {total}"))
+                progress_bar.empty()
+            else:
+                detections = tiling.detect_whole(model, input_img, profiler)
+        with timed(profiler, "cache store"):
+            cache.put(file_bytes, detections, settings, input_img)
 
     vacant_count = 0
     car_count = 0
@@ -48,11 +98,10 @@ if uploaded_file is not None:
 
     class_names = ['Car', 'Vacant']
 
-    for result in results:
-        for box in result.boxes:
-            cls = int(box.cls[0])
-            label = class_names[cls]
-            x1, y1, x2, y2 = map(int, box.xyxy[0])
+    with timed(profiler, "draw"):
+        for box, cls in zip(detections.boxes, detections.classes):
+            label = class_names[int(cls)]
+            x1, y1, x2, y2 = map(int, box)
 
             spot_label = f"Spot-{spot_id}"
             spot_id += 1
@@ -70,18 +119,21 @@ if uploaded_file is not None:
             cv2.putText(img, f"{spot_label}", (x1, y1 - 8),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
 
-    img_output = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-    input_img_rgb = cv2.cvtColor(input_img, cv2.COLOR_BGR2RGB)
+    with timed(profiler, "colour conversion"):
+        img_output = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        input_img_rgb = cv2.cvtColor(input_img, cv2.COLOR_BGR2RGB)
 
     col1, col2 = st.columns(2)
 
-    with col1:
-        st.subheader("📥 Input Image")
-        st.image(input_img_rgb, use_column_width=True)
+    # st.image encodes the array and ships it to the browser
+    with timed(profiler, "image transfer"):
+        with col1:
+            st.subheader("📥 Input Image")
+            st.image(input_img_rgb, use_column_width=True)
 
-    with col2:
-        st.subheader("📤 Processed Output")
-        st.image(img_output, use_column_width=True)
+        with col2:
+            st.subheader("📤 Processed Output")
+            st.image(img_output, use_column_width=True)
 
     st.markdown("""
         <style>
@@ -95,10 +147,29 @@ if uploaded_file is not None:
     colA.markdown(f"<div class='card green-card'>🟢 Vacant Spots: {vacant_count}</div>", unsafe_allow_html=True)
     colB.markdown(f"<div class='card red-card'>🔴 Occupied Spots: {car_count}</div>", unsafe_allow_html=True)
 
+    stats = cache.stats()
+    st.caption(f"Detection cache: {stats['hits']} hits, {stats['near_hits']} near-identical, "
+               f"{stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), {stats['stored']} results stored")
+
     st.markdown("<h3>🅿️ Spot-by-Spot Status</h3>", unsafe_allow_html=True)
     for status in spot_results:
         st.markdown(status, unsafe_allow_html=True)
 
+    with st.expander("Pipeline timings"):
+        st.caption("Milliseconds per stage over every upload since the server started; "
+                   "percentiles cover each stage's most recent runs.")
+        st.dataframe(profiler.summary(), use_container_width=True, hide_index=True)
+        timings_left, timings_right = st.columns(2)
+        timings_left.download_button("Download Chrome trace", json.dumps(profiler.trace()),
+                                     file_name="parking_trace.json", mime="application/json",
+                                     help="Open in chrome://tracing or ui.perfetto.dev")
+        if timings_right.button("Reset timings"):
+            profiler.reset()
+
 else:
     st.info("⬆️ Please upload an image to begin.")
 
+    # The page is already on screen: warm the model now so the first
+    # upload does not wait for it (cached, so this only happens once)
+    load_model()
+
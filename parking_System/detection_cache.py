@@ -0,0 +1,198 @@
+# Detection results cached by image content
+#
+# Streamlit reruns the whole script on every widget change, and fixed
+# cameras send the same view over and over, so the same pixels are often
+# detected again and again. Results are cached under a BLAKE2b digest of
+# the encoded image bytes plus everything else that changes the answer
+# (the weights file and the tiling settings), so a hit skips inference.
+#
+# With near > 0 a miss also tries a perceptual difference hash (dHash) of
+# the decoded image: a frame whose hash is within `near` bits of a cached
+# one - the same view with different JPEG noise or lighting flicker - reuses
+# that result. Keep it small; a car arriving is a small change too. The
+# tolerance can be given per lookup, so one shared cache serves callers
+# that want different ones.
+#
+# Entries live in an in-memory LRU and, when a directory is given, as one
+# .npz file each, so they survive restarts and are shared by processes.
+# Both are bounded: max_entries in memory and max_bytes on disk, oldest
+# use evicted first.
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from tiling import Detections
+
+HASH_SIZE = 16          # dHash grid; 16 x 16 = 256 bits
+MAX_ENTRIES = 256
+MAX_BYTES = 64 << 20
+
+def content_key(data, settings=''):
+    """Digest of the encoded image and the settings it was detected with"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(settings.encode())
+    digest.update(data)
+    return digest.hexdigest()
+
+def settings_tag(model_path, **settings):
+    """Short tag for a model file (by size and mtime) and detection settings"""
+    try:
+        stat = os.stat(model_path)
+        weights = f'{os.path.abspath(model_path)}:{stat.st_size}:{stat.st_mtime_ns}'
+    except OSError:
+        weights = str(model_path)
+    text = weights + repr(sorted(settings.items()))
+    return hashlib.blake2b(text.encode(), digest_size=6).hexdigest()
+
+def dhash(img, size=HASH_SIZE):
+    """Difference hash of an image as packed bits: is each cell brighter than its right neighbour?"""
+    gray = img.mean(axis=2) if img.ndim == 3 else img.astype(np.float64)
+    height, width = gray.shape
+    # Area-average down to size x (size + 1) cells
+    rows = np.linspace(0, height, size + 1).astype(int)[:-1]
+    cols = np.linspace(0, width, size + 2).astype(int)[:-1]
+    cells = np.add.reduceat(np.add.reduceat(gray, rows, axis=0), cols, axis=1)
+    counts = np.outer(np.diff(np.append(rows, height)), np.diff(np.append(cols, width)))
+    cells = cells / np.maximum(counts, 1)
+    return np.packbits(cells[:, 1:] > cells[:, :-1]).tobytes()
+
+def hash_distance(a, b):
+    """Number of differing bits between two dHashes"""
+    return int(np.unpackbits(np.frombuffer(a, np.uint8) ^ np.frombuffer(b, np.uint8)).sum())
+
+class DetectionCache:
+    """Detections by image content, in memory and optionally on disk"""
+
+    def __init__(self, directory=None, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, near=0):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.near = near
+        self.entries = OrderedDict()    # key -> Detections
+        self.hashes = {}                # key -> (settings, dHash), for every entry in memory or on disk
+        self.hits = self.near_hits = self.misses = 0
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            for name in os.listdir(directory):
+                parts = name[:-len('.npz')].split('_') if name.endswith('.npz') else ()
+                if len(parts) == 3:
+                    self.hashes[parts[1]] = (parts[0], bytes.fromhex(parts[2]))
+
+    # Disk files are named <settings>_<key>_<dHash hex>.npz
+
+    def _path(self, key):
+        settings, phash = self.hashes[key]
+        return os.path.join(self.directory, f'{settings}_{key}_{phash.hex()}.npz')
+
+    def _load(self, key):
+        try:
+            with np.load(self._path(key)) as stored:
+                found = Detections(stored['boxes'], stored['scores'], stored['classes'])
+            os.utime(self._path(key))
+        except (OSError, KeyError, ValueError):
+            self.hashes.pop(key, None)
+            return None
+        return found
+
+    def _save(self, key, detections):
+        path = self._path(key)
+        temp = f'{path}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as handle:
+            np.savez(handle, boxes=detections.boxes, scores=detections.scores, classes=detections.classes)
+        os.replace(temp, path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npz'):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+            parts = name[:-len('.npz')].split('_')
+            if len(parts) == 3:
+                self.hashes.pop(parts[1], None)
+
+    # Lookups
+
+    def _remember(self, key, detections):
+        self.entries[key] = detections
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            evicted, _ = self.entries.popitem(last=False)
+            if not self.directory:
+                self.hashes.pop(evicted, None)
+
+    def _fetch(self, key):
+        found = self.entries.get(key)
+        if found is not None:
+            self.entries.move_to_end(key)
+        elif self.directory and key in self.hashes:
+            found = self._load(key)
+            if found is not None:
+                self._remember(key, found)
+        return found
+
+    def _nearest(self, settings, phash, near):
+        best, best_distance = None, near + 1
+        for key, (tag, other) in self.hashes.items():
+            if tag == settings and len(other) == len(phash):
+                distance = hash_distance(phash, other)
+                if distance < best_distance:
+                    best, best_distance = key, distance
+        return best
+
+    def get(self, data, settings='', img=None, near=None):
+        """Cached Detections for these image bytes (or a near-identical img), or None.
+
+        near overrides the cache's own tolerance (in dHash bits) for this lookup.
+        """
+        near = self.near if near is None else near
+        key = content_key(data, settings)
+        with self._lock:
+            found = self._fetch(key)
+            if found is not None:
+                self.hits += 1
+                return found
+            if near and img is not None:
+                near_key = self._nearest(settings, dhash(img), near)
+                found = self._fetch(near_key) if near_key else None
+                if found is not None:
+                    self.near_hits += 1
+                    return found
+            self.misses += 1
+            return None
+
+    def put(self, data, detections, settings='', img=None):
+        """Cache the Detections found for these image bytes"""
+        key = content_key(data, settings)
+        phash = dhash(img) if img is not None else b''
+        with self._lock:
+            self.hashes[key] = (settings, phash)
+            self._remember(key, detections)
+            if self.directory:
+                self._save(key, detections)
+
+    def stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'stored': len(self.hashes),
+        }
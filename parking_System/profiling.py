@@ -0,0 +1,135 @@
+# Per-stage timing for the detection pipeline
+#
+# A Profiler times named stages - decoding, the model call, turning results
+# into boxes, drawing, colour conversion, handing images to Streamlit - so
+# it is clear which one to optimize. Each stage keeps its last `window`
+# durations for rolling percentiles, plus running totals.
+#
+# Every timed stage is also kept as a Chrome trace event (bounded by
+# max_events); export_trace() writes them as JSON that chrome://tracing or
+# https://ui.perfetto.dev opens, with nested stages shown inside their
+# parents and one row per thread.
+#
+# Stages the profiler can't wrap itself, like the preprocess / inference /
+# postprocess split ultralytics reports on each result, are added with
+# record(). Code that takes an optional profiler times its stages with
+# timed(profiler, name), which does nothing when the profiler is None.
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+import numpy as np
+
+WINDOW = 200            # durations per stage kept for percentiles
+MAX_EVENTS = 100_000    # trace events kept; the oldest are dropped first
+
+class StageStats:
+    """Running totals and the recent durations (seconds) of one stage"""
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+class Profiler:
+    """Timers per pipeline stage, with rolling percentiles and a trace"""
+
+    def __init__(self, window=WINDOW, max_events=MAX_EVENTS):
+        self.window = window
+        self.stats = {}                         # stage -> StageStats, in first-seen order
+        self.events = deque(maxlen=max_events)  # (name, start ns, duration ns, thread id)
+        self._lock = threading.Lock()
+
+    def _add(self, name, seconds):
+        stats = self.stats.get(name)
+        if stats is None:
+            stats = self.stats[name] = StageStats(self.window)
+        stats.add(seconds)
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of a with block as one run of `name`"""
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter_ns() - start
+            with self._lock:
+                self._add(name, duration / 1e9)
+                self.events.append((name, start, duration, threading.get_ident()))
+
+    def record(self, name, seconds):
+        """Add a duration measured elsewhere (stats only, no trace event)"""
+        with self._lock:
+            self._add(name, seconds)
+
+    def summary(self):
+        """One dict per stage: count, total and mean, and p50 / p95 / max of the recent runs, in ms"""
+        with self._lock:
+            snapshot = [(name, s.count, s.total, np.array(s.recent)) for name, s in self.stats.items()]
+        rows = []
+        for name, count, total, recent in snapshot:
+            p50, p95 = np.percentile(recent, [50, 95]) if len(recent) else (0.0, 0.0)
+            rows.append({
+                'stage': name,
+                'count': count,
+                'total_ms': round(total * 1e3, 2),
+                'mean_ms': round(total * 1e3 / count, 3) if count else 0.0,
+                'p50_ms': round(float(p50) * 1e3, 3),
+                'p95_ms': round(float(p95) * 1e3, 3),
+                'max_ms': round(float(recent.max()) * 1e3, 3) if len(recent) else 0.0,
+            })
+        return rows
+
+    def report(self):
+        """The summary as a fixed-width text table"""
+        header = f"{'stage':<24}{'count':>7}{'total ms':>12}{'mean':>10}{'p50':>10}{'p95':>10}{'max':>10}"
+        lines = [header, '-' * len(header)]
+        for row in self.summary():
+            lines.append(f"{row['stage']:<24}{row['count']:>7}{row['total_ms']:>12.1f}{row['mean_ms']:>10.2f}"
+                         f"{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['max_ms']:>10.2f}")
+        return '\n'.join(lines)
+
+    def trace(self):
+        """The timed stages as a Chrome trace (a JSON-ready dict)"""
+        with self._lock:
+            events = list(self.events)
+        pid = os.getpid()
+        return {
+            'displayTimeUnit': 'ms',
+            'traceEvents': [
+                {'name': name, 'cat': 'pipeline', 'ph': 'X', 'ts': start / 1e3, 'dur': duration / 1e3,
+                 'pid': pid, 'tid': tid}
+                for name, start, duration, tid in events
+            ],
+        }
+
+    def export_trace(self, path):
+        """Write the Chrome trace JSON to path"""
+        with open(path, 'w') as handle:
+            json.dump(self.trace(), handle)
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+            self.events.clear()
+
+def timed(profiler, name):
+    """profiler.stage(name), or a no-op when there is no profiler"""
+    return profiler.stage(name) if profiler is not None else nullcontext()
+
+def record_model_speed(profiler, results):
+    """Add the per-image preprocess / inference / postprocess split ultralytics reports on each result"""
+    if profiler is None:
+        return
+    for result in results:
+        for part, ms in (getattr(result, 'speed', None) or {}).items():
+            if ms is not None:
+                profiler.record(f'model.{part}', ms / 1e3)
@@ -1,29 +1,50 @@
-from ultralytics import YOLO
-import cv2
-import screeninfo   # <<---- NEW
+# Run the parking spot detector on one image and show the annotated result
+#
+# Usage:  python smart_parking.py [image] [--model best.pt] [--tile 640]
+#         python smart_parking.py [image] --profile --repeat 20 --trace trace.json
+#
+# Images larger than one tile are detected tile by tile (see tiling.py), so
+# small cars on high-resolution drone shots are not downscaled away;
+# --tile 0 runs the model on the whole image instead. With --cache DIR,
+# results are kept by image content and an image seen before is not
+# detected again (see detection_cache.py). --profile times each stage of
+# the pipeline and prints rolling percentiles; --trace also writes a Chrome
+# trace of every stage (see profiling.py).
+#
+# ultralytics (torch), OpenCV and screeninfo are imported inside the
+# functions that use them, so importing this module is instant and the
+# heavy stack is only loaded when a detection actually runs.
+import argparse
+import tiling
+from detection_cache import DetectionCache, settings_tag
+from profiling import Profiler, timed
 
-# Load your trained model
-model = YOLO("best.pt")  # make sure best.pt is in same folder
+# Class names from your dataset
+class_names = ['Car', 'Vacant']
 
-# Load parking lot image
-image_path = "parking4.png"   # change this to your image name
-img = cv2.imread(image_path)
+def load_model(path="best.pt"):
+    """Load your trained model (make sure best.pt is in same folder)"""
+    from ultralytics import YOLO
+    return YOLO(path)
 
-# Run prediction
-results = model(img)
+def detect(model, img, tile=tiling.DEFAULT_TILE, overlap=tiling.DEFAULT_OVERLAP,
+           batch=tiling.DEFAULT_BATCH, progress=None, profiler=None):
+    """Detections for img, tiled when it is larger than `tile` (0 = never tile)"""
+    if not tile:
+        return tiling.detect_whole(model, img, profiler, verbose=False)
+    return tiling.detect(model, img, tile, overlap, batch, progress=progress, profiler=profiler, verbose=False)
 
-# Counting
-vacant_count = 0
-car_count = 0
+def draw_detections(img, detections):
+    """Draw a box per detection on img and return (vacant_count, car_count)"""
+    import cv2
 
-# Class names from your dataset
-class_names = ['Car', 'Vacant']
+    # Counting
+    vacant_count = 0
+    car_count = 0
 
-for result in results:
-    for box in result.boxes:
-        cls = int(box.cls[0])
-        label = class_names[cls]
-        x1, y1, x2, y2 = map(int, box.xyxy[0])
+    for box, cls in zip(detections.boxes, detections.classes):
+        label = class_names[int(cls)]
+        x1, y1, x2, y2 = map(int, box)
 
         if label == "Vacant":
             vacant_count += 1
@@ -36,20 +57,98 @@ for result in results:
         cv2.putText(img, label, (x1, y1 - 5),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
-# Display counts
-cv2.putText(img, f"Vacant Spots: {vacant_count}", (20, 40),
-            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
-cv2.putText(img, f"Occupied Spots: {car_count}", (20, 80),
-            cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+    # Display counts
+    cv2.putText(img, f"Vacant Spots: {vacant_count}", (20, 40),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 255, 0), 2)
+    cv2.putText(img, f"Occupied Spots: {car_count}", (20, 80),
+                cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 2)
+
+    return vacant_count, car_count
+
+def show(img):
+    """Show the image in a window that fits the screen"""
+    import cv2
+    import screeninfo
+
+    # ------------ AUTO-FIT SCREEN DISPLAY ----------------
+    screen = screeninfo.get_monitors()[0]
+    screen_width, screen_height = screen.width, screen.height
+
+    cv2.namedWindow("Parking Detection", cv2.WINDOW_NORMAL)
+    cv2.resizeWindow("Parking Detection", screen_width, screen_height)
+    # -----------------------------------------------------
+
+    cv2.imshow("Parking Detection", img)
+    cv2.waitKey(0)
+    cv2.destroyAllWindows()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect vacant and occupied parking spots in an image")
+    parser.add_argument("image", nargs="?", default="parking4.png", help="parking lot image")
+    parser.add_argument("--model", default="best.pt", help="trained YOLO weights")
+    parser.add_argument("--tile", type=int, default=tiling.DEFAULT_TILE,
+                        help="tile size in pixels for large images (0 = whole image)")
+    parser.add_argument("--overlap", type=float, default=tiling.DEFAULT_OVERLAP,
+                        help="fraction of a tile shared with its neighbours")
+    parser.add_argument("--batch", type=int, default=tiling.DEFAULT_BATCH, help="tiles per model call")
+    parser.add_argument("--cache", metavar="DIR", help="reuse results for images detected before")
+    parser.add_argument("--near", type=int, default=0,
+                        help="also reuse results for images whose perceptual hash differs by at most this many bits")
+    parser.add_argument("--profile", action="store_true", help="time each pipeline stage and print a summary")
+    parser.add_argument("--repeat", type=int, default=1, help="run detection and drawing this many times")
+    parser.add_argument("--trace", metavar="FILE", help="write a Chrome trace of the stages (implies --profile)")
+    parser.add_argument("--no-show", action="store_true", help="don't open a window with the result")
+    args = parser.parse_args(argv)
+    profiler = Profiler() if args.profile or args.trace else None
+
+    with timed(profiler, "import cv2"):
+        import cv2
+
+    # Load parking lot image
+    with timed(profiler, "decode"):
+        img = cv2.imread(args.image)
+    if img is None:
+        parser.error(f"could not read image {args.image}")
+
+    # Run prediction
+    cache = settings = detections = None
+    if args.cache:
+        with timed(profiler, "cache lookup"):
+            with open(args.image, "rb") as handle:
+                data = handle.read()
+            cache = DetectionCache(args.cache, near=args.near)
+            settings = settings_tag(args.model, tile=args.tile, overlap=args.overlap, batch=args.batch)
+            detections = cache.get(data, settings, img)
+        print("Detections reused from cache" if detections is not None else "Not in cache, detecting")
+
+    if detections is None:
+        with timed(profiler, "load model"):
+            model = load_model(args.model)
+
+        def progress(done, total):
+            if total > 1 and args.repeat == 1:
+                print(f"\rTiles: {done}/{total}", end="\n" if done == total else "", flush=True)
+
+        for _ in range(max(1, args.repeat)):
+            with timed(profiler, "detect"):
+                detections = detect(model, img, args.tile, args.overlap, args.batch, progress, profiler)
+        if cache is not None:
+            with timed(profiler, "cache store"):
+                cache.put(data, detections, settings, img)
 
-# ------------ AUTO-FIT SCREEN DISPLAY (Added) ----------------
-screen = screeninfo.get_monitors()[0]
-screen_width, screen_height = screen.width, screen.height
+    for _ in range(max(1, args.repeat)):
+        annotated = img.copy()
+        with timed(profiler, "draw"):
+            vacant_count, car_count = draw_detections(annotated, detections)
+    print(f"Vacant: {vacant_count}  Occupied: {car_count}")
 
-cv2.namedWindow("Parking Detection", cv2.WINDOW_NORMAL)
-cv2.resizeWindow("Parking Detection", screen_width, screen_height)
-# -------------------------------------------------------------
+    if profiler is not None:
+        print(profiler.report())
+        if args.trace:
+            profiler.export_trace(args.trace)
+            print(f"Trace written to {args.trace} (open it in chrome://tracing or ui.perfetto.dev)")
+    if not args.no_show:
+        show(annotated)
 
-cv2.imshow("Parking Detection", img)
-cv2.waitKey(0)
-cv2.destroyAllWindows()
+if __name__ == "__main__":
+    main()
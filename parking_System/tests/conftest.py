@@ -0,0 +1,5 @@
+# The vision modules import each other as top-level modules, the way app.py runs them
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,61 @@
+import os
+import numpy as np
+from tiling import Detections
+from detection_cache import DetectionCache, content_key, dhash, hash_distance
+
+def found(n):
+    boxes = np.arange(n * 4, dtype=np.float32).reshape(n, 4)
+    return Detections(boxes, np.full(n, 0.9, np.float32), np.zeros(n, np.int64))
+
+def image(seed):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (64, 96, 3)).astype(np.uint8)
+
+def test_keys_depend_on_bytes_and_settings():
+    assert content_key(b'img', 'a') == content_key(b'img', 'a')
+    assert content_key(b'img', 'a') != content_key(b'img', 'b')
+    assert content_key(b'img', 'a') != content_key(b'img2', 'a')
+
+def test_hit_after_put():
+    cache = DetectionCache()
+    assert cache.get(b'img', 'tag') is None
+    cache.put(b'img', found(2), 'tag')
+    assert len(cache.get(b'img', 'tag')) == 2
+    assert cache.get(b'img', 'other') is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+def test_memory_is_bounded_lru():
+    cache = DetectionCache(max_entries=2)
+    for data in (b'a', b'b'):
+        cache.put(data, found(1))
+    cache.get(b'a')
+    cache.put(b'c', found(1))
+    assert cache.get(b'b') is None and cache.get(b'a') is not None
+
+def test_dhash_tolerates_noise_but_not_a_new_scene():
+    img = image(0)
+    noisy = np.clip(img.astype(np.int16) + np.random.default_rng(1).integers(-3, 4, img.shape), 0, 255)
+    assert hash_distance(dhash(img), dhash(noisy.astype(np.uint8))) <= 8
+    assert hash_distance(dhash(img), dhash(image(2))) > 64
+
+def test_near_hits_only_within_tolerance():
+    img = image(0)
+    cache = DetectionCache()
+    cache.put(b'frame-1', found(3), 'tag', img=img)
+    assert cache.get(b'frame-2', 'tag', img=img) is None
+    assert len(cache.get(b'frame-2', 'tag', img=img, near=4)) == 3
+    assert cache.get(b'frame-2', 'other', img=img, near=4) is None
+    assert cache.get(b'frame-3', 'tag', img=image(2), near=4) is None
+    assert cache.stats()['near_hits'] == 1
+
+def test_disk_entries_survive_a_restart(tmp_path):
+    DetectionCache(str(tmp_path)).put(b'img', found(2), 'tag', img=image(0))
+    reopened = DetectionCache(str(tmp_path))
+    assert np.array_equal(reopened.get(b'img', 'tag').boxes, found(2).boxes)
+    assert reopened.get(b'other', 'tag', img=image(0), near=1) is not None
+
+def test_disk_is_bounded(tmp_path):
+    cache = DetectionCache(str(tmp_path), max_bytes=1)
+    cache.put(b'a', found(1))
+    cache.put(b'b', found(1))
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.npz')]) <= 1
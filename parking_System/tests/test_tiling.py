@@ -0,0 +1,76 @@
+from types import SimpleNamespace
+import numpy as np
+from tiling import Detections, detect, merge, tile_grid, tile_starts
+
+def found(boxes, scores, classes=None):
+    classes = [0] * len(scores) if classes is None else classes
+    return Detections(np.array(boxes, np.float32), np.array(scores, np.float32), np.array(classes, np.int64))
+
+class Array:
+    """Stands in for a torch tensor: .cpu().numpy()"""
+    def __init__(self, values):
+        self.values = np.array(values)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+def result(boxes, scores):
+    return SimpleNamespace(boxes=SimpleNamespace(
+        xyxy=Array(np.array(boxes, np.float32).reshape(-1, 4)), conf=Array(scores), cls=Array([0] * len(scores))))
+
+def test_tiles_cover_the_image_flush_with_the_end():
+    assert tile_starts(500, 640, 0.2) == [0]
+    starts = tile_starts(1000, 640, 0.2)
+    assert starts[0] == 0 and starts[-1] == 360
+    assert len(tile_grid((1000, 1000, 3), 640, 0.2)) == len(starts) ** 2
+
+def test_neighbours_in_one_tile_are_kept():
+    # Two cars parked tightly side by side, both found by the same tile
+    cars = found([[100, 100, 200, 300], [110, 100, 210, 300]], [0.9, 0.8])
+    assert len(merge(cars, origins=[[0, 0], [0, 0]], tile=640)) == 2
+
+def test_duplicate_across_the_overlap_keeps_the_best_box():
+    # The same car seen whole by the right tile and cut by the left tile's edge
+    cars = found([[600, 100, 640, 300], [590, 100, 700, 300]], [0.7, 0.9])
+    merged = merge(cars, origins=[[0, 0], [512, 0]], tile=640)
+    assert len(merged) == 1
+    assert merged.scores[0] == np.float32(0.9)
+    assert merged.boxes[0].tolist() == [590, 100, 700, 300]
+
+def test_cut_box_outscoring_its_twin_keeps_its_own_extent():
+    cars = found([[600, 100, 640, 300], [590, 100, 700, 300]], [0.95, 0.9])
+    merged = merge(cars, origins=[[0, 0], [512, 0]], tile=640)
+    assert merged.boxes.tolist() == [[600, 100, 640, 300]]
+
+def test_boxes_outside_the_shared_band_are_kept():
+    # Tiles [0, 640) and [512, 1152) share [512, 640); both boxes lie right of it
+    cars = found([[700, 100, 800, 300], [710, 100, 810, 300]], [0.9, 0.8])
+    assert len(merge(cars, origins=[[0, 0], [512, 0]], tile=640)) == 2
+
+def test_tiles_that_do_not_overlap_never_merge():
+    cars = found([[600, 100, 700, 300], [600, 100, 700, 300]], [0.9, 0.8])
+    assert len(merge(cars, origins=[[0, 0], [1024, 0]], tile=640)) == 2
+
+def test_merge_is_class_aware():
+    cars = found([[590, 100, 700, 300], [590, 100, 700, 300]], [0.9, 0.8], [0, 1])
+    assert len(merge(cars, origins=[[0, 0], [512, 0]], tile=640)) == 2
+
+def test_without_origins_any_pair_may_merge():
+    cars = found([[100, 100, 200, 300], [110, 100, 210, 300]], [0.9, 0.8])
+    merged = merge(cars)
+    assert len(merged) == 1 and merged.boxes[0].tolist() == [100, 100, 200, 300]
+
+def test_detect_merges_the_overlap_but_not_neighbours():
+    img = np.zeros((640, 1152, 3), np.uint8)
+
+    def model(views, **kwargs):
+        # Left tile: two neighbouring cars and one cut at its right edge;
+        # right tile: the cut car whole (at x 590-700 in the image)
+        return [result([[100, 100, 200, 300], [110, 100, 210, 300], [600, 100, 640, 300]], [0.9, 0.8, 0.6]),
+                result([[78, 100, 188, 300]], [0.9])][:len(views)]
+
+    merged = detect(model, img, tile=640, overlap=0.2)
+    assert sorted(merged.boxes[:, 0].tolist()) == [100, 110, 590]
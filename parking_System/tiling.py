@@ -0,0 +1,171 @@
+# Tiled inference for large parking lot images
+#
+# YOLO letterboxes every input down to its training size (640 px), so on a
+# 6000 px drone shot a car ends up a few pixels wide and is missed. Here the
+# image is cut into overlapping tile x tile windows instead - NumPy views
+# into the decoded image, so no pixels are copied - and the windows are run
+# through the model a batch at a time. Each tile's boxes are shifted back
+# into image coordinates and the duplicates found in the overlaps are
+# merged with a vectorized, class-aware non-maximum suppression. Only boxes
+# from two different, overlapping tiles that both reach into the band those
+# tiles share can be duplicates, so neighbouring cars inside one tile (the
+# model has already separated those) are never merged away.
+#
+# Memory stays bounded by one batch of tiles plus the boxes found so far,
+# and batching lets torch spread each forward pass over every core. Images
+# no bigger than one tile go through the model whole, exactly as before.
+#
+# Only NumPy is needed here; the model is whatever callable the caller
+# loaded (an ultralytics YOLO in practice).
+from typing import NamedTuple
+import numpy as np
+from profiling import timed, record_model_speed
+
+DEFAULT_TILE = 640
+DEFAULT_OVERLAP = 0.2
+DEFAULT_BATCH = 8
+
+# Boxes from neighbouring tiles are the same object when the smaller one is
+# mostly inside the larger: a car cut by a tile edge overlaps its whole
+# twin by far less than IoU would need, but lies almost entirely within it
+MATCH_THRESHOLD = 0.6
+
+class Detections(NamedTuple):
+    """Boxes as parallel arrays: xyxy (N, 4) in image pixels, scores (N,), classes (N,)"""
+    boxes: np.ndarray
+    scores: np.ndarray
+    classes: np.ndarray
+
+    def __len__(self):
+        return len(self.scores)
+
+    @classmethod
+    def empty(cls):
+        return cls(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+
+    @classmethod
+    def from_result(cls, result, offset=(0, 0)):
+        """Detections of one ultralytics Result, shifted by a tile's (x, y) origin"""
+        boxes = result.boxes
+        xyxy = boxes.xyxy.cpu().numpy().astype(np.float32)
+        xyxy += np.array([offset[0], offset[1], offset[0], offset[1]], np.float32)
+        return cls(xyxy, boxes.conf.cpu().numpy().astype(np.float32), boxes.cls.cpu().numpy().astype(np.int64))
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls.empty()
+        return cls(*(np.concatenate(column) for column in zip(*parts)))
+
+    def take(self, index):
+        return Detections(self.boxes[index], self.scores[index], self.classes[index])
+
+def tile_starts(length, tile, overlap):
+    """Start offsets of windows covering [0, length), the last one flush with the end"""
+    if length <= tile:
+        return [0]
+    stride = max(1, int(tile * (1 - overlap)))
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+def tile_grid(shape, tile=DEFAULT_TILE, overlap=DEFAULT_OVERLAP):
+    """(x, y) origins of the tiles covering an image of this (height, width, ...) shape"""
+    height, width = shape[:2]
+    return [(x, y) for y in tile_starts(height, tile, overlap) for x in tile_starts(width, tile, overlap)]
+
+def tiles(img, tile=DEFAULT_TILE, overlap=DEFAULT_OVERLAP):
+    """Yield ((x, y), view) for each tile; views share the image's memory"""
+    for x, y in tile_grid(img.shape, tile, overlap):
+        yield (x, y), img[y:y + tile, x:x + tile]
+
+def _touches(boxes, x1, y1, x2, y2):
+    """Which boxes reach into the rectangles [x1, x2) x [y1, y2) (arrays broadcast)"""
+    return (boxes[..., 0] < x2) & (boxes[..., 2] > x1) & (boxes[..., 1] < y2) & (boxes[..., 3] > y1)
+
+def merge(detections, threshold=MATCH_THRESHOLD, origins=None, tile=DEFAULT_TILE):
+    """Greedy class-aware suppression: keep the best-scoring box of each group of duplicates
+
+    origins is the (N, 2) (x, y) origin of the tile each box came from; with
+    it, a box can only suppress boxes from another tile overlapping its own,
+    and only when both reach into the band the two tiles share. Without it
+    any two boxes may be duplicates.
+    """
+    if len(detections) < 2:
+        return detections
+    order = np.argsort(-detections.scores, kind='stable')
+    boxes = detections.boxes[order].astype(np.float64)
+    classes = detections.classes[order]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    if origins is not None:
+        origins = np.asarray(origins, np.float64)[order]
+
+    # One vectorized pass per kept box over the lower-scored boxes, so memory
+    # stays linear in the number of boxes (a full pairwise matrix would not)
+    suppressed = np.zeros(len(boxes), bool)
+    for i in range(len(boxes)):
+        if suppressed[i]:
+            continue
+        rest = slice(i + 1, None)
+        x1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        smaller = np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        candidate = (inter > threshold * smaller) & (classes[rest] == classes[i])
+        if origins is not None:
+            # The band shared by box i's tile and each other box's tile
+            bx1 = np.maximum(origins[i, 0], origins[rest, 0])
+            by1 = np.maximum(origins[i, 1], origins[rest, 1])
+            bx2 = np.minimum(origins[i, 0], origins[rest, 0]) + tile
+            by2 = np.minimum(origins[i, 1], origins[rest, 1]) + tile
+            other_tile = (origins[rest] != origins[i]).any(axis=1)
+            candidate &= (other_tile & (bx1 < bx2) & (by1 < by2)
+                          & _touches(boxes[i], bx1, by1, bx2, by2) & _touches(boxes[rest], bx1, by1, bx2, by2))
+        suppressed[np.flatnonzero(candidate) + i + 1] = True
+    kept = ~suppressed
+    return Detections(boxes[kept].astype(np.float32), detections.scores[order][kept], classes[kept])
+
+def detect_whole(model, img, profiler=None, **predict_args):
+    """Run model on the whole image and return its Detections"""
+    with timed(profiler, 'model'):
+        results = model(img, **predict_args)
+    record_model_speed(profiler, results)
+    with timed(profiler, 'boxes'):
+        return Detections.concat([Detections.from_result(r) for r in results])
+
+def detect(model, img, tile=DEFAULT_TILE, overlap=DEFAULT_OVERLAP, batch=DEFAULT_BATCH,
+           threshold=MATCH_THRESHOLD, progress=None, profiler=None, **predict_args):
+    """Run model over img tile by tile and return the merged Detections
+
+    progress(done, total) is called after every batch, so callers can show
+    how far a large image has got. predict_args go to every model call.
+    With a profiler, the model calls, box extraction and merge are timed.
+    """
+    height, width = img.shape[:2]
+    if height <= tile and width <= tile:
+        found = detect_whole(model, img, profiler, **predict_args)
+        if progress:
+            progress(1, 1)
+        return found
+
+    grid = tile_grid(img.shape, tile, overlap)
+    parts, origins = [], []
+    for start in range(0, len(grid), batch):
+        batch_origins = grid[start:start + batch]
+        views = [img[y:y + tile, x:x + tile] for x, y in batch_origins]
+        with timed(profiler, 'model'):
+            results = model(views, **predict_args)
+        record_model_speed(profiler, results)
+        with timed(profiler, 'boxes'):
+            for result, origin in zip(results, batch_origins):
+                part = Detections.from_result(result, origin)
+                parts.append(part)
+                origins.append(np.tile(np.array(origin, np.float64), (len(part), 1)))
+        if progress:
+            progress(min(start + batch, len(grid)), len(grid))
+    with timed(profiler, 'merge'):
+        found = Detections.concat(parts)
+        return merge(found, threshold, np.concatenate(origins) if len(found) else None, tile)